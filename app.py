@@ -1,63 +1,80 @@
 import streamlit as st
 import pandas as pd
-import gspread
-from google.oauth2.service_account import Credentials
 import datetime
+from sheets import DEFAULT_TTL, SheetCache, SheetWriter, open_spreadsheet
 
 # --- 1. ฟังก์ชันเชื่อมต่อฐานข้อมูล (เปลี่ยนจาก SQL เป็น Sheets) ---
 # ใช้ @st.cache_resource เพื่อให้เชื่อมต่อแค่ครั้งเดียว ไม่ต้องต่อใหม่ทุกครั้งที่กดปุ่ม
+# เปิดเมื่อมีการเรียก get_data/add_data ครั้งแรกเท่านั้น (ไม่ต่อเน็ตตอนโหลดหน้า) / หน้าเว็บหลักใช้ SQLite + ซิงก์เบื้องหลัง (replication.py)
 @st.cache_resource
 def get_db_connection():
     try:
-        # ดึง Secrets
-        secrets = st.secrets["gsheets"]
-        scopes = [
-            "https://www.googleapis.com/auth/spreadsheets",
-            "https://www.googleapis.com/auth/drive"
-        ]
-        creds = Credentials.from_service_account_info(secrets, scopes=scopes)
-        client = gspread.authorize(creds)
-        
-        # เปิดไฟล์
-        sh = client.open("SchoolData")
-        return sh
+        # ดึง Secrets แล้วเปิดไฟล์
+        return open_spreadsheet(st.secrets["gsheets"])
     except Exception as e:
         st.error(f"❌ เชื่อมต่อฐานข้อมูลไม่ได้: {e}")
         return None
 
-# สร้างตัวแปร sh ไว้ใช้งานทั่วโปรแกรม
-sh = get_db_connection()
-
 # --- 2. ฟังก์ชันช่วยดึงข้อมูล (เหมือน SELECT * FROM table) ---
+# cache ของทุกชีตใช้ร่วมกันทุก session (ttl ตั้งได้ด้วย sheets_cache_ttl ใน secrets) -> ไม่ดาวน์โหลดทั้งชีตทุกครั้งที่เรียก
+@st.cache_resource
+def get_sheet_cache():
+    sh = get_db_connection()
+    if not sh: return None
+    return SheetCache(sh, ttl=st.secrets.get("sheets_cache_ttl", DEFAULT_TTL))
+
 def get_data(sheet_name):
-    if sh:
-        worksheet = sh.worksheet(sheet_name)
-        data = worksheet.get_all_records()
-        return pd.DataFrame(data)
+    cache = get_sheet_cache()
+    if cache: return cache.get(sheet_name)
     return pd.DataFrame()
 
+# หลายชีตพร้อมกัน (request เดียว) -> {ชื่อชีต: DataFrame}
+def get_data_many(sheet_names):
+    cache = get_sheet_cache()
+    if cache: return cache.get_many(sheet_names)
+    return {name: pd.DataFrame() for name in sheet_names}
+
 # --- 3. ฟังก์ชันช่วยเพิ่มข้อมูล (เหมือน INSERT INTO table) ---
-def add_data(sheet_name, row_data):
-    if sh:
-        worksheet = sh.worksheet(sheet_name)
-        worksheet.append_row(row_data)
-        return True
-    return False
+# เข้าบัฟเฟอร์แล้วกลับทันที (เขียนเป็น batch ด้วย append_rows) -> ได้ RowTicket: .ok = เขียนลง Sheets แล้ว
+# wait=True -> flush ชีตนั้นแล้วรอผล คืน True/False
+@st.cache_resource
+def get_sheet_writer():
+    sh = get_db_connection()
+    if not sh: return None
+    cache = get_sheet_cache()
+    return SheetWriter(sh, on_written=cache.invalidate if cache else None)
+
+def add_data(sheet_name, row_data, wait=False):
+    writer = get_sheet_writer()
+    if not writer: return False
+    ticket = writer.append(sheet_name, row_data)
+    if wait: return writer.flush(sheet_name)
+    return ticket
 
 # ... (ส่วนล่างคือโค้ดหน้าเว็บของคุณ) ...
 
 
 import streamlit as st
 import pandas as pd
-from dbfread import DBF
-import zipfile
-import tempfile
 import os
 import re
-import sqlite3
 import time
 from datetime import datetime
 from streamlit_option_menu import option_menu
+from db import get_db
+from refdata import get_refdata
+from exams import exam_dashboard, exam_version, get_exam
+from submissions import get_submission_queue
+from attendance import get_attendance
+from summary import check_summaries, rebuild_summaries
+from search import match_student_ids, search_groups, search_students
+from roster import level_counts, roster_page
+from matrix import get_matrix
+from replication import Replicator
+from sessions import Identity, get_sessions
+from exports import MIME, PREVIEW_PAGE_SIZE, TERM_SCORES_HEADER, download, export_bytes, frame_rows, matrix_export, term_scores_export, term_scores_page
+import importer
+import perf
 
 # ==========================================
 # 0. ตั้งค่าระบบ
@@ -96,125 +113,65 @@ div[data-testid="stDataFrame"] { background: white; padding: 10px; border-radius
 # ==========================================
 # 2. Database & Utils
 # ==========================================
-def init_db():
-    conn = sqlite3.connect(DB_NAME, check_same_thread=False)
-    c = conn.cursor()
-    
-    # ตารางเดิม (คงไว้)
-    c.execute('CREATE TABLE IF NOT EXISTS grades (std_id TEXT, sub_code TEXT, semestry TEXT, grade TEXT, grp_code TEXT)')
-    c.execute('CREATE TABLE IF NOT EXISTS schedule (sub_code TEXT, semestry TEXT, exam_day TEXT, exam_start TEXT, exam_end TEXT)')
-    c.execute('CREATE TABLE IF NOT EXISTS subjects (sub_code TEXT, sub_name TEXT)')
-    c.execute('CREATE TABLE IF NOT EXISTS activities (std_id TEXT, semestry TEXT, act_name TEXT, act_type TEXT, hours REAL)')
-    c.execute('CREATE TABLE IF NOT EXISTS students (std_id TEXT PRIMARY KEY, prefix TEXT, name TEXT, surname TEXT, grp_code TEXT, phone TEXT, card_id TEXT, level TEXT)')
-    c.execute('CREATE TABLE IF NOT EXISTS groups (grp_code TEXT PRIMARY KEY, teacher_name TEXT)')
-    c.execute('CREATE TABLE IF NOT EXISTS users (username TEXT PRIMARY KEY, password TEXT, role TEXT, name TEXT, assigned_group TEXT)')
-    
-    # --- ส่วนที่แก้: ตาราง exams เพิ่มคอลัมน์ sub_code, semestry ---
-    # สร้างตาราง exams (ถ้ายังไม่มี)
-    c.execute('''CREATE TABLE IF NOT EXISTS exams (
-                exam_id INTEGER PRIMARY KEY AUTOINCREMENT, 
-                exam_name TEXT, 
-                sub_code TEXT, 
-                semestry TEXT, 
-                is_active INTEGER DEFAULT 0)''')
-    
+# connection manager ระดับ process (สร้างตาราง/migration ครั้งเดียว ไม่ใช่ทุก rerun)
+db = get_db(DB_NAME)
 
-    # *MIGRATION CHECK*: เช็คว่าถ้าเป็น DB เก่าที่ไม่มี sub_code ให้เพิ่มเข้าไป
-    try:
-        c.execute("SELECT sub_code FROM exams LIMIT 1")
-    except sqlite3.OperationalError:
-        # ถ้า Error แสดงว่ายังไม่มีคอลัมน์ sub_code (เป็น DB เวอร์ชั่นเก่า) ให้เพิ่มเข้าไป
-        c.execute("ALTER TABLE exams ADD COLUMN sub_code TEXT")
-        c.execute("ALTER TABLE exams ADD COLUMN semestry TEXT")
-        conn.commit()
-    # -----------------------------------------------------------
-
-    c.execute('''CREATE TABLE IF NOT EXISTS exam_questions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                exam_id INTEGER,
-                question_text TEXT,
-                choice_a TEXT, choice_b TEXT, choice_c TEXT, choice_d TEXT,
-                correct_answer TEXT)''')
-    c.execute('CREATE TABLE IF NOT EXISTS exam_results (id INTEGER PRIMARY KEY AUTOINCREMENT, exam_id INTEGER, std_id TEXT, score INTEGER, total_score INTEGER, timestamp TEXT)')
-    
-    c.execute("INSERT OR IGNORE INTO users VALUES ('admin', '1234', 'admin', 'ผู้ดูแลระบบ', '')")
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS classroom_videos (
-            vid_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            sub_code TEXT,
-            topic_name TEXT,
-            video_url TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
+# ซิงก์ตารางผลสอบ/วิดีโอ/คำถาม กับ Google Sheets ใน thread เบื้องหลัง (เฉพาะเมื่อตั้ง secrets gsheets ไว้)
+# ทุกหน้าอ่าน/เขียน SQLite อย่างเดียว -> Sheets ช้าหรือล่มไม่ทำให้หน้าเว็บค้าง
+@st.cache_resource
+def get_replicator():
+    try: secrets = dict(st.secrets["gsheets"])
+    except Exception: return None
+    return Replicator(db, lambda: open_spreadsheet(secrets)).start()
 
-    conn.commit()
-    return conn
+replicator = get_replicator()
+
+# token เข้าสู่ระบบแบบลงชื่อ + cache ตัวตน (sessions.py) กุญแจจาก session_secret ใน secrets ถ้ามี
+@st.cache_resource
+def get_session_store():
+    try: secret = st.secrets["session_secret"]
+    except Exception: secret = None
+    return get_sessions(db, secret)
+
+session_store = get_session_store()
 
 def clean_id_card(val):
     if pd.isna(val): return ""
     s = str(val).strip().replace('.0', '')
     return re.sub(r'[^0-9]', '', s)
 
-def format_thai_time(t):
-    if pd.isna(t) or t == '' or str(t).lower() == 'nan': return ""
-    try:
-        val = float(t)
-        if val >= 24: s = str(int(val)); return f"{s[:2]}.{s[2:]} น." if len(s)==4 else f"0{s[0]}.{s[1:]} น."
-        else: h = int(val); m = int(round((val - h) * 100)); return f"{h:02}.{m:02} น."
-    except: return str(t)
-
-def get_level_from_id(std_id):
-    sid = clean_id_card(std_id)
-    if len(sid) >= 4:
-        digit = sid[3]
-        if digit == '1': return 'ประถมศึกษา'
-        elif digit == '2': return 'มัธยมศึกษาตอนต้น'
-        elif digit == '3': return 'มัธยมศึกษาตอนปลาย'
-    return "ไม่ระบุ"
-
-def read_dbf_robust(path):
-    try:
-        if os.path.getsize(path) < 50: return pd.DataFrame() 
-        with DBF(path, encoding='cp874', char_decode_errors='ignore', ignore_missing_memofile=True, load=True) as table:
-            df = pd.DataFrame(iter(table))
-        df.columns = [c.upper().strip() for c in df.columns]
-        for col in df.columns:
-            if df[col].dtype == 'object': df[col] = df[col].astype(str).str.strip()
-        return df
-    except: return pd.DataFrame()
-
 # ==========================================
 # 3. Session & Login
 # ==========================================
+def start_session(ident, token):
+    st.session_state.logged_in = True
+    st.session_state.user = ident.user
+    st.session_state.role = ident.role
+    st.session_state.name = ident.name
+    st.session_state.assigned_group = ident.group
+    st.session_state.session_token = token
+    st.query_params["session"] = token
+
 def restore_session():
     if 'logged_in' not in st.session_state:
-        qp = st.query_params
-        if "user" in qp:
-            username = qp["user"]
-            conn = init_db()
-            user = pd.read_sql("SELECT * FROM users WHERE username=?", conn, params=(username,))
-            if not user.empty:
-                row = user.iloc[0]
-                st.session_state.logged_in = True
-                st.session_state.user = row['username']
-                st.session_state.role = row['role']
-                st.session_state.name = row['name']
-                st.session_state.assigned_group = row['assigned_group']
-            else:
-                std = pd.read_sql("SELECT * FROM students WHERE std_id=?", conn, params=(username,))
-                if not std.empty:
-                    st.session_state.logged_in = True
-                    st.session_state.user = username
-                    st.session_state.role = 'student'
-                    st.session_state.name = f"{std.iloc[0]['prefix']}{std.iloc[0]['name']} {std.iloc[0]['surname']}"
-            conn.close()
+        # session ใหม่/รีเฟรช: ?session=<token> ตรวจลายเซ็นในหน่วยความจำ + ตัวตนจาก cache (ไม่ query ทุกครั้ง)
+        token = st.query_params.get("session")
+        ident = session_store.restore(token)
+        if ident is not None: start_session(ident, token)
         else:
             st.session_state.logged_in = False
             st.session_state.role = ''
             st.session_state.view_mode = 'dashboard'
+            if token: del st.query_params["session"]  # หมดอายุ / ถูกเพิกถอน / ปลอม
+    elif st.session_state.logged_in and session_store.verify(st.session_state.get('session_token')) is None:
+        # ถูกเพิกถอนระหว่างใช้งาน (รีเซ็ตรหัสผ่าน) หรือหมดอายุ -> กลับหน้าเข้าสู่ระบบ
+        st.session_state.clear()
+        st.query_params.clear()
+        restore_session()
 
 def do_logout():
+    token = st.session_state.get('session_token')
+    if token: session_store.revoke(token)
     st.session_state.clear()
     st.query_params.clear()
     st.rerun()
@@ -234,37 +191,29 @@ def login_page():
             pwd_input = st.text_input("รหัสผ่าน", type="password")
             
             if st.form_submit_button("เข้าสู่ระบบ", use_container_width=True):
-                conn = init_db()
+                conn = db.reader()
                 cl_user = clean_id_card(user_input)
                 
                 user = pd.read_sql("SELECT * FROM users WHERE username=? AND password=?", conn, params=(user_input, pwd_input))
-                success = False
+                ident = None
                 
                 if not user.empty:
                     row = user.iloc[0]
-                    st.session_state.logged_in = True
-                    st.session_state.user = row['username']
-                    st.session_state.role = row['role']
-                    st.session_state.name = row['name']
-                    st.session_state.assigned_group = row['assigned_group']
-                    success = True
+                    ident = Identity(row['username'], row['role'], row['name'], row['assigned_group'] or '')
                 else:
                     # Logic: ถ้ารหัสผ่าน == รหัสผู้ใช้ หรือ รหัสผ่าน == เลขบัตรประชาชน (ถ้ามีในอนาคต)
                     if cl_user == clean_id_card(pwd_input):
                         search_id = cl_user[-10:] if len(cl_user) > 10 else cl_user
                         std = pd.read_sql("SELECT * FROM students WHERE std_id=?", conn, params=(search_id,))
                         if not std.empty:
-                            st.session_state.logged_in = True
-                            st.session_state.user = search_id
-                            st.session_state.role = 'student'
-                            st.session_state.name = f"{std.iloc[0]['prefix']}{std.iloc[0]['name']} {std.iloc[0]['surname']}"
-                            success = True
+                            ident = Identity(search_id, 'student', f"{std.iloc[0]['prefix']}{std.iloc[0]['name']} {std.iloc[0]['surname']}",
+                                             std.iloc[0]['grp_code'] or '')
                         else: st.error("❌ ไม่พบข้อมูลในระบบ")
                     else: st.error("❌ รหัสผ่านไม่ถูกต้อง")
                 
-                conn.close()
-                if success:
-                    st.query_params["user"] = st.session_state.user
+                if ident is not None:
+                    # token ลงชื่อใน URL แทน ?user= -> รีเฟรชแล้วยังอยู่ในระบบ โดยไม่ต้อง query ตัวตนใหม่
+                    start_session(ident, session_store.issue(ident))
                     st.rerun()
 
 # ==========================================
@@ -276,8 +225,16 @@ def styled_df(df):
     styler.set_table_styles([{'selector': 'th', 'props': [('background-color', '#F0F2F6'), ('color', '#000000'), ('font-weight', 'bold')]}])
     return styler
 
+@st.fragment(run_every=1)
+def pending_submission_status():
+    # ผลสอบที่ส่งแล้วยังไม่ได้บันทึก -> แสดงสถานะและเช็คใหม่ทุกวินาที บันทึกเสร็จแล้ว rerun ทั้งหน้าเพื่อแสดงผล
+    ticket = st.session_state.get('pending_submission')
+    if ticket is None: return
+    if ticket.done: st.rerun()
+    st.info(f"⏳ กำลังบันทึกผลสอบ... (รอในคิว {get_submission_queue(db).stats()['depth']:,} รายการ)")
+
 def view_data_page(std_id, is_teacher_view=False):
-    conn = init_db()
+    conn = db.reader()
     clean_sid = clean_id_card(std_id)
     std_info = pd.read_sql("SELECT s.*, g.teacher_name FROM students s LEFT JOIN groups g ON s.grp_code = g.grp_code WHERE s.std_id=?", conn, params=(clean_sid,))
     
@@ -290,7 +247,7 @@ def view_data_page(std_id, is_teacher_view=False):
 
     row = std_info.iloc[0]
     s_name = f"{row['prefix']}{row['name']} {row['surname']}"
-    current_level = row['level'] if row['level'] else get_level_from_id(clean_sid)
+    current_level = row['level']
 
     st.markdown(f"""
     <div class='top-header'>
@@ -315,6 +272,7 @@ def view_data_page(std_id, is_teacher_view=False):
         selected = option_menu(None, ["รายวิชาและผลการเรียน", "ตารางสอบ", "กิจกรรม กพช.", "แบบทดสอบออนไลน์", "ห้องเรียนออนไลน์", "ติวเข้มออนไลน์"], 
             icons=["book", "calendar", "star", "pencil-square", "play-btn-fill", "cast"], default_index=0,
             styles={"container": {"padding": "0!important", "background-color": "transparent"}})
+        perf.set_section(selected)
         
         st.markdown("<br>", unsafe_allow_html=True)
         if is_teacher_view:
@@ -330,11 +288,8 @@ def view_data_page(std_id, is_teacher_view=False):
         if selected == "รายวิชาและผลการเรียน":
             st.markdown(f"<div class='section-title'>📚 รายวิชาและผลการเรียน</div>", unsafe_allow_html=True)
             if not grades.empty:
-                subjects = pd.read_sql("SELECT * FROM subjects", conn)
-                grades['k'] = grades['sub_code'].str.replace('-','')
-                subjects['k'] = subjects['sub_code'].str.replace('-','')
-                m = pd.merge(grades, subjects[['k','sub_name']], on='k', how='left')
-                m['sub_name'] = m['sub_name'].fillna(m['sub_code'])
+                m = grades.copy()
+                m['sub_name'] = get_refdata(db).subject_names(m['sub_code'], m['sub_key'])
                 
                 sems = sorted(m['semestry'].unique(), reverse=True)
                 sem_sel = st.selectbox("เลือกปีการศึกษา:", sems)
@@ -344,28 +299,27 @@ def view_data_page(std_id, is_teacher_view=False):
 
         elif selected == "ตารางสอบ":
             st.markdown("<div class='section-title'>🗓️ ตารางสอบปลายภาค</div>", unsafe_allow_html=True)
-            schedule = pd.read_sql("SELECT * FROM schedule", conn)
             
             if not grades.empty:
-                my_subs = grades['sub_code'].unique()
-                my_sch = schedule[schedule['sub_code'].isin(my_subs)].copy()
+                # วิชาที่ลงทะเบียน (จับคู่ด้วย sub_key ที่คำนวณไว้ตอนนำเข้า) — กรองใน SQL ไม่ต้องโหลดตารางสอบทั้งหมด
+                sems = pd.read_sql("SELECT DISTINCT semestry FROM schedule WHERE sub_key IN (SELECT sub_key FROM grades WHERE std_id = ?) ORDER BY semestry DESC",
+                                   conn, params=(clean_sid,))['semestry'].tolist()
                 
-                if not my_sch.empty:
-                    sems = sorted(my_sch['semestry'].unique(), reverse=True)
+                if sems:
                     sem_sel = st.selectbox("เลือกปีการศึกษา:", sems)
                     
-                    graded_subs = grades[(grades['semestry'] == sem_sel) & (grades['grade'].str.strip() != '')]['sub_code'].tolist()
-                    filtered_sch = my_sch[(my_sch['semestry'] == sem_sel) & (~my_sch['sub_code'].isin(graded_subs))].copy()
+                    # ตัดวิชาที่ได้รับผลการเรียนแล้วในเทอมนี้
+                    sql_sch = """
+                        SELECT exam_day, exam_time, sub_code, sub_key FROM schedule
+                        WHERE semestry = ? AND sub_key IN (SELECT sub_key FROM grades WHERE std_id = ?)
+                          AND sub_key NOT IN (SELECT sub_key FROM grades WHERE std_id = ? AND semestry = ? AND (grade IS NULL OR trim(grade) <> ''))
+                    """
+                    full_sch = pd.read_sql(sql_sch, conn, params=(sem_sel, clean_sid, clean_sid, sem_sel))
                     
-                    if not filtered_sch.empty:
-                        subjects = pd.read_sql("SELECT sub_code, sub_name FROM subjects", conn)
-                        filtered_sch['k'] = filtered_sch['sub_code'].str.replace('-','')
-                        subjects['k'] = subjects['sub_code'].str.replace('-','')
+                    if not full_sch.empty:
+                        full_sch['sub_name'] = get_refdata(db).subject_names(full_sch['sub_code'], full_sch['sub_key'])
                         
-                        full_sch = pd.merge(filtered_sch, subjects[['k','sub_name']], on='k', how='left')
-                        full_sch['time'] = full_sch.apply(lambda x: f"{format_thai_time(x['exam_start'])}-{format_thai_time(x['exam_end'])}", axis=1)
-                        
-                        show = full_sch[['exam_day','time','sub_code','sub_name']].rename(columns={'exam_day':'วันสอบ','time':'เวลา','sub_code':'รหัส','sub_name':'วิชา'})
+                        show = full_sch[['exam_day','exam_time','sub_code','sub_name']].rename(columns={'exam_day':'วันสอบ','exam_time':'เวลา','sub_code':'รหัส','sub_name':'วิชา'})
                         st.dataframe(styled_df(show), hide_index=True, use_container_width=True)
                     else:
                         st.success("✅ คุณสอบครบทุกวิชา หรือ ได้รับการตัดสินผลการเรียนครบแล้วในเทอมนี้")
@@ -399,74 +353,45 @@ def view_data_page(std_id, is_teacher_view=False):
                 st.markdown(f"### ✍️ กำลังทำ: {exam_name}")
                 st.info("⚠️ ห้ามกด Refresh Browser ระหว่างทำข้อสอบ")
 
-                questions = pd.read_sql("SELECT * FROM exam_questions WHERE exam_id=?", conn, params=(exam_id,))
+                # ชุดข้อสอบที่คอมไพล์ไว้ (cache ร่วมทุก session) -> rerun ตอนเลือกคำตอบไม่ต้อง query ใหม่
+                exam = get_exam(db, exam_id)
 
-                if questions.empty:
+                if len(exam) == 0:
                     st.warning("❌ ข้อสอบนี้ยังไม่มีคำถาม")
                     if st.button("🔙 ย้อนกลับ"):
                         del st.session_state.doing_exam_id
                         st.rerun()
                 else:
                     with st.form("exam_form_student"):
-                        answers = {}
-                        for q_idx, q in questions.iterrows():
-                            st.markdown(f"**ข้อที่ {q_idx+1}:** {q['question_text']}")
-                            opts = [q['choice_a'], q['choice_b'], q['choice_c'], q['choice_d']]
-                            clean_opts = [o for o in opts if o and str(o).strip() != ""] # กรองช้อยส์ว่าง
+                        answers = []
+                        for q_idx, q_id, q_text, clean_opts in exam.questions():
+                            st.markdown(f"**ข้อที่ {q_idx+1}:** {q_text}")
                             
-                            # ดึงคำตอบเดิมถ้ามี (กรณีหน้า refresh)
-                            choice = st.radio(f"เลือกคำตอบข้อ {q_idx+1}", clean_opts, key=f"q_{q['id']}", index=None)
-                            answers[q['id']] = choice
+                            # ดึงคำตอบเดิมถ้ามี (กรณีหน้า refresh) — เก็บเป็นลำดับตัวเลือก ตรวจคะแนนกับเฉลยได้ตรง ๆ
+                            choice = st.radio(f"เลือกคำตอบข้อ {q_idx+1}", range(len(clean_opts)), format_func=clean_opts.__getitem__,
+                                              key=f"q_{q_id}", index=None)
+                            answers.append(choice)
                             st.markdown("---")
                         
                         col_sub, col_cancel = st.columns([1, 1])
                         with col_sub:
                             if st.form_submit_button("📤 ส่งคำตอบ", type="primary"):
-                                score = 0
-                                answered_count = 0
-                                total_q = len(questions)
-
-                                # ตรวจคะแนน
-                                for q_idx, q in questions.iterrows():
-                                    user_ans = answers.get(q['id'])
-                                    if user_ans: answered_count += 1
-                                    
-                                    correct_val = ""
-                                    if q['correct_answer'] == 'A': correct_val = q['choice_a']
-                                    elif q['correct_answer'] == 'B': correct_val = q['choice_b']
-                                    elif q['correct_answer'] == 'C': correct_val = q['choice_c']
-                                    elif q['correct_answer'] == 'D': correct_val = q['choice_d']
-                                    
-                                    # เทียบคำตอบ (ตัดช่องว่าง)
-                                    if str(user_ans).strip() == str(correct_val).strip():
-                                        score += 1
+                                total_q = len(exam)
+
+                                # ตรวจคะแนน (เทียบกับเฉลยทั้งชุดทีเดียว)
+                                score, answered_count = exam.grade(answers)
 
                                 if answered_count < total_q:
                                     st.error(f"⚠️ คุณตอบไป {answered_count}/{total_q} ข้อ กรุณาตอบให้ครบ")
                                 else:
-                                    # บันทึกผล
-                                    try:
-                                        cur = conn.cursor()
-                                        # ลบของเก่าออกก่อน (ถ้าเป็นการสอบแก้ตัว)
-                                        cur.execute("DELETE FROM exam_results WHERE exam_id=? AND std_id=?", (exam_id, clean_sid))
-                                        
-                                        # ใส่ของใหม่
-                                        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M")
-                                        cur.execute("""
-                                            INSERT INTO exam_results (exam_id, std_id, score, total_score, timestamp) 
-                                            VALUES (?, ?, ?, ?, ?)
-                                        """, (exam_id, clean_sid, score, total_q, timestamp))
-                                        conn.commit()
-                                        
-                                        st.balloons()
-                                        st.success(f"🎉 บันทึกสำเร็จ! คุณได้ {score} / {total_q} คะแนน")
-                                        time.sleep(3)
-                                        
-                                        # เคลียร์สถานะ เพื่อกลับหน้ารายการ
-                                        del st.session_state.doing_exam_id
-                                        st.rerun()
-                                    except Exception as e:
-                                        st.error(f"เกิดข้อผิดพลาดในการบันทึก: {e}")
+                                    # บันทึกผล: ส่งเข้าคิว (thread เขียนเบื้องหลังรวบเป็น batch) แล้วกลับหน้ารายการทันที
+                                    # (ลบผลเก่าของคนเดิม/ข้อสอบเดิมก่อนใส่ใหม่ ทำใน thread เขียน)
+                                    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M")
+                                    st.session_state.pending_submission = get_submission_queue(db).submit(exam_id, clean_sid, score, total_q, timestamp)
+                                    
+                                    # เคลียร์สถานะ เพื่อกลับหน้ารายการ
+                                    del st.session_state.doing_exam_id
+                                    st.rerun()
 
                         with col_cancel:
                             if st.form_submit_button("❌ ยกเลิกการสอบ"):
@@ -477,69 +402,49 @@ def view_data_page(std_id, is_teacher_view=False):
             # 🅱️ MODE 2: หน้ารายการวิชา (จะทำงานก็ต่อเมื่อไม่ได้สอบอยู่)
             # ========================================================
             else:
-                # 1. เช็คเกรด (Nuclear Filter)
-                df_my_grades = pd.read_sql("SELECT sub_code, grade FROM grades WHERE std_id=?", conn, params=(clean_sid,))
-                
-                passed_subjects = set()
-                registered_subjects = set() 
-                debug_grade_info = {}
-
-                if not df_my_grades.empty:
-                    for _, row in df_my_grades.iterrows():
-                        s_code = str(row['sub_code']).strip()
-                        registered_subjects.add(s_code)
-                        
-                        g_val = row['grade']
-                        if g_val is None: g_str = ""
-                        else: g_str = str(g_val).strip()
-                        
-                        debug_grade_info[s_code] = g_str
-                        
-                        if g_str != "" and g_str.lower() != "nan" and g_str.lower() != "none":
-                            passed_subjects.add(s_code)
-
-                # 2. ดึงข้อสอบ
-                active_exams = pd.read_sql("SELECT * FROM exams WHERE is_active=1", conn)
+                # 0. ผลสอบที่เพิ่งส่ง: ไม่รอ thread เขียนใน rerun นี้ -> ยังไม่เสร็จก็แสดง fragment ที่เช็คทุกวินาที แล้ว rerun เมื่อบันทึกเสร็จ
+                ticket = st.session_state.get('pending_submission')
+                if ticket is not None and ticket.done:
+                    del st.session_state.pending_submission
+                    if ticket.ok:
+                        st.balloons()
+                        st.success(f"🎉 บันทึกสำเร็จ! คุณได้ {ticket.score} / {ticket.total} คะแนน")
+                    else:
+                        st.error(f"เกิดข้อผิดพลาดในการบันทึก: {ticket.error} (กรุณาทำแบบทดสอบและส่งใหม่อีกครั้ง)")
+                elif ticket is not None:
+                    pending_submission_status()
+
+                # 1. ข้อสอบที่ต้องสอบ (ลงทะเบียน + ยังไม่ผ่าน) พร้อมผลสอบล่าสุด -> query เดียว
+                my_exams = exam_dashboard(conn, clean_sid)
+
+                # 2. แสดงผล
+                for exam in my_exams:
+                    with st.expander(f"📘 {exam.sub_code} {exam.exam_name}", expanded=True):
+                        col_info, col_btn = st.columns([3, 1])
+                        with col_info:
+                            if exam.result_id is not None:
+                                st.warning(f"⚠️ เคยสอบแล้วเมื่อ: {exam.timestamp}")
+                                st.metric("คะแนนล่าสุด", f"{exam.score} / {exam.total_score}")
+                            else:
+                                st.info("ยังไม่เคยทำข้อสอบนี้")
+
+                        with col_btn:
+                            btn_label = "สอบแก้ตัว" if exam.result_id is not None else "เริ่มทำแบบทดสอบ"
+                            # 🔥 จุดสำคัญ: กดปุ่มแล้ว Set State และ Rerun ทันที
+                            if st.button(btn_label, key=f"start_{exam.exam_id}", type="primary"):
+                                st.session_state.doing_exam_id = exam.exam_id
+                                st.session_state.doing_exam_name = exam.exam_name
+                                st.rerun()
 
-                # 3. แสดงผล
-                count_show = 0
-                if active_exams.empty:
-                    st.info("ไม่พบแบบทดสอบในระบบ")
-                else:
-                    for idx, exam in active_exams.iterrows():
-                        exam_sub_code = str(exam['sub_code']).strip()
-                        
-                        # กรอง: ต้องลงทะเบียน และ ยังไม่ผ่าน
-                        is_registered = exam_sub_code in registered_subjects
-                        is_passed = exam_sub_code in passed_subjects
-                        
-                        if is_registered and not is_passed:
-                            count_show += 1
-                            with st.expander(f"📘 {exam_sub_code} {exam['exam_name']}", expanded=True):
-                                history = pd.read_sql("SELECT * FROM exam_results WHERE exam_id=? AND std_id=?", conn, params=(exam['exam_id'], clean_sid))
-                                
-                                col_info, col_btn = st.columns([3, 1])
-                                with col_info:
-                                    if not history.empty:
-                                        score = history.iloc[0]['score']
-                                        total = history.iloc[0]['total_score']
-                                        st.warning(f"⚠️ เคยสอบแล้วเมื่อ: {history.iloc[0]['timestamp']}")
-                                        st.metric("คะแนนล่าสุด", f"{score} / {total}")
-                                    else:
-                                        st.info("ยังไม่เคยทำข้อสอบนี้")
-
-                                with col_btn:
-                                    btn_label = "สอบแก้ตัว" if not history.empty else "เริ่มทำแบบทดสอบ"
-                                    # 🔥 จุดสำคัญ: กดปุ่มแล้ว Set State และ Rerun ทันที
-                                    if st.button(btn_label, key=f"start_{exam['exam_id']}", type="primary"):
-                                        st.session_state.doing_exam_id = exam['exam_id']
-                                        st.session_state.doing_exam_name = exam['exam_name']
-                                        st.rerun()
-                    
-                    if count_show == 0:
+                if not my_exams:
+                    # กรณีไม่มีรายการ (ไม่บ่อย) ค่อยแยกสาเหตุ
+                    if conn.execute("SELECT 1 FROM exams WHERE is_active=1 LIMIT 1").fetchone() is None:
+                        st.info("ไม่พบแบบทดสอบในระบบ")
+                    else:
                         st.success("🎉 คุณไม่มีรายวิชาที่ต้องสอบ (สอบครบ/ผ่านหมดแล้ว)")
                         with st.expander("ตรวจสอบสถานะเกรด (Debug)"):
-                             st.write(debug_grade_info)
+                            debug = pd.read_sql("SELECT sub_code, grade FROM grades WHERE std_id=?", conn, params=(clean_sid,))
+                            st.write(dict(zip(debug['sub_code'].astype(str).str.strip(), debug['grade'].fillna('').astype(str).str.strip())))
 # ========================================================
         # ✅ ส่วนที่เพิ่ม: หน้าห้องเรียนออนไลน์
         # ========================================================
@@ -565,16 +470,8 @@ def view_data_page(std_id, is_teacher_view=False):
             if all_videos.empty:
                 st.info("📭 ยังไม่มีวิดีโอการสอนในระบบ")
             else:
-                # รายชื่อวิชาภาษาไทย (Mapping)
-                subject_map_video = {
-                    'ทช11001': 'เศรษฐกิจพอเพียง',
-                    'พท11001': 'ภาษาไทย',
-                    'พค11001': 'คณิตศาสตร์',
-                    'พด11001': 'พลศึกษา/สุขศึกษา',
-                    'อช11001': 'ช่องทางการเข้าสู่อาชีพ',
-                    'สค11001': 'สังคมศึกษา',
-                    'ทข11002': 'สุขศึกษา พลศึกษา'
-                }
+                # รายชื่อวิชาภาษาไทย (จากตาราง subjects ผ่าน registry)
+                ref = get_refdata(db)
                 
                 count_visible = 0
                 unique_subs_in_video = all_videos['sub_code'].unique()
@@ -586,7 +483,7 @@ def view_data_page(std_id, is_teacher_view=False):
                     # 🔥 กรอง: แสดงเฉพาะวิชาที่นักเรียนลงทะเบียนเรียนเท่านั้น
                     if clean_sub_code in my_subjects:
                         count_visible += 1
-                        sub_name = subject_map_video.get(clean_sub_code, clean_sub_code)
+                        sub_name = ref.subject_name(clean_sub_code)
                         
                         # สร้างกล่องรายวิชา (Expander)
                         with st.expander(f"📚 {clean_sub_code} : {sub_name}", expanded=False):
@@ -667,7 +564,7 @@ def teacher_page():
         view_data_page(st.session_state.target_sid, is_teacher_view=True)
         return
 
-    conn = init_db()
+    conn = db.reader()
     grp = st.session_state.assigned_group
     
     # --- ส่วนหัวข้อหลัก (Main Header) ---
@@ -700,6 +597,7 @@ def teacher_page():
             "เลือกรายการที่ต้องการดู:",
             ["👥 รายชื่อนักศึกษา", "📊 ตารางคะแนน (Matrix)"]
         )
+        perf.set_section(menu_option)
         
         st.markdown("---")
         # (ปุ่มออกจากระบบ จะแสดงต่อท้ายจากตรงนี้โดยอัตโนมัติ ถ้าโค้ดหลักของคุณเขียนไว้ใน main)
@@ -712,126 +610,68 @@ def teacher_page():
     if menu_option == "👥 รายชื่อนักศึกษา":
         st.subheader(f"👥 รายชื่อนักศึกษา (เทอม {cur_sem})")
         
-        sql_active = """
-            SELECT DISTINCT s.std_id, s.prefix, s.name, s.surname 
-            FROM students s
-            JOIN grades g ON s.std_id = g.std_id
-            WHERE s.grp_code = ? AND g.semestry = ?
-            ORDER BY s.std_id
-        """
-        std_list = pd.read_sql(sql_active, conn, params=(grp, cur_sem))
+        # สถิติ (COUNT ใน SQL)
+        lv = level_counts(conn, grp, cur_sem)
         
-        if not std_list.empty:
-            std_list['full_name'] = std_list['prefix'] + std_list['name'] + ' ' + std_list['surname']
-
-            # สถิติ
-            level_counts = {'ประถมศึกษา': 0, 'มัธยมศึกษาตอนต้น': 0, 'มัธยมศึกษาตอนปลาย': 0}
-            for sid in std_list['std_id']:
-                lvl = get_level_from_id(sid)
-                if lvl in level_counts: level_counts[lvl] += 1
-            
+        if not sum(lv.values()):
+            st.warning(f"ไม่พบนักศึกษาในกลุ่มนี้ ที่ลงทะเบียนเรียนในภาคเรียน {cur_sem}")
+        else:
             c1, c2, c3 = st.columns(3)
-            c1.info(f"ประถม: {level_counts['ประถมศึกษา']} คน")
-            c2.info(f"ม.ต้น: {level_counts['มัธยมศึกษาตอนต้น']} คน")
-            c3.info(f"ม.ปลาย: {level_counts['มัธยมศึกษาตอนปลาย']} คน")
+            c1.info(f"ประถม: {lv['ประถมศึกษา']} คน")
+            c2.info(f"ม.ต้น: {lv['มัธยมศึกษาตอนต้น']} คน")
+            c3.info(f"ม.ปลาย: {lv['มัธยมศึกษาตอนปลาย']} คน")
 
-            # ช่องค้นหา
-            col_search, _ = st.columns([2, 2])
+            # ช่องค้นหา (กรองใน SQL) + แบ่งหน้า: ดึงเฉพาะหน้าที่แสดง
+            col_search, col_page = st.columns([2, 2])
             with col_search:
                 search_query = st.text_input("🔍 ค้นหา (ชื่อ/รหัส):", key="search_std_list")
-
-            if search_query:
-                std_list = std_list[
-                    std_list['std_id'].astype(str).str.contains(search_query, case=False) |
-                    std_list['full_name'].str.contains(search_query, case=False)
-                ]
+            # คำค้น/เทอมเปลี่ยน -> กลับหน้าแรก
+            if st.session_state.get('roster_filter') != (search_query, cur_sem):
+                st.session_state.roster_filter = (search_query, cur_sem)
+                st.session_state.roster_page = 1
+            page = roster_page(conn, grp, cur_sem, search_query, st.session_state.get('roster_page', 1) - 1)
+        
+            if page.total:
+                with col_page:
+                    if page.pages > 1:
+                        st.number_input(f"หน้า (จาก {page.pages})", min_value=1, max_value=page.pages, key="roster_page")
             
-            st.write(f"แสดงผล: {len(std_list)} คน")
-            st.markdown("---")
+                st.write(f"แสดงผล: {page.total} คน" + (f" (หน้า {page.page + 1}/{page.pages})" if page.pages > 1 else ""))
             
-            # แสดงรายการ
-            for _, row in std_list.iterrows():
-                with st.container():
-                    c1, c2, c3 = st.columns([1.5, 4, 1.5])
-                    c1.write(f"**{row['std_id']}**")
-                    c2.write(row['full_name'])
-                    if c3.button("🔍 ดูข้อมูล", key=f"btn_{row['std_id']}"):
-                        st.session_state.target_sid = row['std_id']
+                # ตารางเดียว เลือกแถวเพื่อดูข้อมูล (แทนปุ่มทีละคน)
+                def open_detail(rows):
+                    sel = st.session_state.get(f"roster_table_{st.session_state.get('roster_nonce', 0)}")
+                    if sel and sel.selection.rows:
+                        st.session_state.target_sid = rows[sel.selection.rows[0]][0]
                         st.session_state.view_mode = 'detail'
-                        st.rerun()
-                    st.markdown("---")
-        else:
-            st.warning(f"ไม่พบนักศึกษาในกลุ่มนี้ ที่ลงทะเบียนเรียนในภาคเรียน {cur_sem}")
+                        # กลับมาหน้ารายชื่อแล้วตารางต้องไม่มีแถวที่เลือกค้างไว้
+                        st.session_state.roster_nonce = st.session_state.get('roster_nonce', 0) + 1
+
+                st.caption("คลิกที่แถวเพื่อดูข้อมูลนักศึกษา")
+                st.dataframe(pd.DataFrame(page.rows, columns=['รหัสนักศึกษา', 'ชื่อ-สกุล', 'ระดับ']),
+                             use_container_width=True, hide_index=True,
+                             key=f"roster_table_{st.session_state.get('roster_nonce', 0)}",
+                             on_select=lambda: open_detail(page.rows), selection_mode="single-row")
+            else:
+                st.write("แสดงผล: 0 คน")
 
     # --- กรณีเลือก: ตารางคะแนน (Matrix) ---
     elif menu_option == "📊 ตารางคะแนน (Matrix)":
         st.subheader("📊 ตารางคะแนนรวม (Score Matrix)")
         
         try:
-            sql_report = """
-                SELECT 
-                    s.std_id, 
-                    s.prefix || s.name || ' ' || s.surname AS full_name,
-                    e.sub_code,
-                    r.score,
-                    r.total_score
-                FROM exam_results r
-                JOIN students s ON r.std_id = s.std_id
-                JOIN exams e ON r.exam_id = e.exam_id
-                WHERE s.grp_code = ? 
-            """
-            df_scores = pd.read_sql(sql_report, conn, params=(grp,))
-
-            if df_scores.empty:
+            # pivot ของกลุ่ม cache ไว้ (ผลสอบใหม่ -> แก้เฉพาะแถวของคนที่ส่ง) ค้นหา/ดาวน์โหลดใช้ frame เดิม
+            matrix = get_matrix(db, grp)
+
+            if matrix.empty:
                 st.info("📭 ยังไม่มีข้อมูลการสอบของนักเรียนในกลุ่มนี้")
             else:
-                # Mapping ชื่อวิชา
-                subject_map = {
-                    'ทช11001': 'เศรษฐกิจพอเพียง',
-                    'พท11001': 'ภาษาไทย',
-                    'พค11001': 'คณิตศาสตร์',
-                    'พด11001': 'พลศึกษา/สุขศึกษา',
-                    'สค12025': 'ลูกเสือ กศน',
-                    'อช11001': 'ช่องทางการเข้าสู่อาชีพ',
-                    'อช11002': 'ทักษะการประกอบอาชีพ',
-                    'อช11003': 'พัฒนาอาชีพให้มีอยู่มีกิน',
-                    'สค11001': 'สังคมศึกษา',
-                    'สค11002': 'ศาสนาและหน้าที่พลเมือง',
-                    'สค11003': 'การพัฒนาตนเอง',
-                    'สค12010': 'ประชาธิปไตยในชุมชน',
-                    'ทข11002': 'สุขศึกษา พลศึกษา',
-                    'ทบ11002': 'สุขศึกษา พลศึกษา'
-                }
-
-                def get_sub_name(code):
-                    return subject_map.get(code, code)
-
-                df_scores['sub_name'] = df_scores['sub_code'].apply(get_sub_name)
-                df_scores['subject_label'] = df_scores['sub_name'] + " (เต็ม " + df_scores['total_score'].astype(str) + ")"
-                
-                # Pivot & Search
-                matrix_view = df_scores.pivot_table(
-                    index=['std_id', 'full_name'],  
-                    columns='subject_label',       
-                    values='score',                
-                    aggfunc='max'
-                ).reset_index()
-
-                matrix_view = matrix_view.rename(columns={'std_id': 'รหัสนักเรียน', 'full_name': 'ชื่อ-สกุล'})
-
                 # ค้นหาในหน้าคะแนน
                 col_search_score, _ = st.columns([2, 2])
                 with col_search_score:
                     search_score = st.text_input("🔍 ค้นหาคะแนน (ชื่อ/รหัส):", key="search_score_matrix")
 
-                if search_score:
-                    mask = (
-                        matrix_view['รหัสนักเรียน'].astype(str).str.contains(search_score, case=False) |
-                        matrix_view['ชื่อ-สกุล'].astype(str).str.contains(search_score, case=False)
-                    )
-                    matrix_view = matrix_view[mask]
-
-                matrix_view.index = range(1, len(matrix_view) + 1)
+                matrix_view = matrix.view(match_student_ids(conn, search_score, grp) if search_score else None)
                 
                 st.write(f"แสดงข้อมูล: {len(matrix_view)} รายการ")
                 
@@ -840,8 +680,11 @@ def teacher_page():
                     use_container_width=True 
                 )
 
-                csv = matrix_view.to_csv(index=False).encode('utf-8-sig')
-                st.download_button("📥 ดาวน์โหลด (CSV)", csv, "scores.csv", "text/csv")
+                # ไฟล์สร้างตอนกดดาวน์โหลดเท่านั้น (ทั้งกลุ่ม cache ตามเวอร์ชัน / ผลค้นหาสร้างจากตารางที่แสดงอยู่)
+                for col, fmt in zip(st.columns([1, 1, 2])[:2], ('csv', 'xlsx')):
+                    if search_score: build = lambda fmt=fmt, view=matrix_view: export_bytes(fmt, list(view.columns), frame_rows(view))
+                    else: build = lambda fmt=fmt: matrix_export(db, grp, fmt)
+                    col.download_button(f"📥 ดาวน์โหลด ({fmt.upper()})", download(build), f"scores.{fmt}", MIME[fmt], key=f"dl_matrix_{fmt}")
 
         except Exception as e:
             st.error(f"เกิดข้อผิดพลาด: {e}")
@@ -850,23 +693,29 @@ def teacher_page():
         st.divider()
         if st.button("🔴 ออกจากระบบ", use_container_width=True): 
             do_logout()
-            
-    conn.close()
     
 # ==========================================
 # 6. Admin Page (เพิ่ม Tab จัดการข้อสอบ)
 # ==========================================
+SEARCH_LIMIT = 200  # ผลค้นหา นศ. สูงสุดต่อครั้ง (คำค้นสั้น/กว้าง เช่น '67' ไม่ต้องดึงทั้งโรงเรียน)
+ADMIN_SECTIONS = ["📊 ภาพรวม", "🔎 ค้นหาข้อมูล", "📤 นำเข้าข้อมูล", "🔑 รหัสผ่าน", "📝 จัดการข้อสอบ", "📈 รายงานผลสอบ", "📺 จัดการห้องเรียน", "🎯 ติวเข้ม", "⏱️ ประสิทธิภาพ"]
+PERF_LOG = "perf_log.jsonl"  # ไฟล์ JSON lines ของ perf (เปิด/ปิดในแท็บ ⏱️ ประสิทธิภาพ)
+
+
 def admin_page():
     st.title("⚙️ Admin Panel")
-    conn = init_db()
+    conn = db.reader()
     
-    # เพิ่ม Tab 5: จัดการข้อสอบ
-    tab1, tab2, tab3, tab4, tab5, tab6, tab7, tab8 = st.tabs(["📊 ภาพรวม", "🔎 ค้นหาข้อมูล", "📤 นำเข้าข้อมูล", "🔑 รหัสผ่าน", "📝 จัดการข้อสอบ", "📈 รายงานผลสอบ","📺 จัดการห้องเรียน","🎯 ติวเข้ม"])
+    # เมนูแทน st.tabs: st.tabs รันโค้ด/query ของทุกแท็บทุก rerun -> รันเฉพาะส่วนที่เลือก (จำส่วนที่เลือกไว้ใน session)
+    tab1, tab2, tab3, tab4, tab5, tab6, tab7, tab8, tab9 = ADMIN_SECTIONS
+    section = st.radio("เมนูผู้ดูแลระบบ", ADMIN_SECTIONS, horizontal=True, key="admin_section", label_visibility="collapsed")
+    perf.set_section(section)
+    st.divider()
     
     try: cur_sem = conn.execute("SELECT MAX(semestry) FROM grades").fetchone()[0]
     except: cur_sem = "-"
 
-    with tab1:
+    if section == tab1:
         st.info(f"📌 ภาคเรียนล่าสุด: {cur_sem}")
         n_std_active = 0
         n_tea_active = 0
@@ -879,6 +728,10 @@ def admin_page():
         c1, c2 = st.columns(2)
         c1.metric("จำนวนครู (กลุ่มที่ Active)", f"{n_tea_active} คน")
         c2.metric(f"นักศึกษา (ลงทะเบียน {cur_sem})", f"{n_std_active} คน")
+        if replicator:
+            rs = replicator.status()
+            st.caption(f"☁️ ซิงก์ Google Sheets: รอส่ง {rs['pending']} รายการ" + (f" | ⚠️ {rs['last_error']}" if rs['last_error'] else "")
+                       + (f" | ข้ามแถวรหัสไม่ถูกต้อง {rs['skipped']} แถว (ล่าสุด {rs['last_skipped'][0]} แถว {rs['last_skipped'][1]})" if rs['skipped'] else ""))
         
         st.divider()
         st.markdown(f"**📈 แยกตามระดับชั้น (เฉพาะที่ลงทะเบียน {cur_sem})**")
@@ -898,24 +751,22 @@ def admin_page():
                 col3.info(f"ม.ปลาย: {v_high} คน")
             else: st.warning("ไม่มีข้อมูลการลงทะเบียนในเทอมล่าสุด")
 
-    with tab2:
+    if section == tab2:
         st.markdown("#### 🔍 ค้นหาข้อมูลครูและนักศึกษา")
         search_type = st.radio("เลือกประเภทข้อมูล:", ["นักศึกษา", "ครูที่ปรึกษา"], horizontal=True)
         search_kw = st.text_input("พิมพ์ชื่อ หรือ รหัส เพื่อค้นหา...", "")
         
         if search_kw:
             if search_type == "นักศึกษา":
-                q = f"%{search_kw}%"
-                sql = "SELECT std_id, prefix, name, surname, grp_code, level FROM students WHERE std_id LIKE ? OR name LIKE ? OR surname LIKE ?"
-                res = pd.read_sql(sql, conn, params=(q, q, q))
+                res = pd.DataFrame(search_students(conn, search_kw, SEARCH_LIMIT + 1), columns=['std_id', 'prefix', 'name', 'surname', 'grp_code', 'level'])
+                if len(res) > SEARCH_LIMIT:
+                    st.caption(f"แสดง {SEARCH_LIMIT} รายการแรก — พิมพ์คำค้นให้เจาะจงขึ้นเพื่อดูผลที่เหลือ")
+                    res = res.head(SEARCH_LIMIT)
                 if not res.empty:
-                    res['level'] = res.apply(lambda x: x['level'] if x['level'] else get_level_from_id(x['std_id']), axis=1)
                     st.dataframe(res.rename(columns={'std_id':'รหัส','name':'ชื่อ','surname':'นามสกุล','grp_code':'กลุ่ม','level':'ระดับ'}), use_container_width=True, hide_index=True)
                 else: st.warning("ไม่พบข้อมูล")
             else:
-                q = f"%{search_kw}%"
-                sql = "SELECT grp_code, teacher_name FROM groups WHERE grp_code LIKE ? OR teacher_name LIKE ?"
-                res = pd.read_sql(sql, conn, params=(q, q))
+                res = pd.DataFrame(search_groups(conn, search_kw), columns=['grp_code', 'teacher_name'])
                 if not res.empty:
                     st.dataframe(res.rename(columns={'grp_code':'รหัสกลุ่ม','teacher_name':'ชื่อครู'}), use_container_width=True, hide_index=True)
                 else: st.warning("ไม่พบข้อมูล")
@@ -928,86 +779,69 @@ def admin_page():
                 res = pd.read_sql("SELECT * FROM groups LIMIT 50", conn)
                 st.dataframe(res, use_container_width=True, hide_index=True)
 
-    with tab3:
-        st.info("อัปโหลดไฟล์ ZIP (ข้อมูลจะถูกบันทึกทับของเดิม)")
+    if section == tab3:
+        st.info("อัปโหลดไฟล์ ZIP (โหมดแทนที่: ข้อมูลจะถูกบันทึกทับของเดิม / โหมด delta: ปรับเฉพาะแถวที่เปลี่ยน) — ระหว่างนำเข้าผู้ใช้ยังเห็นข้อมูลเดิมครบ")
         uploaded = st.file_uploader("Upload ZIP", type='zip')
+        import_modes = {"แทนที่ทั้งหมด": 'staged', "เฉพาะที่เปลี่ยนแปลง (delta)": 'delta'}
+        import_mode = import_modes[st.radio("โหมดนำเข้า", list(import_modes), horizontal=True)]
+        c_par, c_wk = st.columns(2)
+        use_parallel = c_par.checkbox("⚡ นำเข้าแบบขนาน (หลาย process)", value=importer.IMPORT_WORKERS > 1)
+        n_workers = c_wk.number_input("จำนวน process", min_value=1, max_value=max(os.cpu_count() or 1, 1), value=importer.IMPORT_WORKERS, disabled=not use_parallel)
+        if 'import_report' in st.session_state:
+            with st.expander("⏱️ ผลการนำเข้าครั้งล่าสุด (เวลาแยกรายไฟล์)", expanded=True):
+                report = st.session_state.import_report
+                for r in report:
+                    if r['error']: st.warning(f"⚠️ อ่านไฟล์ {r['file']} ไม่ได้: {r['error']}")
+                # อ่าน/แปลง (รวมทุก process) vs เขียนลงฐานข้อมูล
+                st.dataframe(pd.DataFrame([{'ไฟล์': r['file'], 'แถว': r['records'],
+                                            'อ่าน/แปลง (วินาที)': round(r['decode_s'], 2), 'เขียน DB (วินาที)': round(r['write_s'], 2),
+                                            'แถว/วินาที': round(r['records'] / r['seconds']) if r['seconds'] else 0} for r in report]),
+                             hide_index=True, use_container_width=True)
+                summary = st.session_state.get('import_summary') or {}
+                if summary.get('swap_s') is not None:
+                    st.caption(f"🔀 สลับตารางใหม่เข้าระบบใช้เวลา {summary['swap_s'] * 1000:,.1f} ms")
+                changes = summary.get('changes')
+                if changes:
+                    st.markdown("**🔁 การเปลี่ยนแปลงรายตาราง (delta)**")
+                    st.dataframe(pd.DataFrame([{'ตาราง': t, 'เพิ่ม': c['inserted'], 'แก้ไข': c['updated'], 'ลบ': c['deleted'], 'ไม่เปลี่ยน': c['unchanged']}
+                                               for t, c in changes.items()]), hide_index=True, use_container_width=True)
         if uploaded and st.button("เริ่มนำเข้าข้อมูล", type="primary"):
             progress = st.progress(0); status = st.empty()
             try:
-                c = conn.cursor()
-                for t in ['grades', 'schedule', 'subjects', 'activities', 'students', 'groups']: c.execute(f"DELETE FROM {t}")
-                c.execute("DELETE FROM users WHERE role != 'admin'")
-                conn.commit()
-                
-                with zipfile.ZipFile(uploaded) as z:
-                    files = [f for f in z.namelist() if f.lower().endswith('.dbf')]
-                    d_std, d_grd, d_sch, d_sub, d_act, d_grp, users = [], [], [], [], [], [], []
-                    
-                    for i, fname in enumerate(files):
-                        progress.progress((i+1)/len(files))
-                        status.text(f"Processing: {fname}...")
-                        
-                        with tempfile.NamedTemporaryFile(delete=False) as tmp: 
-                            tmp.write(z.read(fname)); tmp_path = tmp.name
-                        df = read_dbf_robust(tmp_path)
-                        try: os.remove(tmp_path)
-                        except: pass
-                        if df.empty: continue
-                        
-                        fn = fname.lower()
-                        if 'student' in fn or 'reg' in fn:
-                            for _, r in df.iterrows():
-                                sid = clean_id_card(str(r.get('STD_CODE', r.get('ID',''))))[-10:]
-                                if sid:
-                                    lvl = get_level_from_id(sid) 
-                                    d_std.append((sid, r.get('PRENAME',''), r.get('NAME',''), r.get('SURNAME',''), r.get('GRP_CODE',''), str(r.get('PHONE','')), clean_id_card(r.get('CARDID','')), lvl))
-                        elif 'grade' in fn:
-                            for _, r in df.iterrows():
-                                sid = clean_id_card(str(r.get('STD_CODE','')))[-10:]
-                                d_grd.append((sid, str(r.get('SUB_CODE','')).strip(), str(r.get('SEMESTRY','')), str(r.get('GRADE','')), str(r.get('GRP_CODE',''))))
-                        elif 'activit' in fn:
-                            for _, r in df.iterrows():
-                                sid = clean_id_card(str(r.get('STD_CODE','')))[-10:]
-                                aname = str(r.get('ACT_NAME', r.get('ACTIVITY', r.get('NAME', ''))))
-                                d_act.append((sid, str(r.get('SEMESTRY','')), aname, 'กพช.', r.get('HOUR',0)))
-                        elif 'group' in fn:
-                            for _, r in df.iterrows():
-                                gc, tn = str(r.get('GRP_CODE','')).strip(), str(r.get('TEACHER_NAME', r.get('GRP_ADVIS',''))).strip()
-                                d_grp.append((gc, tn))
-                                users.append((gc, gc, 'teacher', tn, gc))
-                        elif 'schedule' in fn:
-                            for _, r in df.iterrows(): d_sch.append((str(r.get('SUB_CODE','')), str(r.get('SEMESTRY','')), str(r.get('EXAM_DAY','')), str(r.get('EXAM_START','')), str(r.get('EXAM_END',''))))
-                        elif 'subject' in fn:
-                            for _, r in df.iterrows(): d_sub.append((str(r.get('SUB_CODE','')), str(r.get('SUB_NAME',''))))
-
-                c.executemany("INSERT OR REPLACE INTO students VALUES (?,?,?,?,?,?,?,?)", d_std)
-                c.executemany("INSERT INTO grades VALUES (?,?,?,?,?)", d_grd)
-                c.executemany("INSERT INTO schedule VALUES (?,?,?,?,?)", d_sch)
-                c.executemany("INSERT OR REPLACE INTO subjects VALUES (?,?)", d_sub)
-                c.executemany("INSERT INTO activities VALUES (?,?,?,?,?)", d_act)
-                c.executemany("INSERT OR REPLACE INTO groups VALUES (?,?)", d_grp)
-                c.executemany("INSERT OR IGNORE INTO users VALUES (?,?,?,?,?)", users)
-                conn.commit()
+                # อ่านทีละ batch จากไฟล์ใน ZIP โดยตรง แล้ว insert ทีละก้อน (หน่วยความจำคงที่)
+                def on_progress(fname, done, total, secs):
+                    rate = done / secs if secs > 0 else 0
+                    progress.progress(min(done / total, 1.0) if total else 1.0,
+                                      text=f"{fname}: {done:,}/{total:,} แถว ({rate:,.0f} แถว/วินาที)")
+
+                if use_parallel:
+                    report, summary = importer.import_zip_parallel(db, uploaded, workers=int(n_workers), on_progress=on_progress, mode=import_mode)
+                else:
+                    report, summary = importer.import_zip(db, uploaded, on_progress=on_progress, mode=import_mode)
+                st.session_state.import_report = report
+                st.session_state.import_summary = summary
                 
                 status.success("✅ นำเข้าข้อมูลสำเร็จ! ระบบจะรีเฟรชใน 2 วินาที...")
                 time.sleep(2) 
                 st.rerun()
                 
+            except importer.ImportValidationError as e: st.error(f"❌ ข้อมูลไม่ผ่านการตรวจสอบ (ข้อมูลเดิมยังอยู่ครบ): {e}")
             except Exception as e: st.error(f"Error: {e}")
 
-    with tab4:
+    if section == tab4:
         st.markdown("#### 🔐 รีเซ็ตรหัสผ่าน")
         with st.form("reset"):
             u = st.text_input("Username")
             p = st.text_input("New Password", type="password")
             if st.form_submit_button("Submit"):
                 if conn.execute("SELECT * FROM users WHERE username=?", (u,)).fetchone():
-                    conn.execute("UPDATE users SET password=? WHERE username=?", (p, u))
-                    conn.commit(); st.success("Success")
+                    with db.writer() as w: w.execute("UPDATE users SET password=? WHERE username=?", (p, u))
+                    session_store.revoke_user(u)  # ออกจากระบบทุกเครื่องที่ใช้รหัสเดิม
+                    st.success("Success")
                 else: st.error("User not found")
     
     # --- ส่วนที่เพิ่ม: หน้าจัดการข้อสอบ ---
-    with tab5:
+    if section == tab5:
         st.markdown("#### 📝 จัดการข้อสอบ")
 
         # --- ส่วนที่ 1: Master Switch (เปิด-ปิด ทั้งระบบ) ---
@@ -1015,15 +849,13 @@ def admin_page():
         c_master1, c_master2 = st.columns(2)
         with c_master1:
             if st.button("🟢 เปิดสอบทุกวิชา (Open All)", use_container_width=True):
-                conn.execute("UPDATE exams SET is_active = 1")
-                conn.commit()
+                with db.writer() as w: w.execute("UPDATE exams SET is_active = 1")
                 st.success("เปิดระบบสอบทุกวิชาแล้ว!")
                 time.sleep(1)
                 st.rerun()
         with c_master2:
             if st.button("🔴 ปิดสอบทุกวิชา (Close All)", type="primary", use_container_width=True):
-                conn.execute("UPDATE exams SET is_active = 0")
-                conn.commit()
+                with db.writer() as w: w.execute("UPDATE exams SET is_active = 0")
                 st.error("ปิดระบบสอบทุกวิชาแล้ว!")
                 time.sleep(1)
                 st.rerun()
@@ -1035,11 +867,10 @@ def admin_page():
         # --- Column 1: สร้างและเลือกข้อสอบ ---
         with c1:
             st.write("**1. สร้างชุดข้อสอบใหม่**")
-            all_subs = pd.read_sql("SELECT sub_code, sub_name FROM subjects", conn)
+            all_subs = get_refdata(db).subjects
             
-            if not all_subs.empty:
-                all_subs['display'] = all_subs['sub_code'] + " - " + all_subs['sub_name']
-                selected_sub = st.selectbox("เลือกรายวิชา", all_subs['display'])
+            if all_subs:
+                selected_sub = st.selectbox("เลือกรายวิชา", [f"{c} - {n}" for c, n in all_subs])
                 sel_sub_code = selected_sub.split(" - ")[0]
             else:
                 st.error("ไม่พบฐานข้อมูลรายวิชา")
@@ -1050,31 +881,33 @@ def admin_page():
 
             if st.button("สร้างข้อสอบ", type="primary"):
                 if exam_name and sel_sub_code and exam_sem:
-                    conn.execute("INSERT INTO exams (exam_name, sub_code, semestry, is_active) VALUES (?, ?, ?, 0)", 
-                                 (f"{sel_sub_code} {exam_name}", sel_sub_code, exam_sem))
-                    conn.commit()
+                    with db.writer() as w:
+                        w.execute("INSERT INTO exams (exam_name, sub_code, semestry, is_active) VALUES (?, ?, ?, 0)", 
+                                  (f"{sel_sub_code} {exam_name}", sel_sub_code, exam_sem))
                     st.success(f"สร้างข้อสอบ {sel_sub_code} เรียบร้อย!")
                     time.sleep(0.5)
                     st.rerun()
 
             st.divider()
             st.write("**2. เลือกข้อสอบเพื่อจัดการ**")
-            exams = pd.read_sql("SELECT * FROM exams ORDER BY exam_id DESC", conn)
+            exams = pd.read_sql("SELECT e.*, coalesce(m.submissions, 0) AS submissions FROM exams e "
+                                "LEFT JOIN exam_summary m ON m.exam_id = e.exam_id ORDER BY e.exam_id DESC", conn)
             
             if not exams.empty:
                 def fmt_exam(x):
                     row = exams[exams['exam_id'] == x].iloc[0]
                     status = "🟢 ON" if row['is_active'] else "🔴 OFF"
-                    return f"{status} | {row['sub_code']} {row['exam_name']}"
+                    return f"{status} | {row['sub_code']} {row['exam_name']} (ส่งแล้ว {row['submissions']} คน)"
 
                 sel_exam_id = st.selectbox("เลือกข้อสอบ:", exams['exam_id'], format_func=fmt_exam)
                 
                 # ปุ่มลบข้อสอบทั้งชุด
                 if st.button("🗑️ ลบชุดข้อสอบนี้ทิ้ง", type="secondary", use_container_width=True):
-                    conn.execute("DELETE FROM exams WHERE exam_id=?", (sel_exam_id,))
-                    conn.execute("DELETE FROM exam_questions WHERE exam_id=?", (sel_exam_id,))
-                    conn.execute("DELETE FROM exam_results WHERE exam_id=?", (sel_exam_id,))
-                    conn.commit()
+                    with db.writer(bump=(exam_version(sel_exam_id), 'results', 'exams')) as w:
+                        w.execute("DELETE FROM exams WHERE exam_id=?", (sel_exam_id,))
+                        w.execute("DELETE FROM exam_questions WHERE exam_id=?", (sel_exam_id,))
+                        w.execute("DELETE FROM exam_results WHERE exam_id=?", (sel_exam_id,))
+                        rebuild_summaries(w)
                     st.rerun()
             else:
                 sel_exam_id = None
@@ -1100,21 +933,21 @@ def admin_page():
                         req_cols = ['Question', 'A', 'B', 'C', 'D', 'Correct']
                         if all(col in df_ex.columns for col in req_cols):
                             count = 0
-                            for _, r in df_ex.iterrows():
-                                # แปลงทุกอย่างเป็น String ป้องกัน Error
-                                q_text = str(r['Question'])
-                                ca = str(r['A'])
-                                cb = str(r['B'])
-                                cc = str(r['C'])
-                                cd = str(r['D'])
-                                corr = str(r['Correct']).upper().strip() # ทำให้เป็นตัวใหญ่ A,B,C,D
-                                
-                                conn.execute("""INSERT INTO exam_questions 
+                            with db.writer(bump=exam_version(sel_exam_id)) as w:
+                                for _, r in df_ex.iterrows():
+                                    # แปลงทุกอย่างเป็น String ป้องกัน Error
+                                    q_text = str(r['Question'])
+                                    ca = str(r['A'])
+                                    cb = str(r['B'])
+                                    cc = str(r['C'])
+                                    cd = str(r['D'])
+                                    corr = str(r['Correct']).upper().strip() # ทำให้เป็นตัวใหญ่ A,B,C,D
+                                    
+                                    w.execute("""INSERT INTO exam_questions 
                                                 (exam_id, question_text, choice_a, choice_b, choice_c, choice_d, correct_answer) 
                                                 VALUES (?,?,?,?,?,?,?)""", 
-                                             (sel_exam_id, q_text, ca, cb, cc, cd, corr))
-                                count += 1
-                            conn.commit()
+                                              (sel_exam_id, q_text, ca, cb, cc, cd, corr))
+                                    count += 1
                             st.success(f"นำเข้าเรียบร้อย {count} ข้อ")
                             time.sleep(1)
                             st.rerun()
@@ -1135,9 +968,9 @@ def admin_page():
                         correct = st.selectbox("เฉลย", ["A", "B", "C", "D"])
                         
                         if st.form_submit_button("บันทึกคำถาม"):
-                            conn.execute("INSERT INTO exam_questions (exam_id, question_text, choice_a, choice_b, choice_c, choice_d, correct_answer) VALUES (?,?,?,?,?,?,?)",
-                                         (sel_exam_id, q_text, choice_a, choice_b, choice_c, choice_d, correct))
-                            conn.commit()
+                            with db.writer(bump=exam_version(sel_exam_id)) as w:
+                                w.execute("INSERT INTO exam_questions (exam_id, question_text, choice_a, choice_b, choice_c, choice_d, correct_answer) VALUES (?,?,?,?,?,?,?)",
+                                          (sel_exam_id, q_text, choice_a, choice_b, choice_c, choice_d, correct))
                             st.success("เพิ่มแล้ว")
                             st.rerun()
 
@@ -1163,40 +996,28 @@ def admin_page():
                                 c_btn1, c_btn2 = st.columns(2)
                                 with c_btn1:
                                     if st.form_submit_button("💾 บันทึกการแก้ไข"):
-                                        conn.execute("""UPDATE exam_questions SET 
+                                        with db.writer(bump=exam_version(sel_exam_id)) as w:
+                                            w.execute("""UPDATE exam_questions SET 
                                                         question_text=?, choice_a=?, choice_b=?, choice_c=?, choice_d=?, correct_answer=? 
                                                         WHERE id=?""", 
-                                                     (new_q, new_a, new_b, new_c, new_d, new_correct, row['id']))
-                                        conn.commit()
+                                                      (new_q, new_a, new_b, new_c, new_d, new_correct, row['id']))
                                         st.success("แก้ไขเรียบร้อย")
                                         time.sleep(0.5)
                                         st.rerun()
                                 with c_btn2:
                                     if st.form_submit_button("🗑️ ลบข้อนี้", type="primary"):
-                                        conn.execute("DELETE FROM exam_questions WHERE id=?", (row['id'],))
-                                        conn.commit()
+                                        with db.writer(bump=exam_version(sel_exam_id)) as w: w.execute("DELETE FROM exam_questions WHERE id=?", (row['id'],))
                                         st.warning("ลบแล้ว")
                                         time.sleep(0.5)
                                         st.rerun()
                 else:
                     st.info("ยังไม่มีคำถามในชุดนี้")
 # --- ส่วนที่เพิ่ม: Tab 6 รายงานผลสอบรวม + สถิติสรุป ---
-    with tab6:
+    if section == tab6:
         st.subheader("📊 สรุปสถิติการเข้าสอบแบบละเอียด")
         
-        # 1. Auto-Detect Column Name
-        target_col = None
-        try:
-            test_df = pd.read_sql("SELECT * FROM grades LIMIT 1", conn)
-            if 'term' in test_df.columns: target_col = 'term'
-            elif 'semestry' in test_df.columns: target_col = 'semestry'
-        except: pass
-
-        if not target_col:
-             st.error("⚠️ ไม่พบคอลัมน์ระบุภาคเรียน (term/semestry)")
-             st.stop()
-        
-        # 2. เลือกภาคเรียน
+        # 1. เลือกภาคเรียน
+        target_col = 'semestry'
         try:
             all_terms = pd.read_sql(f"SELECT DISTINCT {target_col} FROM grades ORDER BY {target_col} DESC", conn)
             term_options = all_terms[target_col].dropna().tolist()
@@ -1210,208 +1031,101 @@ def admin_page():
                 selected_term = st.selectbox("📅 เลือกภาคเรียน", term_options, index=0)
             
             # -------------------------------------------------------------
-            # 🔥 CORE LOGIC ใหม่: ดึงรหัสวิชา (sub_code) มาช่วยแยกระดับชั้น
+            # 🔥 CORE LOGIC: กลุ่ม x ระดับชั้น นับใน SQL ครั้งเดียว เฉพาะข้อสอบของเทอมที่เลือก (cache ตามเวอร์ชันข้อมูล)
             # -------------------------------------------------------------
-            # ดึง std_id, grp_code และ sub_code (เอามาแค่วิชาเดียวต่อคนก็พอ เพื่อเช็คระดับ)
-            sql_active = f"""
-                SELECT s.std_id, s.grp_code, g.sub_code
-                FROM students s
-                JOIN grades g ON s.std_id = g.std_id
-                WHERE g.{target_col} = ?
-                GROUP BY s.std_id  -- 1 คน เอามา 1 แถวพอ (ลดความซ้ำซ้อน)
-            """
-            df_active = pd.read_sql(sql_active, conn, params=(selected_term,))
-            
-            # ดึงข้อมูลคนเข้าสอบ
-            submitted_ids = set(pd.read_sql("SELECT DISTINCT std_id FROM exam_results", conn)['std_id'].astype(str))
-            
-            # ดึงรายชื่อครู
-            teachers = pd.read_sql("SELECT name, assigned_group FROM users WHERE role='teacher'", conn)
-            teacher_map = dict(zip(teachers['assigned_group'], teachers['name']))
-
-            if not df_active.empty:
-                df_active['std_id'] = df_active['std_id'].astype(str).str.strip()
-                
-                # --- ฟังก์ชันแยกระดับชั้นจาก "รหัสวิชา" (แม่นยำกว่ารหัสนักศึกษา) ---
-                def get_level_code(sub_code):
-                    if not isinstance(sub_code, str): return 'Unknown'
-                    # หาตัวเลขแรกที่เจอในรหัสวิชา (เช่น ทร21001 -> เจอเลข 2)
-                    import re
-                    match = re.search(r'\d', sub_code)
-                    if match:
-                        digit = match.group(0)
-                        if digit == '1': return '1' # ประถม
-                        if digit == '2': return '2' # ม.ต้น
-                        if digit == '3': return '3' # ม.ปลาย
-                    return 'Unknown'
-
-                # สร้างคอลัมน์ Level ใหม่ใน DataFrame เลย
-                df_active['level_id'] = df_active['sub_code'].apply(get_level_code)
+            att = get_attendance(db, selected_term)
+            ref = get_refdata(db)
 
+            if att.registered:
                 # --- A. Dashboard ภาพรวม ---
-                total_std = len(df_active)
-                total_att = df_active['std_id'].apply(lambda x: 1 if x in submitted_ids else 0).sum()
-                total_abs = total_std - total_att
-                percent = (total_att / total_std * 100) if total_std > 0 else 0
-                
                 st.markdown(f"### 📌 ภาพรวมประจำเทอม {selected_term}")
                 m1, m2, m3, m4 = st.columns(4)
-                m1.metric("นศ. ลงทะเบียน", f"{total_std:,}", "คน")
-                m2.metric("เข้าสอบแล้ว", f"{total_att:,}", "คน")
-                m3.metric("ขาดสอบ", f"{total_abs:,}", "คน")
-                m4.metric("ร้อยละการเข้าสอบ", f"{percent:.2f}%")
+                m1.metric("นศ. ลงทะเบียน", f"{att.registered:,}", "คน")
+                m2.metric("เข้าสอบแล้ว", f"{att.attended:,}", "คน")
+                m3.metric("ขาดสอบ", f"{att.absent:,}", "คน")
+                m4.metric("ร้อยละการเข้าสอบ", f"{att.percent:.2f}%")
                 
                 st.divider()
 
-                # --- B. ตารางแยกรายกลุ่ม (คำนวณใหม่) ---
-                stats_data = []
-                active_groups = sorted(df_active['grp_code'].dropna().unique())
-                
-                for grp in active_groups:
-                    g_students = df_active[df_active['grp_code'] == grp]
-                    if g_students.empty: continue
-                        
-                    t_name = teacher_map.get(grp, "(ไม่พบข้อมูลครู)")
-                    row = {"กลุ่มเรียน": grp, "ครูที่ปรึกษา": t_name}
-                    
-                    # ฟังก์ชันนับตาม Level ID ที่เราสร้างไว้
-                    def count_by_level(lvl_id):
-                        subset = g_students[g_students['level_id'] == lvl_id]
-                        tot = len(subset)
-                        att = subset['std_id'].apply(lambda x: 1 if x in submitted_ids else 0).sum()
-                        ab = tot - att
-                        return tot, att, ab
-
-                    # นับแยกชั้น (ดูจากรหัสวิชา)
-                    p_tot, p_att, p_abs = count_by_level('1')  # ประถม
-                    m1_tot, m1_att, m1_abs = count_by_level('2') # ม.ต้น
-                    m2_tot, m2_att, m2_abs = count_by_level('3') # ม.ปลาย
-                    
-                    row.update({
-                        'ประถม-ทั้งหมด': p_tot, 'ประถม-เข้าสอบ': p_att, 'ประถม-ขาดสอบ': p_abs,
-                        'ม.ต้น-ทั้งหมด': m1_tot, 'ม.ต้น-เข้าสอบ': m1_att, 'ม.ต้น-ขาดสอบ': m1_abs,
-                        'ม.ปลาย-ทั้งหมด': m2_tot, 'ม.ปลาย-เข้าสอบ': m2_att, 'ม.ปลาย-ขาดสอบ': m2_abs
-                    })
-                    
-                    # รวมกลุ่ม (นับจาก g_students ตรงๆ เพื่อกันพลาดกรณี Unknown Level)
-                    g_tot = len(g_students)
-                    g_att = g_students['std_id'].apply(lambda x: 1 if x in submitted_ids else 0).sum()
-                    g_abs = g_tot - g_att
-                    g_per = (g_att / g_tot * 100) if g_tot > 0 else 0
-                    
-                    row.update({
-                        'รวม-ทั้งหมด': g_tot, 
-                        'รวม-เข้าสอบ': g_att, 
-                        'รวม-ขาดสอบ': g_abs, 
-                        'ร้อยละ(%)': f"{g_per:.2f}%"
-                    })
-                    
-                    stats_data.append(row)
-                
-                if stats_data:
-                    df_stats = pd.DataFrame(stats_data)
-                    # เลือกแสดงคอลัมน์
-                    cols = ["กลุ่มเรียน", "ครูที่ปรึกษา", 
-                            "ประถม-ทั้งหมด", "ประถม-เข้าสอบ", "ประถม-ขาดสอบ",
-                            "ม.ต้น-ทั้งหมด", "ม.ต้น-เข้าสอบ", "ม.ต้น-ขาดสอบ",
-                            "ม.ปลาย-ทั้งหมด", "ม.ปลาย-เข้าสอบ", "ม.ปลาย-ขาดสอบ",
-                            "รวม-ทั้งหมด", "รวม-เข้าสอบ", "รวม-ขาดสอบ", "ร้อยละ(%)"]
-                    final_cols = [c for c in cols if c in df_stats.columns]
-                    
+                # --- B. ตารางแยกรายกลุ่ม ---
+                df_stats = att.by_group(lambda grp: ref.teacher_name(grp, "(ไม่พบข้อมูลครู)"))
+                if not df_stats.empty:
                     st.markdown("### 📋 รายละเอียดรายกลุ่ม")
-                    st.dataframe(df_stats[final_cols], use_container_width=True, hide_index=True)
+                    st.dataframe(df_stats, use_container_width=True, hide_index=True)
                     
-                    csv = df_stats[final_cols].to_csv(index=False).encode('utf-8-sig')
-                    st.download_button("📥 ดาวน์โหลด (CSV)", csv, f"Report_{selected_term.replace('/','-')}.csv")
+                    report_name = f"Report_{selected_term.replace('/','-')}"
+                    for col, fmt in zip(st.columns([1, 1, 2])[:2], ('csv', 'xlsx')):
+                        col.download_button(f"📥 ดาวน์โหลด ({fmt.upper()})", download(lambda fmt=fmt: export_bytes(fmt, list(df_stats.columns), frame_rows(df_stats))),
+                                            f"{report_name}.{fmt}", MIME[fmt], key=f"dl_stats_{fmt}")
             else:
                 st.warning(f"ไม่พบนักศึกษาลงทะเบียนในเทอม {selected_term}")
 
+            # ตารางสรุปถูกอัปเดตทีละ batch ตอนบันทึกผลสอบ -> ตรวจเทียบกับการคำนวณใหม่ทั้งหมดได้ (ใช้เวลาเท่าคำนวณเต็ม)
+            with st.expander("🧮 ตรวจความถูกต้องของตารางสรุป"):
+                if st.button("ตรวจเทียบกับการคำนวณใหม่", key="check_summaries"):
+                    diffs = check_summaries(conn)
+                    if not diffs: st.success("ตารางสรุปตรงกับข้อมูลจริงทั้งหมด")
+                    else:
+                        st.error(f"ไม่ตรงกัน {len(diffs)} รายการ")
+                        st.dataframe(pd.DataFrame(diffs, columns=['ตาราง', 'key', 'ค่าที่เก็บไว้', 'ค่าที่ถูกต้อง']).astype(str), hide_index=True)
+                if st.button("คำนวณตารางสรุปใหม่ทั้งหมด", key="rebuild_summaries"):
+                    with db.writer(bump='results') as w: rebuild_summaries(w)
+                    st.success("คำนวณใหม่เรียบร้อย")
+
             # --- C. ตารางคะแนนรายบุคคล ---
             st.divider()
             st.subheader("📈 คะแนนสอบรายบุคคล (Filtered)")
             search_res = st.text_input("🔎 กรองข้อมูล:", "")
+            # ไฟล์ทั้งเทอม: เขียนจาก SQL ทีละ chunk ตอนกดเท่านั้น แล้ว cache ไว้จนกว่าจะมีผลสอบ/ข้อมูลใหม่
+            for col, fmt in zip(st.columns([1, 1, 2])[:2], ('csv', 'xlsx')):
+                col.download_button(f"📥 คะแนนทั้งเทอม ({fmt.upper()})", download(lambda fmt=fmt: term_scores_export(db, selected_term, fmt)),
+                                    f"Scores_{selected_term.replace('/','-')}.{fmt}", MIME[fmt], key=f"dl_term_scores_{fmt}")
             
-            sql_report = f"""
-                SELECT 
-                    r.timestamp, r.std_id, 
-                    s.prefix || s.name || ' ' || s.surname as fullname,
-                    s.grp_code, e.sub_code, e.exam_name, r.score, r.total_score
-                FROM exam_results r
-                JOIN students s ON r.std_id = s.std_id
-                JOIN grades g ON r.std_id = g.std_id
-                LEFT JOIN exams e ON r.exam_id = e.exam_id
-                WHERE g.{target_col} = ?
-                GROUP BY r.id
-                ORDER BY r.timestamp DESC
-            """
             try:
-                df_report = pd.read_sql(sql_report, conn, params=(selected_term,))
-                if not df_report.empty:
-                    df_report.columns = ['เวลาส่ง', 'รหัสนักศึกษา', 'ชื่อ-นามสกุล', 'กลุ่ม', 'รหัสวิชา', 'ชื่อข้อสอบ', 'คะแนน', 'คะแนนเต็ม']
-                    if search_res:
-                        mask = df_report.astype(str).apply(lambda x: x.str.contains(search_res, case=False)).any(axis=1)
-                        df_report = df_report[mask]
-                    
-                    df_report.insert(0, 'ลำดับ', range(1, len(df_report) + 1))
+                # ตารางบนจอ: ดึงจาก SQL ทีละหน้า (คำค้นกรองใน SQL) ไม่โหลดทั้งเทอมทุก rerun
+                if st.session_state.get('term_scores_filter') != (search_res, selected_term):
+                    st.session_state.term_scores_filter = (search_res, selected_term)
+                    st.session_state.term_scores_page = 1
+                page = term_scores_page(conn, selected_term, search_res, st.session_state.get('term_scores_page', 1) - 1)
+                if page.total:
+                    first = page.page * PREVIEW_PAGE_SIZE + 1
+                    df_report = pd.DataFrame(page.rows, columns=TERM_SCORES_HEADER)
+                    df_report.insert(0, 'ลำดับ', range(first, first + len(df_report)))
+                    st.write(f"แสดงผล: {page.total} รายการ" + (f" (หน้า {page.page + 1}/{page.pages})" if page.pages > 1 else ""))
                     st.dataframe(df_report, use_container_width=True, hide_index=True)
+                    if page.pages > 1:
+                        st.number_input(f"หน้า (จาก {page.pages})", min_value=1, max_value=page.pages, key="term_scores_page")
                 else:
-                    st.info("ยังไม่มีข้อมูลการสอบในเทอมนี้")
+                    st.info("ไม่พบข้อมูลที่ค้นหา" if search_res else "ยังไม่มีข้อมูลการสอบในเทอมนี้")
             except Exception as e:
                 st.error(f"Error: {e}")
-    with tab7:
+    if section == tab7:
         st.subheader("📺 จัดการวิดีโอการสอน (Online Classroom)")
         
-        # ✅ แก้ตรงนี้: เชื่อมต่อฐานข้อมูลใหม่ใน Tab นี้เลย ป้องกัน Error หาตัวแปร c ไม่เจอ
-        conn = init_db()
-        c = conn.cursor()
-        
+        ref = get_refdata(db)
         # ฟอร์มเพิ่มวิดีโอ
         with st.expander("➕ เพิ่มวิดีโอใหม่", expanded=True):
             with st.form("add_video_form_tab"):
-                # รายชื่อวิชา
-                subject_map_video = {
-                    'ทช11001': 'เศรษฐกิจพอเพียง',
-                    'พท11001': 'ภาษาไทย',
-                    'พค11001': 'คณิตศาสตร์',
-                    'พด11001': 'พลศึกษา/สุขศึกษา',
-                    'อช11001': 'ช่องทางการเข้าสู่อาชีพ',
-                    'สค11001': 'สังคมศึกษา',
-                    'ทข11002': 'สุขศึกษา พลศึกษา'
-                }
-                sub_opts = [f"{k} : {v}" for k, v in subject_map_video.items()]
+                # รายชื่อวิชา (จากตาราง subjects)
+                sub_opts = [f"{k} : {v}" for k, v in ref.subjects]
                 
                 c_vid1, c_vid2 = st.columns(2)
                 with c_vid1:
                     sel_sub_full = st.selectbox("เลือกวิชา", sub_opts)
                     # ตัดเอาแค่รหัสวิชา (ตัวหน้าก่อนเครื่องหมาย :)
-                    sel_sub_code = sel_sub_full.split(":")[0].strip()
+                    sel_sub_code = sel_sub_full.split(":")[0].strip() if sel_sub_full else None
                 with c_vid2:
                     topic = st.text_input("ชื่อเรื่อง / หัวข้อ")
                 
                 url = st.text_input("ลิงก์ YouTube (URL)")
                 
                 if st.form_submit_button("บันทึกวิดีโอ"):
-                    if topic and url:
+                    if topic and url and sel_sub_code:
                         try:
-                            # ตรวจสอบก่อนว่ามีตาราง classroom_videos ไหม
-                            c.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='classroom_videos'")
-                            if not c.fetchone():
-                                # ถ้าไม่มี ให้สร้างตรงนี้เลย (กันเหนียว)
-                                c.execute("""
-                                    CREATE TABLE IF NOT EXISTS classroom_videos (
-                                        vid_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                                        sub_code TEXT,
-                                        topic_name TEXT,
-                                        video_url TEXT,
-                                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                                    )
-                                """)
-                                conn.commit()
-
-                            # บันทึกข้อมูล
-                            c.execute("INSERT INTO classroom_videos (sub_code, topic_name, video_url) VALUES (?,?,?)",
-                                      (sel_sub_code, topic, url))
-                            conn.commit()
+                            # บันทึกข้อมูล (ตาราง classroom_videos ถูกสร้างไว้แล้วตอนเริ่มระบบ)
+                            with db.writer() as w:
+                                w.execute("INSERT INTO classroom_videos (sub_code, topic_name, video_url) VALUES (?,?,?)",
+                                          (sel_sub_code, topic, url))
                             st.success("✅ บันทึกวิดีโอเรียบร้อย")
                             time.sleep(1) # รอสักนิดแล้วรีเฟรช
                             st.rerun()
@@ -1438,42 +1152,26 @@ def admin_page():
                             c1.error("ลิงก์วิดีโอไม่ถูกต้อง")
                         
                         # แสดงข้อมูล
-                        # หาชื่อวิชาจาก Dictionary
-                        sub_name_show = subject_map_video.get(row['sub_code'], row['sub_code'])
+                        # หาชื่อวิชาจาก registry
+                        sub_name_show = ref.subject_name(row['sub_code'])
                         c2.write(f"**{row['sub_code']} {sub_name_show}**")
                         c2.write(f"📌 {row['topic_name']}")
                         c2.caption(f"URL: {row['video_url']}")
                         
                         # ปุ่มลบ
                         if c3.button("🗑️ ลบ", key=f"del_vid_tab_{row['vid_id']}"):
-                            c.execute("DELETE FROM classroom_videos WHERE vid_id = ?", (row['vid_id'],))
-                            conn.commit()
+                            with db.writer() as w: w.execute("DELETE FROM classroom_videos WHERE vid_id = ?", (row['vid_id'],))
                             st.rerun()
                         st.markdown("---")
             else:
                 st.info("ยังไม่มีวิดีโอ")
         except Exception as e:
-             # กรณี Database ยังไม่มีตารางเลย
-             st.warning("⚠️ ยังไม่พบตารางข้อมูลวิดีโอ (ระบบจะสร้างให้อัตโนมัติเมื่อคุณกดบันทึกวิดีโอแรก)")
+             st.warning(f"⚠️ โหลดรายการวิดีโอไม่ได้: {e}")
     # ---------------------------------------------------------
     # Tab 8: จัดการติวเข้ม (อิสระ ไม่ผูกรายวิชา)
     # ---------------------------------------------------------
-    with tab8:
+    if section == tab8:
         st.subheader("🎯 จัดการวิดีโอติวเข้ม (Intensive Tutoring)")
-        conn = init_db()
-        c = conn.cursor()
-
-        # สร้างตาราง tutoring_videos อัตโนมัติถ้ายังไม่มี
-        c.execute("""
-            CREATE TABLE IF NOT EXISTS tutoring_videos (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                title TEXT,
-                video_url TEXT,
-                description TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        conn.commit()
 
         # ฟอร์มเพิ่มวิดีโอ
         with st.expander("➕ เพิ่มวิดีโอติวเข้มใหม่", expanded=True):
@@ -1484,9 +1182,9 @@ def admin_page():
                 
                 if st.form_submit_button("บันทึก"):
                     if t_title and t_url:
-                        c.execute("INSERT INTO tutoring_videos (title, video_url, description) VALUES (?,?,?)",
-                                  (t_title, t_url, t_desc))
-                        conn.commit()
+                        with db.writer() as w:
+                            w.execute("INSERT INTO tutoring_videos (title, video_url, description) VALUES (?,?,?)",
+                                      (t_title, t_url, t_desc))
                         st.success("✅ บันทึกเรียบร้อย")
                         st.rerun()
                     else:
@@ -1514,31 +1212,81 @@ def admin_page():
                         c2.info(row['description'])
                     
                     if c2.button("🗑️ ลบวิดีโอนี้", key=f"del_tutor_{row['id']}"):
-                        c.execute("DELETE FROM tutoring_videos WHERE id=?", (row['id'],))
-                        conn.commit()
+                        with db.writer() as w: w.execute("DELETE FROM tutoring_videos WHERE id=?", (row['id'],))
                         st.rerun()
                 st.markdown("---")
         else:
             st.info("ยังไม่มีวิดีโอติวเข้ม")
 
+    # --- TAB 9: ประสิทธิภาพ (perf.py: query / rerun ล่าสุดของ process นี้ ทุก session) ---
+    if section == tab9:
+        st.subheader("⏱️ ประสิทธิภาพของหน้าเว็บ")
+        st.caption(f"เก็บล่าสุด {perf.QUERY_BUFFER:,} query / {perf.RERUN_BUFFER:,} rerun ในหน่วยความจำ (ไม่รวม rerun ที่กำลังแสดงอยู่นี้)")
+        c1, c2 = st.columns([3, 1])
+        log_on = c1.checkbox(f"บันทึกลงไฟล์ {PERF_LOG} ด้วย", value=perf.log_path() is not None, key="perf_log")
+        perf.set_log_path(os.path.abspath(PERF_LOG) if log_on else None)
+        if c2.button("🧹 ล้างข้อมูล", use_container_width=True):
+            perf.clear()
+            st.rerun()
+
+        st.write("#### 🖥️ เวลา rerun ต่อบทบาท (ms)")
+        runs = pd.DataFrame(perf.rerun_summary())
+        if runs.empty: st.info("ยังไม่มีข้อมูล rerun")
+        else:
+            runs.columns = ['หน้า', 'จำนวน rerun', 'p50', 'p95', 'p99', 'สูงสุด', 'query/rerun (เฉลี่ย)', 'query/rerun (สูงสุด)', '% เวลาใน query']
+            st.dataframe(runs.round(1), use_container_width=True, hide_index=True)
+
+        st.write("#### 🔁 N+1 (statement เดียวกันซ้ำใน rerun เดียว)")
+        n1 = pd.DataFrame(perf.n_plus_one())
+        if n1.empty: st.success(f"ไม่พบ statement ที่ซ้ำตั้งแต่ {perf.N_PLUS_ONE} ครั้งใน rerun เดียว")
+        else:
+            n1.columns = ['หน้า', 'ส่วน', 'SQL', 'จำนวน rerun ที่พบ', 'ซ้ำสูงสุด (ครั้ง)']
+            st.dataframe(n1, use_container_width=True, hide_index=True)
+
+        st.write("#### 🐢 query ที่ช้าที่สุด")
+        slow = pd.DataFrame(perf.slowest_queries(20))
+        if slow.empty: st.info("ยังไม่มีข้อมูล query")
+        else:
+            slow['at'] = pd.to_datetime(slow['at'], unit='s', utc=True).dt.tz_convert('Asia/Bangkok').dt.strftime('%H:%M:%S')
+            slow.columns = ['SQL', 'ms', 'แถว', 'หน้า', 'ส่วน', 'เวลา']
+            st.dataframe(slow.round({'ms': 2}), use_container_width=True, hide_index=True)
+
+        st.write("#### 📋 สรุปต่อ statement (เรียงตามเวลารวม)")
+        agg = pd.DataFrame(perf.query_summary())
+        if not agg.empty:
+            agg.columns = ['SQL', 'จำนวนครั้ง', 'เวลารวม (ms)', 'p50 (ms)', 'p95 (ms)', 'สูงสุด (ms)', 'แถวเฉลี่ย', 'หน้า/ส่วน']
+            st.dataframe(agg.round(2), use_container_width=True, hide_index=True)
+
 # ==========================================
     # --- ส่วนที่เพิ่ม: ปุ่มออกจากระบบ (Sidebar) ---
     with st.sidebar:
         st.write(f"ผู้ดูแลระบบ: {st.session_state.name}")
+        st.caption(f"🔌 DB connections เปิดใหม่ใน rerun นี้: {db.opened_this_rerun()} (รวมทั้ง process: {db.opened_total})")
+        q = get_submission_queue(db).stats()
+        st.caption(f"📨 คิวบันทึกผลสอบ: ค้าง {q['depth']:,} | บันทึกแล้ว {q['committed']:,} (ล้มเหลว {q['failed']:,}) | "
+                   f"commit ล่าสุด {q['last_commit_ms']:.1f} ms ({q['last_batch']} รายการ) | รอถึงบันทึก p50 {q['p50_ms']:.0f} / p95 {q['p95_ms']:.0f} ms")
+        ss = session_store.stats
+        st.caption(f"🔑 session: ออก token {ss['issued']:,} | ตรวจผ่าน {ss['verified']:,} / ไม่ผ่าน {ss['rejected']:,} | "
+                   f"ตัวตนจาก cache {ss['hit']:,} / อ่าน DB {ss['miss']:,} | เพิกถอน {ss['revoked']:,}")
         st.divider()
         if st.button("🔴 ออกจากระบบ", use_container_width=True):
             do_logout()
-            
-    conn.close()
 # ==========================================
 # Main
 # ==========================================
-restore_session()
-
-if not st.session_state.logged_in: login_page()
-else:
-    if st.session_state.role == 'admin': admin_page()
-    elif st.session_state.role == 'teacher': teacher_page()
-
-    else: view_data_page(st.session_state.user)
+# perf: จับเวลาทั้ง rerun (finally -> รวม rerun ที่จบด้วย st.rerun() / st.stop())
+_perf_run = perf.begin_rerun()
+try:
+    db.begin_rerun()
+    restore_session()
+
+    if not st.session_state.logged_in: login_page()
+    else:
+        perf.set_page(st.session_state.role if st.session_state.role in ('admin', 'teacher') else 'student')
+        if st.session_state.role == 'admin': admin_page()
+        elif st.session_state.role == 'teacher': teacher_page()
+
+        else: view_data_page(st.session_state.user)
+finally:
+    perf.end_rerun(_perf_run)
 
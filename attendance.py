@@ -0,0 +1,104 @@
+# ==========================================
+# Exam attendance statistics (รายงานผลสอบ tab6)
+# ==========================================
+# กลุ่ม x ระดับชั้น -> (ลงทะเบียน, เข้าสอบ, ขาดสอบ, ร้อยละ) ของเทอมที่เลือก (นิยาม/การคำนวณอยู่ใน summary.py)
+# - ลงทะเบียน = นศ. ที่มีรายวิชาในเทอมนั้น (1 คน นับ 1 ครั้ง) ระดับชั้นดูจากรหัสวิชา (grades.level_id)
+#   ลงหลายระดับในเทอมเดียว -> ใช้ระดับต่ำสุด (เดิมได้แถวไหนก็ได้แบบสุ่ม)
+# - เข้าสอบ = มีผลสอบของ "ข้อสอบในเทอมนั้น" อย่างน้อย 1 ชุด (เดิมนับผลสอบทุกเทอมรวมกัน)
+# cache ต่อ (เทอม, เวอร์ชัน 'data' + 'results') -> แอดมินกดรีเฟรชซ้ำไม่ต้องอ่าน/pivot ใหม่ถ้าไม่มีผลสอบเข้ามา
+import threading
+
+import pandas as pd
+
+LEVELS = (('1', 'ประถม'), ('2', 'ม.ต้น'), ('3', 'ม.ปลาย'))
+VERSIONS = ('data', 'results')
+
+# อ่านจากตารางสรุป (summary.att_summary) ที่คิวบันทึกผลสอบ/การนำเข้าดูแลให้ -> หลักร้อยแถวต่อเทอม
+ATTENDANCE_SQL = """
+    SELECT nullif(grp_code, '') AS grp_code, nullif(level_id, '') AS level_id, registered, attended
+    FROM att_summary WHERE term = ?
+"""
+
+
+def _pct(att, tot):
+    return att / tot * 100 if tot > 0 else 0.0
+
+
+class AttendanceStats:
+    __slots__ = ('term', 'version', 'cube', '_groups')
+
+    def __init__(self, term, version, cube):
+        # cube: grp_code, level_id, registered, attended, absent (1 แถวต่อ กลุ่ม x ระดับ)
+        self.term = term
+        self.version = version
+        self.cube = cube
+        self._groups = None
+
+    @property
+    def registered(self):
+        return int(self.cube['registered'].sum())
+
+    @property
+    def attended(self):
+        return int(self.cube['attended'].sum())
+
+    @property
+    def absent(self):
+        return self.registered - self.attended
+
+    @property
+    def percent(self):
+        return _pct(self.attended, self.registered)
+
+    def by_group(self, teacher_name=None):
+        # ตารางรายกลุ่ม (คอลัมน์ภาษาไทยตามรายงานเดิม) — pivot ครั้งเดียวต่อเวอร์ชัน เติมแค่ชื่อครูทุกครั้งที่เรียก
+        if self._groups is None: self._groups = self._pivot()
+        out = self._groups.copy()
+        if not out.empty:
+            out.insert(1, 'ครูที่ปรึกษา', [teacher_name(g) if teacher_name else '' for g in out['กลุ่มเรียน']])
+        return out
+
+    def _pivot(self):
+        cube = self.cube.dropna(subset=['grp_code'])
+        if cube.empty: return pd.DataFrame()
+        total = cube.groupby('grp_code')[['registered', 'attended']].sum()
+        levels = [lvl for lvl, _ in LEVELS]
+        wide = (cube[cube['level_id'].isin(levels)].set_index(['grp_code', 'level_id'])[['registered', 'attended']]
+                .unstack('level_id').reindex(index=total.index, columns=pd.MultiIndex.from_product([['registered', 'attended'], levels]))
+                .fillna(0).astype(int))
+        out = pd.DataFrame({'กลุ่มเรียน': total.index})
+        for lvl, label in LEVELS:
+            out[f'{label}-ทั้งหมด'] = wide[('registered', lvl)].to_numpy()
+            out[f'{label}-เข้าสอบ'] = wide[('attended', lvl)].to_numpy()
+            out[f'{label}-ขาดสอบ'] = out[f'{label}-ทั้งหมด'] - out[f'{label}-เข้าสอบ']
+        # รวมกลุ่ม (รวมระดับที่ไม่ทราบด้วย)
+        out['รวม-ทั้งหมด'] = total['registered'].to_numpy()
+        out['รวม-เข้าสอบ'] = total['attended'].to_numpy()
+        out['รวม-ขาดสอบ'] = out['รวม-ทั้งหมด'] - out['รวม-เข้าสอบ']
+        out['ร้อยละ(%)'] = [f"{_pct(a, t):.2f}%" for a, t in zip(out['รวม-เข้าสอบ'], out['รวม-ทั้งหมด'])]
+        return out
+
+
+def load_attendance(conn, term, version=None):
+    cube = pd.read_sql(ATTENDANCE_SQL, conn, params=(term,))
+    cube['registered'] = cube['registered'].astype(int)
+    cube['attended'] = cube['attended'].astype(int)
+    cube['absent'] = cube['registered'] - cube['attended']
+    return AttendanceStats(term, version, cube)
+
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def get_attendance(db, term):
+    version = db.version(*VERSIONS)
+    key = (db.path, term)
+    stats = _cache.get(key)
+    if stats is not None and stats.version == version: return stats
+    with _cache_lock:
+        stats = _cache.get(key)
+        if stats is None or stats.version != version:
+            stats = load_attendance(db.reader(), term, version)
+            _cache[key] = stats
+    return stats
@@ -0,0 +1,1057 @@
+# ==========================================
+# Performance benchmarks
+# ==========================================
+# การตรวจที่ต้องผ่านทุกครั้ง (query plan / ...) อยู่ใน tests/ -> python -m pytest
+# ใช้งาน:  python bench.py swap         -> วัดเวลาที่ตารางจริง "ใช้ไม่ได้" ระหว่างนำเข้า (inplace vs staged)
+#         python bench.py derived      -> หน้า ตารางสอบ / รายงานสถิติ ก่อน-หลัง ใช้คอลัมน์ที่คำนวณไว้ตอนนำเข้า
+#         python bench.py grading      -> ส่งข้อสอบ/วินาที: query + iterrows (เดิม) vs ชุดข้อสอบที่คอมไพล์ไว้
+#         python bench.py submit       -> นศ. ส่งข้อสอบพร้อมกันทั้งรุ่น: เขียนเองทีละคน (เดิม) vs คิว + thread เขียน
+#         python bench.py dashboard    -> หน้ารายการแบบทดสอบของ นศ.: จำนวน query ต่อ rerun (ต้องเป็น 1) + เวลา
+#         python bench.py attendance   -> สถิติการเข้าสอบ (tab6): วนทีละกลุ่ม (เดิม) vs aggregation เดียว + cache ต่อเทอม
+#         python bench.py summary      -> ระหว่างสอบ: tab6 คำนวณจากตารางดิบ vs อ่านตารางสรุป + ตรวจความถูกต้องหลังส่งข้อสอบทั้งรุ่น
+#         python bench.py admin        -> หน้า Admin: เวลา/จำนวน query ต่อ rerun ของแต่ละเมนู (--app ไฟล์อื่นเพื่อเทียบกับเวอร์ชันเก่า)
+#         python bench.py search       -> ค้นหา นศ./กลุ่ม 50k คน: LIKE '%kw%' / pandas str.contains (เดิม) vs FTS5 trigram
+#         python bench.py roster       -> หน้ารายชื่อ นศ. ของครู: เวลา rerun ตามขนาดกลุ่ม (--app เทียบเวอร์ชันเก่า)
+#         python bench.py matrix       -> ตารางคะแนนของครู: query + pivot ทุก rerun (เดิม) vs cache + แก้เฉพาะแถวที่มีผลใหม่
+#         python bench.py export       -> ดาวน์โหลดคะแนนทั้งเทอม: DataFrame + to_csv (เดิม) vs เขียน CSV/XLSX ทีละ chunk จาก cursor (หน่วยความจำสูงสุด)
+#         python bench.py sheets       -> get_data() จาก Google Sheets (fake ในเครื่อง): ดาวน์โหลดทุกครั้ง (เดิม) vs cache + ตรวจการเปลี่ยนแปลง
+#         python bench.py sheetwrite   -> add_data() ไป Google Sheets (fake): append_row ทีละแถว (เดิม) vs บัฟเฟอร์ + append_rows เป็น batch (rows/s)
+#         python bench.py replication  -> ซิงก์ SQLite <-> Google Sheets (fake): push/pull/ขัดกัน/Sheets ล่ม + เวลาอ่านของหน้าเว็บระหว่างซิงก์
+#         python bench.py perf         -> instrumentation ของ perf.py: overhead ต่อ query + เวลา/จำนวน query ต่อ rerun ของแต่ละบทบาท (AppTest)
+#         python bench.py sessions     -> นศ. รีเฟรชพร้อมกันตอนเริ่มสอบ: query users/students ทุก session (เดิม) vs token ลงชื่อ + cache ตัวตน
+import argparse
+import os
+import random
+import re
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import pandas as pd
+from gspread.exceptions import APIError
+
+from db import Database
+import importer
+from refdata import get_refdata
+import exams
+from exams import exam_version, get_exam
+from submissions import SubmissionQueue
+import attendance
+from summary import check_summaries, rebuild_summaries
+import search
+import matrix
+import exports
+import sheets
+import replication
+import perf
+import sessions
+from sessions import token_for
+from synthetic import LEVELS, FakeClock, fake_sheet_rows, fake_spreadsheet, make_zip, seed_synthetic, thai_names
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = os.path.join(HERE, "app.py")
+
+
+# ==========================================
+# Import availability (staged swap)
+# ==========================================
+def measure_import_availability(db, zip_path, mode, probe_sid, interval=0.002):
+    # reader: ถามเกรดของ นศ. คนหนึ่งซ้ำ ๆ -> รวมช่วงเวลาที่ "ไม่พบข้อมูล"
+    # writer: บันทึกผลสอบทุก 20ms -> เวลารอ writer นานสุด
+    stop = threading.Event()
+    gaps = {'missing_s': 0.0, 'max_read_ms': 0.0, 'max_write_wait_ms': 0.0, 'write_errors': 0}
+
+    def reader():
+        conn = db.reader()
+        last = time.perf_counter()
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            try: ok = conn.execute("SELECT COUNT(*) FROM grades WHERE std_id=?", (probe_sid,)).fetchone()[0] > 0
+            except Exception: ok = False
+            now = time.perf_counter()
+            gaps['max_read_ms'] = max(gaps['max_read_ms'], (now - t0) * 1000)
+            if not ok: gaps['missing_s'] += now - last
+            last = now
+            time.sleep(interval)
+
+    def writer():
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            try:
+                with db.writer() as w:
+                    w.execute("INSERT INTO exam_results (exam_id, std_id, score, total_score, timestamp) VALUES (0, ?, 0, 0, 'bench')", (probe_sid,))
+            except Exception: gaps['write_errors'] += 1
+            gaps['max_write_wait_ms'] = max(gaps['max_write_wait_ms'], (time.perf_counter() - t0) * 1000)
+            time.sleep(0.02)
+
+    threads = [threading.Thread(target=reader), threading.Thread(target=writer)]
+    for t in threads: t.start()
+    t0 = time.perf_counter()
+    try: _, summary = importer.import_zip(db, zip_path, mode=mode)
+    finally:
+        stop.set()
+        for t in threads: t.join()
+    gaps['import_s'] = time.perf_counter() - t0
+    gaps['swap_ms'] = (summary['swap_s'] or 0) * 1000
+    return gaps
+
+
+def cmd_swap(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        zip_path = os.path.join(tmp, "school.zip")
+        n = make_zip(zip_path, n_students=args.students, grades_per_student=args.grades_per_student)
+        print(f"zip: {n['students']:,} students / {n['grades']:,} grades")
+        for mode in ('inplace', 'staged'):
+            db = Database(os.path.join(tmp, f"{mode}.db"))
+            importer.import_zip(db, zip_path, mode='inplace')  # ข้อมูลตั้งต้น
+            sid = db.reader().execute("SELECT std_id FROM grades ORDER BY rowid DESC LIMIT 1").fetchone()[0]
+            r = measure_import_availability(db, zip_path, mode, sid)
+            print(f"{mode:8s} import {r['import_s']:6.2f}s | live data missing {r['missing_s']:6.3f}s | "
+                  f"swap {r['swap_ms']:7.1f}ms | max read {r['max_read_ms']:7.1f}ms | max write wait {r['max_write_wait_ms']:7.1f}ms | write errors {r['write_errors']}")
+            db.close()
+    return 0
+
+
+# ==========================================
+# Derived columns: before / after
+# ==========================================
+# "before" = โค้ดหน้าเว็บแบบเดิม (คำนวณทีละแถวใน Python ตอน render), "after" = SQL เดียวกับ app.py ปัจจุบัน
+def _format_thai_time_before(t):
+    if pd.isna(t) or t == '' or str(t).lower() == 'nan': return ""
+    try:
+        val = float(t)
+        if val >= 24: s = str(int(val)); return f"{s[:2]}.{s[2:]} น." if len(s)==4 else f"0{s[0]}.{s[1:]} น."
+        else: h = int(val); m = int(round((val - h) * 100)); return f"{h:02}.{m:02} น."
+    except: return str(t)
+
+
+def schedule_before(db, sid, sem):
+    conn, ref = db.reader(), get_refdata(db)
+    grades = pd.read_sql("SELECT * FROM grades WHERE std_id=?", conn, params=(sid,))
+    schedule = pd.read_sql("SELECT * FROM schedule", conn)
+    my_sch = schedule[schedule['sub_code'].isin(grades['sub_code'].unique())].copy()
+    graded = grades[(grades['semestry'] == sem) & (grades['grade'].str.strip() != '')]['sub_code'].tolist()
+    out = my_sch[(my_sch['semestry'] == sem) & (~my_sch['sub_code'].isin(graded))].copy()
+    out['sub_name'] = ref.subject_names(out['sub_code'])
+    out['time'] = out.apply(lambda x: f"{_format_thai_time_before(x['exam_start'])}-{_format_thai_time_before(x['exam_end'])}", axis=1)
+    return out
+
+
+def schedule_after(db, sid, sem):
+    conn, ref = db.reader(), get_refdata(db)
+    pd.read_sql("SELECT * FROM grades WHERE std_id=?", conn, params=(sid,))
+    out = pd.read_sql("""SELECT exam_day, exam_time, sub_code, sub_key FROM schedule
+                         WHERE semestry = ? AND sub_key IN (SELECT sub_key FROM grades WHERE std_id = ?)
+                           AND sub_key NOT IN (SELECT sub_key FROM grades WHERE std_id = ? AND semestry = ? AND (grade IS NULL OR trim(grade) <> ''))""",
+                      conn, params=(sem, sid, sid, sem))
+    out['sub_name'] = ref.subject_names(out['sub_code'], out['sub_key'])
+    return out
+
+
+def report_before(db, term):
+    conn = db.reader()
+    df = pd.read_sql("SELECT s.std_id, s.grp_code, g.sub_code FROM students s JOIN grades g ON s.std_id = g.std_id "
+                     "WHERE g.semestry = ? GROUP BY s.std_id", conn, params=(term,))
+    submitted = set(pd.read_sql("SELECT DISTINCT std_id FROM exam_results", conn)['std_id'].astype(str))
+    df['std_id'] = df['std_id'].astype(str).str.strip()
+
+    def level_code(code):
+        m = re.search(r'\d', code) if isinstance(code, str) else None
+        return m.group(0) if m and m.group(0) in LEVELS else 'Unknown'
+    df['level_id'] = df['sub_code'].apply(level_code)
+    rows = []
+    for grp in sorted(df['grp_code'].dropna().unique()):
+        g = df[df['grp_code'] == grp]
+        row = {'grp': grp}
+        for lvl in LEVELS:
+            sub = g[g['level_id'] == lvl]
+            row[lvl] = (len(sub), int(sub['std_id'].apply(lambda x: 1 if x in submitted else 0).sum() or 0))
+        row['all'] = (len(g), int(g['std_id'].apply(lambda x: 1 if x in submitted else 0).sum()))
+        rows.append(row)
+    return rows
+
+
+def report_after(db, term):
+    counts = pd.read_sql("""SELECT a.grp_code, a.level_id, COUNT(*) AS tot,
+                                   SUM(EXISTS (SELECT 1 FROM exam_results r WHERE r.std_id = a.std_id)) AS att
+                            FROM (SELECT s.std_id, s.grp_code, g.level_id FROM students s JOIN grades g ON s.std_id = g.std_id
+                                  WHERE g.semestry = ? GROUP BY s.std_id) a
+                            GROUP BY a.grp_code, a.level_id""", db.reader(), params=(term,))
+    rows = []
+    for grp, g in counts.dropna(subset=['grp_code']).groupby('grp_code'):
+        by_level = g.set_index('level_id')
+        row = {'grp': grp}
+        for lvl in LEVELS: row[lvl] = (int(by_level['tot'].get(lvl, 0)), int(by_level['att'].get(lvl, 0)))
+        row['all'] = (int(g['tot'].sum()), int(g['att'].sum()))
+        rows.append(row)
+    return rows
+
+
+def _median_ms(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter(); fn(); times.append((time.perf_counter() - t0) * 1000)
+    return sorted(times)[len(times) // 2]
+
+
+def cmd_derived(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, "derived.db"))
+        n = seed_synthetic(db, n_students=args.students, grades_per_student=args.grades_per_student)
+        print(f"seeded {n['students']:,} students / {n['grades']:,} grades")
+        conn = db.reader()
+        sid, sem = conn.execute("SELECT std_id, semestry FROM grades ORDER BY rowid LIMIT 1").fetchone()
+        term = conn.execute("SELECT MAX(semestry) FROM grades").fetchone()[0]
+        a, b = schedule_before(db, sid, sem), schedule_after(db, sid, sem)
+        same_sch = sorted(a['sub_code']) == sorted(b['sub_code']) and sorted(a['time']) == sorted(b['exam_time'])
+        same_rep = report_before(db, term) == report_after(db, term)
+        for name, before, after, same in (
+                ("schedule page", lambda: schedule_before(db, sid, sem), lambda: schedule_after(db, sid, sem), same_sch),
+                ("report (tab6)", lambda: report_before(db, term), lambda: report_after(db, term), same_rep)):
+            tb, ta = _median_ms(before, args.repeat), _median_ms(after, args.repeat)
+            print(f"{name:14s} before {tb:8.1f}ms | after {ta:8.1f}ms | x{tb / ta if ta else 0:5.1f} | same result: {same}")
+        db.close()
+    return 0 if same_sch and same_rep else 1
+
+
+# ==========================================
+# Exam grading: before / after
+# ==========================================
+# 1 "submission" = rerun ตอนกดส่ง (โหลดชุดข้อสอบ + ตรวจคะแนน) ของ นศ. 1 คน
+def seed_exam(db, n_questions=60, seed=7):
+    rnd = random.Random(seed)
+    with db.writer() as w:
+        exam_id = w.execute("INSERT INTO exams (exam_name, sub_code, semestry, is_active) VALUES ('bench', 'ทช11001', '2/2567', 1)").lastrowid
+        w.executemany("INSERT INTO exam_questions (exam_id, question_text, choice_a, choice_b, choice_c, choice_d, correct_answer) VALUES (?,?,?,?,?,?,?)",
+                      [(exam_id, f"ข้อ {q}", f"ก{q} ", f"ข{q}", f"ค{q}", '' if q % 10 == 0 else f"ง{q}", rnd.choice('ABCD')) for q in range(n_questions)])
+    return exam_id
+
+
+def _answer_sheets(rows, n_sheets, seed=11):
+    # rows: (id, a, b, c, d) -> คำตอบแบบข้อความ (ตามที่ radio เดิมคืนค่า) และแบบลำดับตัวเลือก
+    rnd = random.Random(seed)
+    sheets = []
+    for _ in range(n_sheets):
+        text, index = {}, []
+        for r in rows:
+            opts = [o for o in r[1:] if o and str(o).strip() != ""]
+            i = rnd.randrange(len(opts))
+            text[r[0]] = opts[i]; index.append(i)
+        sheets.append((text, index))
+    return sheets
+
+
+def submit_before(conn, exam_id, answers):
+    questions = pd.read_sql("SELECT * FROM exam_questions WHERE exam_id=?", conn, params=(exam_id,))
+    score = 0
+    for _, q in questions.iterrows():
+        user_ans = answers.get(q['id'])
+        correct_val = ""
+        if q['correct_answer'] == 'A': correct_val = q['choice_a']
+        elif q['correct_answer'] == 'B': correct_val = q['choice_b']
+        elif q['correct_answer'] == 'C': correct_val = q['choice_c']
+        elif q['correct_answer'] == 'D': correct_val = q['choice_d']
+        if str(user_ans).strip() == str(correct_val).strip(): score += 1
+    return score
+
+
+def submit_after(db, exam_id, answers):
+    return get_exam(db, exam_id).grade(answers)[0]
+
+
+def cmd_grading(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, "grading.db"))
+        exam_id = seed_exam(db, args.questions)
+        conn = db.reader()
+        rows = conn.execute("SELECT id, choice_a, choice_b, choice_c, choice_d FROM exam_questions WHERE exam_id=? ORDER BY id", (exam_id,)).fetchall()
+        sheets = _answer_sheets(rows, args.students)
+        same = all(submit_before(conn, exam_id, t) == submit_after(db, exam_id, i) for t, i in sheets)
+        print(f"{args.students} students x {args.questions} questions | same scores: {same}")
+        for name, fn in (("before", lambda t, i: submit_before(conn, exam_id, t)), ("after", lambda t, i: submit_after(db, exam_id, i))):
+            t0 = time.perf_counter()
+            for t, i in sheets: fn(t, i)
+            dt = time.perf_counter() - t0
+            print(f"{name:6s} {len(sheets) / dt:10,.0f} submissions/s | {dt / len(sheets) * 1000:7.3f} ms each")
+        # แอดมินแก้ข้อสอบ -> คอมไพล์ใหม่ครั้งเดียว
+        t0 = time.perf_counter(); db.bump(exam_version(exam_id)); get_exam(db, exam_id)
+        print(f"recompile after edit: {(time.perf_counter() - t0) * 1000:.2f} ms")
+        db.close()
+    return 0
+
+
+# ==========================================
+# Exam submissions: direct writes vs queue
+# ==========================================
+def _percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0.0
+
+
+def run_submissions(db, n_students, mode, exam_id=1):
+    # คืนค่า (เวลารวม, เวลาที่ script thread ถูกบล็อก [ms], เวลาจนบันทึกเสร็จ [ms])
+    blocked, confirmed = [], []
+    sq = SubmissionQueue(db) if mode == 'queue' else None
+    start = threading.Barrier(n_students)
+
+    def student(i):
+        sid = f"6720{i:06d}"
+        start.wait()
+        t0 = time.perf_counter()
+        if sq is None:
+            with db.writer() as w:
+                w.execute("DELETE FROM exam_results WHERE exam_id=? AND std_id=?", (exam_id, sid))
+                w.execute("INSERT INTO exam_results (exam_id, std_id, score, total_score, timestamp) VALUES (?, ?, ?, ?, ?)",
+                          (exam_id, sid, i % 60, 60, 'bench'))
+            blocked.append((time.perf_counter() - t0) * 1000); confirmed.append(blocked[-1])
+        else:
+            ticket = sq.submit(exam_id, sid, i % 60, 60, 'bench')
+            blocked.append((time.perf_counter() - t0) * 1000)
+            ticket.wait()
+            confirmed.append((time.perf_counter() - t0) * 1000)
+
+    threads = [threading.Thread(target=student, args=(i,)) for i in range(n_students)]
+    t0 = time.perf_counter()
+    for t in threads: t.start()
+    for t in threads: t.join()
+    return time.perf_counter() - t0, blocked, confirmed, (sq.stats() if sq else None)
+
+
+def cmd_submit(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ('direct', 'queue'):
+            db = Database(os.path.join(tmp, f"{mode}.db"))
+            total, blocked, confirmed, stats = run_submissions(db, args.students, mode)
+            n = db.reader().execute("SELECT COUNT(*) FROM exam_results").fetchone()[0]
+            extra = f" | batches {stats['batches']}" if stats else ""
+            print(f"{mode:6s} {args.students / total:8,.0f} submissions/s | session blocked p95 {_percentile(blocked, 0.95):7.2f} ms | "
+                  f"saved p95 {_percentile(confirmed, 0.95):7.2f} ms | rows {n}{extra}")
+            db.close()
+    return 0
+
+
+# ==========================================
+# Student exam dashboard: N+1 vs single query
+# ==========================================
+def dashboard_before(conn, sid):
+    # หน้าเดิม: เกรด -> set ใน Python, ข้อสอบที่เปิด, แล้ว query ประวัติทีละวิชา
+    grades = pd.read_sql("SELECT sub_code, grade FROM grades WHERE std_id=?", conn, params=(sid,))
+    registered, passed = set(), set()
+    for _, row in grades.iterrows():
+        code = str(row['sub_code']).strip()
+        registered.add(code)
+        g = "" if row['grade'] is None else str(row['grade']).strip()
+        if g != "" and g.lower() not in ("nan", "none"): passed.add(code)
+    out = []
+    for _, exam in pd.read_sql("SELECT * FROM exams WHERE is_active=1", conn).iterrows():
+        code = str(exam['sub_code']).strip()
+        if code in registered and code not in passed:
+            h = pd.read_sql("SELECT * FROM exam_results WHERE exam_id=? AND std_id=?", conn, params=(exam['exam_id'], sid))
+            out.append((int(exam['exam_id']), None if h.empty else int(h.iloc[-1]['score'])))
+    return out
+
+
+def dashboard_after(conn, sid):
+    return [(r.exam_id, r.score) for r in exams.exam_dashboard(conn, sid)]
+
+
+def count_queries(conn, fn, *args):
+    n = [0]
+    conn.set_trace_callback(lambda sql: n.__setitem__(0, n[0] + 1))
+    try: result = fn(conn, *args)
+    finally: conn.set_trace_callback(None)
+    return result, n[0]
+
+
+def cmd_dashboard(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, "dashboard.db"))
+        seed_synthetic(db, n_students=args.students, grades_per_student=args.grades_per_student)
+        # ทำให้ทุกวิชามีข้อสอบเปิดอยู่ -> นศ. แต่ละคนมีหลายวิชาที่ต้องสอบ
+        with db.writer() as w:
+            w.execute("INSERT INTO exams (exam_name, sub_code, semestry, is_active) SELECT 'สอบ ' || sub_code, sub_code, '2/2567', 1 "
+                      "FROM subjects WHERE sub_code NOT IN (SELECT sub_code FROM exams)")
+        conn = sqlite3.connect(db.path)
+        sids = [r[0] for r in conn.execute("SELECT std_id FROM students ORDER BY std_id LIMIT ?", (args.sample,))]
+        q_before = sum(count_queries(conn, dashboard_before, s)[1] for s in sids) / len(sids)
+        q_after = sum(count_queries(conn, dashboard_after, s)[1] for s in sids) / len(sids)
+        t_before = _median_ms(lambda: [dashboard_before(conn, s) for s in sids], 3) / len(sids)
+        t_after = _median_ms(lambda: [dashboard_after(conn, s) for s in sids], 3) / len(sids)
+        print(f"{len(sids)} students | queries per rerun: before {q_before:.1f}, after {q_after:.1f}")
+        print(f"per rerun: before {t_before:.2f} ms | after {t_after:.2f} ms")
+        conn.close(); db.close()
+    return 0
+
+
+# ==========================================
+# Exam attendance statistics (tab6)
+# ==========================================
+def attendance_after(db, term):
+    return attendance.get_attendance(db, term).by_group()
+
+
+def cmd_attendance(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, "attendance.db"))
+        n = seed_synthetic(db, n_students=args.students, grades_per_student=args.grades_per_student, n_groups=args.groups)
+        # ผลสอบของเทอมก่อน -> รายงานเดิมนับรวมข้ามเทอม ตัวใหม่ต้องไม่นับ
+        with db.writer(bump='results') as w:
+            old = w.execute("INSERT INTO exams (exam_name, sub_code, semestry, is_active) VALUES ('สอบเทอมก่อน', 'ทช10001', '1/2567', 0)").lastrowid
+            w.execute("INSERT INTO exam_results (exam_id, std_id, score, total_score, timestamp) "
+                      "SELECT ?, std_id, 10, 20, '2024-10-01 10:00' FROM students WHERE rowid % 3 = 0", (old,))
+            rebuild_summaries(w)
+        print(f"seeded {n['students']:,} students / {n['grades']:,} grades / {args.groups} groups")
+        term = db.reader().execute("SELECT MAX(semestry) FROM grades").fetchone()[0]
+        stats = attendance.load_attendance(db.reader(), term)
+        before_att = sum(r['all'][1] for r in report_before(db, term))
+        t_before = _median_ms(lambda: report_before(db, term), args.repeat)
+        t_cold = _median_ms(lambda: attendance.load_attendance(db.reader(), term).by_group(), args.repeat)
+        attendance_after(db, term)
+        t_warm = _median_ms(lambda: attendance_after(db, term), args.repeat)
+        print(f"per-group loop (before)  {t_before:8.1f} ms | attended {before_att:,} (all terms)")
+        print(f"summary table, cold      {t_cold:8.1f} ms | attended {stats.attended:,} ({term} only) | x{t_before / t_cold if t_cold else 0:5.1f}")
+        print(f"cached (same version)    {t_warm:8.3f} ms")
+        db.close()
+    return 0
+
+
+# ==========================================
+# Live attendance summaries (during an exam)
+# ==========================================
+# tab6 แบบก่อนมีตารางสรุป: JOIN ตารางดิบทุกครั้ง
+ATTENDANCE_RAW_SQL = """
+    WITH reg AS (SELECT std_id, MIN(level_id) AS level_id FROM grades WHERE semestry = ? GROUP BY std_id),
+         att AS (SELECT DISTINCT r.std_id FROM exam_results r JOIN exams e ON e.exam_id = r.exam_id WHERE e.semestry = ?)
+    SELECT s.grp_code, reg.level_id, COUNT(*) AS registered, COUNT(att.std_id) AS attended
+    FROM reg JOIN students s ON s.std_id = reg.std_id LEFT JOIN att ON att.std_id = reg.std_id
+    GROUP BY s.grp_code, reg.level_id
+"""
+
+
+def cmd_summary(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, "summary.db"))
+        n = seed_synthetic(db, n_students=args.students, grades_per_student=args.grades_per_student, n_groups=args.groups)
+        conn = db.reader()
+        term = conn.execute("SELECT MAX(semestry) FROM grades").fetchone()[0]
+        with db.writer() as w:
+            t0 = time.perf_counter(); rebuild_summaries(w); t_rebuild = (time.perf_counter() - t0) * 1000
+        print(f"seeded {n['students']:,} students / {n['grades']:,} grades / {args.groups} groups | rebuild {t_rebuild:.0f} ms")
+        # ทั้งรุ่นส่งข้อสอบผ่านคิว (บางคนส่งซ้ำ) -> ตารางสรุปต้องตรงกับการคำนวณใหม่
+        exam_ids = [r[0] for r in conn.execute("SELECT exam_id FROM exams WHERE semestry=?", (term,))]
+        sids = [r[0] for r in conn.execute("SELECT std_id FROM students ORDER BY random() LIMIT ?", (args.submissions,))]
+        rnd = random.Random(5)
+        q = SubmissionQueue(db)
+        tickets = [q.submit(rnd.choice(exam_ids), sid, rnd.randint(0, 20), 20, '2025-03-01 10:00') for sid in sids + sids[:len(sids) // 10]]
+        for t in tickets: t.wait()
+        st = q.stats()
+        print(f"{len(tickets):,} submissions in {st['batches']} batches | failed {st['failed']} | p95 enqueue->commit {st['p95_ms']:.1f} ms")
+        diffs = check_summaries(conn)
+        t_check = _median_ms(lambda: check_summaries(conn), 1)
+        t_raw = _median_ms(lambda: pd.read_sql(ATTENDANCE_RAW_SQL, conn, params=(term, term)), args.repeat)
+        t_sum = _median_ms(lambda: attendance.load_attendance(conn, term), args.repeat)
+        rows = len(attendance.load_attendance(conn, term).cube)
+        print(f"tab6 refresh: raw join {t_raw:7.1f} ms | summary table {t_sum:6.2f} ms ({rows} rows) | x{t_raw / t_sum if t_sum else 0:5.0f}")
+        print(f"consistency check {t_check:.0f} ms: {len(diffs)} difference(s)")
+        for d in diffs[:10]: print("  DIFF", d)
+        db.close()
+    return 1 if diffs else 0
+
+
+# ==========================================
+# Admin panel: per-rerun cost per section
+# ==========================================
+ADMIN_SECTION_KEY = "admin_section"
+
+
+def _count_all_queries(db):
+    # เปิด reader ให้ครบ pool แล้วนับทุก statement ที่รันผ่าน connection ของ DB นี้
+    for _ in range(db.pool_size): db.reader()
+    n = [0]
+    for conn in db._readers + [db._writer]: conn.set_trace_callback(lambda sql: n.__setitem__(0, n[0] + 1))
+    return n
+
+
+def _admin_rerun(at, counter, repeat):
+    times, queries = [], []
+    for _ in range(repeat):
+        counter[0] = 0
+        t0 = time.perf_counter(); at.run(); times.append((time.perf_counter() - t0) * 1000)
+        queries.append(counter[0])
+    if at.exception: raise RuntimeError(at.exception[0].value)
+    return sorted(times)[len(times) // 2], max(queries)
+
+
+def cmd_admin(args):
+    from streamlit.testing.v1 import AppTest
+    from db import get_db
+    from loadtest import app_db_name
+    app = os.path.abspath(args.app)
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)  # app ใช้ DB_NAME แบบ relative
+        db = get_db(app_db_name())
+        n = seed_synthetic(db, n_students=args.students, grades_per_student=args.grades_per_student)
+        print(f"seeded {n['students']:,} students / {n['grades']:,} grades | app: {os.path.relpath(app, HERE)}")
+        counter = _count_all_queries(db)
+        at = AppTest.from_file(app, default_timeout=300)
+        at.query_params["session"] = token_for(db, "admin")
+        at.run()
+        menu = [r for r in at.radio if r.key == ADMIN_SECTION_KEY]
+        results = {}
+        if not menu:
+            # st.tabs: ทุกแท็บรันทุก rerun ไม่ว่าจะเปิดแท็บไหนอยู่
+            results['(ทุกแท็บ)'] = _admin_rerun(at, counter, args.repeat)
+        for label in (menu[0].options if menu else []):
+            at.radio(key=ADMIN_SECTION_KEY).set_value(label)
+            at.run()
+            results[label] = _admin_rerun(at, counter, args.repeat)
+        os.chdir(HERE)
+        db.close()
+    for label, (ms, q) in results.items():
+        print(f"  {label:22s} rerun {ms:8.1f} ms | {q:4d} queries")
+    return 0
+
+
+# ==========================================
+# Full-text search
+# ==========================================
+SEARCH_TERMS = ['สม', 'ชาย', 'ศรีสุข', 'ณัฐพล ทอง', '6712', '01234', 'G0042', '50%_']
+
+# เดิม: แอดมิน LIKE บนตารางจริง / ครู กรองด้วย pandas ในเฟรมของกลุ่ม
+SEARCH_LIKE_SQL = "SELECT std_id, prefix, name, surname, grp_code, level FROM students WHERE std_id LIKE ? OR name LIKE ? OR surname LIKE ?"
+
+
+def cmd_search(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, "search.db"))
+        n = seed_synthetic(db, n_students=args.students, grades_per_student=args.grades_per_student, n_groups=args.groups)
+        thai_names(db)
+        with db.writer() as w:
+            t0 = time.perf_counter(); search.rebuild_search(w); t_build = (time.perf_counter() - t0) * 1000
+        conn = db.reader()
+        print(f"seeded {n['students']:,} students / {args.groups} groups | FTS rebuild {t_build:.0f} ms")
+        grp, = conn.execute("SELECT grp_code FROM students GROUP BY grp_code ORDER BY COUNT(*) DESC LIMIT 1").fetchone()
+        roster = pd.read_sql("SELECT std_id, prefix || name || ' ' || surname AS full_name FROM students WHERE grp_code=?", conn, params=(grp,))
+        print(f"{'keyword':12s} {'hits':>6s} | admin LIKE   FTS(≤200)  | teacher pandas  search API (group {grp}, {len(roster)} คน)")
+        for kw in SEARCH_TERMS:
+            hits = {r[0] for r in search.search_students(conn, kw)}
+            q = f"%{kw}%"
+            t_like = _median_ms(lambda: conn.execute(SEARCH_LIKE_SQL, (q, q, q)).fetchall(), args.repeat)
+            t_fts = _median_ms(lambda: search.search_students(conn, kw, 200), args.repeat)  # SEARCH_LIMIT ของหน้าแอดมิน
+            t_pd = _median_ms(lambda: roster[roster['std_id'].astype(str).str.contains(kw, case=False) |
+                                             roster['full_name'].str.contains(kw, case=False)], args.repeat)
+            t_grp = _median_ms(lambda: search.match_student_ids(conn, kw, grp), args.repeat)
+            print(f"{kw:12s} {len(hits):6d} | {t_like:7.2f} ms {t_fts:7.2f} ms | {t_pd:7.2f} ms {t_grp:7.2f} ms")
+        for kw in ('G00', 'ครู G01'):
+            t_like = _median_ms(lambda: conn.execute("SELECT grp_code FROM groups WHERE grp_code LIKE ? OR teacher_name LIKE ?", (f"%{kw}%",) * 2).fetchall(), args.repeat)
+            t_fts = _median_ms(lambda: search.search_groups(conn, kw), args.repeat)
+            print(f"group '{kw}': LIKE {t_like:.2f} ms / FTS {t_fts:.2f} ms")
+        db.close()
+    return 0
+
+
+# ==========================================
+# Teacher roster: rerun time vs group size
+# ==========================================
+ROSTER_SIZES = (50, 200, 800, 2000)
+
+
+def _count_widgets(node):
+    return sum(_count_widgets(c) for c in getattr(node, 'children', {}).values()) + 1
+
+
+def cmd_roster(args):
+    from streamlit.testing.v1 import AppTest
+    from db import get_db
+    from loadtest import app_db_name
+    app = os.path.abspath(args.app)
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        db = get_db(app_db_name())
+        seed_synthetic(db, n_students=args.students, grades_per_student=args.grades_per_student)
+        # กลุ่มขนาดต่าง ๆ: ย้าย นศ. ช่วงติดกันเข้ากลุ่ม R<ขนาด> + บัญชีครูของกลุ่ม
+        offset = 0
+        with db.writer() as w:
+            for size in ROSTER_SIZES:
+                w.execute("UPDATE students SET grp_code = ? WHERE std_id IN (SELECT std_id FROM students ORDER BY std_id LIMIT ? OFFSET ?)",
+                          (f"R{size}", size * 3, offset))  # ~1/3 ลงทะเบียนเทอมล่าสุด
+                w.execute("INSERT OR REPLACE INTO users VALUES (?, ?, 'teacher', ?, ?)", (f"R{size}", 'x', f"ครู R{size}", f"R{size}"))
+                offset += size * 3
+        counter = _count_all_queries(db)
+        for size in ROSTER_SIZES:
+            at = AppTest.from_file(app, default_timeout=300)
+            at.query_params["session"] = token_for(db, f"R{size}")
+            at.run()
+            ms, q = _admin_rerun(at, counter, args.repeat)
+            shown = next((m.value for m in at.markdown if m.value.startswith('แสดงผล')), '')
+            rows.append((size * 3, shown, ms, q, _count_widgets(at._tree)))
+        os.chdir(HERE)
+        db.close()
+    print(f"app: {os.path.relpath(app, HERE)}")
+    for members, shown, ms, q, widgets in rows:
+        print(f"  group of {members:5d} ({shown:28s}) rerun {ms:8.1f} ms | {q:3d} queries | {widgets:5d} elements")
+    return 0
+
+
+# ==========================================
+# Teacher score matrix: cached + patched
+# ==========================================
+def matrix_before(conn, ref, grp):
+    # หน้าเดิม: query ทั้งกลุ่ม + map ชื่อวิชา + pivot ทุก rerun
+    df = pd.read_sql(matrix.MATRIX_SQL, conn, params=(grp,))
+    df['sub_name'] = ref.subject_names(df['sub_code'])
+    df['subject_label'] = df['sub_name'] + " (เต็ม " + df['total_score'].astype(str) + ")"
+    view = df.pivot_table(index=['std_id', 'full_name'], columns='subject_label', values='score', aggfunc='max').reset_index()
+    return view.rename(columns={'std_id': 'รหัสนักเรียน', 'full_name': 'ชื่อ-สกุล'})
+
+
+def cmd_matrix(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, "matrix.db"))
+        seed_synthetic(db, n_students=args.students, grades_per_student=args.grades_per_student, n_groups=args.groups)
+        conn, ref = db.reader(), get_refdata(db)
+        grp, size = conn.execute("SELECT grp_code, COUNT(*) FROM students GROUP BY grp_code ORDER BY COUNT(*) DESC LIMIT 1").fetchone()
+        sids = [r[0] for r in conn.execute("SELECT std_id FROM students WHERE grp_code=?", (grp,))]
+        exam_ids = [r[0] for r in conn.execute("SELECT exam_id FROM exams")]
+        # ประวัติสอบของกลุ่ม: ทุกคนสอบหลายวิชา
+        rnd = random.Random(3)
+        with db.writer(bump='results') as w:
+            w.executemany("INSERT INTO exam_results (exam_id, std_id, score, total_score, timestamp) VALUES (?,?,?,?,?)",
+                          [(e, sid, rnd.randint(0, 20), 20, '2025-03-01 10:00') for sid in sids for e in rnd.sample(exam_ids, min(args.exams, len(exam_ids)))])
+        t_before = _median_ms(lambda: matrix_before(conn, ref, grp), args.repeat)
+        t_build = _median_ms(lambda: matrix.build_matrix(conn, ref, grp), args.repeat)
+        m = matrix.get_matrix(db, grp)
+        t_hit = _median_ms(lambda: matrix.get_matrix(db, grp), args.repeat)
+        t_search = _median_ms(lambda: m.view(search.match_student_ids(conn, 'สกุล1', grp)), args.repeat)
+        # ผลสอบใหม่ผ่านคิว (รวมส่งซ้ำ) -> patch เฉพาะแถวที่เปลี่ยน
+        q = SubmissionQueue(db)
+        patch_ms = []
+        for _ in range(args.rounds):
+            tickets = [q.submit(rnd.choice(exam_ids), sid, rnd.randint(0, 20), rnd.choice((20, 30)), '2025-03-02 10:00')
+                       for sid in rnd.sample(sids, min(args.batch, len(sids)))]
+            for t in tickets: t.wait()
+            t0 = time.perf_counter(); m = matrix.get_matrix(db, grp); patch_ms.append((time.perf_counter() - t0) * 1000)
+        print(f"group {grp}: {size} students x {len(m.frame.columns) - 2} subject columns")
+        print(f"query + pivot every rerun (before) {t_before:8.2f} ms")
+        print(f"full build                         {t_build:8.2f} ms")
+        print(f"cached (no new results)            {t_hit:8.3f} ms | search on cached frame {t_search:.2f} ms")
+        print(f"patch after {args.batch} new results        {sorted(patch_ms)[len(patch_ms) // 2]:8.2f} ms (median of {args.rounds})")
+        db.close()
+    return 0
+
+
+# ==========================================
+# Streamed exports
+# ==========================================
+def export_before(conn, term):
+    # tab6 เดิม: อ่านทั้งเทอมเป็น DataFrame แล้ว encode ทั้งไฟล์ในหน่วยความจำ (ทุก rerun)
+    df = pd.read_sql(exports.TERM_SCORES_SQL, conn, params=(term,))
+    df.columns = exports.TERM_SCORES_HEADER
+    return df.to_csv(index=False).encode('utf-8-sig')
+
+
+def _peak_mb(fn):
+    tracemalloc.start()
+    try:
+        out = fn()
+        return out, tracemalloc.get_traced_memory()[1] / 2**20
+    finally:
+        tracemalloc.stop()
+
+
+def cmd_export(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        exports.EXPORT_DIR = os.path.join(tmp, 'exports')
+        db = Database(os.path.join(tmp, "export.db"))
+        seed_synthetic(db, n_students=args.students, grades_per_student=3, n_groups=args.groups, n_exams=40)
+        term = '2/2567'
+        # ผลสอบของ นศ. ที่ลงทะเบียนเทอมนี้ ให้ครบ --rows แถว (เวลาส่งไม่ซ้ำกัน -> ลำดับแน่นอน)
+        with db.writer(bump='results') as w:
+            w.execute("DELETE FROM exam_results")
+            w.execute("""
+                WITH reg AS (SELECT DISTINCT std_id FROM grades WHERE semestry = ?),
+                     k(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM k WHERE n < 40)
+                INSERT INTO exam_results (exam_id, std_id, score, total_score, timestamp)
+                SELECT k.n, reg.std_id, abs(random()) % 21, 20, printf('2025-03-01 %09d', row_number() OVER ())
+                FROM reg CROSS JOIN k LIMIT ?""", (term, args.rows))
+            rebuild_summaries(w)
+        conn = db.reader()
+        n_rows = conn.execute("SELECT COUNT(*) FROM exam_results").fetchone()[0]
+
+        t0 = time.perf_counter(); before = export_before(conn, term); t_before = time.perf_counter() - t0
+        del before
+        _, mb_before = _peak_mb(lambda: export_before(conn, term))
+        print(f"{n_rows:,} rows in term {term}")
+        print(f"{'':28} {'time':>8} {'peak MB':>8} {'file MB':>8}")
+        print(f"{'DataFrame + to_csv (before)':28} {t_before:7.2f}s {mb_before:8.1f}")
+        for fmt in ('csv', 'xlsx'):
+            t0 = time.perf_counter(); art = exports.term_scores_export(db, term, fmt); t_build = time.perf_counter() - t0
+            os.remove(art.path)
+            art, mb = _peak_mb(lambda: exports.term_scores_export(db, term, fmt))
+            t_hit = _median_ms(lambda: exports.term_scores_export(db, term, fmt), 5)
+            print(f"{'streamed ' + fmt.upper():28} {t_build:7.2f}s {mb:8.1f} {os.path.getsize(art.path) / 2**20:8.1f}  (cached: {t_hit:.3f} ms)")
+        db.close()
+    return 0
+
+
+# ==========================================
+# Google Sheets: get_data() เดิม vs SheetCache
+# ==========================================
+def get_data_before(sh, name):
+    # app.get_data เดิม: metadata + ดาวน์โหลดทั้งชีตทุกครั้ง
+    return pd.DataFrame(sh.worksheet(name).get_all_records())
+
+
+def cmd_sheets(args):
+    # rerun ซ้ำ ๆ: เดิม vs cache (ttl ผ่านไประหว่าง rerun ตามเวลาจำลอง)
+    names = [f"Sheet{i}" for i in range(args.sheets)]
+    data = {n: fake_sheet_rows(args.rows, seed=i) for i, n in enumerate(names)}
+    sh, client = fake_spreadsheet(data, latency=args.latency)
+    t0 = time.perf_counter()
+    for _ in range(args.reruns): {n: get_data_before(sh, n) for n in names}
+    t_before, calls_before = time.perf_counter() - t0, sum(client.calls.values())
+    sh, client = fake_spreadsheet(data, latency=args.latency)
+    clock = FakeClock()
+    cache = sheets.SheetCache(sh, ttl=args.ttl, clock=clock)
+    t0 = time.perf_counter()
+    for _ in range(args.reruns):
+        cache.get_many(names)
+        clock.now += args.interval
+    t_after, calls_after = time.perf_counter() - t0, sum(client.calls.values())
+    print(f"{args.reruns} reruns x {len(names)} sheets x {args.rows} rows, {args.latency * 1000:.0f} ms/request, "
+          f"rerun every {args.interval}s, ttl {args.ttl}s")
+    print(f"  get_data every time (before)  {t_before:7.2f}s {calls_before:6} requests")
+    print(f"  SheetCache.get_many           {t_after:7.2f}s {calls_after:6} requests {dict(client.calls)}")
+    return 0
+
+
+def add_data_before(sh, name, row):
+    # app.add_data เดิม: metadata + append_row ทีละแถว (ไม่ลองใหม่ -> quota เต็ม = แถวหาย)
+    try:
+        sh.worksheet(name).append_row(row)
+        return True
+    except APIError:
+        return False
+
+
+def cmd_sheetwrite(args):
+    rows = [[f"671{i:07d}", f"ชื่อ{i}", 'G0001', str(i % 21), '20', ''] for i in range(args.rows)]
+    quota = (args.quota, args.window) if args.quota else None
+    print(f"{args.rows} rows from {args.threads} sessions, {args.latency * 1000:.0f} ms/request, "
+          f"write quota {f'{args.quota}/{args.window}s' if quota else 'none'}")
+
+    def producers(fn):
+        chunks = [rows[i::args.threads] for i in range(args.threads)]
+        out = [None] * args.threads
+        def work(k): out[k] = [fn(r) for r in chunks[k]]
+        threads = [threading.Thread(target=work, args=(k,)) for k in range(args.threads)]
+        for t in threads: t.start()
+        for t in threads: t.join()
+        return [x for part in out for x in part]
+
+    sh, client = fake_spreadsheet({'Results': fake_sheet_rows(0)}, latency=args.latency, write_quota=quota)
+    t0 = time.perf_counter()
+    ok_before = sum(producers(lambda r: add_data_before(sh, 'Results', r)))
+    t_before = time.perf_counter() - t0
+    print(f"  append_row per row (before)  {ok_before / t_before:8.1f} rows/s  {sum(client.calls.values()) - client.calls['429']:5} requests  "
+          f"{args.rows - ok_before} rows lost to quota")
+
+    sh, client = fake_spreadsheet({'Results': fake_sheet_rows(0)}, latency=args.latency, write_quota=quota)
+    writer = sheets.SheetWriter(sh, flush_rows=args.batch, flush_interval=args.interval, backoff=args.backoff)
+    t0 = time.perf_counter()
+    tickets = producers(lambda r: writer.append('Results', r))
+    t_enqueue = time.perf_counter() - t0
+    flushed = writer.flush(timeout=300)
+    t_after = time.perf_counter() - t0
+    written = client.sheets['Results'][1:]
+    print(f"  SheetWriter (batch {args.batch})     {len(written) / t_after:8.1f} rows/s  {sum(client.calls.values()) - client.calls['429']:5} requests  "
+          f"{client.calls['429']} x 429 retried, enqueue {t_enqueue * 1000:.1f} ms total")
+    print(f"  all tickets ok: {flushed and all(t.ok for t in tickets)}")
+    return 0
+
+
+# ==========================================
+# SQLite <-> Sheets replication
+# ==========================================
+def cmd_replication(args):
+    def sync(label):
+        client.calls.clear()
+        t0 = time.perf_counter()
+        done = rep.sync_once()
+        print(f"  {label:38} {(time.perf_counter() - t0) * 1000:8.1f} ms {sum(client.calls.values()):4} requests {dict(client.calls)}")
+        return done
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, "repl.db"))
+        seed_synthetic(db, n_students=args.students, grades_per_student=2, n_groups=20, n_exams=10)
+        conn = db.reader()
+        sh, client = fake_spreadsheet({}, latency=args.latency)
+        rep = replication.Replicator(db, lambda: sh)
+        print(f"{args.latency * 1000:.0f} ms/request, " + ", ".join(
+            f"{t.name} {conn.execute(f'SELECT COUNT(*) FROM {t.name}').fetchone()[0]}" for t in replication.TABLES))
+
+        # 1) ครั้งแรก: ส่งทุกแถวขึ้น Sheets
+        sync("bootstrap push")
+        sync("idle round (nothing changed)")
+
+        # 2) เปลี่ยนในเครื่อง: ส่งข้อสอบ (รวมส่งซ้ำ) / เพิ่มวิดีโอ / แก้ + ลบคำถาม
+        q = SubmissionQueue(db)
+        sids = [r[0] for r in conn.execute("SELECT std_id FROM students LIMIT ?", (args.submissions,))]
+        for t in [q.submit(random.randint(1, 10), sid, 10, 20, '2025-03-02 10:00') for sid in sids] + \
+                 [q.submit(1, sid, 15, 20, '2025-03-02 11:00') for sid in sids[:20]]: t.wait()
+        with db.writer() as w:
+            w.execute("INSERT INTO classroom_videos (sub_code, topic_name, video_url) VALUES ('ทช11001', 'บทที่ 1', 'https://youtu.be/x')")
+            w.execute("UPDATE exam_questions SET question_text='ข้อ 1 (แก้ไข)' WHERE id=1")
+            w.execute("DELETE FROM exam_questions WHERE id=2")
+        sync("push local changes")
+
+        # 3) แก้ใน Sheets: แก้คำถาม / เพิ่มวิดีโอแถวใหม่ไม่มีรหัส / ลบวิดีโอ (_deleted)
+        client.edit('exam_questions', 3, 2, 'ข้อ 3 (แก้จาก Sheets)')
+        client.sheets['classroom_videos'].append(['', 'ทช21001', 'บทที่ 2', 'https://youtu.be/y', '', ''])
+        client.edit('classroom_videos', 1, 5, '1')
+        sync("pull remote edits (+ write new id back)")
+        sync("idle round after own writes")
+
+        # 4) Sheets ล่ม: เวลาอ่านของหน้าเว็บระหว่างที่ thread ซิงก์พยายามเชื่อมต่อ
+        client.down = True
+        stop = threading.Event()
+        rounds = []
+        def syncer():
+            while not stop.is_set(): rounds.append(rep.sync_once())
+        th = threading.Thread(target=syncer); th.start()
+        reads = []
+        end = time.perf_counter() + args.outage
+        while time.perf_counter() < end:
+            sid = random.choice(sids)
+            t0 = time.perf_counter()
+            exams.exam_dashboard(conn, sid)
+            conn.execute("SELECT * FROM classroom_videos ORDER BY vid_id DESC").fetchall()
+            reads.append((time.perf_counter() - t0) * 1000)
+        for t in [q.submit(2, sid, 12, 20, '2025-03-03 10:00') for sid in sids[:50]]: t.wait()
+        stop.set(); th.join()
+        st = rep.status()
+        print(f"  outage: {len(rounds)} failed sync rounds, page reads p50 {_percentile(reads, 0.5):.2f} ms / p99 {_percentile(reads, 0.99):.2f} ms "
+              f"(one Sheets request = {args.latency * 1000:.0f} ms), pending {st['pending']}, last error {st['last_error']}")
+        client.down = False
+        sync("recovery round")
+        db.close()
+    return 0
+
+
+# ==========================================
+# Query / rerun instrumentation (perf.py)
+# ==========================================
+PERF_PAGES = (('admin', 'admin'), ('teacher', 'G0000'), ('student', None))
+
+
+def _perf_loop(conn, sids):
+    for sid in sids:
+        conn.execute("SELECT name, grp_code FROM students WHERE std_id=?", (sid,)).fetchone()
+        pd.read_sql("SELECT sub_code, grade FROM grades WHERE std_id=?", conn, params=(sid,))
+
+
+def cmd_perf(args):
+    from streamlit.testing.v1 import AppTest
+    from db import get_db
+    from loadtest import app_db_name
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        db = get_db(app_db_name())
+        n = seed_synthetic(db, n_students=args.students, grades_per_student=args.grades_per_student, n_groups=50)
+        print(f"seeded {n['students']:,} students / {n['grades']:,} grades")
+        plain = sqlite3.connect(db.path)
+        traced = sqlite3.connect(db.path, factory=perf.TracedConnection)
+        sids = [r[0] for r in plain.execute("SELECT std_id FROM students ORDER BY std_id LIMIT ?", (args.sample,))]
+
+        # 1) overhead: point query + pd.read_sql ต่อ นศ. 1 คน (2 statement)
+        t_plain = _median_ms(lambda: _perf_loop(plain, sids), args.repeat) / (2 * len(sids))
+        perf.clear()
+        t_traced = _median_ms(lambda: _perf_loop(traced, sids), args.repeat) / (2 * len(sids))
+        print(f"per statement: plain {t_plain * 1000:.1f} us | traced {t_traced * 1000:.1f} us "
+              f"(+{(t_traced - t_plain) * 1000:.1f} us, {100 * (t_traced / t_plain - 1):+.1f}%)")
+        plain.close(); traced.close()
+
+        # 2) rerun จริงของแต่ละบทบาท (AppTest): เวลา / จำนวน query ที่ perf.py บันทึก เทียบกับที่ SQLite รันจริง
+        perf.clear()
+        counter = _count_all_queries(db)
+        for page, user in PERF_PAGES:
+            at = AppTest.from_file(APP_PATH, default_timeout=300)
+            at.query_params["session"] = token_for(db, user or sids[0])
+            at.run()
+            counter[0] = 0
+            at.run()
+            last = perf.reruns[-1]
+            print(f"  {last.page:8s} rerun {last.ms:7.1f} ms | {last.n_queries:3d} queries ({last.query_ms:6.1f} ms, SQLite ran {counter[0]}) "
+                  f"| section {last.section!r}")
+        os.chdir(HERE)
+        db.close()
+    return 0
+
+
+# ==========================================
+# Session tokens (refresh storm)
+# ==========================================
+def restore_before(conn, username):
+    # restore_session เดิม: ?user= -> users แล้ว students ทุก session ใหม่
+    user = pd.read_sql("SELECT * FROM users WHERE username=?", conn, params=(username,))
+    if not user.empty: return user.iloc[0]['role']
+    std = pd.read_sql("SELECT * FROM students WHERE std_id=?", conn, params=(username,))
+    return None if std.empty else 'student'
+
+
+def _storm(fn, items):
+    # -> (ms ต่อ session, query ต่อ session) ผ่าน perf.py
+    run = perf.begin_rerun('bench')
+    t0 = time.perf_counter()
+    for x in items: fn(x)
+    ms = (time.perf_counter() - t0) * 1000
+    perf.end_rerun(run)
+    return ms / len(items), run.n_queries / len(items)
+
+
+def cmd_sessions(args):
+    from streamlit.testing.v1 import AppTest
+    from db import get_db
+    from loadtest import app_db_name
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        db = get_db(app_db_name())
+        seed_synthetic(db, n_students=args.students, grades_per_student=2, n_groups=50, n_exams=0)
+        conn = sqlite3.connect(db.path, factory=perf.TracedConnection)
+        sids = [r[0] for r in conn.execute("SELECT std_id FROM students ORDER BY std_id LIMIT ?", (args.sessions,))]
+        store = sessions.Sessions(db)
+        tokens = [store.issue(store.identity(sid)) for sid in sids]
+
+        # 1) refresh storm: ทุกคนเปิด session ใหม่ (รีเฟรช) พร้อมกัน
+        before = _storm(lambda sid: restore_before(conn, sid), sids)
+        restarted = sessions.Sessions(db)     # server รีสตาร์ต: cache ว่าง, กุญแจเดิมจาก DB
+        cold = _storm(restarted.restore, tokens)
+        warm = _storm(restarted.restore, tokens)
+        print(f"{len(sids)} sessions | before {before[0]:.3f} ms, {before[1]:.1f} queries/session | "
+              f"token after restart {cold[0]:.3f} ms, {cold[1]:.1f} q | token warm {warm[0]:.4f} ms, {warm[1]:.1f} q")
+        conn.close()
+
+        # 2) หน้าเว็บ: rerun แรกของ session ใหม่ด้วย token (ตัวตนอยู่ใน cache แล้ว)
+        at = AppTest.from_file(APP_PATH, default_timeout=300)
+        at.query_params["session"] = token_for(db, sids[1])
+        at.run()
+        last = perf.reruns[-1]
+        print(f"first rerun with token: page {last.page!r} | {last.ms:.1f} ms | {last.n_queries} queries")
+        os.chdir(HERE)
+        db.close()
+    return 0
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="School system performance checks")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("swap", help="เวลาที่ตารางจริงว่าง/ถูกล็อกระหว่างนำเข้า ZIP: inplace vs staged")
+    p.add_argument("--students", type=int, default=20000)
+    p.add_argument("--grades-per-student", type=int, default=25)
+    p.set_defaults(func=cmd_swap)
+    p = sub.add_parser("derived", help="หน้า ตารางสอบ / รายงานสถิติ: คำนวณตอน render (เดิม) vs คอลัมน์ที่คำนวณไว้ตอนนำเข้า")
+    p.add_argument("--students", type=int, default=20000)
+    p.add_argument("--grades-per-student", type=int, default=25)
+    p.add_argument("--repeat", type=int, default=5)
+    p.set_defaults(func=cmd_derived)
+    p = sub.add_parser("grading", help="ส่งข้อสอบ/วินาที: โหลดคำถาม + ตรวจทีละข้อ (เดิม) vs ชุดข้อสอบคอมไพล์ + ตรวจแบบ array")
+    p.add_argument("--students", type=int, default=300)
+    p.add_argument("--questions", type=int, default=60)
+    p.set_defaults(func=cmd_grading)
+    p = sub.add_parser("submit", help="นศ. ส่งข้อสอบพร้อมกัน: เขียนตรงทีละคน vs คิว + thread เขียน (fsync ต่อ batch)")
+    p.add_argument("--students", type=int, default=300)
+    p.set_defaults(func=cmd_submit)
+    p = sub.add_parser("dashboard", help="หน้ารายการแบบทดสอบ: query ทีละวิชา (เดิม) vs query เดียวต่อ rerun")
+    p.add_argument("--students", type=int, default=20000)
+    p.add_argument("--grades-per-student", type=int, default=25)
+    p.add_argument("--sample", type=int, default=200)
+    p.set_defaults(func=cmd_dashboard)
+    p = sub.add_parser("attendance", help="สถิติการเข้าสอบ (tab6): วนทีละกลุ่ม vs aggregation เดียวต่อเทอม + cache")
+    p.add_argument("--students", type=int, default=20000)
+    p.add_argument("--grades-per-student", type=int, default=25)
+    p.add_argument("--groups", type=int, default=200)
+    p.add_argument("--repeat", type=int, default=5)
+    p.set_defaults(func=cmd_attendance)
+    p = sub.add_parser("summary", help="ระหว่างสอบ: tab6 จากตารางดิบ vs ตารางสรุป + ตรวจว่าตารางสรุปตรงกับการคำนวณใหม่")
+    p.add_argument("--students", type=int, default=20000)
+    p.add_argument("--grades-per-student", type=int, default=25)
+    p.add_argument("--groups", type=int, default=200)
+    p.add_argument("--submissions", type=int, default=5000)
+    p.add_argument("--repeat", type=int, default=5)
+    p.set_defaults(func=cmd_summary)
+    p = sub.add_parser("admin", help="หน้า Admin: เวลาและจำนวน query ต่อ rerun แยกตามเมนู (AppTest)")
+    p.add_argument("--students", type=int, default=20000)
+    p.add_argument("--grades-per-student", type=int, default=25)
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--app", default=APP_PATH, help="ไฟล์ app ที่จะวัด (เช่น app.py เวอร์ชันก่อนหน้า)")
+    p.set_defaults(func=cmd_admin)
+    p = sub.add_parser("search", help="ค้นหา นศ./กลุ่ม: LIKE / pandas (เดิม) vs FTS5 trigram")
+    p.add_argument("--students", type=int, default=50000)
+    p.add_argument("--grades-per-student", type=int, default=2)
+    p.add_argument("--groups", type=int, default=300)
+    p.add_argument("--repeat", type=int, default=5)
+    p.set_defaults(func=cmd_search)
+    p = sub.add_parser("roster", help="หน้ารายชื่อ นศ. ของครู: เวลา rerun / จำนวน element ตามขนาดกลุ่ม (AppTest)")
+    p.add_argument("--students", type=int, default=20000)
+    p.add_argument("--grades-per-student", type=int, default=5)
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--app", default=APP_PATH, help="ไฟล์ app ที่จะวัด (เช่น app.py เวอร์ชันก่อนหน้า)")
+    p.set_defaults(func=cmd_roster)
+    p = sub.add_parser("matrix", help="ตารางคะแนนของครู: query + pivot ทุก rerun vs cache + patch เฉพาะแถว")
+    p.add_argument("--students", type=int, default=20000)
+    p.add_argument("--grades-per-student", type=int, default=3)
+    p.add_argument("--groups", type=int, default=40)
+    p.add_argument("--exams", type=int, default=15, help="จำนวนวิชาที่ นศ. แต่ละคนมีผลสอบ")
+    p.add_argument("--batch", type=int, default=10, help="ผลสอบใหม่ต่อรอบ")
+    p.add_argument("--rounds", type=int, default=10)
+    p.add_argument("--repeat", type=int, default=5)
+    p.set_defaults(func=cmd_matrix)
+    p = sub.add_parser("export", help="ดาวน์โหลดคะแนนทั้งเทอม: DataFrame + to_csv vs CSV/XLSX แบบ stream (หน่วยความจำสูงสุด)")
+    p.add_argument("--rows", type=int, default=500000)
+    p.add_argument("--students", type=int, default=30000)
+    p.add_argument("--groups", type=int, default=300)
+    p.set_defaults(func=cmd_export)
+    p = sub.add_parser("sheets", help="get_data() จาก Google Sheets (fake): ดาวน์โหลดทุกครั้ง vs cache + ตรวจการเปลี่ยนแปลง + batch_get")
+    p.add_argument("--sheets", type=int, default=4)
+    p.add_argument("--rows", type=int, default=2000)
+    p.add_argument("--reruns", type=int, default=50)
+    p.add_argument("--interval", type=float, default=2.0, help="วินาที (เวลาจำลอง) ระหว่าง rerun")
+    p.add_argument("--ttl", type=float, default=sheets.DEFAULT_TTL)
+    p.add_argument("--latency", type=float, default=0.05, help="วินาทีต่อ request")
+    p.set_defaults(func=cmd_sheets)
+    p = sub.add_parser("sheetwrite", help="add_data() ไป Google Sheets (fake): append_row ทีละแถว vs บัฟเฟอร์ + append_rows + retry")
+    p.add_argument("--rows", type=int, default=400)
+    p.add_argument("--threads", type=int, default=8, help="จำนวน session ที่เพิ่มแถวพร้อมกัน")
+    p.add_argument("--latency", type=float, default=0.05, help="วินาทีต่อ request")
+    p.add_argument("--quota", type=int, default=30, help="request เขียนต่อ --window วินาที (0 = ไม่จำกัด)")
+    p.add_argument("--window", type=float, default=5.0)
+    p.add_argument("--batch", type=int, default=sheets.FLUSH_ROWS)
+    p.add_argument("--interval", type=float, default=0.5)
+    p.add_argument("--backoff", type=float, default=0.5)
+    p.set_defaults(func=cmd_sheetwrite)
+    p = sub.add_parser("replication", help="ซิงก์ SQLite <-> Google Sheets (fake): push / pull / ขัดกัน / Sheets ล่ม")
+    p.add_argument("--students", type=int, default=2000)
+    p.add_argument("--submissions", type=int, default=300)
+    p.add_argument("--latency", type=float, default=0.05, help="วินาทีต่อ request")
+    p.add_argument("--outage", type=float, default=1.0, help="วินาทีที่จำลองว่า Sheets ล่ม")
+    p.set_defaults(func=cmd_replication)
+    p = sub.add_parser("perf", help="perf.py: overhead ต่อ statement + เวลา/จำนวน query ต่อ rerun ของทุกบทบาท (AppTest)")
+    p.add_argument("--students", type=int, default=5000)
+    p.add_argument("--grades-per-student", type=int, default=10)
+    p.add_argument("--sample", type=int, default=500)
+    p.add_argument("--repeat", type=int, default=5)
+    p.set_defaults(func=cmd_perf)
+    p = sub.add_parser("sessions", help="รีเฟรชพร้อมกันตอนเริ่มสอบ: query ตัวตนทุก session vs token ลงชื่อ + cache ตัวตน")
+    p.add_argument("--students", type=int, default=20000)
+    p.add_argument("--sessions", type=int, default=5000)
+    p.set_defaults(func=cmd_sessions)
+    args = ap.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,324 @@
+# ==========================================
+# Database layer (SQLite)
+# ==========================================
+# ตัวจัดการการเชื่อมต่อระดับ process: สร้างตารางครั้งเดียวตอนเริ่มระบบ
+# แจก connection สำหรับอ่าน (WAL, ใช้ร่วมกันได้หลาย thread) และมี writer ตัวเดียวแบบเข้าคิว
+import sqlite3
+import threading
+import itertools
+import weakref
+from contextlib import contextmanager
+
+READ_POOL_SIZE = 4
+
+PRAGMAS = [
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA cache_size=-20000",     # ~20MB ต่อ connection
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+]
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS grades (std_id TEXT, sub_code TEXT, semestry TEXT, grade TEXT, grp_code TEXT, sub_key TEXT, level_id TEXT)',
+    'CREATE TABLE IF NOT EXISTS schedule (sub_code TEXT, semestry TEXT, exam_day TEXT, exam_start TEXT, exam_end TEXT, sub_key TEXT, exam_time TEXT)',
+    'CREATE TABLE IF NOT EXISTS subjects (sub_code TEXT, sub_name TEXT, sub_key TEXT)',
+    'CREATE TABLE IF NOT EXISTS activities (std_id TEXT, semestry TEXT, act_name TEXT, act_type TEXT, hours REAL)',
+    'CREATE TABLE IF NOT EXISTS students (std_id TEXT PRIMARY KEY, prefix TEXT, name TEXT, surname TEXT, grp_code TEXT, phone TEXT, card_id TEXT, level TEXT)',
+    'CREATE TABLE IF NOT EXISTS groups (grp_code TEXT PRIMARY KEY, teacher_name TEXT)',
+    'CREATE TABLE IF NOT EXISTS users (username TEXT PRIMARY KEY, password TEXT, role TEXT, name TEXT, assigned_group TEXT)',
+    '''CREATE TABLE IF NOT EXISTS exams (
+        exam_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        exam_name TEXT,
+        sub_code TEXT,
+        semestry TEXT,
+        is_active INTEGER DEFAULT 0)''',
+    '''CREATE TABLE IF NOT EXISTS exam_questions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        exam_id INTEGER,
+        question_text TEXT,
+        choice_a TEXT, choice_b TEXT, choice_c TEXT, choice_d TEXT,
+        correct_answer TEXT)''',
+    'CREATE TABLE IF NOT EXISTS exam_results (id INTEGER PRIMARY KEY AUTOINCREMENT, exam_id INTEGER, std_id TEXT, score INTEGER, total_score INTEGER, timestamp TEXT)',
+    '''CREATE TABLE IF NOT EXISTS classroom_videos (
+        vid_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        sub_code TEXT,
+        topic_name TEXT,
+        video_url TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''',
+    '''CREATE TABLE IF NOT EXISTS tutoring_videos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT,
+        video_url TEXT,
+        description TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''',
+    # เลขเวอร์ชันของข้อมูลแต่ละกลุ่ม (cache ใช้ตรวจว่าต้องโหลดใหม่หรือไม่)
+    'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER)',
+]
+
+# index ที่ระบบดูแลเอง (ชื่อขึ้นต้น ix_) -> สร้างที่ขาด / ลบตัวที่เลิกใช้ ตอนเริ่มระบบ
+INDEXES = {
+    'ix_grades_key': 'grades(std_id, semestry, sub_code)',      # หน้า นศ. / JOIN ตาม std_id / natural key ตอน delta import
+    'ix_grades_sem_std_lvl': 'grades(semestry, std_id, level_id)',  # COUNT DISTINCT ต่อเทอม / แยกระดับชั้น (ภาพรวม/รายงาน)
+    'ix_schedule_key': 'schedule(sub_key, semestry)',           # ตารางสอบของ นศ. (JOIN ด้วยรหัสวิชาแบบตัดขีด)
+    'ix_students_grp': 'students(grp_code)',                    # หน้าครู กรองตามกลุ่ม
+    'ix_activities_std': 'activities(std_id)',
+    'ix_exams_active': 'exams(is_active)',
+    'ix_exam_questions_exam': 'exam_questions(exam_id)',
+    'ix_exam_results_exam_std': 'exam_results(exam_id, std_id)',  # ประวัติสอบรายวิชา
+    'ix_exam_results_std': 'exam_results(std_id)',
+}
+
+
+# ตารางเงา (staged import) สร้าง index ด้วยชื่อสำรอง (ชื่อ + ALT_SUFFIX) เพราะชื่อเดิมยังถูกตารางจริงใช้อยู่
+# หลังสลับตาราง index จะสลับชื่อไป-มา ระหว่าง 2 ชื่อนี้ -> นับเป็น index เดียวกัน
+ALT_SUFFIX = '_b'
+
+
+def index_table(name):
+    return INDEXES[name].split('(')[0]
+
+
+def _live_index_names(conn):
+    return {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='index' AND name GLOB 'ix_*'")}
+
+
+def ensure_indexes(conn):
+    existing = _live_index_names(conn)
+    keep, created = set(), []
+    for name in INDEXES:
+        have = [n for n in (name, name + ALT_SUFFIX) if n in existing]
+        if have: keep.add(have[0])
+        else:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {INDEXES[name]}")
+            created.append(name)
+    for name in existing - keep:
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
+    if created: conn.execute("ANALYZE")
+    return created
+
+
+def create_shadow_indexes(conn, table, shadow):
+    # สร้าง index ชุดเดียวกับ table บนตารางเงา โดยใช้ชื่อที่ตารางจริงไม่ได้ใช้อยู่
+    existing = _live_index_names(conn)
+    for name, spec in INDEXES.items():
+        if index_table(name) != table: continue
+        alt = name + ALT_SUFFIX if name in existing else name
+        conn.execute(f"DROP INDEX IF EXISTS {alt}")
+        conn.execute(f"CREATE INDEX {alt} ON {shadow}({spec.split('(', 1)[1]}")
+
+
+# ==========================================
+# Derived columns (คำนวณครั้งเดียวตอนนำเข้า)
+# ==========================================
+# คำนวณด้วย UPDATE ทั้งตาราง (set-based ใน SQLite) หลังโหลดข้อมูล -> หน้าเว็บอ่านค่าพร้อมใช้ ไม่ต้องวนทีละแถวใน Python
+def _first_digit_sql(col):
+    # ตัวเลขตัวแรกในข้อความ (เช่น ทร21001 -> '2'), ไม่มีตัวเลข -> ''
+    pos = ', '.join(f"coalesce(nullif(instr({col}, '{d}'), 0), 999)" for d in '0123456789')
+    return f"substr({col}, min({pos}), 1)"
+
+
+def _thai_time_sql(col):
+    # เทียบเท่า format_thai_time เดิม: 9.3 -> '09.30 น.', 930 -> '09.30 น.', 1330 -> '13.30 น.', ข้อความอื่นคงเดิม
+    t = f"trim({col})"
+    v = f"CAST({t} AS REAL)"
+    h = f"CAST({v} AS INTEGER)"
+    s = f"CAST({h} AS TEXT)"
+    return (f"CASE WHEN {col} IS NULL OR {t} = '' OR lower({t}) = 'nan' THEN '' "
+            f"WHEN {t} GLOB '*[0-9]*' AND {t} NOT GLOB '*[^0-9.]*' AND {t} NOT GLOB '*.*.*' THEN "
+            f"CASE WHEN {v} >= 24 THEN (CASE WHEN length({s}) = 4 THEN substr({s}, 1, 2) || '.' || substr({s}, 3) "
+            f"ELSE '0' || substr({s}, 1, 1) || '.' || substr({s}, 2) END) || ' น.' "
+            f"ELSE printf('%02d.%02d น.', {h}, CAST(round(({v} - {h}) * 100) AS INTEGER)) END "
+            f"ELSE {t} END")
+
+
+def _sub_key_sql(col):
+    return f"coalesce(trim(replace({col}, '-', '')), '')"
+
+
+# table -> (เงื่อนไขแถวที่ยังไม่ได้คำนวณ, SET ...)
+DERIVED = {
+    'grades': ("sub_key IS NULL OR level_id IS NULL",
+               f"sub_key = {_sub_key_sql('sub_code')}, "
+               f"level_id = CASE {_first_digit_sql('sub_code')} WHEN '1' THEN '1' WHEN '2' THEN '2' WHEN '3' THEN '3' ELSE 'Unknown' END"),
+    'schedule': ("sub_key IS NULL OR exam_time IS NULL",
+                 f"sub_key = {_sub_key_sql('sub_code')}, "
+                 f"exam_time = ({_thai_time_sql('exam_start')}) || '-' || ({_thai_time_sql('exam_end')})"),
+    'subjects': ("sub_key IS NULL", f"sub_key = {_sub_key_sql('sub_code')}"),
+    # ระดับชั้นจากหลักที่ 4 ของรหัสนักศึกษา (นำเข้าคำนวณให้แล้ว เติมเฉพาะข้อมูลเก่าที่ว่าง)
+    'students': ("level IS NULL OR level = ''",
+                 "level = CASE substr(std_id, 4, 1) WHEN '1' THEN 'ประถมศึกษา' WHEN '2' THEN 'มัธยมศึกษาตอนต้น' "
+                 "WHEN '3' THEN 'มัธยมศึกษาตอนปลาย' ELSE 'ไม่ระบุ' END"),
+}
+DERIVED_COLUMNS = {'grades': ['sub_key', 'level_id'], 'schedule': ['sub_key', 'exam_time'], 'subjects': ['sub_key']}
+
+
+def derive_columns(conn, table, target=None):
+    # target: ตารางที่จะเติมค่า (เช่น shadow_grades / temp.inc_grades) ค่าเริ่มต้นคือ table เอง
+    if table not in DERIVED: return 0
+    where, assign = DERIVED[table]
+    return conn.execute(f"UPDATE {target or table} SET {assign} WHERE {where}").rowcount
+
+
+def _migrate(conn):
+    # *MIGRATION CHECK*: DB เก่าที่ตาราง exams ยังไม่มี sub_code/semestry
+    cols = {r[1] for r in conn.execute("PRAGMA table_info(exams)")}
+    if 'sub_code' not in cols:
+        conn.execute("ALTER TABLE exams ADD COLUMN sub_code TEXT")
+    if 'semestry' not in cols:
+        conn.execute("ALTER TABLE exams ADD COLUMN semestry TEXT")
+    # DB เก่าที่ยังไม่มีคอลัมน์ที่คำนวณไว้ -> เพิ่มคอลัมน์แล้วเติมค่าครั้งเดียว
+    for table, names in DERIVED_COLUMNS.items():
+        cols = {r[1] for r in conn.execute(f"PRAGMA table_info({table})")}
+        for name in names:
+            if name not in cols: conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} TEXT")
+    for table in DERIVED: derive_columns(conn, table)
+
+
+# ==========================================
+# Hooks (ฟีเจอร์ลงทะเบียนเอง)
+# ==========================================
+# db.py เป็นชั้นล่างสุด ไม่ import module ของฟีเจอร์ -> แต่ละ module ลงทะเบียนตาราง/trigger/migration ของตัวเองตอน import
+# Database รัน hook ทั้งหมดครั้งเดียวตอนเริ่ม ตามลำดับที่ลงทะเบียน / ลงทะเบียนทีหลัง -> รันกับ DB ที่เปิดอยู่แล้วทันที
+_schema_hooks = []
+_open = weakref.WeakSet()
+_hooks_lock = threading.Lock()
+_connection_factory = sqlite3.Connection
+
+
+def _run_hook(conn, hook):
+    ddl, migrate = hook
+    for stmt in ddl: conn.execute(stmt)
+    if migrate is not None: migrate(conn)
+
+
+def register_schema(ddl=(), migrate=None):
+    # ddl: CREATE ... IF NOT EXISTS / migrate(conn): เติมข้อมูลครั้งแรกให้ DB เก่า (รันทุกครั้งที่เปิด DB ต้องเช็คเองว่าทำไปแล้วหรือยัง)
+    hook = (tuple(ddl), migrate)
+    with _hooks_lock:
+        _schema_hooks.append(hook)
+        live = list(_open)
+    for db in live:
+        with db.writer() as w: _run_hook(w, hook)
+
+
+def ensure_schema(conn):
+    # สร้างตาราง/trigger ที่ลงทะเบียนไว้อีกรอบ (IF NOT EXISTS) เช่น หลังสลับตาราง trigger ของตารางเดิมหายไปพร้อมตารางเก่า
+    with _hooks_lock: hooks = list(_schema_hooks)
+    for ddl, _ in hooks:
+        for stmt in ddl: conn.execute(stmt)
+
+
+def set_connection_factory(factory):
+    # connection ที่เปิดหลังจากนี้ใช้ factory นี้ (เช่น perf.TracedConnection จับเวลาทุก query)
+    global _connection_factory
+    _connection_factory = factory
+
+
+class Database:
+    def __init__(self, path, pool_size=READ_POOL_SIZE):
+        self.path = path
+        self.pool_size = pool_size
+        self._lock = threading.Lock()
+        self._write_lock = threading.RLock()
+        self._writer = None
+        self._readers = []
+        self._rr = itertools.count()
+        self._local = threading.local()
+        self.opened_total = 0
+        self._versions = {}
+        self._init_schema()
+
+    # --- connection ---
+    def _connect(self, read_only=False):
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5, factory=_connection_factory)
+        for p in PRAGMAS: conn.execute(p)
+        if read_only: conn.execute("PRAGMA query_only=1")
+        with self._lock: self.opened_total += 1
+        self._local.opened = getattr(self._local, 'opened', 0) + 1
+        return conn
+
+    def _init_schema(self):
+        # รันครั้งเดียวต่อ process (ไม่ต้องรัน DDL ทุกครั้งที่ rerun)
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        for ddl in SCHEMA: conn.execute(ddl)
+        _migrate(conn)
+        with _hooks_lock:
+            for hook in _schema_hooks: _run_hook(conn, hook)
+            _open.add(self)
+        ensure_indexes(conn)
+        conn.execute("INSERT OR IGNORE INTO users VALUES ('admin', '1234', 'admin', 'ผู้ดูแลระบบ', '')")
+        conn.commit()
+        self._versions = {k[len('version:'):]: v for k, v in conn.execute("SELECT key, value FROM meta WHERE key GLOB 'version:*'")}
+        self._writer = conn
+
+    def reader(self):
+        # pool ขนาดคงที่ ใช้ร่วมกันได้ทุก thread (sqlite3 serialized mode) -> ไม่เปิด connection ใหม่ทุก rerun
+        with self._lock:
+            if len(self._readers) < self.pool_size:
+                conn = None
+            else:
+                conn = self._readers[next(self._rr) % self.pool_size]
+        if conn is None:
+            conn = self._connect(read_only=True)
+            with self._lock: self._readers.append(conn)
+        return conn
+
+    @contextmanager
+    def writer(self, bump=(), durable=False):
+        # writer ตัวเดียวทั้ง process: เข้าคิวด้วย lock แล้ว commit/rollback ให้อัตโนมัติ
+        # bump: ชื่อเวอร์ชันข้อมูลที่การเขียนนี้ทำให้เปลี่ยน (เช่น 'ref', 'data') -> cache ที่ผูกไว้จะโหลดใหม่
+        # durable: fsync WAL ตอน commit (synchronous=FULL) สำหรับข้อมูลที่ยืนยันกับผู้ใช้แล้วว่าบันทึกสำเร็จ
+        if isinstance(bump, str): bump = (bump,)
+        with self._write_lock:
+            conn = self._writer
+            if durable: conn.execute("PRAGMA synchronous=FULL")
+            try:
+                yield conn
+                for name in bump:
+                    conn.execute("INSERT INTO meta VALUES (?, 1) ON CONFLICT(key) DO UPDATE SET value = value + 1", (f"version:{name}",))
+                conn.commit()
+            except BaseException:
+                # รวมถึง st.rerun()/st.stop() (ไม่ใช่ Exception) -> ไม่ทิ้ง transaction ค้างไว้
+                conn.rollback()
+                raise
+            finally:
+                if durable: conn.execute("PRAGMA synchronous=NORMAL")
+            for name in bump:
+                self._versions[name] = self._versions.get(name, 0) + 1
+
+    # --- data versions ---
+    def version(self, *names):
+        if len(names) == 1: return self._versions.get(names[0], 0)
+        return tuple(self._versions.get(n, 0) for n in names)
+
+    def bump(self, *names):
+        with self.writer(bump=names): pass
+
+    # --- per-rerun counter ---
+    def begin_rerun(self):
+        self._local.opened = 0
+
+    def opened_this_rerun(self):
+        return getattr(self._local, 'opened', 0)
+
+    def close(self):
+        with self._lock:
+            for conn in self._readers: conn.close()
+            self._readers = []
+        with self._write_lock:
+            if self._writer is not None: self._writer.close()
+            self._writer = None
+
+
+_instances = {}
+_instances_lock = threading.Lock()
+
+
+def get_db(path):
+    # instance เดียวต่อไฟล์ DB ทั้ง process (module นี้ไม่ถูก re-exec ตอน Streamlit rerun)
+    with _instances_lock:
+        if path not in _instances:
+            _instances[path] = Database(path)
+        return _instances[path]
@@ -0,0 +1,107 @@
+# ==========================================
+# Compiled exam question sets
+# ==========================================
+# ข้อสอบแต่ละชุดถูก "คอมไพล์" ครั้งเดียวต่อเวอร์ชัน (exam:<id>) เป็น object อ่านอย่างเดียว ใช้ร่วมกันทุก session
+# rerun ระหว่างทำข้อสอบ (กดเลือกคำตอบทุกครั้ง) ไม่ต้อง query ใหม่ / ตรวจคะแนนเป็นการเทียบ array ครั้งเดียว
+# แอดมินแก้/นำเข้า/ลบคำถาม -> db.writer(bump=exam_version(id)) -> คอมไพล์ใหม่ในการเรียกครั้งถัดไป
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+LETTERS = ('A', 'B', 'C', 'D')
+
+
+def exam_version(exam_id):
+    return f"exam:{int(exam_id)}"
+
+
+def _clean(text):
+    return str(text).strip()
+
+
+class CompiledExam:
+    __slots__ = ('exam_id', 'version', 'ids', 'texts', 'options', 'key', 'canon', '_rows')
+
+    def __init__(self, exam_id, version, rows):
+        # rows: [(id, question_text, choice_a, choice_b, choice_c, choice_d, correct_answer), ...] ตามลำดับ id
+        self.exam_id = exam_id
+        self.version = version
+        self.ids = tuple(r[0] for r in rows)
+        self.texts = tuple(r[1] for r in rows)
+        options, key = [], []
+        canon = np.full((len(rows), len(LETTERS)), -2, dtype=np.int16)
+        for q, r in enumerate(rows):
+            opts = tuple(o for o in r[2:6] if o and _clean(o) != "")  # กรองช้อยส์ว่าง
+            stripped = [_clean(o) for o in opts]
+            # ตัวเลือกที่ข้อความเหมือนกัน (หลังตัดช่องว่าง) นับเป็นคำตอบเดียวกัน -> ชี้ไปตัวแรก
+            for i, s in enumerate(stripped): canon[q, i] = stripped.index(s)
+            correct = r[2 + LETTERS.index(r[6])] if r[6] in LETTERS else ""
+            correct = _clean(correct)
+            key.append(stripped.index(correct) if correct in stripped else -1)
+            options.append(opts)
+        self.options = tuple(options)
+        self.key = np.array(key, dtype=np.int16)
+        self.canon = canon
+        self._rows = np.arange(len(rows))
+        for arr in (self.key, self.canon, self._rows): arr.flags.writeable = False
+
+    def __len__(self):
+        return len(self.ids)
+
+    def questions(self):
+        # (ลำดับ, id, โจทย์, ตัวเลือก)
+        return zip(range(len(self.ids)), self.ids, self.texts, self.options)
+
+    def grade(self, answers):
+        # answers: index ตัวเลือกที่เลือกของแต่ละข้อ (None = ยังไม่ตอบ) เรียงตามข้อ -> (คะแนน, จำนวนข้อที่ตอบ)
+        ans = np.fromiter((-1 if a is None else a for a in answers), dtype=np.int16, count=len(self.ids))
+        answered = ans >= 0
+        picked = np.where(answered, self.canon[self._rows, np.maximum(ans, 0)], -3)
+        return int(np.count_nonzero(picked == self.key)), int(np.count_nonzero(answered))
+
+
+def compile_exam(conn, exam_id, version=0):
+    rows = conn.execute("SELECT id, question_text, choice_a, choice_b, choice_c, choice_d, correct_answer "
+                        "FROM exam_questions WHERE exam_id=? ORDER BY id", (int(exam_id),)).fetchall()
+    return CompiledExam(int(exam_id), version, rows)
+
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def get_exam(db, exam_id):
+    version = db.version(exam_version(exam_id))
+    key = (db.path, int(exam_id))
+    exam = _cache.get(key)
+    if exam is not None and exam.version == version: return exam
+    with _cache_lock:
+        exam = _cache.get(key)
+        if exam is None or exam.version != version:
+            exam = compile_exam(db.reader(), exam_id, version)
+            _cache[key] = exam
+    return exam
+
+
+# ==========================================
+# Student exam dashboard
+# ==========================================
+# 1 query ต่อ rerun: ข้อสอบที่เปิดอยู่ + นศ. ลงทะเบียนวิชานั้น + ยังไม่มีผลการเรียน + ผลสอบครั้งล่าสุด (ถ้ามี)
+# ผลการเรียน '', 'nan', 'none' (ไม่สนตัวพิมพ์) = ยังไม่ผ่าน เหมือนเงื่อนไขเดิมในหน้าเว็บ
+DASHBOARD_SQL = """
+    SELECT e.exam_id, trim(e.sub_code) AS sub_code, e.exam_name, r.id AS result_id, r.score, r.total_score, r.timestamp
+    FROM exams e
+    LEFT JOIN exam_results r ON r.id = (SELECT MAX(id) FROM exam_results WHERE exam_id = e.exam_id AND std_id = ?)
+    WHERE e.is_active = 1
+      AND EXISTS (SELECT 1 FROM grades g WHERE g.std_id = ? AND trim(g.sub_code) = trim(e.sub_code))
+      AND NOT EXISTS (SELECT 1 FROM grades g WHERE g.std_id = ? AND trim(g.sub_code) = trim(e.sub_code)
+                      AND lower(trim(coalesce(g.grade, ''))) NOT IN ('', 'nan', 'none'))
+    ORDER BY e.exam_id
+"""
+
+DashboardRow = namedtuple('DashboardRow', 'exam_id sub_code exam_name result_id score total_score timestamp')
+
+
+def exam_dashboard(conn, std_id):
+    return [DashboardRow(*r) for r in conn.execute(DASHBOARD_SQL, (std_id,) * 3)]
@@ -0,0 +1,173 @@
+# ==========================================
+# Report exports (CSV / XLSX แบบ stream)
+# ==========================================
+# ไฟล์ดาวน์โหลดสร้าง "ตอนกดดาวน์โหลด" เท่านั้น (st.download_button รับ callable) ไม่ใช่ทุก rerun
+# - เขียนทีละ chunk จาก cursor ของ SQL ลงไฟล์ชั่วคราว (csv.writer / openpyxl write-only) -> หน่วยความจำไม่โตตามจำนวนแถว
+# - ไฟล์ที่สร้างแล้ว cache ต่อ (รายงาน, key, รูปแบบ) + เวอร์ชันข้อมูล ใช้ร่วมกันทุก session จนกว่าข้อมูลจะเปลี่ยน
+import csv
+import hashlib
+import io
+import os
+import sqlite3
+import tempfile
+import threading
+from collections import namedtuple
+
+from openpyxl import Workbook
+
+import perf
+from matrix import get_matrix
+
+EXPORT_DIR = os.path.join(tempfile.gettempdir(), 'schoolsystem_exports')
+CHUNK_ROWS = 5000
+MIME = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+# คะแนนสอบรายบุคคลทั้งเทอม (tab6): ผลสอบของ นศ. ที่ลงทะเบียนในเทอมนั้น ใหม่สุดก่อน
+_TERM_SCORES_SELECT = """
+    SELECT r.timestamp, r.std_id, s.prefix || s.name || ' ' || s.surname AS fullname,
+           s.grp_code, e.sub_code, e.exam_name, r.score, r.total_score
+    FROM exam_results r
+    JOIN students s ON r.std_id = s.std_id
+    LEFT JOIN exams e ON r.exam_id = e.exam_id
+    WHERE EXISTS (SELECT 1 FROM grades g WHERE g.std_id = r.std_id AND g.semestry = ?)
+"""
+TERM_SCORES_SQL = _TERM_SCORES_SELECT + "    ORDER BY r.timestamp DESC\n"
+TERM_SCORES_COLUMNS = ('timestamp', 'std_id', 'fullname', 'grp_code', 'sub_code', 'exam_name', 'score', 'total_score')
+TERM_SCORES_HEADER = ['เวลาส่ง', 'รหัสนักศึกษา', 'ชื่อ-นามสกุล', 'กลุ่ม', 'รหัสวิชา', 'ชื่อข้อสอบ', 'คะแนน', 'คะแนนเต็ม']
+TERM_SCORES_VERSIONS = ('data', 'results', 'exams')
+PREVIEW_PAGE_SIZE = 100
+
+Export = namedtuple('Export', 'path rows version')
+PreviewPage = namedtuple('PreviewPage', 'rows total page pages')
+
+
+# ==========================================
+# On-screen preview (ทีละหน้าจาก SQL)
+# ==========================================
+# ตารางบนหน้าจอของ tab6 ดึงเฉพาะหน้าที่แสดง (LIMIT/OFFSET แบบ roster_page) ไฟล์ทั้งเทอมสร้างตอนกดดาวน์โหลดเท่านั้น
+# คำค้น = ข้อความย่อยในคอลัมน์ใดก็ได้ ไม่สนตัวพิมพ์ (เหมือน str.contains เดิม) กรองใน SQL
+def _term_scores_filter(kw):
+    if not kw or not str(kw).strip(): return "", ()
+    cond = ' OR '.join(f"instr(lower(CAST(t.{c} AS TEXT)), ?) > 0" for c in TERM_SCORES_COLUMNS)
+    return f" WHERE {cond}", (str(kw).strip().lower(),) * len(TERM_SCORES_COLUMNS)
+
+
+def term_scores_page(conn, term, kw=None, page=0, size=PREVIEW_PAGE_SIZE):
+    # rows: tuple ตามลำดับ TERM_SCORES_HEADER ของหน้าที่ขอ (หน้าเกินช่วง -> หน้าสุดท้าย)
+    where, params = _term_scores_filter(kw)
+    base = f"SELECT * FROM ({_TERM_SCORES_SELECT}) t{where}"
+    total = conn.execute(f"SELECT COUNT(*) FROM ({base})", (term,) + params).fetchone()[0]
+    pages = max(1, -(-total // size))
+    page = min(max(0, int(page)), pages - 1)
+    rows = conn.execute(f"{base} ORDER BY t.timestamp DESC LIMIT ? OFFSET ?", (term,) + params + (size, page * size)).fetchall()
+    return PreviewPage(rows, total, page, pages)
+
+
+# ==========================================
+# Writers (rows = iterable ของ tuple)
+# ==========================================
+def cursor_rows(cur, size=CHUNK_ROWS):
+    while True:
+        chunk = cur.fetchmany(size)
+        if not chunk: return
+        yield from chunk
+
+
+def frame_rows(frame):
+    # DataFrame -> tuple ทีละแถว (NaN เป็นช่องว่าง เหมือน to_csv)
+    return frame.astype(object).where(frame.notna(), None).itertuples(index=False, name=None)
+
+
+def write_csv(fh, header, rows):
+    # fh: ไฟล์ข้อความ (utf-8-sig, newline='') -> ผลเหมือน df.to_csv(index=False)
+    out = csv.writer(fh, lineterminator='\n')
+    out.writerow(header)
+    n = 0
+    for n, row in enumerate(rows, 1): out.writerow(row)
+    return n
+
+
+def write_xlsx(target, header, rows, sheet='Report'):
+    # write-only workbook: แถวถูก flush ลงไฟล์ชั่วคราวของ openpyxl ทันที ไม่เก็บ cell ไว้ในหน่วยความจำ
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(sheet)
+    ws.append(header)
+    n = 0
+    for n, row in enumerate(rows, 1): ws.append(row)
+    wb.save(target)
+    return n
+
+
+def write_export(path, fmt, header, rows):
+    if fmt == 'csv':
+        with open(path, 'w', encoding='utf-8-sig', newline='') as fh: return write_csv(fh, header, rows)
+    return write_xlsx(path, header, rows)
+
+
+def export_bytes(fmt, header, rows):
+    # ไฟล์เล็ก (เช่น ผลค้นหา) สร้างในหน่วยความจำ ไม่ต้อง cache
+    buf = io.BytesIO()
+    if fmt == 'csv':
+        fh = io.TextIOWrapper(buf, encoding='utf-8-sig', newline='')
+        write_csv(fh, header, rows)
+        fh.flush(); fh.detach()
+    else: write_xlsx(buf, header, rows)
+    return buf.getvalue()
+
+
+def read_file(path):
+    with open(path, 'rb') as fh: return fh.read()
+
+
+# ==========================================
+# Cached artefacts
+# ==========================================
+_cache = {}
+_cache_lock = threading.Lock()
+_build_locks = {}
+
+
+def get_export(db, name, key, fmt, version, header, rows_fn):
+    # rows_fn(conn) -> rows ถูกเรียกเฉพาะตอนต้องสร้างไฟล์ใหม่ (connection แยกของงานนี้ ไม่แย่ง pool ของหน้าเว็บ)
+    cache_key = (db.path, name, key, fmt)
+    art = _cache.get(cache_key)
+    if art is not None and art.version == version and os.path.exists(art.path): return art
+    with _cache_lock: lock = _build_locks.setdefault(cache_key, threading.Lock())
+    with lock:
+        art = _cache.get(cache_key)
+        if art is not None and art.version == version and os.path.exists(art.path): return art
+        os.makedirs(EXPORT_DIR, exist_ok=True)
+        stem = hashlib.sha1(repr(cache_key).encode('utf-8')).hexdigest()[:16]
+        path = os.path.join(EXPORT_DIR, f"{stem}.{fmt}")
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        conn = sqlite3.connect(db.path, factory=perf.TracedConnection)
+        try:
+            n = write_export(tmp, fmt, header, rows_fn(conn))
+        finally:
+            conn.close()
+        os.replace(tmp, path)
+        art = Export(path, n, version)
+        _cache[cache_key] = art
+    return art
+
+
+def term_scores_export(db, term, fmt):
+    return get_export(db, 'term_scores', term, fmt, db.version(*TERM_SCORES_VERSIONS), TERM_SCORES_HEADER,
+                      lambda conn: cursor_rows(conn.execute(TERM_SCORES_SQL, (term,))))
+
+
+def matrix_export(db, grp_code, fmt):
+    # ตารางคะแนนทั้งกลุ่ม: เขียนจาก frame ที่ cache ไว้ (matrix.py) ตามเวอร์ชันของ frame นั้น
+    matrix = get_matrix(db, grp_code)
+    return get_export(db, 'matrix', grp_code, fmt, matrix.version, list(matrix.frame.columns), lambda conn: frame_rows(matrix.frame))
+
+
+def download(build):
+    # build() -> Export / bytes  ใช้เป็น data ของ st.download_button (เรียกตอนกดเท่านั้น)
+    def data():
+        out = build()
+        return read_file(out.path) if isinstance(out, Export) else out
+    return data
@@ -0,0 +1,560 @@
+# ==========================================
+# DBF Import (streaming)
+# ==========================================
+# อ่าน record จากไฟล์ใน ZIP โดยตรง (ไม่เขียน temp file / ไม่โหลดทั้งตาราง)
+# แปลงและ insert ทีละ batch ขนาดคงที่ -> ใช้หน่วยความจำคงที่ไม่ว่าไฟล์จะใหญ่แค่ไหน
+import datetime
+import io
+import os
+import re
+import struct
+import time
+import zipfile
+import multiprocessing
+from collections import deque
+
+from db import create_shadow_indexes, derive_columns, ensure_schema
+from search import rebuild_search
+from summary import rebuild_summaries
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+ENCODING = 'cp874'
+BATCH_SIZE = 5000
+MIN_DBF_SIZE = 50
+
+
+# ==========================================
+# 1. DBF reader
+# ==========================================
+def _parse_number(raw):
+    s = raw.decode('ascii', 'ignore').strip()
+    if not s: return None
+    try: return int(s)
+    except ValueError:
+        try: return float(s)
+        except ValueError: return None
+
+
+def _parse_date(raw):
+    s = raw.decode('ascii', 'ignore').strip()
+    return f"{s[:4]}-{s[4:6]}-{s[6:8]}" if len(s) == 8 and s.isdigit() else None
+
+
+def _parse_logical(raw):
+    c = raw.decode('ascii', 'ignore').strip()[:1].upper()
+    if c in ('T', 'Y'): return True
+    if c in ('F', 'N'): return False
+    return None
+
+
+# ชนิดไบนารีของ FoxPro / dBase (ค่าเหมือน dbfread ที่ใช้ก่อนหน้านี้)
+JULIAN_OFFSET = 1721425     # julian day -> ordinal ของ datetime
+VFP_VERSIONS = (0x30, 0x31, 0x32)   # Visual FoxPro: B = double / รุ่นอื่น B = memo
+
+
+def _parse_int(raw):
+    return struct.unpack('<i', raw)[0]
+
+
+def _parse_currency(raw):
+    # int64 ทศนิยม 4 ตำแหน่ง -> float (SQLite ไม่รับ Decimal)
+    return struct.unpack('<q', raw)[0] / 10000
+
+
+def _parse_double(raw):
+    return struct.unpack('<d', raw)[0]
+
+
+def _parse_datetime(raw):
+    # julian day + มิลลิวินาทีนับจากเที่ยงคืน -> 'YYYY-MM-DD HH:MM:SS' (รูปแบบเดียวกับ D)
+    if not raw.strip(): return None
+    day, msec = struct.unpack('<II', raw)
+    if not day: return None
+    dt = datetime.datetime.fromordinal(day - JULIAN_OFFSET) + datetime.timedelta(milliseconds=msec)
+    return dt.isoformat(' ', 'seconds')
+
+
+def _parse_memo(raw):
+    return None  # ไม่มีไฟล์ memo (ignore_missing_memofile)
+
+
+FIELD_PARSERS = {
+    'N': _parse_number, 'F': _parse_number, 'D': _parse_date, 'L': _parse_logical,
+    'I': _parse_int, '+': _parse_int, 'Y': _parse_currency, 'T': _parse_datetime, 'B': _parse_double, 'O': _parse_double,
+    'M': _parse_memo, 'G': _parse_memo, 'P': _parse_memo, '0': _parse_memo,    # 0 = _NullFlags ของระบบ VFP
+}
+
+
+class DBFStream:
+    def __init__(self, fileobj, encoding=ENCODING):
+        self.f = fileobj
+        self.encoding = encoding
+        head = [self._read(32)]
+        self.version = head[0][0]
+        self.num_records, self.header_len, self.record_len = struct.unpack('<IHH', head[0][4:12])
+        self.consumed = 0
+        self.fields = []  # (NAME, type, offset, length)
+        offset = 1  # byte แรกของ record คือ deletion flag
+        read = 32
+        while True:
+            first = self._read(1); read += 1
+            head.append(first)
+            if first in (b'\r', b''): break
+            desc = first + self._read(31); read += 31
+            head[-1] = desc
+            name = desc[:11].split(b'\0')[0].decode('ascii', 'ignore').upper().strip()
+            ftype = chr(desc[11])
+            length = desc[16]
+            self.fields.append((name, ftype, offset, length))
+            offset += length
+        head.append(self._read(self.header_len - read))  # byte ที่เหลือของ header
+        self.header = b''.join(head)
+
+    def _read(self, n):
+        if n <= 0: return b''
+        buf = self.f.read(n)
+        while len(buf) < n:
+            more = self.f.read(n - len(buf))
+            if not more: break
+            buf += more
+        return buf
+
+    @property
+    def columns(self):
+        return [f[0] for f in self.fields]
+
+    def _parser(self, name, ftype):
+        if ftype == 'C':
+            enc = self.encoding
+            return lambda raw: raw.decode(enc, 'ignore').strip()
+        if ftype == 'B' and self.version not in VFP_VERSIONS: return _parse_memo
+        if ftype not in FIELD_PARSERS:
+            # ไม่เดาเป็นข้อความ (ค่าไบนารีจะกลายเป็นขยะในตาราง) -> ไฟล์นี้นำเข้าไม่สำเร็จพร้อมเหตุผล
+            raise ValueError(f"ไม่รองรับฟิลด์ชนิด '{ftype}' (คอลัมน์ {name})")
+        return FIELD_PARSERS[ftype]
+
+    def read_raw(self, count):
+        # byte ดิบของ record ถัดไปไม่เกิน count ตัว (ยังไม่ถอดรหัส) -> b'' เมื่อครบไฟล์
+        count = min(count, self.num_records - self.consumed)
+        raw = self._read(count * self.record_len)
+        n = len(raw) // self.record_len
+        self.consumed += n
+        return raw[:n * self.record_len]
+
+    def iter_batches(self, batch_size=BATCH_SIZE, start=0, count=None):
+        # yield list ของ dict (ต่อ batch) ข้าม record ที่ถูกลบ ('*')
+        # start/count: อ่านเฉพาะช่วง record (start ใช้ seek -> เฉพาะไฟล์ที่ไม่ได้บีบอัด)
+        if start: self.f.seek(self.header_len + start * self.record_len)
+        remaining = self.num_records - start
+        if count is not None: remaining = min(remaining, count)
+        rl = self.record_len
+        fields = [(name, self._parser(name, t), off, ln) for name, t, off, ln in self.fields]
+        while remaining > 0:
+            n = min(batch_size, remaining)
+            chunk = self._read(n * rl)
+            n = len(chunk) // rl
+            if n == 0: break
+            remaining -= n
+            self.consumed += n
+            batch = []
+            for i in range(0, n * rl, rl):
+                if chunk[i:i+1] == b'*': continue
+                if chunk[i:i+1] == b'\x1a': remaining = 0; break
+                batch.append({name: parse(chunk[i+off:i+off+ln]) for name, parse, off, ln in fields})
+            yield batch
+
+
+# ==========================================
+# 2. Field cleaning & mapping
+# ==========================================
+def _s(rec, *keys):
+    for k in keys:
+        if k in rec:
+            v = rec[k]
+            return '' if v is None else str(v).strip()
+    return ''
+
+
+def clean_id(val):
+    s = str(val).strip().replace('.0', '')
+    return re.sub(r'[^0-9]', '', s)
+
+
+def level_from_id(sid):
+    if len(sid) >= 4:
+        return {'1': 'ประถมศึกษา', '2': 'มัธยมศึกษาตอนต้น', '3': 'มัธยมศึกษาตอนปลาย'}.get(sid[3], "ไม่ระบุ")
+    return "ไม่ระบุ"
+
+
+def map_students(batch):
+    rows = []
+    for r in batch:
+        sid = clean_id(_s(r, 'STD_CODE', 'ID'))[-10:]
+        if sid:
+            rows.append((sid, _s(r, 'PRENAME'), _s(r, 'NAME'), _s(r, 'SURNAME'), _s(r, 'GRP_CODE'), _s(r, 'PHONE'), clean_id(_s(r, 'CARDID')), level_from_id(sid)))
+    return {'students': rows}
+
+
+def map_grades(batch):
+    return {'grades': [(clean_id(_s(r, 'STD_CODE'))[-10:], _s(r, 'SUB_CODE'), _s(r, 'SEMESTRY'), _s(r, 'GRADE'), _s(r, 'GRP_CODE')) for r in batch]}
+
+
+def map_activities(batch):
+    return {'activities': [(clean_id(_s(r, 'STD_CODE'))[-10:], _s(r, 'SEMESTRY'), _s(r, 'ACT_NAME', 'ACTIVITY', 'NAME'), 'กพช.', r.get('HOUR') or 0) for r in batch]}
+
+
+def map_groups(batch):
+    grp, users = [], []
+    for r in batch:
+        gc, tn = _s(r, 'GRP_CODE'), _s(r, 'TEACHER_NAME', 'GRP_ADVIS')
+        grp.append((gc, tn))
+        users.append((gc, gc, 'teacher', tn, gc))
+    return {'groups': grp, 'users': users}
+
+
+def map_schedule(batch):
+    return {'schedule': [(_s(r, 'SUB_CODE'), _s(r, 'SEMESTRY'), _s(r, 'EXAM_DAY'), _s(r, 'EXAM_START'), _s(r, 'EXAM_END')) for r in batch]}
+
+
+def map_subjects(batch):
+    return {'subjects': [(_s(r, 'SUB_CODE'), _s(r, 'SUB_NAME')) for r in batch]}
+
+
+# เลือกตัวแปลงจากชื่อไฟล์ (ลำดับสำคัญ เหมือนเดิม)
+FILE_KINDS = [
+    (lambda fn: 'student' in fn or 'reg' in fn, map_students),
+    (lambda fn: 'grade' in fn, map_grades),
+    (lambda fn: 'activit' in fn, map_activities),
+    (lambda fn: 'group' in fn, map_groups),
+    (lambda fn: 'schedule' in fn, map_schedule),
+    (lambda fn: 'subject' in fn, map_subjects),
+]
+
+# ระบุคอลัมน์ต้นทางชัดเจน คอลัมน์ที่คำนวณได้ (sub_key, level_id, exam_time) เติมด้วย db.derive_columns หลังโหลด
+INSERT_SQL = {
+    'students': "INSERT OR REPLACE INTO students VALUES (?,?,?,?,?,?,?,?)",
+    'grades': "INSERT INTO grades (std_id, sub_code, semestry, grade, grp_code) VALUES (?,?,?,?,?)",
+    'schedule': "INSERT INTO schedule (sub_code, semestry, exam_day, exam_start, exam_end) VALUES (?,?,?,?,?)",
+    'subjects': "INSERT OR REPLACE INTO subjects (sub_code, sub_name) VALUES (?,?)",
+    'activities': "INSERT INTO activities VALUES (?,?,?,?,?)",
+    'groups': "INSERT OR REPLACE INTO groups VALUES (?,?)",
+    'users': "INSERT OR IGNORE INTO users VALUES (?,?,?,?,?)",
+}
+
+IMPORT_TABLES = ['grades', 'schedule', 'subjects', 'activities', 'students', 'groups']
+
+# natural key ของแต่ละตาราง (ใช้จับคู่แถวตอนนำเข้าแบบ delta)
+DELTA_KEYS = {
+    'grades': ['std_id', 'sub_code', 'semestry'],
+    'students': ['std_id'],
+    'groups': ['grp_code'],
+    'subjects': ['sub_code'],
+    'schedule': ['sub_code', 'semestry'],
+    'activities': ['std_id', 'semestry', 'act_name'],
+    'users': ['username'],
+}
+# คอลัมน์ที่ไม่เอามาเทียบ (รหัสผ่านที่แอดมินเปลี่ยนแล้วต้องไม่ถูกทับ)
+DELTA_SKIP = {'users': {'password'}}
+# ขอบเขตแถวเดิมที่ delta ลบได้
+DELTA_SCOPE = {'users': "role = 'teacher'"}
+SHADOW_SQL = {t: sql.replace(f'INTO {t} ', f'INTO shadow_{t} ') for t, sql in INSERT_SQL.items()}
+STAGE_SQL = {t: sql.replace('INSERT OR REPLACE INTO ', 'INSERT INTO ').replace('INSERT OR IGNORE INTO ', 'INSERT INTO ')
+                   .replace(f'INTO {t} ', f'INTO temp.inc_{t} ') for t, sql in INSERT_SQL.items()}
+
+
+def mapper_for(fname):
+    fn = fname.lower()
+    for match, mapper in FILE_KINDS:
+        if match(fn): return mapper
+    return None
+
+
+# ==========================================
+# 3. Import
+# ==========================================
+def dbf_members(z):
+    return [i for i in z.infolist() if i.filename.lower().endswith('.dbf') and i.file_size >= MIN_DBF_SIZE]
+
+
+def write_rows(db, mapped, counts, sql=INSERT_SQL):
+    with db.writer() as w:
+        for tbl, rows in mapped.items():
+            if rows: w.executemany(sql[tbl], rows)
+            counts[tbl] = counts.get(tbl, 0) + len(rows)
+
+
+def _report(fname, records=0, seconds=0.0, write_s=0.0, tables=None, error=None):
+    return {'file': fname, 'records': records, 'seconds': seconds, 'decode_s': max(seconds - write_s, 0.0),
+            'write_s': write_s, 'tables': tables or {}, 'error': error}
+
+
+def import_member(db, z, info, batch_size=BATCH_SIZE, on_progress=None, sql=INSERT_SQL):
+    # คืนค่า report ของไฟล์ (จำนวน record, เวลาอ่าน/แปลง vs เวลาเขียน)
+    mapper = mapper_for(info.filename)
+    counts = {}
+    done = 0
+    write_s = 0.0
+    t0 = time.perf_counter()
+    if mapper is None: return _report(info.filename)
+    with z.open(info) as f:
+        table = DBFStream(f)
+        for batch in table.iter_batches(batch_size):
+            if batch:
+                mapped = mapper(batch)
+                tw = time.perf_counter()
+                write_rows(db, mapped, counts, sql)
+                write_s += time.perf_counter() - tw
+            done += len(batch)
+            if on_progress: on_progress(info.filename, table.consumed, table.num_records, time.perf_counter() - t0)
+    return _report(info.filename, done, time.perf_counter() - t0, write_s, counts)
+
+
+def clear_import_tables(db):
+    with db.writer() as w:
+        for t in IMPORT_TABLES: w.execute(f"DELETE FROM {t}")
+        w.execute("DELETE FROM users WHERE role != 'admin'")
+
+
+# ==========================================
+# 3.1 Staged (shadow table) import
+# ==========================================
+# โหลดลง shadow_<table> ในไฟล์ DB เดียวกัน -> ตรวจสอบ -> สลับชื่อตารางใน transaction สั้น ๆ
+# ระหว่างนำเข้า ผู้ใช้ยังเห็นข้อมูลเดิมครบ ถ้าพังกลางทางข้อมูลเดิมไม่หาย
+class ImportValidationError(Exception):
+    pass
+
+
+def _shadow_ddl(w, table):
+    sql = w.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name=?", (table,)).fetchone()[0]
+    return re.sub(r'^CREATE TABLE\s+"?\w+"?', f'CREATE TABLE shadow_{table}', sql)
+
+
+def drop_shadow(db):
+    with db.writer() as w:
+        for t in IMPORT_TABLES + ['users']: w.execute(f"DROP TABLE IF EXISTS shadow_{t}")
+
+
+def begin_shadow(db):
+    drop_shadow(db)
+    with db.writer() as w:
+        for t in IMPORT_TABLES + ['users']: w.execute(_shadow_ddl(w, t))
+
+
+def validate_shadow(db, report):
+    problems = [f"{r['file']}: {r['error']}" for r in report if r['error']]
+    with db.writer() as w:
+        for t in _present_tables(report):
+            if t in IMPORT_TABLES and w.execute(f"SELECT COUNT(*) FROM shadow_{t}").fetchone()[0] == 0:
+                problems.append(f"ตาราง {t} ไม่มีข้อมูล")
+        for t in ('students', 'grades', 'activities'):
+            bad = w.execute(f"SELECT COUNT(*) FROM shadow_{t} WHERE std_id IS NULL OR std_id = ''").fetchone()[0]
+            if bad: problems.append(f"ตาราง {t} มีรหัสนักศึกษาว่าง {bad:,} แถว")
+    if problems: raise ImportValidationError('; '.join(problems))
+
+
+def swap_shadow(db, report):
+    try:
+        # คอลัมน์ที่คำนวณได้ + index สร้างหลังโหลดเสร็จ (เร็วกว่าอัปเดต index ทีละแถว) และทำนอก transaction สลับตาราง
+        for t in IMPORT_TABLES:
+            with db.writer() as w:
+                derive_columns(w, t, f"shadow_{t}")
+                create_shadow_indexes(w, t, f"shadow_{t}")
+        validate_shadow(db, report)
+    except BaseException:
+        drop_shadow(db)
+        raise
+    t0 = time.perf_counter()
+    with db.writer() as w:
+        w.execute("BEGIN IMMEDIATE")
+        for t in IMPORT_TABLES:
+            # rename อย่างเดียว (แก้แค่ schema) -> การ DROP ตารางเก่าที่ต้องคืนหน้าข้อมูลทำหลัง commit
+            w.execute(f"DROP TABLE IF EXISTS retired_{t}")
+            w.execute(f"ALTER TABLE {t} RENAME TO retired_{t}")
+            w.execute(f"ALTER TABLE shadow_{t} RENAME TO {t}")
+        # users มีแอดมิน/รหัสผ่านที่แก้ไว้ -> คัดลอกเฉพาะครู (ตารางเล็ก)
+        w.execute("DELETE FROM users WHERE role != 'admin'")
+        w.execute("INSERT OR IGNORE INTO users SELECT * FROM shadow_users WHERE role != 'admin'")
+        w.execute("DROP TABLE shadow_users")
+        # trigger ของตารางเดิม (เช่น FTS) ย้ายไปอยู่กับ retired_* (ชื่อเดิม) -> ลบทิ้งแล้วสร้างบนตารางใหม่ใน transaction เดียวกับการสลับ
+        for (name,) in w.execute("SELECT name FROM sqlite_master WHERE type='trigger' AND tbl_name GLOB 'retired_*'").fetchall():
+            w.execute(f"DROP TRIGGER {name}")
+        ensure_schema(w)
+    swap_s = time.perf_counter() - t0
+    for t in IMPORT_TABLES:
+        with db.writer() as w: w.execute(f"DROP TABLE IF EXISTS retired_{t}")
+    with db.writer() as w: w.execute("PRAGMA optimize")
+    return swap_s
+
+
+def _begin(db, mode):
+    if mode == 'delta':
+        begin_delta(db); return STAGE_SQL
+    if mode == 'staged':
+        begin_shadow(db); return SHADOW_SQL
+    clear_import_tables(db); return INSERT_SQL
+
+
+def _finish(db, mode, report):
+    summary = {'mode': mode, 'changes': None, 'swap_s': None}
+    if mode == 'delta': summary['changes'] = apply_delta(db, _present_tables(report))
+    elif mode == 'staged': summary['swap_s'] = swap_shadow(db, report)
+    else:
+        with db.writer() as w:
+            for t in IMPORT_TABLES: derive_columns(w, t)
+    # ข้อมูลหลัก/ข้อมูลอ้างอิงเปลี่ยน -> ตารางสรุปคำนวณใหม่ทั้งหมด + cache ที่ผูกกับเวอร์ชันโหลดใหม่ (refdata ฯลฯ)
+    # staged: students/groups เป็นตารางใหม่ (rowid ใหม่) -> สร้าง index ค้นหาใหม่ / inplace, delta: trigger ดูแลให้แล้ว
+    with db.writer(bump=('data', 'ref')) as w:
+        if mode == 'staged': rebuild_search(w)
+        rebuild_summaries(w)
+    return summary
+
+
+# ==========================================
+# 3.2 Delta import
+# ==========================================
+# นำข้อมูลเข้า temp.inc_<table> ก่อน แล้วเทียบกับตารางจริงตาม natural key
+# เขียนเฉพาะแถวที่ เพิ่ม/แก้/ลบ จริง -> เวลาและปริมาณการเขียนขึ้นกับขนาดการเปลี่ยนแปลง
+def begin_delta(db):
+    with db.writer() as w:
+        for t in DELTA_KEYS:
+            w.execute(f"DROP TABLE IF EXISTS temp.inc_{t}")
+            w.execute(f"CREATE TEMP TABLE inc_{t} AS SELECT * FROM main.{t} WHERE 0")
+
+
+def _match(keys, a, b):
+    return ' AND '.join(f"{a}.{k} = {b}.{k}" for k in keys)
+
+
+def apply_delta_table(w, table):
+    keys = DELTA_KEYS[table]
+    cols = [r[1] for r in w.execute(f"PRAGMA main.table_info({table})")]
+    vals = [c for c in cols if c not in keys and c not in DELTA_SKIP.get(table, ())]
+    scope = f" AND {DELTA_SCOPE[table]}" if table in DELTA_SCOPE else ""
+    # แถวซ้ำ key เดียวกันในไฟล์ -> ใช้แถวหลังสุด (เหมือน INSERT OR REPLACE)
+    w.execute(f"DROP TABLE IF EXISTS temp.new_{table}")
+    w.execute(f"CREATE TEMP TABLE new_{table} AS SELECT * FROM temp.inc_{table} WHERE rowid IN "
+              f"(SELECT MAX(rowid) FROM temp.inc_{table} GROUP BY {', '.join(keys)})")
+    w.execute(f"CREATE INDEX temp.ix_new_{table} ON new_{table}({', '.join(keys)})")
+    total = w.execute(f"SELECT COUNT(*) FROM temp.new_{table}").fetchone()[0]
+
+    deleted = w.execute(f"DELETE FROM main.{table} WHERE NOT EXISTS "
+                        f"(SELECT 1 FROM temp.new_{table} n WHERE {_match(keys, 'n', f'main.{table}')}){scope}").rowcount
+    updated = 0
+    if vals:
+        differs = ' OR '.join(f"n.{c} IS NOT main.{table}.{c}" for c in vals)
+        updated = w.execute(f"UPDATE main.{table} SET ({', '.join(vals)}) = "
+                            f"(SELECT {', '.join('n.' + c for c in vals)} FROM temp.new_{table} n WHERE {_match(keys, 'n', f'main.{table}')}) "
+                            f"WHERE EXISTS (SELECT 1 FROM temp.new_{table} n WHERE {_match(keys, 'n', f'main.{table}')} AND ({differs})){scope}").rowcount
+    inserted = w.execute(f"INSERT INTO main.{table} ({', '.join(cols)}) SELECT {', '.join('n.' + c for c in cols)} FROM temp.new_{table} n "
+                         f"WHERE NOT EXISTS (SELECT 1 FROM main.{table} l WHERE {_match(keys, 'l', 'n')})").rowcount
+    w.execute(f"DROP TABLE temp.new_{table}")
+    return {'inserted': inserted, 'updated': updated, 'deleted': deleted, 'unchanged': max(total - inserted - updated, 0)}
+
+
+def apply_delta(db, tables):
+    # ทุกตารางใน transaction เดียว -> ผู้ใช้ไม่เห็นข้อมูลครึ่ง ๆ กลาง ๆ
+    changes = {}
+    with db.writer() as w:
+        for t in DELTA_KEYS:
+            if t in tables:
+                derive_columns(w, t, f"temp.inc_{t}")
+                changes[t] = apply_delta_table(w, t)
+        for t in DELTA_KEYS: w.execute(f"DROP TABLE IF EXISTS temp.inc_{t}")
+    return changes
+
+
+def _present_tables(report):
+    return {t for r in report if not r['error'] for t, n in r['tables'].items()}
+
+
+# mode: 'staged' (ค่าเริ่มต้น: โหลดลงตารางเงาแล้วสลับ), 'delta' (ปรับเฉพาะแถวที่เปลี่ยน), 'inplace' (ลบแล้วเขียนทับตรง ๆ แบบเดิม)
+IMPORT_MODES = ('staged', 'delta', 'inplace')
+
+
+def import_zip(db, source, batch_size=BATCH_SIZE, on_progress=None, mode='staged'):
+    # source: path หรือ file-like (เช่น UploadedFile ของ Streamlit)
+    # คืนค่า (report รายไฟล์, summary: changes รายตาราง [delta] / เวลาสลับตาราง [staged])
+    report = []
+    sql = _begin(db, mode)
+    with zipfile.ZipFile(source) as z:
+        for info in dbf_members(z):
+            try: report.append(import_member(db, z, info, batch_size, on_progress, sql))
+            except Exception as e: report.append(_report(info.filename, error=str(e)))
+    return report, _finish(db, mode, report)
+
+
+# ==========================================
+# 4. Parallel import (process pool)
+# ==========================================
+# process หลักคลาย deflate แต่ละไฟล์ใน ZIP ครั้งเดียวตามลำดับ แล้วส่ง byte ดิบทีละ CHUNK_RECORDS record ให้ process ลูก
+# process ลูกถอดรหัส cp874 + แปลงฟิลด์ (งาน CPU) / การเขียนลง SQLite ยังทำที่ writer ตัวเดียวใน process หลัก ตามลำดับงาน
+# (ไม่ให้ process ลูกเปิดไฟล์ใน ZIP แล้ว seek เอง: seek ใน member ที่ deflate = คลายใหม่ตั้งแต่ต้นไฟล์ทุกช่วง)
+IMPORT_WORKERS = max(1, min(4, (os.cpu_count() or 2) - 1))
+CHUNK_RECORDS = 50000
+
+
+def decode_chunk(member, header, raw, batch_size=BATCH_SIZE):
+    t0 = time.perf_counter()
+    mapper = mapper_for(member)
+    out = {}
+    n = 0
+    table = DBFStream(io.BytesIO(header + raw))
+    for batch in table.iter_batches(batch_size):
+        n += len(batch)
+        for tbl, rows in mapper(batch).items(): out.setdefault(tbl, []).extend(rows)
+    return out, n, time.perf_counter() - t0
+
+
+def read_chunks(z, chunk_records=CHUNK_RECORDS):
+    # (ไฟล์, record แรก, จำนวน record, record ทั้งไฟล์, header, byte ดิบ) ทีละช่วง อ่านแต่ละไฟล์ผ่านครั้งเดียว
+    for info in dbf_members(z):
+        if mapper_for(info.filename) is None: continue
+        with z.open(info) as f:
+            table = DBFStream(f)
+            start = 0
+            while True:
+                raw = table.read_raw(chunk_records)
+                if not raw: break
+                n = len(raw) // table.record_len
+                yield info.filename, start, n, table.num_records, table.header, raw
+                start += n
+
+
+def import_zip_parallel(db, source, workers=IMPORT_WORKERS, chunk_records=CHUNK_RECORDS, batch_size=BATCH_SIZE, on_progress=None, mode='staged'):
+    # source: path หรือ file-like (เช่น UploadedFile ของ Streamlit)
+    stats = {}
+    def stat(fname):
+        return stats.setdefault(fname, {'records': 0, 'decode_s': 0.0, 'write_s': 0.0, 'tables': {}, 'error': None, 't0': time.perf_counter()})
+
+    sql = _begin(db, mode)
+    ctx = multiprocessing.get_context('spawn')  # ไม่ fork process ที่มีหลาย thread (Streamlit)
+    with zipfile.ZipFile(source) as z, ProcessPoolExecutor(workers, mp_context=ctx) as pool:
+        todo = read_chunks(z, chunk_records)
+        pending = deque()
+        def submit_next():
+            task = next(todo, None)
+            if task: pending.append((task[:4], pool.submit(decode_chunk, task[0], task[4], task[5], batch_size)))
+        for _ in range(workers * 2): submit_next()
+        # รอผลตามลำดับงาน -> ลำดับการเขียนเหมือนนำเข้าแบบทีละไฟล์ และจำกัดงานค้างในหน่วยความจำ
+        while pending:
+            (fname, start, count, total), fut = pending.popleft()
+            st_ = stat(fname)
+            try: mapped, n, decode_s = fut.result()
+            except BrokenProcessPool: raise
+            except Exception as e:
+                st_['error'] = str(e); submit_next(); continue
+            submit_next()
+            tw = time.perf_counter()
+            write_rows(db, mapped, st_['tables'], sql)
+            st_['write_s'] += time.perf_counter() - tw
+            st_['decode_s'] += decode_s
+            st_['records'] += n
+            if on_progress: on_progress(fname, start + count, total, time.perf_counter() - st_['t0'])
+
+    report = []
+    for fname, s_ in stats.items():
+        r = _report(fname, s_['records'], s_['decode_s'] + s_['write_s'], s_['write_s'], s_['tables'], s_['error'])
+        r['decode_s'] = s_['decode_s']
+        report.append(r)
+    return report, _finish(db, mode, report)
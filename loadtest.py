@@ -0,0 +1,261 @@
+# ==========================================
+# Exam-day load test (Streamlit AppTest, in-process)
+# ==========================================
+# จำลอง นศ. N คนพร้อมกัน: เข้าสู่ระบบ -> หน้ารายการแบบทดสอบ -> ตอบทุกข้อ -> ส่งคำตอบ -> หน้าแสดงผลที่บันทึกแล้ว
+# ทุกคนรันใน process เดียวกับ app (ใช้ DB / คิวบันทึกผลตัวเดียวกันเหมือน server จริง 1 instance)
+# ใช้งาน:  python loadtest.py --students 200 --questions 60
+#         python loadtest.py --students 300 --ramp 30 --think 0.5 --json result.json
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = os.path.join(HERE, "app.py")
+sys.path.insert(0, HERE)
+
+EXAM_MENU = "แบบทดสอบออนไลน์"
+MENU_STATE_KEY = "_loadtest_menu"
+LOCK_WORDS = ("database is locked", "database table is locked", "SQLITE_BUSY")
+
+
+# ==========================================
+# 1. Synthetic school
+# ==========================================
+def seed_school(db, n_students, n_questions, grades_per_student=25, seed=3):
+    import synthetic
+    synthetic.seed_synthetic(db, n_students=n_students, grades_per_student=grades_per_student,
+                             n_groups=max(1, n_students // 60), n_exams=0, seed=seed)
+    rnd = random.Random(seed)
+    # ข้อสอบวันสอบ: วิชาเดียวที่ทุกคนลงทะเบียนและยังไม่มีเกรด
+    with db.writer() as w:
+        sub = 'ทช19999'
+        w.execute("INSERT OR REPLACE INTO subjects (sub_code, sub_name) VALUES (?, 'วิชาวันสอบ')", (sub,))
+        w.execute("INSERT INTO grades (std_id, sub_code, semestry, grade, grp_code) SELECT std_id, ?, '2/2567', '', grp_code FROM students", (sub,))
+        exam_id = w.execute("INSERT INTO exams (exam_name, sub_code, semestry, is_active) VALUES ('สอบปลายภาค', ?, '2/2567', 1)", (sub,)).lastrowid
+        w.executemany("INSERT INTO exam_questions (exam_id, question_text, choice_a, choice_b, choice_c, choice_d, correct_answer) VALUES (?,?,?,?,?,?,?)",
+                      [(exam_id, f"ข้อ {q + 1}", f"ก {q}", f"ข {q}", f"ค {q}", f"ง {q}", rnd.choice('ABCD')) for q in range(n_questions)])
+    from db import derive_columns
+    from summary import rebuild_summaries
+    with db.writer() as w: derive_columns(w, 'grades'); rebuild_summaries(w)
+    sids = [r[0] for r in db.reader().execute("SELECT std_id FROM students ORDER BY std_id")]
+    return exam_id, sids
+
+
+# ==========================================
+# 2. Driver
+# ==========================================
+def app_db_name():
+    # ชื่อไฟล์ DB ตามที่ app.py ใช้ (import app.py ตรง ๆ ไม่ได้เพราะจะรันหน้าเว็บ)
+    src = open(APP_PATH, encoding='utf-8').read()
+    return re.search(r'^DB_NAME\s*=\s*["\'](.+?)["\']', src, re.M).group(1)
+
+
+def _allow_concurrent_apptests():
+    # AppTest ออกแบบมาให้รันทีละตัว: ตั้ง Runtime._instance / config global.appTest ตอนเริ่ม แล้วล้างทิ้งตอนจบ
+    # หลาย session พร้อมกัน -> ตัวที่จบก่อนล้างของตัวที่ยังรันอยู่ จึงให้ runtime จำลองตัวล่าสุดค้างไว้ และเปิด appTest ไว้ตลอด
+    # + ใช้ ScriptCache ตัวเดียว (เหมือน server จริง) -> คอมไพล์ app.py ครั้งเดียว ไม่ชน ast.parse พร้อมกันหลาย thread
+    from streamlit import config
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.testing.v1 import app_test, local_script_runner
+    config.set_option("global.appTest", True)
+    shared_cache = ScriptCache()
+    app_test.ScriptCache = lambda: shared_cache
+    local_script_runner.ScriptCache = lambda: shared_cache   # ตัวที่ runner ใช้คอมไพล์ app.py จริง
+    last = {}
+
+    def instance(cls):
+        if cls._instance is not None: last['runtime'] = cls._instance
+        if 'runtime' not in last: raise RuntimeError("Runtime hasn't been created!")
+        return last['runtime']
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(lambda cls: cls._instance is not None or 'runtime' in last)
+
+
+def _patch_option_menu():
+    # AppTest กดเมนูของ component ภายนอกไม่ได้ -> ให้ option_menu คืนค่าที่ นศ. จำลองเลือกไว้ใน session_state
+    import streamlit as st
+    import streamlit_option_menu
+
+    def option_menu(menu_title, options, default_index=0, **kwargs):
+        choice = st.session_state.get(MENU_STATE_KEY)
+        return choice if choice in options else options[default_index]
+    streamlit_option_menu.option_menu = option_menu
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = defaultdict(list)   # step -> [ms]
+        self.lock_errors = 0
+        self.exceptions = []
+        self.empty_renders = 0
+        self.submitted = 0
+        self.confirmed = 0
+
+    def record(self, step, ms, at):
+        errors = [e.value for e in at.exception] + [str(e.value) for e in at.error]
+        with self.lock:
+            self.latency[step].append(ms)
+            for msg in errors:
+                if any(w in str(msg) for w in LOCK_WORDS): self.lock_errors += 1
+            self.exceptions.extend(f"{step}: {e.value}"[:200] for e in at.exception)
+
+
+def _run(at, stats, step, timeout):
+    t0 = time.perf_counter()
+    at.run(timeout=timeout)
+    if not len(at.main.children) and not at.exception:
+        # AppTest หลายตัวพร้อมกันบางครั้งได้หน้าว่าง (ข้อความ delta ไปไม่ถึง) -> รันซ้ำ 1 ครั้ง นับแยกไว้ในรายงาน
+        with stats.lock: stats.empty_renders += 1
+        at.run(timeout=timeout)
+    stats.record(step, (time.perf_counter() - t0) * 1000, at)
+    return not at.exception and len(at.main.children) > 0
+
+
+def _page_summary(at):
+    return ' | '.join([f"error: {e.value}" for e in at.error if 'secrets' not in str(e.value)] +
+                      [f"inputs {len(at.text_input)}", f"buttons {[b.label for b in at.button][:5]}"])
+
+
+def student_session(sid, exam_id, n_questions, stats, think, timeout, rnd):
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    _run(at, stats, 'open', timeout)
+    if len(at.text_input) < 2 or not at.button:
+        with stats.lock: stats.exceptions.append(f"{sid}: login form not rendered ({_page_summary(at)})")
+        return
+    # เข้าสู่ระบบ (นศ.: รหัสผ่าน = รหัสนักศึกษา)
+    at.text_input[0].input(sid); at.text_input[1].input(sid)
+    at.button[0].click()
+    _run(at, stats, 'login', timeout)
+    time.sleep(think * rnd.random())
+    at.session_state[MENU_STATE_KEY] = EXAM_MENU
+    _run(at, stats, 'exam_list', timeout)
+    start = [b for b in at.button if b.key == f"start_{exam_id}"]
+    if not start:
+        with stats.lock: stats.exceptions.append(f"{sid}: exam {exam_id} not listed ({_page_summary(at)})")
+        return
+    start[0].click()
+    _run(at, stats, 'open_exam', timeout)
+    # ตอบทุกข้อ (อยู่ใน st.form -> ไม่ rerun ระหว่างเลือก) แล้วส่ง
+    for radio in at.radio: radio.set_value(rnd.randrange(len(radio.options)))
+    time.sleep(think * rnd.random())
+    submit = [b for b in at.button if 'ส่งคำตอบ' in (b.label or '')]
+    if len(at.radio) != n_questions or not submit:
+        with stats.lock: stats.exceptions.append(f"{sid}: exam form incomplete ({len(at.radio)} questions; {_page_summary(at)})")
+        return
+    submit[0].click()
+    if not _run(at, stats, 'submit', timeout): return
+    with stats.lock: stats.submitted += 1
+    # หน้ารายการไม่รอ thread เขียน (fragment เช็คทุกวินาที) -> รอ ticket เอง แล้ว rerun แบบที่ fragment ทำเมื่อบันทึกเสร็จ
+    ticket = at.session_state['pending_submission'] if 'pending_submission' in at.session_state else None
+    if ticket is not None and ticket.wait(timeout): _run(at, stats, 'confirm', timeout)
+    if any('บันทึกสำเร็จ' in s.value for s in at.success):
+        with stats.lock: stats.confirmed += 1
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0.0
+
+
+def summarise(stats, elapsed, saved_rows):
+    all_ms = [ms for v in stats.latency.values() for ms in v]
+    steps = {step: {'n': len(v), 'p50_ms': percentile(v, 0.50), 'p95_ms': percentile(v, 0.95), 'p99_ms': percentile(v, 0.99)}
+             for step, v in stats.latency.items()}
+    return {
+        'elapsed_s': elapsed,
+        'reruns': len(all_ms),
+        'reruns_per_s': len(all_ms) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(all_ms, 0.50), 'p95_ms': percentile(all_ms, 0.95), 'p99_ms': percentile(all_ms, 0.99),
+        'steps': steps,
+        'submitted': stats.submitted,
+        'confirmed': stats.confirmed,
+        'saved_rows': saved_rows,
+        'submissions_per_s': stats.submitted / elapsed if elapsed else 0.0,
+        'lock_errors': stats.lock_errors,
+        'exceptions': len(stats.exceptions),
+        'empty_renders': stats.empty_renders,
+        'exception_samples': stats.exceptions[:10],
+    }
+
+
+def run_load(n_students, n_questions=60, ramp=10.0, think=1.0, timeout=120, workdir=None, seed=5):
+    # app ใช้ DB_NAME แบบ relative -> ทำงานในโฟลเดอร์ชั่วคราวของตัวเอง
+    os.chdir(workdir)
+    _allow_concurrent_apptests()
+    _patch_option_menu()
+    from db import get_db
+    db = get_db(app_db_name())
+    exam_id, sids = seed_school(db, n_students, n_questions)
+    stats = Stats()
+    rnd = random.Random(seed)
+    threads = []
+    t0 = time.perf_counter()
+    for i, sid in enumerate(sids[:n_students]):
+        delay = ramp * i / max(1, n_students)
+        t = threading.Thread(target=_student_thread, args=(delay, sid, exam_id, n_questions, stats, think, timeout, random.Random(rnd.random())))
+        t.start(); threads.append(t)
+    for t in threads: t.join()
+    # รอ thread เขียนจัดการผลที่ส่งครบ (คิวว่างแล้วยังอาจมี batch ที่กำลังเขียน) แล้วนับผลที่ลงดิสก์จริง
+    from submissions import get_submission_queue
+    queue = get_submission_queue(db)
+    deadline = time.perf_counter() + timeout
+    while sum(queue.stats()[k] for k in ('committed', 'failed')) < stats.submitted and time.perf_counter() < deadline: time.sleep(0.05)
+    elapsed = time.perf_counter() - t0
+    saved = db.reader().execute("SELECT COUNT(DISTINCT std_id) FROM exam_results WHERE exam_id=?", (exam_id,)).fetchone()[0]
+    result = summarise(stats, elapsed, saved)
+    result['queue'] = queue.stats()
+    return result
+
+
+def _student_thread(delay, sid, exam_id, n_questions, stats, think, timeout, rnd):
+    time.sleep(delay)
+    try: student_session(sid, exam_id, n_questions, stats, think, timeout, rnd)
+    except Exception as e:
+        with stats.lock:
+            stats.exceptions.append(f"{sid}: {type(e).__name__}: {e}"[:200])
+            if any(w in str(e) for w in LOCK_WORDS): stats.lock_errors += 1
+
+
+def print_report(r, n_students, n_questions):
+    print(f"{n_students} students x {n_questions} questions | {r['elapsed_s']:.1f}s | "
+          f"{r['reruns']:,} reruns ({r['reruns_per_s']:.1f}/s) | {r['submissions_per_s']:.2f} submissions/s")
+    print(f"rerun latency  p50 {r['p50_ms']:8.1f} ms | p95 {r['p95_ms']:8.1f} ms | p99 {r['p99_ms']:8.1f} ms")
+    for step, s in r['steps'].items():
+        print(f"  {step:10s} n={s['n']:5d} | p50 {s['p50_ms']:8.1f} | p95 {s['p95_ms']:8.1f} | p99 {s['p99_ms']:8.1f} ms")
+    print(f"submitted {r['submitted']} | confirmed on page {r['confirmed']} | saved in DB {r['saved_rows']} | "
+          f"lock errors {r['lock_errors']} | exceptions {r['exceptions']} | empty renders retried {r['empty_renders']}")
+    q = r['queue']
+    print(f"submission queue: {q['batches']} batches | p95 enqueue->commit {q['p95_ms']:.1f} ms | failed {q['failed']}")
+    for e in r['exception_samples']: print("  !", e)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Exam-day load test (Streamlit AppTest)")
+    ap.add_argument("--students", type=int, default=100)
+    ap.add_argument("--questions", type=int, default=60)
+    ap.add_argument("--ramp", type=float, default=10.0, help="วินาทีที่ใช้ทยอยเริ่ม session ทั้งหมด")
+    ap.add_argument("--think", type=float, default=1.0, help="เวลาคิดสูงสุด (วินาที) ระหว่างขั้นตอน")
+    ap.add_argument("--timeout", type=float, default=120)
+    ap.add_argument("--json", help="บันทึกผลเป็นไฟล์ JSON")
+    args = ap.parse_args(argv)
+    with tempfile.TemporaryDirectory() as tmp:
+        r = run_load(args.students, args.questions, args.ramp, args.think, args.timeout, workdir=tmp)
+        os.chdir(HERE)
+    print_report(r, args.students, args.questions)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f: json.dump(r, f, ensure_ascii=False, indent=2)
+    return 1 if r['lock_errors'] or r['saved_rows'] < r['submitted'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
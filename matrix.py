@@ -0,0 +1,101 @@
+# ==========================================
+# Score matrix (ตารางคะแนนของกลุ่ม: นศ. x วิชา)
+# ==========================================
+# pivot ครั้งเดียวต่อกลุ่มแล้ว cache ใช้ร่วมกันทุก session
+# - ผลสอบใหม่เข้ามา (เวอร์ชัน 'results' เปลี่ยน) -> อ่านเฉพาะผลที่ id มากกว่าจุดที่ pivot ไว้ แล้วคำนวณแถวของ นศ. ที่มีผลใหม่
+#   (ส่งซ้ำ = ลบผลเก่าแล้วใส่ใหม่ จึงคำนวณทั้งแถวของคนนั้นใหม่ ไม่ใช่แค่ max กับค่าเดิม)
+# - นำเข้าข้อมูล / ชื่อวิชาเปลี่ยน / ลบชุดข้อสอบ ('data', 'ref', 'exams') -> pivot ใหม่ทั้งกลุ่ม
+# ค้นหา/ดาวน์โหลด (exports.frame_rows) ทำบน frame ที่ cache ไว้ ไม่ query/pivot ซ้ำ
+import threading
+
+import pandas as pd
+
+from refdata import get_refdata
+
+REBUILD_VERSIONS = ('data', 'ref', 'exams')
+ID_COL, NAME_COL = 'รหัสนักเรียน', 'ชื่อ-สกุล'
+
+MATRIX_SQL = """
+    SELECT s.std_id, s.prefix || s.name || ' ' || s.surname AS full_name, e.sub_code, r.score, r.total_score
+    FROM exam_results r
+    JOIN students s ON r.std_id = s.std_id
+    JOIN exams e ON r.exam_id = e.exam_id
+    WHERE s.grp_code = ?
+"""
+
+CHANGED_SQL = """
+    SELECT DISTINCT r.std_id FROM exam_results r JOIN students s ON s.std_id = r.std_id
+    WHERE r.id > ? AND r.id <= ? AND s.grp_code = ?
+"""
+
+
+def _pivot(scores, ref):
+    if scores.empty: return pd.DataFrame(columns=[ID_COL, NAME_COL])
+    scores['subject_label'] = pd.Series(ref.subject_names(scores['sub_code']), index=scores.index) + " (เต็ม " + scores['total_score'].astype(str) + ")"
+    wide = scores.pivot_table(index=['std_id', 'full_name'], columns='subject_label', values='score', aggfunc='max').reset_index()
+    wide.columns.name = None
+    return wide.rename(columns={'std_id': ID_COL, 'full_name': NAME_COL})
+
+
+class ScoreMatrix:
+    __slots__ = ('grp_code', 'version', 'watermark', 'frame')
+
+    def __init__(self, grp_code, version, watermark, frame):
+        self.grp_code = grp_code
+        self.version = version          # (เวอร์ชันที่ต้อง pivot ใหม่, เวอร์ชัน 'results')
+        self.watermark = watermark      # exam_results.id สูงสุดที่รวมไว้แล้ว
+        self.frame = frame              # รหัสนักเรียน, ชื่อ-สกุล, <วิชา (เต็ม n)>...  เรียงตามรหัส
+
+    @property
+    def empty(self):
+        return self.frame.empty
+
+    def view(self, std_ids=None):
+        # std_ids: ผลค้นหา (set ของรหัส) -> กรองแถว, None = ทั้งกลุ่ม
+        out = self.frame if std_ids is None else self.frame[self.frame[ID_COL].isin(std_ids)]
+        out = out.copy()
+        out.index = range(1, len(out) + 1)
+        return out
+
+
+def build_matrix(conn, ref, grp_code, version=None):
+    hi = conn.execute("SELECT coalesce(MAX(id), 0) FROM exam_results").fetchone()[0]
+    scores = pd.read_sql(MATRIX_SQL + " AND r.id <= ?", conn, params=(grp_code, hi))
+    return ScoreMatrix(grp_code, version, hi, _pivot(scores, ref).sort_values(ID_COL, kind='stable').reset_index(drop=True))
+
+
+def patch_matrix(conn, ref, matrix, version):
+    # คำนวณเฉพาะแถวของ นศ. ที่มีผลสอบใหม่ตั้งแต่ watermark แล้ววางแทนแถวเดิม (frame ใหม่ ไม่แก้ของเดิมที่ session อื่นใช้อยู่)
+    hi = conn.execute("SELECT coalesce(MAX(id), 0) FROM exam_results").fetchone()[0]
+    changed = [r[0] for r in conn.execute(CHANGED_SQL, (matrix.watermark, hi, matrix.grp_code))]
+    if not changed: return ScoreMatrix(matrix.grp_code, version, hi, matrix.frame)
+    marks = ','.join('?' * len(changed))
+    scores = pd.read_sql(MATRIX_SQL + f" AND r.std_id IN ({marks}) AND r.id <= ?", conn, params=(matrix.grp_code, *changed, hi))
+    rows = _pivot(scores, ref)
+    kept = matrix.frame[~matrix.frame[ID_COL].isin(changed)]
+    frame = pd.concat([kept, rows], ignore_index=True) if not kept.empty else rows
+    # วิชาที่ไม่เหลือคะแนนของใครเลย (เช่นส่งซ้ำแล้วคะแนนเต็มเปลี่ยน) -> ตัดคอลัมน์ทิ้ง เหมือน pivot ใหม่
+    labels = sorted(c for c in frame.columns if c not in (ID_COL, NAME_COL) and frame[c].notna().any())
+    frame = frame[[ID_COL, NAME_COL] + labels].sort_values(ID_COL, kind='stable').reset_index(drop=True)
+    return ScoreMatrix(matrix.grp_code, version, hi, frame)
+
+
+_cache = {}
+_cache_lock = threading.Lock()
+_build_locks = {}   # ต่อ (DB, กลุ่ม): pivot กลุ่มใหญ่ที่ช้าไม่บล็อกกลุ่มอื่น
+
+
+def get_matrix(db, grp_code):
+    version = (db.version(*REBUILD_VERSIONS), db.version('results'))
+    key = (db.path, grp_code)
+    matrix = _cache.get(key)
+    if matrix is not None and matrix.version == version: return matrix
+    with _cache_lock: lock = _build_locks.setdefault(key, threading.Lock())
+    with lock:
+        matrix = _cache.get(key)
+        if matrix is None or matrix.version[0] != version[0]:
+            matrix = build_matrix(db.reader(), get_refdata(db), grp_code, version)
+        elif matrix.version != version:
+            matrix = patch_matrix(db.reader(), get_refdata(db), matrix, version)
+        _cache[key] = matrix
+    return matrix
@@ -0,0 +1,252 @@
+# ==========================================
+# Performance instrumentation (query / rerun)
+# ==========================================
+# import แล้วทุก connection ที่ db.py เปิดใช้ factory=TracedConnection -> ทุก conn.execute / pd.read_sql / executemany ถูกจับเวลา
+# - query: SQL (normalise แล้ว), เวลา (execute + fetch), จำนวนแถวที่อ่าน, หน้า/ส่วนของหน้าที่เรียก
+# - rerun: เวลาทั้งสคริปต์ต่อบทบาท (student / teacher / admin / login) + query ทั้งหมดใน rerun นั้น
+# เก็บใน ring buffer ขนาดจำกัดในหน่วยความจำ (+ ไฟล์ JSON lines ถ้าเปิด set_log_path) -> แท็บ ⏱️ ประสิทธิภาพ ของแอดมิน
+# thread เบื้องหลัง (คิวบันทึกผล / ซิงก์ Sheets) ไม่มี rerun -> page = 'background'
+import functools
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+
+from db import set_connection_factory
+
+QUERY_BUFFER = 5000
+RERUN_BUFFER = 500
+RERUN_QUERIES_MAX = 2000    # query ต่อ rerun ที่เก็บรายละเอียด (นับครบทุกตัว)
+N_PLUS_ONE = 3              # statement เดียวกันซ้ำ >= เท่านี้ใน rerun เดียว = รูปแบบ N+1
+
+queries = deque(maxlen=QUERY_BUFFER)
+reruns = deque(maxlen=RERUN_BUFFER)
+_local = threading.local()
+_log_lock = threading.Lock()
+_log_path = None
+
+
+@functools.lru_cache(maxsize=2048)
+def normalise_sql(sql):
+    # ตัด comment/ช่องว่าง แทนค่าคงที่ด้วย ? และรวม IN (?, ?, ...) -> statement เดียวกันนับรวมกันได้
+    sql = re.sub(r"--[^\n]*", " ", sql)
+    sql = re.sub(r"'(?:[^']|'')*'", "?", sql)
+    sql = re.sub(r"\b\d+(?:\.\d+)?\b", "?", sql)
+    sql = re.sub(r"\(\s*\?(?:\s*,\s*\?)+\s*\)", "(?, ...)", sql)
+    return re.sub(r"\s+", " ", sql).strip()
+
+
+class QueryRecord:
+    __slots__ = ('sql', 'ms', 'rows', 'page', 'section', 'at')
+
+    def __init__(self, sql, ms, page, section):
+        self.sql, self.ms, self.rows, self.page, self.section = sql, ms, 0, page, section
+        self.at = time.time()
+
+    def as_dict(self):
+        return {k: getattr(self, k) for k in self.__slots__}
+
+
+class Rerun:
+    __slots__ = ('page', 'section', 'started', 'ms', 'n_queries', 'query_ms', 'records', 'at')
+
+    def __init__(self, page):
+        self.page, self.section = page, ''
+        self.started = time.perf_counter()
+        self.ms = None
+        self.n_queries = 0
+        self.query_ms = 0.0
+        self.records = []
+        self.at = time.time()
+
+    def repeats(self):
+        # {sql: จำนวนครั้ง} ของ statement ที่ซ้ำตั้งแต่ N_PLUS_ONE ครั้งขึ้นไป
+        counts = {}
+        for r in self.records: counts[r.sql] = counts.get(r.sql, 0) + 1
+        return {sql: n for sql, n in counts.items() if n >= N_PLUS_ONE}
+
+
+def _record(sql, started):
+    ms = (time.perf_counter() - started) * 1000
+    run = getattr(_local, 'run', None)
+    rec = QueryRecord(normalise_sql(sql), ms, run.page if run else 'background', run.section if run else '')
+    queries.append(rec)
+    if run is not None:
+        run.n_queries += 1
+        run.query_ms += ms
+        if len(run.records) < RERUN_QUERIES_MAX: run.records.append(rec)
+    return rec
+
+
+# ==========================================
+# sqlite3 factories
+# ==========================================
+class TracedCursor(sqlite3.Cursor):
+    _rec = None
+
+    def execute(self, sql, parameters=()):
+        t0 = time.perf_counter()
+        try: return super().execute(sql, parameters)
+        finally: self._rec = _record(sql, t0)
+
+    def executemany(self, sql, seq_of_parameters):
+        t0 = time.perf_counter()
+        try: return super().executemany(sql, seq_of_parameters)
+        finally: self._rec = _record(sql, t0)
+
+    def executescript(self, sql_script):
+        t0 = time.perf_counter()
+        try: return super().executescript(sql_script)
+        finally: self._rec = _record(sql_script, t0)
+
+    def _fetched(self, rows, t0):
+        rec = self._rec
+        if rec is not None:
+            ms = (time.perf_counter() - t0) * 1000
+            rec.ms += ms
+            rec.rows += rows
+            run = getattr(_local, 'run', None)
+            if run is not None: run.query_ms += ms
+
+    def fetchone(self):
+        t0 = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(row is not None, t0)
+        return row
+
+    def fetchmany(self, size=None):
+        t0 = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(len(rows), t0)
+        return rows
+
+    def fetchall(self):
+        t0 = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(len(rows), t0)
+        return rows
+
+    def __next__(self):
+        t0 = time.perf_counter()
+        row = super().__next__()
+        self._fetched(1, t0)
+        return row
+
+
+class TracedConnection(sqlite3.Connection):
+    # Connection.execute ใน C เรียก cursor() แต่ execute ของ cursor ตรง ๆ -> ต้อง override ทั้งสองชั้น
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+
+set_connection_factory(TracedConnection)
+
+
+# ==========================================
+# Rerun context (เรียกจาก app.py)
+# ==========================================
+def begin_rerun(page='login'):
+    _local.run = Rerun(page)
+    return _local.run
+
+
+def set_page(page, section=''):
+    run = getattr(_local, 'run', None)
+    if run is not None: run.page, run.section = page, section
+
+
+def set_section(section):
+    run = getattr(_local, 'run', None)
+    if run is not None: run.section = section
+
+
+def end_rerun(run):
+    run.ms = (time.perf_counter() - run.started) * 1000
+    reruns.append(run)
+    if getattr(_local, 'run', None) is run: _local.run = None
+    if _log_path: _write_log(run)
+
+
+def set_log_path(path):
+    global _log_path
+    _log_path = path or None
+
+
+def log_path():
+    return _log_path
+
+
+def _write_log(run):
+    line = json.dumps({'page': run.page, 'section': run.section, 'at': run.at, 'ms': run.ms, 'n_queries': run.n_queries,
+                       'query_ms': run.query_ms, 'queries': [r.as_dict() for r in run.records]}, ensure_ascii=False)
+    try:
+        with _log_lock, open(_log_path, 'a', encoding='utf-8') as fh: fh.write(line + '\n')
+    except OSError:
+        pass    # เขียน log ไม่ได้ (ดิสก์เต็ม/สิทธิ์) ไม่ให้หน้าเว็บล้ม
+
+
+def clear():
+    queries.clear()
+    reruns.clear()
+
+
+# ==========================================
+# Summaries (แท็บแอดมิน)
+# ==========================================
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0.0
+
+
+def rerun_summary():
+    # ต่อหน้า: จำนวน rerun, p50/p95/p99/max ms, query ต่อ rerun (เฉลี่ย/สูงสุด), เวลาใน query (ร้อยละ)
+    by_page = {}
+    for run in list(reruns): by_page.setdefault(run.page, []).append(run)
+    out = []
+    for page, runs in sorted(by_page.items()):
+        ms = [r.ms for r in runs]
+        out.append({'page': page, 'reruns': len(runs), 'p50_ms': percentile(ms, 0.5), 'p95_ms': percentile(ms, 0.95),
+                    'p99_ms': percentile(ms, 0.99), 'max_ms': max(ms),
+                    'queries_avg': sum(r.n_queries for r in runs) / len(runs), 'queries_max': max(r.n_queries for r in runs),
+                    'query_pct': 100 * sum(r.query_ms for r in runs) / max(sum(ms), 1e-9)})
+    return out
+
+
+def query_summary():
+    # ต่อ statement (normalise แล้ว): จำนวนครั้ง, เวลารวม, p50/p95/max, แถวเฉลี่ย, หน้าที่เรียก
+    by_sql = {}
+    for q in list(queries): by_sql.setdefault(q.sql, []).append(q)
+    out = []
+    for sql, qs in by_sql.items():
+        ms = [q.ms for q in qs]
+        out.append({'sql': sql, 'calls': len(qs), 'total_ms': sum(ms), 'p50_ms': percentile(ms, 0.5), 'p95_ms': percentile(ms, 0.95),
+                    'max_ms': max(ms), 'rows_avg': sum(q.rows for q in qs) / len(qs),
+                    'pages': ', '.join(sorted({f"{q.page}/{q.section}" if q.section else q.page for q in qs}))})
+    return sorted(out, key=lambda r: r['total_ms'], reverse=True)
+
+
+def slowest_queries(n=20):
+    return [q.as_dict() for q in sorted(list(queries), key=lambda q: q.ms, reverse=True)[:n]]
+
+
+def n_plus_one():
+    # statement ที่ถูกเรียกซ้ำใน rerun เดียวกัน -> ควรรวมเป็น query เดียว (JOIN / IN / GROUP BY)
+    found = {}
+    for run in list(reruns):
+        for sql, n in run.repeats().items():
+            key = (run.page, run.section, sql)
+            cur = found.setdefault(key, {'page': run.page, 'section': run.section, 'sql': sql, 'reruns': 0, 'max_repeats': 0})
+            cur['reruns'] += 1
+            cur['max_repeats'] = max(cur['max_repeats'], n)
+    return sorted(found.values(), key=lambda r: (r['max_repeats'], r['reruns']), reverse=True)
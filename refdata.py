@@ -0,0 +1,68 @@
+# ==========================================
+# Reference data registry (รายวิชา / กลุ่ม / ครู)
+# ==========================================
+# โหลดครั้งเดียวต่อเวอร์ชันข้อมูล 'ref' แล้วใช้ร่วมกันทุก session
+# การนำเข้าหรือแอดมินแก้ไขจะ bump เวอร์ชัน -> โหลดใหม่อัตโนมัติในการเรียกครั้งถัดไป
+import threading
+
+
+def subject_key(code):
+    # รหัสวิชาแบบตัดขีด/ช่องว่าง ใช้จับคู่ 'ทช-11001' กับ 'ทช11001'
+    return str(code).replace('-', '').strip() if code is not None else ''
+
+
+class RefData:
+    __slots__ = ('version', 'subjects', 'subject_by_key', 'teacher_by_group', 'groups')
+
+    def __init__(self, version, subjects, subject_by_key, teacher_by_group):
+        self.version = version
+        self.subjects = tuple(subjects)                      # ((sub_code, sub_name), ...) เรียงตามรหัส
+        self.subject_by_key = subject_by_key                 # {sub_key: sub_name} (sub_key คำนวณไว้ตอนนำเข้า)
+        self.teacher_by_group = teacher_by_group             # {grp_code: ชื่อครู}
+        self.groups = tuple(sorted(teacher_by_group))
+
+    def subject_name(self, code, default=None):
+        name = self.subject_by_key.get(subject_key(code))
+        if name: return name
+        return code if default is None else default
+
+    def subject_names(self, codes, keys=None):
+        # keys: คอลัมน์ sub_key ที่อ่านมาจากตารางพร้อมกัน -> lookup ตรง ไม่ต้องตัดขีดใหม่
+        if keys is None: return [self.subject_name(c) for c in codes]
+        get = self.subject_by_key.get
+        return [get(k) or c for c, k in zip(codes, keys)]
+
+    def teacher_name(self, grp_code, default=None):
+        return self.teacher_by_group.get(grp_code, default)
+
+
+def load_refdata(conn, version=0):
+    subjects, by_key = {}, {}
+    for code, name, key in conn.execute("SELECT sub_code, sub_name, sub_key FROM subjects ORDER BY sub_code"):
+        code = str(code or '').strip()
+        if code and code not in subjects:
+            subjects[code] = str(name or '').strip() or code
+            by_key.setdefault(key if key is not None else subject_key(code), subjects[code])
+    teachers = {}
+    for grp, name in conn.execute("SELECT grp_code, teacher_name FROM groups"):
+        if grp: teachers[grp] = name or ''
+    # ชื่อครูในบัญชีผู้ใช้ (ตรงกับที่รายงานเดิมใช้) มาก่อนชื่อในตาราง groups
+    for name, grp in conn.execute("SELECT name, assigned_group FROM users WHERE role='teacher'"):
+        if grp: teachers[grp] = name or teachers.get(grp, '')
+    return RefData(version, subjects.items(), by_key, teachers)
+
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def get_refdata(db):
+    version = db.version('ref')
+    ref = _cache.get(db.path)
+    if ref is not None and ref.version == version: return ref
+    with _cache_lock:
+        ref = _cache.get(db.path)
+        if ref is None or ref.version != version:
+            ref = load_refdata(db.reader(), version)
+            _cache[db.path] = ref
+    return ref
@@ -0,0 +1,273 @@
+# ==========================================
+# SQLite <-> Google Sheets replication (offline-first)
+# ==========================================
+# หน้าเว็บอ่าน/เขียน SQLite เท่านั้น -> Sheets ช้า/ล่ม ไม่กระทบการ render
+# thread เบื้องหลังตัวเดียว (Replicator) ซิงก์เป็นรอบ ๆ:
+# - push: trigger บันทึกทุกการเปลี่ยนแปลงของตารางที่ซิงก์ลง repl_changes -> รวมเป็น batch
+#         (แก้แถวเดิม = values_batch_update 1 request, แถวใหม่ = values_append 1 request ต่อชีต, ลบ = ตั้ง _deleted = 1)
+# - pull: ตรวจเวลาแก้ไขของไฟล์ (Drive / ไม่มีสิทธิ์ = ขนาดชีต) ก่อน ไม่เปลี่ยน = ไม่ดาวน์โหลด / เปลี่ยน = อ่านทุกชีตใน request เดียว
+#         แล้วใช้เฉพาะแถวที่ต่างจากที่ซิงก์ไว้ล่าสุด (repl_rows เก็บ hash ของแถวที่ตรงกันทั้งสองฝั่ง)
+# กติกาเมื่อขัดกัน (แก้แถวเดียวกันทั้งสองฝั่งก่อนซิงก์): ฝั่ง SQLite ชนะ
+# - แถวที่มีการเปลี่ยนแปลงในเครื่องที่ยังไม่ได้ push -> ไม่รับค่าจาก Sheets แล้ว push ทับ
+# - แถวที่ไม่มีการเปลี่ยนแปลงในเครื่อง -> รับค่าจาก Sheets
+# exam_results ซิงก์ทางเดียว (push): คะแนนมาจากการตรวจในระบบ และตารางสรุป (summary.py) ผูกกับการเขียนผลผ่านคิว
+# แถวที่เพิ่มใน Sheets โดยไม่มีรหัส (คอลัมน์แรกว่าง) -> เพิ่มในเครื่อง แล้วเขียนรหัสที่ได้กลับไปที่แถวนั้น
+# ลบแถวในชีต: ใส่ 1 ในคอลัมน์ _deleted (ห้ามลบ/แทรกแถวจริง เพราะระบบอ้างอิงแถวด้วยเลขแถว)
+import hashlib
+import re
+import threading
+import time
+from collections import namedtuple
+
+from db import register_schema
+from exams import exam_version
+from sheets import change_token
+
+Table = namedtuple('Table', 'name key columns pull')
+
+TABLES = (
+    Table('exam_results', 'id', ('id', 'exam_id', 'std_id', 'score', 'total_score', 'timestamp'), False),
+    Table('classroom_videos', 'vid_id', ('vid_id', 'sub_code', 'topic_name', 'video_url', 'created_at'), True),
+    Table('exam_questions', 'id', ('id', 'exam_id', 'question_text', 'choice_a', 'choice_b', 'choice_c', 'choice_d', 'correct_answer'), True),
+)
+BY_NAME = {t.name: t for t in TABLES}
+DELETED_COL = '_deleted'
+
+INTERVAL = 5.0          # วินาทีระหว่างรอบซิงก์
+PUSH_BATCH = 500        # การเปลี่ยนแปลงต่อรอบ
+BACKOFF_MAX = 300.0     # Sheets ใช้ไม่ได้ -> รอนานขึ้นเรื่อย ๆ (x2) ไม่เกินนี้
+MAX_AGE = 60.0          # ไม่มีสิทธิ์ Drive (ตรวจด้วยขนาดชีต) -> อ่านทั้งไฟล์อย่างน้อยทุกกี่วินาที
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS repl_changes (seq INTEGER PRIMARY KEY AUTOINCREMENT, tbl TEXT, row_key INTEGER)',
+    'CREATE TABLE IF NOT EXISTS repl_rows (tbl TEXT, row_key INTEGER, hash TEXT, PRIMARY KEY (tbl, row_key))',
+]
+
+# บันทึกเฉพาะเมื่อเปิดใช้การซิงก์แล้ว (ยังไม่เคยซิงก์ = ไม่มีอะไรค้าง ตอนเริ่มซิงก์ครั้งแรก _bootstrap บันทึกทุกแถวให้เอง)
+TRIGGERS = [
+    f"CREATE TRIGGER IF NOT EXISTS {t.name}_repl_{op[0]} AFTER {op} ON {t.name} "
+    "WHEN EXISTS (SELECT 1 FROM meta WHERE key = 'repl:bootstrapped') BEGIN "
+    f"INSERT INTO repl_changes (tbl, row_key) VALUES ('{t.name}', {'old' if op == 'DELETE' else 'new'}.{t.key}); "
+    + (f"INSERT INTO repl_changes (tbl, row_key) SELECT '{t.name}', old.{t.key} WHERE old.{t.key} IS NOT new.{t.key}; " if op == 'UPDATE' else '')
+    + "END"
+    for t in TABLES for op in ('INSERT', 'UPDATE', 'DELETE')
+]
+register_schema(SCHEMA + TRIGGERS)
+
+
+def row_hash(values):
+    return hashlib.sha1('\x1f'.join('' if v is None else str(v) for v in values).encode('utf-8')).hexdigest()
+
+
+def _a1_col(n):
+    s = ''
+    while n: n, r = divmod(n - 1, 26); s = chr(65 + r) + s
+    return s
+
+
+def _sheet_values(row):
+    return ['' if v is None else str(v) for v in row]
+
+
+def _local_values(raw, n):
+    raw = list(raw[:n]) + [''] * (n - len(raw))
+    return [None if v == '' else v for v in raw]
+
+
+def _int(value):
+    try: return int(value)
+    except (TypeError, ValueError): return None
+
+
+class Replicator:
+    def __init__(self, db, connect, interval=INTERVAL, push_batch=PUSH_BATCH, max_age=MAX_AGE, clock=time.monotonic):
+        self.db = db
+        self.connect = connect          # connect() -> gspread.Spreadsheet (เรียกใน thread ซิงก์เท่านั้น)
+        self.interval = interval
+        self.push_batch = push_batch
+        self.max_age = max_age
+        self.clock = clock
+        self.sh = None
+        self._index = None              # {ชื่อตาราง: {key: เลขแถวในชีต}}
+        self._remote_token = None
+        self._drive = True              # False = อ่านเวลาแก้ไขจาก Drive ไม่ได้ -> ใช้ขนาดชีต (แบบ SheetCache)
+        self._pulled_at = None
+        self._lock = threading.Lock()   # รอบซิงก์ทีละรอบ (thread / sync_once จากภายนอก)
+        self._wake = threading.Event()
+        self._thread = None
+        self.pushed = self.pulled = self.conflicts = 0
+        self.skipped = 0                # แถวในชีตที่รหัสไม่ใช่ตัวเลข (พิมพ์ผิด/วางข้อความ) -> ข้าม ไม่ให้ทั้งรอบล้ม
+        self.last_skipped = None        # (ตาราง, เลขแถว, รหัส) แถวล่าสุดที่ข้าม
+        self.last_ok = None
+        self.last_error = None
+        self.failures = 0
+
+    # --- bootstrap ---
+    def _bootstrap(self):
+        # ครั้งแรก: ทุกแถวที่มีอยู่ในเครื่อง (ก่อนมี trigger) ถือว่ายังไม่ได้ push
+        with self.db.writer() as w:
+            if w.execute("SELECT value FROM meta WHERE key='repl:bootstrapped'").fetchone(): return
+            for t in TABLES:
+                w.execute(f"INSERT INTO repl_changes (tbl, row_key) SELECT '{t.name}', {t.key} FROM {t.name} ORDER BY {t.key}")
+            w.execute("INSERT INTO meta VALUES ('repl:bootstrapped', 1)")
+
+    def _ensure_sheets(self):
+        titles = {s['properties']['title'] for s in self.sh.fetch_sheet_metadata().get('sheets', [])}
+        for t in TABLES:
+            if t.name in titles: continue
+            self.sh.add_worksheet(t.name, rows=1, cols=len(t.columns) + 1)
+            self.sh.values_update(f"'{t.name}'!A1", params={'valueInputOption': 'RAW'}, body={'values': [list(t.columns) + [DELETED_COL]]})
+
+    # --- pull ---
+    def _read_remote(self):
+        resp = self.sh.values_batch_get([f"'{t.name}'" for t in TABLES])
+        return {t.name: vr.get('values', [])[1:] for t, vr in zip(TABLES, resp.get('valueRanges', []))}
+
+    def pull(self, force=False):
+        token, self._drive = change_token(self.sh, self._drive)
+        now = self.clock()
+        # ขนาดชีตมองไม่เห็นการแก้ค่าในช่องเดิม -> ครบ max_age อ่านทั้งไฟล์อีกครั้ง
+        fresh = self._drive or (self._pulled_at is not None and now - self._pulled_at < self.max_age)
+        if not force and fresh and self._index is not None and token == self._remote_token: return 0
+        remote = self._read_remote()
+        index, applied = {}, 0
+        bumps, new_rows = set(), []
+        with self.db.writer() as w:
+            before = w.execute("SELECT coalesce(MAX(seq), 0) FROM repl_changes").fetchone()[0]
+            for t in TABLES:
+                rows = remote[t.name]
+                idx = index[t.name] = {}
+                ncol = len(t.columns)
+                pending = {r[0] for r in w.execute("SELECT DISTINCT row_key FROM repl_changes WHERE tbl=?", (t.name,))}
+                synced = dict(w.execute("SELECT row_key, hash FROM repl_rows WHERE tbl=?", (t.name,)).fetchall())
+                for i, raw in enumerate(rows, start=2):
+                    if not any(str(v).strip() for v in raw): continue
+                    values = _local_values(raw, ncol)
+                    deleted = len(raw) > ncol and str(raw[ncol]).strip() not in ('', '0')
+                    key = values[0]
+                    if key is None:
+                        # แถวใหม่จาก Sheets (ไม่มีรหัส) -> เพิ่มในเครื่อง (trigger บันทึกให้ push รหัสกลับไปที่แถวนี้)
+                        if not t.pull or deleted: continue
+                        cur = w.execute(f"INSERT INTO {t.name} ({', '.join(t.columns[1:])}) VALUES ({', '.join('?' * (ncol - 1))})", values[1:])
+                        idx[cur.lastrowid] = i
+                        new_rows.append((t.name, cur.lastrowid))
+                        applied += 1
+                        if t.name == 'exam_questions': bumps.add(values[1])
+                        continue
+                    if _int(key) is None:
+                        self.skipped += 1
+                        self.last_skipped = (t.name, i, key)
+                        continue
+                    key = int(key)
+                    idx[key] = i
+                    h = row_hash(values)
+                    if not t.pull or synced.get(key) == (None if deleted else h): continue
+                    if key in pending:
+                        self.conflicts += 1      # แก้ทั้งสองฝั่ง -> ฝั่งเครื่องชนะ (push ทับในรอบนี้)
+                        continue
+                    if deleted:
+                        old = w.execute(f"SELECT * FROM {t.name} WHERE {t.key}=?", (key,)).fetchone()
+                        w.execute(f"DELETE FROM {t.name} WHERE {t.key}=?", (key,))
+                        w.execute("DELETE FROM repl_rows WHERE tbl=? AND row_key=?", (t.name, key))
+                        if old and t.name == 'exam_questions': bumps.add(old[1])
+                    else:
+                        w.execute(f"INSERT OR REPLACE INTO {t.name} ({', '.join(t.columns)}) VALUES ({', '.join('?' * ncol)})", values)
+                        w.execute("INSERT OR REPLACE INTO repl_rows VALUES (?, ?, ?)", (t.name, key, h))
+                        if t.name == 'exam_questions': bumps.add(values[1])
+                    applied += 1
+            # ค่าที่รับมาจาก Sheets ไม่ต้อง push กลับ (ยกเว้นแถวใหม่ที่ต้องเขียนรหัสกลับไป)
+            w.execute("DELETE FROM repl_changes WHERE seq > ?", (before,))
+            w.executemany("INSERT INTO repl_changes (tbl, row_key) VALUES (?, ?)", new_rows)
+        self._index = index
+        self._remote_token, self._pulled_at = token, now
+        for exam_id in bumps:
+            if _int(exam_id) is not None: self.db.bump(exam_version(int(exam_id)))
+        self.pulled += applied
+        return applied
+
+    # --- push ---
+    def push(self):
+        conn = self.db.reader()
+        changes = conn.execute("SELECT seq, tbl, row_key FROM repl_changes ORDER BY seq LIMIT ?", (self.push_batch,)).fetchall()
+        if not changes: return 0
+        upto = changes[-1][0]
+        keys = {}
+        for _, tbl, key in changes: keys.setdefault(tbl, set()).add(key)
+        updates, appends, synced, dropped = [], {}, [], []
+        for tbl, ks in keys.items():
+            t = BY_NAME[tbl]
+            have = dict(conn.execute("SELECT row_key, hash FROM repl_rows WHERE tbl=?", (tbl,)).fetchall())
+            marks = ','.join('?' * len(ks))
+            current = {r[0]: r for r in conn.execute(f"SELECT {', '.join(t.columns)} FROM {tbl} WHERE {t.key} IN ({marks})", tuple(ks))}
+            idx = self._index[tbl]
+            last = _a1_col(len(t.columns) + 1)
+            for key in sorted(ks):
+                row = current.get(key)
+                if row is None:
+                    # ลบในเครื่อง -> ทำเครื่องหมายในชีต (ไม่ลบแถว เลขแถวของแถวอื่นจะได้ไม่เลื่อน)
+                    if key in idx:
+                        updates.append({'range': f"'{tbl}'!{last}{idx[key]}", 'values': [['1']]})
+                    dropped.append((tbl, key))
+                    continue
+                h = row_hash(row)
+                if have.get(key) == h and key in idx: continue
+                values = _sheet_values(row) + ['']
+                if key in idx: updates.append({'range': f"'{tbl}'!A{idx[key]}:{last}{idx[key]}", 'values': [values]})
+                else: appends.setdefault(tbl, []).append((key, values))
+                synced.append((tbl, key, h))
+        for tbl, rows in appends.items():
+            resp = self.sh.values_append(f"'{tbl}'!A1", params={'valueInputOption': 'RAW', 'insertDataOption': 'INSERT_ROWS'},
+                                         body={'values': [v for _, v in rows]})
+            start = int(re.search(r'!\$?[A-Z]+\$?(\d+)', resp['updates']['updatedRange']).group(1))
+            for i, (key, _) in enumerate(rows): self._index[tbl][key] = start + i
+        if updates:
+            self.sh.values_batch_update({'valueInputOption': 'RAW', 'data': updates})
+        with self.db.writer() as w:
+            w.executemany("INSERT OR REPLACE INTO repl_rows VALUES (?, ?, ?)", synced)
+            w.executemany("DELETE FROM repl_rows WHERE tbl=? AND row_key=?", dropped)
+            w.execute("DELETE FROM repl_changes WHERE seq <= ?", (upto,))
+        self.pushed += len(synced) + len(dropped)
+        # การเขียนของเราเองทำให้เวลาแก้ไขของไฟล์เปลี่ยน -> รอบหน้า pull อ่านทั้งไฟล์อีกครั้ง (hash ตรงกัน = ไม่มีอะไรเปลี่ยนในเครื่อง)
+        # ไม่จำเวลาใหม่เอง เพราะจะพลาดการแก้ไขจากคนอื่นที่เกิดระหว่าง pull กับ push
+        return len(changes)
+
+    # --- รอบซิงก์ ---
+    def sync_once(self):
+        with self._lock:
+            try:
+                if self.sh is None:
+                    self.sh = self.connect()
+                    self._bootstrap()
+                    self._ensure_sheets()
+                self.pull()
+                while self.push() == self.push_batch: pass
+                self.last_ok, self.last_error, self.failures = time.time(), None, 0
+                return True
+            except Exception as e:
+                # เน็ตหลุด / quota / สิทธิ์ -> เก็บสถานะไว้ แล้วลองใหม่รอบหน้า (ข้อมูลในเครื่องยังอยู่ใน repl_changes)
+                self.last_error = f"{type(e).__name__}: {e}"
+                self.failures += 1
+                self._index = None      # ไม่แน่ใจว่า request สุดท้ายไปถึงหรือไม่ -> อ่านเลขแถวจากชีตใหม่ก่อน push รอบหน้า
+                return False
+
+    def _run(self):
+        while True:
+            ok = self.sync_once()
+            wait = self.interval if ok else min(BACKOFF_MAX, self.interval * 2 ** min(self.failures, 10))
+            self._wake.wait(wait)
+            self._wake.clear()
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="sheets-replicator", daemon=True)
+            self._thread.start()
+        return self
+
+    def wake(self):
+        self._wake.set()
+
+    def status(self):
+        pending = self.db.reader().execute("SELECT COUNT(DISTINCT tbl || ':' || row_key) FROM repl_changes").fetchone()[0]
+        return {'pending': pending, 'pushed': self.pushed, 'pulled': self.pulled, 'conflicts': self.conflicts,
+                'skipped': self.skipped, 'last_skipped': self.last_skipped,
+                'last_ok': self.last_ok, 'last_error': self.last_error, 'failures': self.failures}
@@ -0,0 +1,42 @@
+# ==========================================
+# Teacher roster (รายชื่อ นศ. ในกลุ่ม แบบแบ่งหน้า)
+# ==========================================
+# ดึงจาก SQL ทีละหน้า (กรองคำค้นใน SQL ด้วย search API) -> งานต่อ rerun คงที่ ไม่โตตามขนาดกลุ่ม
+# นศ. ในรายชื่อ = อยู่ในกลุ่ม และลงทะเบียนวิชาในเทอมที่เลือก
+from collections import namedtuple
+
+from search import student_ids_sql
+
+PAGE_SIZE = 50
+LEVEL_NAMES = ('ประถมศึกษา', 'มัธยมศึกษาตอนต้น', 'มัธยมศึกษาตอนปลาย')
+
+_ROSTER_WHERE = "s.grp_code = ? AND EXISTS (SELECT 1 FROM grades g WHERE g.std_id = s.std_id AND g.semestry = ?)"
+
+RosterPage = namedtuple('RosterPage', 'rows total page pages')
+
+
+def _where(grp, sem, kw):
+    where, params = _ROSTER_WHERE, (grp, sem)
+    if kw and str(kw).strip():
+        sql, kw_params = student_ids_sql(kw, grp)
+        where, params = f"{where} AND s.std_id IN ({sql})", params + kw_params
+    return where, params
+
+
+def level_counts(conn, grp, sem):
+    # จำนวน นศ. แยกระดับ (ทั้งกลุ่ม ไม่ขึ้นกับคำค้น) -> ทุกระดับใน LEVEL_NAMES มีค่าเสมอ + ระดับอื่นที่พบ
+    counts = {name: 0 for name in LEVEL_NAMES}
+    counts.update(conn.execute(f"SELECT s.level, COUNT(*) FROM students s WHERE {_ROSTER_WHERE} GROUP BY s.level", (grp, sem)).fetchall())
+    return counts
+
+
+def roster_page(conn, grp, sem, kw=None, page=0, size=PAGE_SIZE):
+    # rows: [(std_id, ชื่อเต็ม, ระดับ), ...] ของหน้าที่ขอ (หน้าเกินช่วง -> หน้าสุดท้าย)
+    where, params = _where(grp, sem, kw)
+    total = conn.execute(f"SELECT COUNT(*) FROM students s WHERE {where}", params).fetchone()[0]
+    pages = max(1, -(-total // size))
+    page = min(max(0, int(page)), pages - 1)
+    rows = conn.execute(
+        "SELECT s.std_id, coalesce(s.prefix, '') || coalesce(s.name, '') || ' ' || coalesce(s.surname, ''), s.level "
+        f"FROM students s WHERE {where} ORDER BY s.std_id LIMIT ? OFFSET ?", params + (size, page * size)).fetchall()
+    return RosterPage(rows, total, page, pages)
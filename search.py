@@ -0,0 +1,115 @@
+# ==========================================
+# Full-text search (SQLite FTS5 trigram)
+# ==========================================
+# ค้นหา นศ. (รหัส / คำนำหน้า+ชื่อ+นามสกุล) และกลุ่ม (รหัสกลุ่ม / ชื่อครู) แบบ substring ด้วย index
+# - trigram ตัดข้อความเป็นชุดละ 3 ตัวอักษร -> ใช้ได้กับภาษาไทย (ไม่ต้องตัดคำ) และรหัสตัวเลข ค้นกลางคำ/ขึ้นต้นได้
+# - ข้อมูลตรงกับตารางจริงเสมอ: trigger บน students/groups (แก้ไข/นำเข้าแบบ inplace, delta)
+#   + rebuild_search() หลังนำเข้าแบบ staged (สลับตารางใหม่ทั้งตาราง rowid เปลี่ยนหมด / trigger สร้างใหม่ตอนสลับ)
+from db import register_schema
+
+MIN_TRIGRAM = 3
+
+_FULL_NAME = "coalesce({p}.prefix, '') || coalesce({p}.name, '') || ' ' || coalesce({p}.surname, '')"
+
+TABLES = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS student_fts USING fts5(std_id, full_name, grp_code UNINDEXED, tokenize='trigram')",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS group_fts USING fts5(grp_code, teacher_name, tokenize='trigram')",
+]
+
+# rowid ของ FTS = rowid ของตารางจริง / BEFORE INSERT ลบแถวเดิมของ key เดียวกันก่อน (INSERT OR REPLACE ไม่เรียก trigger ลบ)
+TRIGGERS = [
+    "CREATE TRIGGER IF NOT EXISTS students_fts_bi BEFORE INSERT ON students BEGIN "
+    "DELETE FROM student_fts WHERE rowid = (SELECT rowid FROM students WHERE std_id = new.std_id); END",
+    "CREATE TRIGGER IF NOT EXISTS students_fts_ai AFTER INSERT ON students BEGIN "
+    f"INSERT INTO student_fts (rowid, std_id, full_name, grp_code) VALUES (new.rowid, new.std_id, {_FULL_NAME.format(p='new')}, new.grp_code); END",
+    "CREATE TRIGGER IF NOT EXISTS students_fts_ad AFTER DELETE ON students BEGIN "
+    "DELETE FROM student_fts WHERE rowid = old.rowid; END",
+    "CREATE TRIGGER IF NOT EXISTS students_fts_au AFTER UPDATE ON students BEGIN "
+    "DELETE FROM student_fts WHERE rowid = old.rowid; "
+    f"INSERT INTO student_fts (rowid, std_id, full_name, grp_code) VALUES (new.rowid, new.std_id, {_FULL_NAME.format(p='new')}, new.grp_code); END",
+    "CREATE TRIGGER IF NOT EXISTS groups_fts_bi BEFORE INSERT ON groups BEGIN "
+    "DELETE FROM group_fts WHERE rowid = (SELECT rowid FROM groups WHERE grp_code = new.grp_code); END",
+    "CREATE TRIGGER IF NOT EXISTS groups_fts_ai AFTER INSERT ON groups BEGIN "
+    "INSERT INTO group_fts (rowid, grp_code, teacher_name) VALUES (new.rowid, new.grp_code, new.teacher_name); END",
+    "CREATE TRIGGER IF NOT EXISTS groups_fts_ad AFTER DELETE ON groups BEGIN "
+    "DELETE FROM group_fts WHERE rowid = old.rowid; END",
+    "CREATE TRIGGER IF NOT EXISTS groups_fts_au AFTER UPDATE ON groups BEGIN "
+    "DELETE FROM group_fts WHERE rowid = old.rowid; "
+    "INSERT INTO group_fts (rowid, grp_code, teacher_name) VALUES (new.rowid, new.grp_code, new.teacher_name); END",
+]
+
+
+def ensure_search(conn):
+    for ddl in TABLES + TRIGGERS: conn.execute(ddl)
+
+
+def rebuild_search(conn):
+    ensure_search(conn)
+    conn.execute("DELETE FROM student_fts")
+    conn.execute(f"INSERT INTO student_fts (rowid, std_id, full_name, grp_code) SELECT rowid, std_id, {_FULL_NAME.format(p='students')}, grp_code FROM students")
+    conn.execute("DELETE FROM group_fts")
+    conn.execute("INSERT INTO group_fts (rowid, grp_code, teacher_name) SELECT rowid, grp_code, teacher_name FROM groups")
+
+
+def _migrate(conn):
+    # index ค้นหา (FTS) ยังว่างแต่มีข้อมูล นศ./กลุ่มอยู่แล้ว -> สร้างครั้งแรก
+    if (not conn.execute("SELECT 1 FROM student_fts LIMIT 1").fetchone() and not conn.execute("SELECT 1 FROM group_fts LIMIT 1").fetchone()
+            and (conn.execute("SELECT 1 FROM students LIMIT 1").fetchone() or conn.execute("SELECT 1 FROM groups LIMIT 1").fetchone())):
+        rebuild_search(conn)
+
+
+register_schema(TABLES + TRIGGERS, _migrate)
+
+
+# ==========================================
+# Query API (ใช้ร่วมกัน: ค้นหาของแอดมิน / รายชื่อ นศ. ของครู / ตารางคะแนน)
+# ==========================================
+# เลือกวิธีค้นตามขนาดของชุดข้อมูล:
+# - ทั้งโรงเรียน + คำค้น >= 3 ตัวอักษร -> FTS trigram (index)
+# - ภายในกลุ่มเดียว -> LIKE บนแถวของกลุ่ม (ix_students_grp เหลือหลักร้อยแถว เร็วกว่าไล่ผล FTS ทั้งโรงเรียน)
+# - คำค้นสั้นกว่า 3 ตัวอักษร -> LIKE (trigram ใช้ไม่ได้)
+def _like(kw):
+    return '%' + kw.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+def _phrase(columns, kw):
+    return "{" + ' '.join(columns) + "} : " + '"' + kw.replace('"', '""') + '"'
+
+
+def _student_filter(kw, grp_code=None):
+    # -> (เงื่อนไข WHERE บนตาราง students, params)
+    kw = str(kw).strip()
+    if grp_code is None and len(kw) >= MIN_TRIGRAM:
+        return "std_id IN (SELECT std_id FROM student_fts WHERE student_fts MATCH ?)", (_phrase(('std_id', 'full_name'), kw),)
+    where = f"(std_id LIKE ? ESCAPE '\\' OR {_FULL_NAME.format(p='students')} LIKE ? ESCAPE '\\')"
+    params = (_like(kw),) * 2
+    if grp_code is not None: where, params = f"grp_code = ? AND {where}", (grp_code,) + params
+    return where, params
+
+
+def student_ids_sql(kw, grp_code=None):
+    # sub-query รหัส นศ. ที่ตรงคำค้น -> ใช้ต่อใน query หลัก "... AND s.std_id IN (<sql>)"
+    where, params = _student_filter(kw, grp_code)
+    return f"SELECT std_id FROM students WHERE {where}", params
+
+
+def match_student_ids(conn, kw, grp_code=None):
+    sql, params = student_ids_sql(kw, grp_code)
+    return {r[0] for r in conn.execute(sql, params)}
+
+
+def search_students(conn, kw, limit=-1):
+    # เรียงตามรหัส + LIMIT -> คำค้นกว้าง ๆ หยุดได้เมื่อครบจำนวน ไม่ต้องอ่านผลทั้งหมด
+    where, params = _student_filter(kw)
+    return conn.execute(f"SELECT std_id, prefix, name, surname, grp_code, level FROM students WHERE {where} ORDER BY std_id LIMIT ?",
+                        params + (limit,)).fetchall()
+
+
+def search_groups(conn, kw, limit=-1):
+    kw = str(kw).strip()
+    if len(kw) >= MIN_TRIGRAM:
+        where, params = "group_fts MATCH ?", (_phrase(('grp_code', 'teacher_name'), kw),)
+    else:
+        where, params = "(grp_code LIKE ? ESCAPE '\\' OR teacher_name LIKE ? ESCAPE '\\')", (_like(kw),) * 2
+    return conn.execute(f"SELECT grp_code, teacher_name FROM group_fts WHERE {where} ORDER BY grp_code LIMIT ?",
+                        params + (limit,)).fetchall()
@@ -0,0 +1,195 @@
+# ==========================================
+# Signed session tokens + identity cache
+# ==========================================
+# เดิม restore_session เชื่อ ?user=<username> ตรง ๆ (แก้ URL เป็นรหัสคนอื่นก็เข้าได้) และ query users + students ทุก session ใหม่ / ทุกครั้งที่รีเฟรช
+# - เข้าสู่ระบบสำเร็จ -> ออก token ลงชื่อ HMAC-SHA256 มีวันหมดอายุ ใส่ไว้ใน ?session= (รีเฟรชแล้วยังอยู่ในระบบ)
+# - ตรวจ token = HMAC + เวลาหมดอายุ + รายการเพิกถอนในหน่วยความจำ -> ไม่แตะ DB
+# - ตัวตน (บทบาท, ชื่อ, กลุ่ม) เก็บใน LRU จำกัดขนาด ผูกกับเวอร์ชัน 'data' (นำเข้าข้อมูลใหม่ -> อ่านจาก DB ใหม่ครั้งเดียวต่อคน)
+# - ออกจากระบบ = เพิกถอน token นั้น / รีเซ็ตรหัสผ่าน = เลื่อน generation ของผู้ใช้ -> token ทุกใบที่ออกก่อนหน้าใช้ไม่ได้
+#   บันทึกลง DB ด้วย (รีสตาร์ต server แล้วยังมีผล) อ่านเข้าหน่วยความจำครั้งเดียวตอนเริ่ม
+#   token ที่หมดอายุแล้วถูกปฏิเสธอยู่แล้ว -> jti ที่เลยวันหมดอายุถูกลบออกจากรายการเพิกถอนทั้งตอนตรวจและตอนเพิ่ม (ไม่โตตลอดวันสอบ)
+# กุญแจลงชื่อ: session_secret ใน secrets ถ้ามี ไม่งั้นสุ่มครั้งแรกแล้วเก็บใน DB
+import base64
+import hashlib
+import heapq
+import hmac
+import json
+import secrets
+import threading
+import time
+from collections import Counter, OrderedDict, namedtuple
+
+from db import register_schema
+
+TOKEN_TTL = 12 * 3600           # วินาที (ครอบคลุมวันสอบทั้งวัน)
+IDENTITY_CACHE_SIZE = 30000     # ตัวตนที่จำไว้ (~ นศ. + ครูทั้งโรงเรียน)
+IDENTITY_VERSIONS = ('data',)   # นำเข้า ZIP (students/users เปลี่ยน) -> resolve ใหม่
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS session_keys (id INTEGER PRIMARY KEY CHECK (id = 1), secret TEXT NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS session_revoked (jti TEXT PRIMARY KEY, expires INTEGER NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS session_generation (username TEXT PRIMARY KEY, generation INTEGER NOT NULL)',
+]
+register_schema(SCHEMA)
+
+# users ก่อน (admin / ครู) แล้วจึง นศ. ใน query เดียว
+IDENTITY_SQL = """
+    SELECT role, name, assigned_group, 0 AS pri FROM users WHERE username = ?
+    UNION ALL
+    SELECT 'student', coalesce(prefix, '') || coalesce(name, '') || ' ' || coalesce(surname, ''), grp_code, 1 FROM students WHERE std_id = ?
+    ORDER BY pri LIMIT 1
+"""
+
+Identity = namedtuple('Identity', 'user role name group')
+CLAIM_TYPES = {'u': str, 'g': int, 'exp': int, 'jti': str}
+
+
+def _b64(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+def _unb64(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def _key(secret):
+    return secret.encode('utf-8') if isinstance(secret, str) else secret
+
+
+def resolve_identity(conn, username):
+    row = conn.execute(IDENTITY_SQL, (username, username)).fetchone()
+    return None if row is None else Identity(username, row[0], row[1], row[2] or '')
+
+
+class Sessions:
+    def __init__(self, db, secret=None, ttl=TOKEN_TTL, cache_size=IDENTITY_CACHE_SIZE, clock=time.time):
+        self.db = db
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self.clock = clock
+        self.stats = Counter()          # issued / verified / rejected / hit / miss / revoked
+        self._lock = threading.Lock()
+        self._identities = OrderedDict()    # username -> (version, Identity)
+        with db.writer() as w:
+            if secret is None:
+                w.execute("INSERT OR IGNORE INTO session_keys VALUES (1, ?)", (secrets.token_urlsafe(32),))
+                secret = w.execute("SELECT secret FROM session_keys WHERE id = 1").fetchone()[0]
+            w.execute("DELETE FROM session_revoked WHERE expires <= ?", (int(clock()),))
+            self._revoked = {jti: exp for jti, exp in w.execute("SELECT jti, expires FROM session_revoked")}
+            self._expiry = [(exp, jti) for jti, exp in self._revoked.items()]    # heap: jti ที่หมดอายุก่อนอยู่บนสุด
+            heapq.heapify(self._expiry)
+            self._generation = dict(w.execute("SELECT username, generation FROM session_generation"))
+        self._key = _key(secret)
+
+    # --- tokens ---
+    def _sign(self, body):
+        return _b64(hmac.new(self._key, body.encode('ascii'), hashlib.sha256).digest())
+
+    def issue(self, identity):
+        now = self.clock()
+        claims = {'u': identity.user, 'g': self._generation.get(identity.user, 0), 'exp': int(now + self.ttl), 'jti': secrets.token_urlsafe(9)}
+        body = _b64(json.dumps(claims, separators=(',', ':'), ensure_ascii=False).encode('utf-8'))
+        self.remember(identity)
+        self.stats['issued'] += 1
+        return f"{body}.{self._sign(body)}"
+
+    def _claims(self, token):
+        # ลายเซ็นถูกต้อง + มีครบทุกช่อง -> claims (ยังไม่ดูวันหมดอายุ/การเพิกถอน) / None
+        # token มาจาก URL (แก้เองได้) -> อะไรที่ไม่ใช่ token ของเรา (ไม่ใช่ ASCII, จุดเกิน, ไม่ใช่ JSON, ช่องหาย) = None ไม่ใช่ exception
+        try:
+            body, sig = token.split('.')
+            if not hmac.compare_digest(sig.encode('utf-8', 'replace'), self._sign(body).encode('ascii')): return None
+            claims = json.loads(_unb64(body))
+        except (ValueError, UnicodeError, AttributeError, TypeError):
+            return None
+        if not isinstance(claims, dict) or not CLAIM_TYPES.keys() <= claims.keys(): return None
+        if not all(isinstance(claims[k], t) for k, t in CLAIM_TYPES.items()): return None
+        return claims
+
+    def verify(self, token):
+        # -> username / None  (ไม่แตะ DB)
+        now = self.clock()
+        if self._expiry and self._expiry[0][0] <= now:
+            with self._lock: self._prune(now)
+        claims = self._claims(token)
+        ok = (claims is not None and claims['exp'] > now and claims['jti'] not in self._revoked
+              and claims['g'] == self._generation.get(claims['u'], 0))
+        self.stats['verified' if ok else 'rejected'] += 1
+        return claims['u'] if ok else None
+
+    # --- identities ---
+    def remember(self, identity):
+        with self._lock:
+            self._identities[identity.user] = (self.db.version(*IDENTITY_VERSIONS), identity)
+            self._identities.move_to_end(identity.user)
+            while len(self._identities) > self.cache_size: self._identities.popitem(last=False)
+
+    def identity(self, username):
+        version = self.db.version(*IDENTITY_VERSIONS)
+        with self._lock:
+            cached = self._identities.get(username)
+            if cached is not None and cached[0] == version:
+                self._identities.move_to_end(username)
+                self.stats['hit'] += 1
+                return cached[1]
+        self.stats['miss'] += 1
+        identity = resolve_identity(self.db.reader(), username)
+        if identity is not None: self.remember(identity)
+        return identity
+
+    def restore(self, token):
+        # ?session=<token> -> Identity / None
+        username = self.verify(token) if token else None
+        return None if username is None else self.identity(username)
+
+    # --- revocation ---
+    def _prune(self, now):
+        # เรียกขณะถือ _lock: ลบ jti ที่หมดอายุแล้ว (token นั้นถูกปฏิเสธด้วย exp อยู่แล้ว)
+        while self._expiry and self._expiry[0][0] <= now:
+            exp, jti = heapq.heappop(self._expiry)
+            if self._revoked.get(jti) == exp: del self._revoked[jti]
+
+    def revoke(self, token):
+        claims = self._claims(token)
+        now = int(self.clock())
+        with self._lock:
+            self._prune(now)
+            if claims is None or claims['exp'] <= now: return     # หมดอายุแล้วใช้ไม่ได้อยู่แล้ว ไม่ต้องจำ
+            self._revoked[claims['jti']] = claims['exp']
+            heapq.heappush(self._expiry, (claims['exp'], claims['jti']))
+        with self.db.writer() as w:
+            w.execute("DELETE FROM session_revoked WHERE expires <= ?", (now,))
+            w.execute("INSERT OR REPLACE INTO session_revoked VALUES (?, ?)", (claims['jti'], claims['exp']))
+        self.stats['revoked'] += 1
+
+    def revoke_user(self, username):
+        # token ทุกใบของผู้ใช้ที่ออกก่อนหน้านี้ใช้ไม่ได้อีก (เช่น หลังรีเซ็ตรหัสผ่าน)
+        with self._lock:
+            generation = self._generation[username] = self._generation.get(username, 0) + 1
+            self._identities.pop(username, None)
+        with self.db.writer() as w:
+            w.execute("INSERT OR REPLACE INTO session_generation VALUES (?, ?)", (username, generation))
+        self.stats['revoked'] += 1
+
+
+def token_for(db, username):
+    # token ของผู้ใช้ที่มีอยู่แล้ว (สคริปต์ทดสอบ / bench เปิดหน้าเว็บในนามผู้ใช้โดยไม่ผ่านฟอร์ม)
+    store = get_sessions(db)
+    identity = store.identity(username)
+    if identity is None: raise ValueError(f"ไม่พบผู้ใช้ '{username}' (users / students)")
+    return store.issue(identity)
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_sessions(db, secret=None):
+    # ตัวเดียวต่อ DB ทั้ง process (เหมือน get_db)
+    # secret=None = ใช้กุญแจของตัวที่มีอยู่แล้ว / ระบุกุญแจอื่นหลังสร้างแล้ว -> error (ไม่เงียบแล้วลงชื่อด้วยกุญแจเดิม)
+    with _sessions_lock:
+        if db.path not in _sessions: _sessions[db.path] = Sessions(db, secret)
+        store = _sessions[db.path]
+    if secret is not None and store._key != _key(secret):
+        raise ValueError(f"Sessions ของ {db.path} สร้างไว้แล้วด้วยกุญแจอื่น (ส่ง session_secret เดียวกันทุกที่ หรือไม่ส่งเลย)")
+    return store
@@ -0,0 +1,252 @@
+# ==========================================
+# Google Sheets read cache (get_data)
+# ==========================================
+# เดิม get_data() = sh.worksheet() (อ่าน metadata) + get_all_records() (ดาวน์โหลดทั้งชีต) ทุกครั้งที่เรียก -> ช้า และชน quota เมื่อมีหลาย session
+# - เก็บ DataFrame ของแต่ละชีตไว้ในหน่วยความจำ ใช้ร่วมกันทุก session
+# - ครบ ttl -> ตรวจแบบถูก ๆ ก่อน 1 ครั้งต่อไฟล์ (เวลาแก้ไขล่าสุดจาก Drive / ขนาดของแต่ละชีต) ไม่เปลี่ยน = ใช้ของเดิมต่อ
+# - ชีตที่ต้องโหลด ดึงพร้อมกันใน values_batch_get ครั้งเดียว (get_many)
+# - ครบ max_age -> โหลดใหม่แน่นอน (กันกรณีตรวจด้วยขนาดชีต ซึ่งมองไม่เห็นการแก้ค่าในช่องเดิม)
+# - เขียนผ่าน add_data (SheetWriter ด้านล่าง) -> invalidate() ชีตนั้นหลังเขียนเสร็จ
+# ใช้ได้กับอะไรก็ได้ที่มี method แบบ gspread.Spreadsheet: values_batch_get, get_lastUpdateTime, fetch_sheet_metadata
+import random
+import threading
+import time
+from collections import Counter
+
+import gspread
+import pandas as pd
+from google.oauth2.service_account import Credentials
+from gspread.exceptions import APIError
+from gspread.utils import fill_gaps, numericise_all, to_records
+
+DEFAULT_TTL = 60
+DEFAULT_MAX_AGE = 600
+SPREADSHEET = "SchoolData"
+SCOPES = [
+    "https://www.googleapis.com/auth/spreadsheets",
+    "https://www.googleapis.com/auth/drive",
+]
+
+
+def open_spreadsheet(secrets, title=SPREADSHEET):
+    # secrets: service account info (st.secrets["gsheets"]) -> gspread.Spreadsheet (มี request ไป Google)
+    creds = Credentials.from_service_account_info(secrets, scopes=SCOPES)
+    return gspread.authorize(creds).open(title)
+
+
+def change_token(spreadsheet, drive=True):
+    # ค่าที่เปลี่ยนเมื่อไฟล์ถูกแก้ -> (token, ยังใช้ Drive ได้หรือไม่)
+    if drive:
+        try:
+            return spreadsheet.get_lastUpdateTime(), True
+        except Exception:
+            pass
+    # ไม่มีสิทธิ์ Drive -> ใช้จำนวนแถว/คอลัมน์ของแต่ละชีต (append แล้วแถวเพิ่ม / แก้ค่าในช่องเดิมมองไม่เห็น)
+    meta = spreadsheet.fetch_sheet_metadata({'fields': 'sheets.properties(title,gridProperties)'})
+    return tuple((p['title'], p['gridProperties'].get('rowCount'), p['gridProperties'].get('columnCount'))
+                 for p in (s['properties'] for s in meta.get('sheets', []))), False
+
+
+def records_frame(values):
+    # ค่าจาก values API -> DataFrame แบบเดียวกับ pd.DataFrame(worksheet.get_all_records())
+    if not values or values == [[]]: return pd.DataFrame()
+    values = fill_gaps(values)
+    return pd.DataFrame(to_records(values[0], [numericise_all(row) for row in values[1:]]))
+
+
+class SheetCache:
+    def __init__(self, spreadsheet, ttl=DEFAULT_TTL, max_age=DEFAULT_MAX_AGE, clock=time.monotonic):
+        self.spreadsheet = spreadsheet
+        self.ttl = ttl
+        self.max_age = max_age
+        self.clock = clock
+        self.stats = Counter()      # hit / probe / fetch (จำนวนชีต) / batch (จำนวน request)
+        self._frames = {}           # ชื่อชีต -> (เวลาที่โหลด, DataFrame)
+        self._token = None          # ผลตรวจล่าสุด
+        self._drive = True          # False = เคยอ่านเวลาแก้ไขจาก Drive ไม่ได้ -> ใช้ขนาดชีตตลอด
+        self._checked = None        # เวลาที่ตรวจ/โหลดล่าสุด
+        self._lock = threading.Lock()
+
+    def _probe(self):
+        token, self._drive = change_token(self.spreadsheet, self._drive)
+        return token
+
+    def _revalidate(self, now):
+        if self._checked is not None and now - self._checked < self.ttl: return
+        token = self._probe()
+        self.stats['probe'] += 1
+        if token != self._token: self._frames.clear()
+        self._token, self._checked = token, now
+        for name in [n for n, (loaded, _) in self._frames.items() if now - loaded >= self.max_age]:
+            del self._frames[name]
+
+    def _fetch(self, names, now):
+        # ชื่อชีต = range ทั้งชีต / ค่าเป็น FORMATTED_VALUE + numericise เหมือน get_all_records()
+        resp = self.spreadsheet.values_batch_get([f"'{n}'" for n in names])
+        self.stats['batch'] += 1
+        self.stats['fetch'] += len(names)
+        for name, vr in zip(names, resp.get('valueRanges', [])):
+            self._frames[name] = (now, records_frame(vr.get('values', [])))
+
+    def get_many(self, names):
+        # -> {ชื่อชีต: DataFrame} (สำเนา ผู้เรียกแก้ไขได้ไม่กระทบ cache)
+        names = list(dict.fromkeys(names))
+        with self._lock:
+            now = self.clock()
+            self._revalidate(now)
+            missing = [n for n in names if n not in self._frames]
+            self.stats['hit'] += len(names) - len(missing)
+            if missing: self._fetch(missing, now)
+            return {n: self._frames[n][1].copy() for n in names}
+
+    def get(self, name):
+        return self.get_many([name])[name]
+
+    def invalidate(self, name=None):
+        with self._lock:
+            if name is None: self._frames.clear()
+            else: self._frames.pop(name, None)
+
+
+# ==========================================
+# Write-behind buffer (add_data)
+# ==========================================
+# เดิม add_data() = sh.worksheet() + append_row() ทีละแถว -> 400 แถว = 800 request ต่อเนื่อง และชน quota การเขียน
+# - แถวเข้าบัฟเฟอร์ของแต่ละชีตแล้วกลับทันที (ได้ RowTicket ไว้ดูผล)
+# - thread เขียนตัวเดียว flush ด้วย append_rows เมื่อ ครบ flush_rows แถว / แถวแรกค้างครบ flush_interval วินาที / เรียก flush()
+# - quota เต็ม (429) / server error / เน็ตหลุด -> ลองใหม่แบบ backoff (x2 ต่อครั้ง) ครบ retries แล้วยังไม่ได้ = แจ้ง error ใน ticket
+# - ticket.ok = API ตอบรับ append แล้ว (บันทึกใน Sheets จริง)
+#   request ที่หมดเวลาแต่ฝั่ง Google เขียนไปแล้ว อาจถูกส่งซ้ำตอนลองใหม่ (at-least-once)
+FLUSH_ROWS = 200
+FLUSH_INTERVAL = 2.0
+RETRIES = 5
+BACKOFF = 1.0
+RETRY_CODES = {429, 500, 502, 503, 504}
+
+
+class RowTicket:
+    __slots__ = ('sheet', 'row', 'written', 'error', '_done')
+
+    def __init__(self, sheet, row):
+        self.sheet, self.row = sheet, list(row)
+        self.written = None
+        self.error = None
+        self._done = threading.Event()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    @property
+    def ok(self):
+        return self.done and self.error is None
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+
+def _retryable(e):
+    if isinstance(e, APIError): return e.code in RETRY_CODES
+    return isinstance(e, OSError)   # requests ConnectionError / timeout
+
+
+class SheetWriter:
+    def __init__(self, spreadsheet, flush_rows=FLUSH_ROWS, flush_interval=FLUSH_INTERVAL, retries=RETRIES, backoff=BACKOFF,
+                 on_written=None, sleep=time.sleep):
+        self.spreadsheet = spreadsheet
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.retries = retries
+        self.backoff = backoff
+        self.on_written = on_written    # on_written(ชื่อชีต) หลังเขียนสำเร็จ เช่น SheetCache.invalidate
+        self.sleep = sleep
+        self.stats = Counter()          # written / failed / requests / retries
+        self._buffers = {}              # ชื่อชีต -> [RowTicket]
+        self._since = {}                # ชื่อชีต -> เวลาที่แถวแรกในบัฟเฟอร์เข้ามา
+        self._forced = set()
+        self._inflight = []             # tickets ที่ thread เขียนหยิบไปแล้วแต่ยังไม่เสร็จ
+        self._worksheets = {}
+        self._cond = threading.Condition()
+        self._thread = None
+
+    # --- producer (session) ---
+    def append(self, sheet_name, row):
+        ticket = RowTicket(sheet_name, row)
+        with self._cond:
+            self._buffers.setdefault(sheet_name, []).append(ticket)
+            self._since.setdefault(sheet_name, time.monotonic())
+            n = len(self._buffers[sheet_name])
+            if n == 1 or n >= self.flush_rows: self._cond.notify()   # แถวแรก (ตั้งเวลา) / ครบ batch
+            self._ensure_thread()
+        return ticket
+
+    def flush(self, sheet_name=None, timeout=None):
+        # เขียนแถวที่ค้างอยู่ตอนนี้ทันที แล้วรอผล -> True = ทุกแถวเขียนสำเร็จ
+        with self._cond:
+            names = [n for n in self._buffers if sheet_name is None or n == sheet_name]
+            tickets = [t for n in names for t in self._buffers[n]]
+            tickets += [t for t in self._inflight if sheet_name is None or t.sheet == sheet_name]
+            self._forced.update(names)
+            self._cond.notify()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for t in tickets:
+            if not t.wait(None if deadline is None else max(0, deadline - time.monotonic())): return False
+        return all(t.ok for t in tickets)
+
+    def pending(self):
+        with self._cond:
+            return sum(len(b) for b in self._buffers.values())
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="sheets-writer", daemon=True)
+            self._thread.start()
+
+    # --- consumer (writer thread) ---
+    def _take_due(self):
+        # -> [(ชื่อชีต, tickets)] ที่ถึงเวลาเขียน / รอจนกว่าจะมี
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                due = [n for n, b in self._buffers.items()
+                       if b and (n in self._forced or len(b) >= self.flush_rows or now - self._since[n] >= self.flush_interval)]
+                if due:
+                    out = []
+                    for n in due:
+                        out.append((n, self._buffers.pop(n)))
+                        self._since.pop(n, None)
+                        self._forced.discard(n)
+                    self._inflight = [t for _, tickets in out for t in tickets]
+                    return out
+                waits = [self.flush_interval - (now - s) for s in self._since.values()]
+                self._cond.wait(min(waits) if waits else None)
+
+    def _worksheet(self, name):
+        if name not in self._worksheets: self._worksheets[name] = self.spreadsheet.worksheet(name)
+        return self._worksheets[name]
+
+    def _write(self, name, rows):
+        for attempt in range(self.retries + 1):
+            try:
+                self.stats['requests'] += 1
+                self._worksheet(name).append_rows(rows, value_input_option='RAW')
+                return None
+            except Exception as e:
+                if attempt == self.retries or not _retryable(e): return e
+                self.stats['retries'] += 1
+                self.sleep(self.backoff * 2 ** attempt * (1 + random.random() * 0.1))
+
+    def _run(self):
+        while True:
+            for name, tickets in self._take_due():
+                for i in range(0, len(tickets), self.flush_rows):
+                    chunk = tickets[i:i + self.flush_rows]
+                    error = self._write(name, [t.row for t in chunk])
+                    # ล้าง cache ก่อนแจ้ง ticket -> ผู้ที่รอ flush แล้วอ่านต่อเห็นแถวใหม่แน่นอน
+                    if self.on_written: self.on_written(name)
+                    now = time.time()
+                    self.stats['written' if error is None else 'failed'] += len(chunk)
+                    for t in chunk:
+                        t.written = now if error is None else None
+                        t.error = None if error is None else f"{type(error).__name__}: {error}"
+                        t._done.set()
@@ -0,0 +1,138 @@
+# ==========================================
+# Exam submission queue (background single writer)
+# ==========================================
+# session ของ นศ. ตรวจคะแนนแล้วแค่ใส่ผลลงคิว -> กลับทันที ไม่รอ lock / ไม่ sleep
+# thread เขียนตัวเดียวรวบผลที่ค้างเป็น batch เขียนใน transaction สั้น ๆ (fsync ครั้งเดียวต่อ batch)
+# แล้วแจ้งกลับผ่าน Ticket ว่าบันทึกลงดิสก์แล้ว / ทุก batch bump เวอร์ชัน 'results' (สถิติการเข้าสอบโหลดใหม่)
+import queue
+import threading
+import time
+from collections import deque
+
+from summary import apply_submissions
+
+BATCH_MAX = 200
+BATCH_WAIT = 0.02       # วินาทีที่รอเก็บผลเพิ่มหลังได้รายการแรก
+RETRIES = 3
+LATENCY_WINDOW = 500    # จำนวน latency ล่าสุดที่เก็บไว้คำนวณ p95
+
+
+class Ticket:
+    __slots__ = ('exam_id', 'std_id', 'score', 'total', 'timestamp', 'enqueued', 'committed', 'error', '_done')
+
+    def __init__(self, exam_id, std_id, score, total, timestamp):
+        self.exam_id, self.std_id, self.score, self.total, self.timestamp = int(exam_id), std_id, int(score), int(total), timestamp
+        self.enqueued = time.perf_counter()
+        self.committed = None
+        self.error = None
+        self._done = threading.Event()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    @property
+    def ok(self):
+        return self.done and self.error is None
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+
+class SubmissionQueue:
+    def __init__(self, db, batch_max=BATCH_MAX, batch_wait=BATCH_WAIT):
+        self.db = db
+        self.batch_max = batch_max
+        self.batch_wait = batch_wait
+        self._q = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.committed = 0
+        self.failed = 0
+        self.batches = 0
+        self.last_batch = 0
+        self.last_commit_ms = 0.0
+        self._latency_ms = deque(maxlen=LATENCY_WINDOW)
+
+    # --- producer (session) ---
+    def submit(self, exam_id, std_id, score, total, timestamp):
+        ticket = Ticket(exam_id, std_id, score, total, timestamp)
+        self._ensure_thread()
+        self._q.put(ticket)
+        return ticket
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="exam-submission-writer", daemon=True)
+                self._thread.start()
+
+    # --- consumer (writer thread) ---
+    def _drain(self):
+        batch = [self._q.get()]
+        deadline = time.perf_counter() + self.batch_wait
+        while len(batch) < self.batch_max:
+            left = deadline - time.perf_counter()
+            try: batch.append(self._q.get(timeout=left) if left > 0 else self._q.get_nowait())
+            except queue.Empty: break
+        return batch
+
+    def _write(self, batch):
+        # ส่งซ้ำในคิวเดียวกัน (คนเดิม ข้อสอบเดิม) -> เก็บผลล่าสุด เหมือนลบของเก่าแล้วใส่ใหม่
+        latest = {(t.exam_id, t.std_id): t for t in batch}
+        with self.db.writer(bump='results', durable=True) as w:
+            apply_submissions(w, list(latest))  # ตารางสรุป (ต้องก่อนลบ/เขียนผล) ใน transaction เดียวกัน
+            w.executemany("DELETE FROM exam_results WHERE exam_id=? AND std_id=?", list(latest))
+            w.executemany("INSERT INTO exam_results (exam_id, std_id, score, total_score, timestamp) VALUES (?, ?, ?, ?, ?)",
+                          [(t.exam_id, t.std_id, t.score, t.total, t.timestamp) for t in latest.values()])
+
+    def _run(self):
+        while True:
+            batch = self._drain()
+            t0 = time.perf_counter()
+            error = None
+            for attempt in range(RETRIES):
+                try:
+                    self._write(batch); error = None; break
+                except Exception as e:  # เช่น database is locked จาก process อื่น
+                    error = e
+                    time.sleep(0.1 * (attempt + 1))
+            now = time.perf_counter()
+            with self._lock:
+                self.batches += 1
+                self.last_batch = len(batch)
+                self.last_commit_ms = (now - t0) * 1000
+                if error is None: self.committed += len(batch)
+                else: self.failed += len(batch)
+                for t in batch: self._latency_ms.append((now - t.enqueued) * 1000)
+            for t in batch:
+                t.committed = now if error is None else None
+                t.error = None if error is None else str(error)
+                t._done.set()
+
+    # --- สถานะสำหรับแอดมิน ---
+    def stats(self):
+        with self._lock:
+            lat = sorted(self._latency_ms)
+            return {
+                'depth': self._q.qsize(),
+                'committed': self.committed,
+                'failed': self.failed,
+                'batches': self.batches,
+                'last_batch': self.last_batch,
+                'last_commit_ms': self.last_commit_ms,
+                'p50_ms': lat[len(lat) // 2] if lat else 0.0,
+                'p95_ms': lat[min(len(lat) - 1, int(len(lat) * 0.95))] if lat else 0.0,
+            }
+
+
+_queues = {}
+_queues_lock = threading.Lock()
+
+
+def get_submission_queue(db):
+    # คิวเดียวต่อ DB ทั้ง process (เหมือน get_db)
+    with _queues_lock:
+        if db.path not in _queues:
+            _queues[db.path] = SubmissionQueue(db)
+        return _queues[db.path]
@@ -0,0 +1,270 @@
+# ==========================================
+# End-to-end benchmark suite (synthetic school)
+# ==========================================
+# สร้างโรงเรียนสังเคราะห์ขนาดเท่าของจริง แล้ววัดทุกเส้นทางหลักด้วยโค้ดชุดเดียวกับหน้าเว็บ (AppTest, in-process):
+#   ZIP ของ DBF (cp874) -> นำเข้าแบบ tab3 -> ข้อสอบ/คำถาม/ผลสอบ -> หน้า นศ. ทุกเมนู -> ครู: รายชื่อ / ตารางคะแนน
+#   -> แอดมิน: ภาพรวม / รายงานผลสอบ (tab6) -> นศ. ส่งข้อสอบพร้อมกัน
+# ผลเป็นไฟล์ JSON (metrics แบบแบน) ไว้เทียบระหว่างรุ่น
+# ใช้งาน:  python suite.py --json results.json                      (20k นศ. / 600k เกรด / 300 กลุ่ม)
+#         python suite.py --students 2000 --grades 60000 --groups 30 --json small.json
+#         python suite.py --zip-only school.zip                     -> สร้างเฉพาะ ZIP ไว้ทดลองนำเข้าที่ tab3
+#         python suite.py --compare old.json new.json               -> metric ที่ช้าลงเกิน --tolerance = regression (exit 1)
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = os.path.join(HERE, "app.py")
+sys.path.insert(0, HERE)
+
+import bench
+import importer
+import loadtest
+import perf
+from synthetic import ZIP_SEMESTERS, make_zip, seed_exams
+from sessions import token_for
+
+SUITE_VERSION = 1
+STUDENT_MENUS = ["รายวิชาและผลการเรียน", "ตารางสอบ", "กิจกรรม กพช.", "แบบทดสอบออนไลน์"]
+TEACHER_MATRIX = "📊 ตารางคะแนน (Matrix)"
+ADMIN_PAGES = {'admin_overview': "📊 ภาพรวม", 'admin_report': "📈 รายงานผลสอบ"}
+MIN_REGRESSION_MS = 5.0     # ต่างกันน้อยกว่านี้ไม่นับเป็น regression (noise ของเครื่อง)
+
+
+# ==========================================
+# 1. Pages
+# ==========================================
+def time_page(at, repeat):
+    # rerun แรก (cold: cache ของหน้านี้ยังไม่มี) + อีก repeat ครั้ง -> p50/p95 + จำนวน query ต่อ rerun (perf.py)
+    t0 = time.perf_counter(); at.run(); cold = (time.perf_counter() - t0) * 1000
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter(); at.run(); times.append((time.perf_counter() - t0) * 1000)
+    last = perf.reruns[-1] if perf.reruns else None
+    return {'cold_ms': cold, 'p50_ms': loadtest.percentile(times, 0.50), 'p95_ms': loadtest.percentile(times, 0.95),
+            'queries': last.n_queries if last else None, 'query_ms': last.query_ms if last else None,
+            'exceptions': [str(e.value)[:200] for e in at.exception]}
+
+
+def _app(db, user):
+    # เปิดหน้าเว็บในนามผู้ใช้ด้วย token ลงชื่อ (แบบเดียวกับหลังเข้าสู่ระบบ)
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file(APP_PATH, default_timeout=600)
+    at.query_params["session"] = token_for(db, user)
+    return at
+
+
+def run_pages(db, sid, teacher, repeat):
+    pages = {}
+    at = _app(db, sid)
+    for i, menu in enumerate(STUDENT_MENUS):
+        at.session_state[loadtest.MENU_STATE_KEY] = menu
+        pages[f"student_{i + 1}"] = dict(time_page(at, repeat), menu=menu)
+    at = _app(db, teacher)
+    pages['teacher_roster'] = time_page(at, repeat)
+    radio = next(r for r in at.radio if TEACHER_MATRIX in r.options)
+    radio.set_value(TEACHER_MATRIX)
+    pages['teacher_matrix'] = time_page(at, repeat)
+    at = _app(db, 'admin')
+    at.run()
+    for name, label in ADMIN_PAGES.items():
+        at.radio(key=bench.ADMIN_SECTION_KEY).set_value(label)
+        pages[name] = time_page(at, repeat)
+    return pages
+
+
+# ==========================================
+# 2. Exam submission (นศ. พร้อมกัน)
+# ==========================================
+def run_submissions(db, exam_id, n_students, timeout, seed):
+    conn = db.reader()
+    sub, sem = conn.execute("SELECT sub_code, semestry FROM exams WHERE exam_id=?", (exam_id,)).fetchone()
+    n_questions = conn.execute("SELECT COUNT(*) FROM exam_questions WHERE exam_id=?", (exam_id,)).fetchone()[0]
+    # มีสิทธิ์สอบ (ลงทะเบียน ยังไม่มีเกรดวิชานี้) และยังไม่เคยส่ง
+    sids = [r[0] for r in conn.execute(
+        "SELECT g.std_id FROM grades g WHERE g.sub_code=? AND g.semestry=? AND g.grade='' "
+        "AND NOT EXISTS (SELECT 1 FROM grades x WHERE x.std_id = g.std_id AND x.sub_code = g.sub_code AND x.grade != '') "
+        "AND NOT EXISTS (SELECT 1 FROM exam_results r WHERE r.exam_id=? AND r.std_id = g.std_id) ORDER BY g.std_id LIMIT ?",
+        (sub, sem, exam_id, n_students))]
+    stats = loadtest.Stats()
+    rnd = random.Random(seed)
+    threads = [threading.Thread(target=loadtest._student_thread, args=(0, sid, exam_id, n_questions, stats, 0, timeout, random.Random(rnd.random())))
+               for sid in sids]
+    t0 = time.perf_counter()
+    for t in threads: t.start()
+    for t in threads: t.join()
+    from submissions import get_submission_queue
+    queue = get_submission_queue(db)
+    while queue.stats()['depth'] > 0: time.sleep(0.05)
+    elapsed = time.perf_counter() - t0
+    saved = conn.execute(f"SELECT COUNT(DISTINCT std_id) FROM exam_results WHERE exam_id=? AND std_id IN ({','.join('?' * len(sids))})",
+                         (exam_id, *sids)).fetchone()[0] if sids else 0
+    result = loadtest.summarise(stats, elapsed, saved)
+    result['students'] = len(sids)
+    result['questions'] = n_questions
+    return result
+
+
+# ==========================================
+# 3. Suite
+# ==========================================
+def _git_rev():
+    try: return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE, capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError): return None
+
+
+def _import_stats(report):
+    return {r['file']: {'records': r['records'], 'seconds': r['seconds'], 'error': r['error']} for r in report}
+
+
+def metrics(result):
+    # ค่าที่ยิ่งน้อยยิ่งดี (ms) สำหรับเทียบระหว่างรุ่น
+    out = {'generate_ms': result['timings']['generate_s'] * 1000, 'import_ms': result['timings']['import_s'] * 1000,
+           'seed_exams_ms': result['timings']['seed_exams_s'] * 1000}
+    for name, page in result['pages'].items():
+        out[f"{name}.cold_ms"] = page['cold_ms']
+        out[f"{name}.p50_ms"] = page['p50_ms']
+        out[f"{name}.p95_ms"] = page['p95_ms']
+    for step, s in result['submit']['steps'].items():
+        out[f"submit.{step}.p50_ms"] = s['p50_ms']
+        out[f"submit.{step}.p95_ms"] = s['p95_ms']
+    return out
+
+
+def run_suite(args, workdir):
+    # app ใช้ DB_NAME แบบ relative -> ทำงานในโฟลเดอร์ชั่วคราวของตัวเอง
+    os.chdir(workdir)
+    loadtest._allow_concurrent_apptests()
+    loadtest._patch_option_menu()
+    from db import get_db
+    db = get_db(loadtest.app_db_name())
+    timings = {}
+    zip_path = os.path.join(workdir, "school.zip")
+    t0 = time.perf_counter()
+    data = make_zip(zip_path, n_students=args.students, n_groups=args.groups, seed=args.seed,
+                    semesters=ZIP_SEMESTERS, n_grades=args.grades)
+    timings['generate_s'] = time.perf_counter() - t0
+    print(f"zip: {data['students']:,} students / {data['grades']:,} grades / {data['groups']} groups | "
+          f"{data['bytes'] / 1e6:.1f} MB in {timings['generate_s']:.1f}s")
+
+    # นำเข้าแบบเดียวกับปุ่มใน tab3 (แทนที่ทั้งหมด)
+    t0 = time.perf_counter()
+    if args.workers > 1: report, summary = importer.import_zip_parallel(db, zip_path, workers=args.workers, mode='staged')
+    else: report, summary = importer.import_zip(db, zip_path, mode='staged')
+    timings['import_s'] = time.perf_counter() - t0
+    print(f"import: {timings['import_s']:.1f}s (swap {summary['swap_s'] * 1000:.1f} ms)")
+
+    t0 = time.perf_counter()
+    data.update(seed_exams(db, n_exams=args.exams, n_questions=args.questions, seed=args.seed))
+    timings['seed_exams_s'] = time.perf_counter() - t0
+    print(f"exams: {data['exams']} exams / {data['questions']:,} questions / {data['results']:,} results")
+
+    conn = db.reader()
+    exam_id, sub = conn.execute("SELECT exam_id, sub_code FROM exams ORDER BY exam_id LIMIT 1").fetchone()
+    # นศ. ที่มีข้อสอบค้าง (หน้าแบบทดสอบไม่ว่าง) / ครูของกลุ่มที่ใหญ่ที่สุด
+    sid = conn.execute("SELECT std_id FROM grades WHERE sub_code=? AND grade='' ORDER BY std_id LIMIT 1", (sub,)).fetchone()[0]
+    teacher = conn.execute("SELECT grp_code FROM students GROUP BY grp_code ORDER BY COUNT(*) DESC, grp_code LIMIT 1").fetchone()[0]
+    perf.clear()
+    pages = run_pages(db, sid, teacher, args.repeat)
+    submit = run_submissions(db, exam_id, args.submitters, args.timeout, args.seed)
+    result = {
+        'suite': SUITE_VERSION,
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'git': _git_rev(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'config': {k: v for k, v in vars(args).items() if k not in ('json', 'zip_only', 'compare', 'tolerance')},
+        'data': data,
+        'timings': timings,
+        'import': _import_stats(report),
+        'pages': pages,
+        'submit': submit,
+    }
+    result['metrics'] = metrics(result)
+    db.close()
+    return result
+
+
+def print_report(r):
+    print(f"{'page':18s} {'cold':>9s} {'p50':>9s} {'p95':>9s} {'queries':>8s}")
+    for name, p in r['pages'].items():
+        print(f"  {name:16s} {p['cold_ms']:9.1f} {p['p50_ms']:9.1f} {p['p95_ms']:9.1f} {p['queries'] if p['queries'] is not None else '-':>8}"
+              + (f"  ! {p['exceptions'][0]}" if p['exceptions'] else ''))
+    s = r['submit']
+    print(f"submit: {s['students']} students x {s['questions']} questions | {s['submissions_per_s']:.2f}/s | "
+          f"saved {s['saved_rows']}/{s['submitted']} | lock errors {s['lock_errors']} | exceptions {s['exceptions']}")
+    for step, st in s['steps'].items():
+        print(f"  {step:10s} n={st['n']:5d} | p50 {st['p50_ms']:8.1f} | p95 {st['p95_ms']:8.1f} ms")
+    for e in s['exception_samples']: print("  !", e)
+
+
+def failed(r):
+    return (any(p['exceptions'] for p in r['pages'].values()) or r['submit']['exceptions'] or r['submit']['lock_errors']
+            or r['submit']['saved_rows'] < r['submit']['submitted'] or any(f['error'] for f in r['import'].values()))
+
+
+# ==========================================
+# 4. Compare two result files
+# ==========================================
+def compare(old, new, tolerance):
+    regressions = []
+    print(f"old: {old.get('git')} ({old.get('created')}) | new: {new.get('git')} ({new.get('created')})")
+    if old.get('config') != new.get('config'): print("! config differs:", old.get('config'), "->", new.get('config'))
+    for key in sorted(set(old['metrics']) & set(new['metrics'])):
+        a, b = old['metrics'][key], new['metrics'][key]
+        change = (b - a) / a if a else 0.0
+        bad = b > a * (1 + tolerance) and b - a > MIN_REGRESSION_MS
+        if bad: regressions.append(key)
+        print(f"  {'REGRESSION' if bad else '':10s} {key:32s} {a:10.1f} -> {b:10.1f} ms ({change:+.0%})")
+    print(f"{len(regressions)} regression(s) over {tolerance:.0%}")
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="End-to-end benchmark suite (synthetic school, Streamlit AppTest)")
+    ap.add_argument("--students", type=int, default=20000)
+    ap.add_argument("--grades", type=int, default=600000, help="จำนวนแถวเกรดทั้งหมด (กระจายใน 3 เทอม)")
+    ap.add_argument("--groups", type=int, default=300)
+    ap.add_argument("--exams", type=int, default=40)
+    ap.add_argument("--questions", type=int, default=30)
+    ap.add_argument("--submitters", type=int, default=50, help="นศ. ที่ส่งข้อสอบพร้อมกัน")
+    ap.add_argument("--repeat", type=int, default=5, help="rerun ต่อหน้า (หลัง rerun แรก)")
+    ap.add_argument("--workers", type=int, default=importer.IMPORT_WORKERS, help="process ตอนนำเข้า (1 = ไม่ขนาน)")
+    ap.add_argument("--timeout", type=float, default=300)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--json", help="บันทึกผลเป็นไฟล์ JSON")
+    ap.add_argument("--zip-only", metavar="PATH", help="สร้างเฉพาะ ZIP สังเคราะห์แล้วจบ")
+    ap.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="เทียบไฟล์ผลสองไฟล์")
+    ap.add_argument("--tolerance", type=float, default=0.2, help="ช้าลงเกินสัดส่วนนี้ = regression (ใช้กับ --compare)")
+    args = ap.parse_args(argv)
+    if args.compare:
+        with open(args.compare[0], encoding='utf-8') as f: old = json.load(f)
+        with open(args.compare[1], encoding='utf-8') as f: new = json.load(f)
+        return compare(old, new, args.tolerance)
+    if args.zip_only:
+        n = make_zip(args.zip_only, n_students=args.students, n_groups=args.groups, seed=args.seed,
+                     semesters=ZIP_SEMESTERS, n_grades=args.grades)
+        print(f"{args.zip_only}: {n['students']:,} students / {n['grades']:,} grades / {n['groups']} groups / "
+              f"{n['activities']:,} activities | {n['bytes'] / 1e6:.1f} MB")
+        return 0
+    json_path = os.path.abspath(args.json) if args.json else None
+    with tempfile.TemporaryDirectory() as tmp:
+        r = run_suite(args, tmp)
+        os.chdir(HERE)
+    print_report(r)
+    if json_path:
+        with open(json_path, 'w', encoding='utf-8') as f: json.dump(r, f, ensure_ascii=False, indent=2)
+    return 1 if failed(r) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
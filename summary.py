@@ -0,0 +1,100 @@
+# ==========================================
+# Materialised summary tables (สถิติการเข้าสอบสด)
+# ==========================================
+# att_summary  : (เทอม, กลุ่ม, ระดับ) -> ลงทะเบียน / เข้าสอบ   ใช้แสดง tab6 (อ่านหลักร้อยแถว แทน JOIN หลักแสนแถว)
+# exam_summary : ข้อสอบ -> จำนวน นศ. ที่ส่งแล้ว
+# - คิวบันทึกผลสอบเรียก apply_submissions() ใน transaction เดียวกับที่เขียนผล -> ตัวเลขตรงกับผลที่ commit เสมอ
+# - นำเข้าข้อมูล / ลบชุดข้อสอบ -> rebuild_summaries() คำนวณใหม่ทั้งตาราง
+# - check_summaries() เทียบกับการคำนวณใหม่ทั้งหมด (ใช้ตรวจความถูกต้อง)
+# ค่า NULL ของ กลุ่ม/ระดับ เก็บเป็น '' เพื่อให้เป็น primary key ได้
+from db import register_schema
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS att_summary (term TEXT, grp_code TEXT, level_id TEXT, registered INTEGER, attended INTEGER, '
+    'PRIMARY KEY (term, grp_code, level_id))',
+    'CREATE TABLE IF NOT EXISTS exam_summary (exam_id INTEGER PRIMARY KEY, submissions INTEGER)',
+]
+
+# นิยามเดียวกับรายงาน: ลงทะเบียน = มีรายวิชาในเทอม (ระดับต่ำสุดที่ลง), เข้าสอบ = มีผลสอบของข้อสอบในเทอมนั้น
+ATTENDANCE_ALL_SQL = """
+    WITH reg AS (
+        SELECT semestry AS term, std_id, coalesce(MIN(level_id), '') AS level_id FROM grades GROUP BY semestry, std_id
+    ), att AS (
+        SELECT DISTINCT e.semestry AS term, r.std_id FROM exam_results r JOIN exams e ON e.exam_id = r.exam_id
+    )
+    SELECT reg.term, coalesce(s.grp_code, '') AS grp_code, reg.level_id, COUNT(*) AS registered, COUNT(att.std_id) AS attended
+    FROM reg
+    JOIN students s ON s.std_id = reg.std_id
+    LEFT JOIN att ON att.term = reg.term AND att.std_id = reg.std_id
+    WHERE reg.term IS NOT NULL
+    GROUP BY reg.term, coalesce(s.grp_code, ''), reg.level_id
+"""
+
+EXAM_SUBMISSIONS_SQL = "SELECT exam_id, COUNT(DISTINCT std_id) AS submissions FROM exam_results GROUP BY exam_id"
+
+# ผลในคิวที่ยังไม่มีในตาราง (ก่อน DELETE/INSERT ของ batch) = คนที่ส่งครั้งแรก
+_NEW_EXAM_SQL = """
+    INSERT INTO exam_summary (exam_id, submissions)
+    SELECT b.exam_id, COUNT(*) FROM temp.sub_batch b
+    WHERE NOT EXISTS (SELECT 1 FROM exam_results r WHERE r.exam_id = b.exam_id AND r.std_id = b.std_id)
+    GROUP BY b.exam_id
+    ON CONFLICT(exam_id) DO UPDATE SET submissions = submissions + excluded.submissions
+"""
+
+# คนที่ยังไม่เคยมีผลสอบของเทอมนั้นเลย -> เข้าสอบ +1 ที่ (เทอม, กลุ่ม, ระดับ) ของเขา (เฉพาะคนที่ลงทะเบียนเทอมนั้น)
+_NEW_ATTENDANCE_SQL = """
+    INSERT INTO att_summary (term, grp_code, level_id, registered, attended)
+    SELECT term, grp_code, level_id, 0, COUNT(*) FROM (
+        SELECT n.term, coalesce(s.grp_code, '') AS grp_code,
+               (SELECT coalesce(MIN(g.level_id), '') FROM grades g WHERE g.std_id = n.std_id AND g.semestry = n.term GROUP BY g.std_id) AS level_id
+        FROM (SELECT DISTINCT e.semestry AS term, b.std_id FROM temp.sub_batch b JOIN exams e ON e.exam_id = b.exam_id
+              WHERE e.semestry IS NOT NULL AND NOT EXISTS (
+                  SELECT 1 FROM exam_results r JOIN exams e2 ON e2.exam_id = r.exam_id
+                  WHERE r.std_id = b.std_id AND e2.semestry = e.semestry)) n
+        JOIN students s ON s.std_id = n.std_id
+    ) WHERE level_id IS NOT NULL
+    GROUP BY term, grp_code, level_id
+    ON CONFLICT(term, grp_code, level_id) DO UPDATE SET attended = attended + excluded.attended
+"""
+
+
+def rebuild_summaries(conn):
+    conn.execute("DELETE FROM att_summary")
+    conn.execute(f"INSERT INTO att_summary (term, grp_code, level_id, registered, attended) {ATTENDANCE_ALL_SQL}")
+    conn.execute("DELETE FROM exam_summary")
+    conn.execute(f"INSERT INTO exam_summary (exam_id, submissions) {EXAM_SUBMISSIONS_SQL}")
+
+
+def _migrate(conn):
+    # DB ที่มีข้อมูลอยู่แล้วแต่ยังไม่มีตารางสรุป -> สร้างครั้งแรก
+    if (not conn.execute("SELECT 1 FROM att_summary LIMIT 1").fetchone() and not conn.execute("SELECT 1 FROM exam_summary LIMIT 1").fetchone()
+            and (conn.execute("SELECT 1 FROM grades LIMIT 1").fetchone() or conn.execute("SELECT 1 FROM exam_results LIMIT 1").fetchone())):
+        rebuild_summaries(conn)
+
+
+register_schema(SCHEMA, _migrate)
+
+
+def apply_submissions(conn, pairs):
+    # pairs: [(exam_id, std_id)] ไม่ซ้ำกัน ต้องเรียก "ก่อน" ลบ/เขียน exam_results ของ batch ใน transaction เดียวกัน
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS sub_batch (exam_id INTEGER, std_id TEXT)")
+    conn.execute("DELETE FROM temp.sub_batch")
+    conn.executemany("INSERT INTO temp.sub_batch VALUES (?, ?)", pairs)
+    conn.execute(_NEW_ATTENDANCE_SQL)
+    conn.execute(_NEW_EXAM_SQL)
+
+
+def check_summaries(conn):
+    # -> [(ตาราง, key, ค่าที่เก็บไว้, ค่าที่ถูกต้อง)] ว่าง = ตรงกันทั้งหมด
+    diffs = []
+    for table, key_cols, val_cols, sql in (
+            ('att_summary', ('term', 'grp_code', 'level_id'), ('registered', 'attended'), ATTENDANCE_ALL_SQL),
+            ('exam_summary', ('exam_id',), ('submissions',), EXAM_SUBMISSIONS_SQL)):
+        n = len(key_cols)
+        stored = {r[:n]: r[n:] for r in conn.execute(f"SELECT {', '.join(key_cols + val_cols)} FROM {table}")}
+        expected = {r[:n]: r[n:] for r in conn.execute(sql)}
+        zero = (0,) * len(val_cols)
+        for key in sorted(set(stored) | set(expected), key=str):
+            have, want = stored.get(key, zero), expected.get(key, zero)
+            if have != want: diffs.append((table, key, have, want))
+    return diffs
@@ -0,0 +1,293 @@
+# ==========================================
+# Synthetic school data (bench / loadtest / tests)
+# ==========================================
+# seed_synthetic: โรงเรียนสมมติขนาดเท่าของจริง เขียนลง DB ตรง ๆ (เร็ว) / make_zip: ZIP ของ DBF ให้ผ่าน importer แบบเดียวกับ tab3
+# seed_exams: ข้อสอบ/คำถาม/ผลสอบ (ตารางของ app ไม่ได้มาจาก ZIP)
+# fake_spreadsheet: Google Sheets ในหน่วยความจำ (gspread ตัวจริงบน HTTP client ปลอม)
+import datetime
+import os
+import random
+import re
+import struct
+import time
+import zipfile
+from collections import Counter, deque
+
+from gspread.exceptions import APIError
+from gspread.http_client import HTTPClient
+from gspread.spreadsheet import Spreadsheet
+
+import importer
+from db import DERIVED, derive_columns
+from summary import rebuild_summaries
+
+LEVELS = ['1', '2', '3']
+
+
+def seed_synthetic(db, n_students=20000, grades_per_student=25, n_groups=300, n_exams=40, seed=42):
+    rnd = random.Random(seed)
+    groups = [f"G{g:04d}" for g in range(n_groups)]
+    sems = ['2/2566', '1/2567', '2/2567']
+    subs = [f"ทช{lvl}{n:04d}" for lvl in LEVELS for n in range(1, 41)]
+    students, grades = [], []
+    for i in range(n_students):
+        lvl = rnd.choice(LEVELS)
+        sid = f"671{lvl}{i:06d}"
+        grp = rnd.choice(groups)
+        students.append((sid, 'นาย', f"ชื่อ{i}", f"สกุล{i}", grp, '', '', importer.level_from_id(sid)))
+        for _ in range(grades_per_student):
+            grades.append((sid, rnd.choice(subs), rnd.choice(sems), rnd.choice(['', '1', '2', '3', '4']), grp))
+    with db.writer() as w:
+        w.executemany("INSERT OR REPLACE INTO students VALUES (?,?,?,?,?,?,?,?)", students)
+        w.executemany(importer.INSERT_SQL['grades'], grades)
+        w.executemany("INSERT OR REPLACE INTO groups VALUES (?,?)", [(g, f"ครู {g}") for g in groups])
+        w.executemany("INSERT OR IGNORE INTO users VALUES (?,?,?,?,?)", [(g, g, 'teacher', f"ครู {g}", g) for g in groups])
+        w.executemany(importer.INSERT_SQL['subjects'], [(s, f"วิชา {s}") for s in subs])
+        w.executemany(importer.INSERT_SQL['schedule'], [(s, sem, '1 มี.ค.', '9.00', '12.00') for s in subs for sem in sems])
+        for t in DERIVED: derive_columns(w, t)
+        w.executemany("INSERT INTO exams (exam_name, sub_code, semestry, is_active) VALUES (?,?,?,1)",
+                      [(f"สอบ {s}", s, sems[-1]) for s in subs[:n_exams]])
+        w.executemany("INSERT INTO exam_questions (exam_id, question_text, choice_a, choice_b, choice_c, choice_d, correct_answer) VALUES (?,?,?,?,?,?,?)",
+                      [(e, f"ข้อ {q}", 'ก', 'ข', 'ค', 'ง', 'A') for e in range(1, n_exams + 1) for q in range(20)])
+        if n_exams:
+            w.executemany("INSERT INTO exam_results (exam_id, std_id, score, total_score, timestamp) VALUES (?,?,?,?,?)",
+                          [(rnd.randint(1, n_exams), s[0], rnd.randint(0, 20), 20, '2025-03-01 10:00') for s in students[::2]])
+        rebuild_summaries(w)
+        w.execute("ANALYZE")
+    return {'students': len(students), 'grades': len(grades)}
+
+
+THAI_FIRST = ['สมชาย', 'สมหญิง', 'วิชัย', 'ปรีชา', 'สุดารัตน์', 'กาญจนา', 'ณัฐพล', 'ธนพร', 'อรุณี', 'ประเสริฐ',
+              'จันทร์เพ็ญ', 'สุรเชษฐ์', 'พิมพ์ชนก', 'ศักดิ์ชัย', 'นภาพร', 'อนุชา', 'ชุติมา', 'ธีรวัฒน์', 'วรรณา', 'เกียรติศักดิ์']
+THAI_LAST = ['ใจดี', 'ศรีสุข', 'แก้วมณี', 'ทองคำ', 'บุญมา', 'สุขสวัสดิ์', 'พรหมมา', 'วงศ์ใหญ่', 'จันทร์หอม', 'มีสุข',
+             'ศรีวงศ์', 'ทองดี', 'คำแสน', 'สายบุญ', 'อินทร์แก้ว', 'ปัญญาดี', 'รัตนพันธ์', 'เพชรรัตน์', 'ชัยมงคล', 'บุญเรือง']
+
+
+def thai_names(db, seed=9):
+    # ชื่อไทยสุ่ม (ใช้ทดสอบการค้นหา) -> UPDATE ผ่าน trigger ของ index ค้นหา
+    rnd = random.Random(seed)
+    sids = [r[0] for r in db.reader().execute("SELECT std_id FROM students")]
+    with db.writer() as w:
+        w.executemany("UPDATE students SET name=?, surname=? WHERE std_id=?",
+                      [(rnd.choice(THAI_FIRST), rnd.choice(THAI_LAST), sid) for sid in sids])
+
+
+def write_dbf(fileobj, fields, rows, encoding='cp874'):
+    # fields: [(NAME, type, length, decimals)] -> DBF III แบบง่าย (C/N) ตามที่ importer อ่าน
+    header_len = 32 + 32 * len(fields) + 1
+    record_len = 1 + sum(f[2] for f in fields)
+    d = datetime.date.today()
+    fileobj.write(struct.pack('<BBBBIHH20x', 3, d.year - 1900, d.month, d.day, len(rows), header_len, record_len))
+    for name, ftype, length, dec in fields:
+        fileobj.write(struct.pack('<11sc4xBB14x', name.encode('ascii'), ftype.encode('ascii'), length, dec))
+    fileobj.write(b'\r')
+    for row in rows:
+        rec = [b' ']
+        for (name, ftype, length, dec), v in zip(fields, row):
+            raw = str(v).encode(encoding)[:length]
+            rec.append(raw.rjust(length) if ftype == 'N' else raw.ljust(length))
+        fileobj.write(b''.join(rec))
+    fileobj.write(b'\x1a')
+
+
+# รายวิชา/กิจกรรม/วันสอบสำหรับ ZIP สังเคราะห์ (ให้หน้าตาเหมือนไฟล์จริงของ สกร.)
+SUBJECT_PREFIXES = [('ทร', 'ทักษะการเรียนรู้'), ('พท', 'ภาษาไทย'), ('พค', 'คณิตศาสตร์'), ('พว', 'วิทยาศาสตร์'), ('สค', 'สังคมศึกษา'),
+                    ('อช', 'อาชีพ'), ('ทช', 'ทักษะชีวิต'), ('พต', 'ภาษาอังกฤษ')]
+ACTIVITIES = ['ปลูกป่าชายเลน', 'จิตอาสาพัฒนาวัด', 'บริจาคโลหิต', 'อบรมลูกเสือ', 'ทำความสะอาดชุมชน', 'ค่ายคุณธรรม']
+EXAM_DAYS = ['1 มี.ค. 2568', '2 มี.ค. 2568', '8 มี.ค. 2568', '9 มี.ค. 2568']
+ZIP_SEMESTERS = ('2/2566', '1/2567', '2/2567')
+
+
+def make_zip(path, n_students=20000, grades_per_student=25, n_groups=300, seed=42, semesters=('2/2567',), n_grades=None):
+    # ZIP ของไฟล์ DBF (cp874) ชื่อ/คอลัมน์ตามที่ importer (tab3) แยกประเภท: student / grade / group / subject / schedule / activity
+    # n_grades = จำนวนแถวเกรดทั้งหมด (แทน grades_per_student) กระจายตามเทอม; เทอมล่าสุดส่วนใหญ่ยังไม่มีเกรด (กำลังเรียน)
+    rnd = random.Random(seed)
+    groups = [f"G{g:04d}" for g in range(n_groups)]
+    subs = {lvl: [f"{p}{lvl}{n:04d}" for p, _ in SUBJECT_PREFIXES for n in range(1, 6)] for lvl in LEVELS}
+    sub_names = [(f"{p}{lvl}{n:04d}", f"{name} {n} ระดับ {lvl}") for p, name in SUBJECT_PREFIXES for lvl in LEVELS for n in range(1, 6)]
+    students = []
+    for i in range(n_students):
+        lvl = rnd.choice(LEVELS)
+        students.append((f"671{lvl}{i:06d}", rnd.choice(['นาย', 'นางสาว', 'นาง']), rnd.choice(THAI_FIRST), f"{rnd.choice(THAI_LAST)}{i}",
+                         rnd.choice(groups), f"08{rnd.randrange(10 ** 8):08d}", f"{rnd.randrange(10 ** 12, 10 ** 13)}"))
+    if n_grades is not None: grades_per_student, extra = divmod(n_grades, max(1, n_students))
+    else: extra = 0
+    grades = []
+    for i, s in enumerate(students):
+        pool = subs[s[0][3]]
+        k = min(grades_per_student + (i < extra), len(pool) * len(semesters))
+        taken = rnd.sample([(sub, sem) for sem in semesters for sub in pool], k)
+        for sub, sem in taken:
+            current = sem == semesters[-1]
+            grade = '' if current and rnd.random() < 0.8 else rnd.choice(['0', '1', '1.5', '2', '2.5', '3', '3.5', '4'])
+            grades.append((s[0], sub, sem, grade, s[4]))
+    files = {
+        'student.dbf': ([('STD_CODE', 'C', 13, 0), ('PRENAME', 'C', 20, 0), ('NAME', 'C', 40, 0), ('SURNAME', 'C', 40, 0),
+                         ('GRP_CODE', 'C', 8, 0), ('PHONE', 'C', 10, 0), ('CARDID', 'C', 13, 0)], students),
+        'grade.dbf': ([('STD_CODE', 'C', 13, 0), ('SUB_CODE', 'C', 10, 0), ('SEMESTRY', 'C', 6, 0), ('GRADE', 'C', 3, 0), ('GRP_CODE', 'C', 8, 0)], grades),
+        'group.dbf': ([('GRP_CODE', 'C', 8, 0), ('TEACHER_NAME', 'C', 60, 0)], [(g, f"ครู{rnd.choice(THAI_FIRST)} {rnd.choice(THAI_LAST)}") for g in groups]),
+        'subject.dbf': ([('SUB_CODE', 'C', 10, 0), ('SUB_NAME', 'C', 80, 0)], sub_names),
+        'schedule.dbf': ([('SUB_CODE', 'C', 10, 0), ('SEMESTRY', 'C', 6, 0), ('EXAM_DAY', 'C', 20, 0), ('EXAM_START', 'N', 5, 2), ('EXAM_END', 'N', 5, 2)],
+                         [(sub, sem, rnd.choice(EXAM_DAYS), start, start + 3) for sem in semesters for sub, _ in sub_names
+                          for start in [rnd.choice([9.0, 13.0])]]),
+        'activity.dbf': ([('STD_CODE', 'C', 13, 0), ('SEMESTRY', 'C', 6, 0), ('ACT_NAME', 'C', 60, 0), ('HOUR', 'N', 6, 1)],
+                         [(s[0], sem, rnd.choice(ACTIVITIES), float(rnd.choice([3, 6, 12]))) for sem in semesters for s in students[::3]]),
+    }
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as z:
+        for name, (fields, rows) in files.items():
+            with z.open(name, 'w') as f: write_dbf(f, fields, rows)
+    return {'students': len(students), 'grades': len(grades), 'groups': len(groups), 'subjects': len(sub_names),
+            'activities': len(files['activity.dbf'][1]), 'bytes': os.path.getsize(path)}
+
+
+def seed_exams(db, n_exams=40, n_questions=30, results_ratio=0.5, seed=42):
+    # ข้อสอบ (ตาราง app ไม่ได้มาจาก ZIP): วิชาเทอมล่าสุดที่มีคนลงทะเบียนมากสุด เปิดสอบ + คำถาม 4 ตัวเลือก
+    # + ผลสอบของ นศ. ที่ยังไม่มีเกรดวิชานั้น results_ratio ของผู้มีสิทธิ์
+    rnd = random.Random(seed)
+    conn = db.reader()
+    sem = conn.execute("SELECT MAX(semestry) FROM grades").fetchone()[0]
+    subs = [r[0] for r in conn.execute("SELECT sub_code FROM grades WHERE semestry=? GROUP BY sub_code ORDER BY COUNT(*) DESC, sub_code LIMIT ?",
+                                       (sem, n_exams))]
+    n = {'exams': 0, 'questions': 0, 'results': 0}
+    with db.writer(bump=('exams', 'results')) as w:
+        for sub in subs:
+            exam_id = w.execute("INSERT INTO exams (exam_name, sub_code, semestry, is_active) VALUES (?, ?, ?, 1)",
+                                (f"สอบปลายภาค {sub}", sub, sem)).lastrowid
+            w.executemany("INSERT INTO exam_questions (exam_id, question_text, choice_a, choice_b, choice_c, choice_d, correct_answer) VALUES (?,?,?,?,?,?,?)",
+                          [(exam_id, f"{sub} ข้อ {q + 1}", f"ก {q}", f"ข {q}", f"ค {q}", f"ง {q}", rnd.choice('ABCD')) for q in range(n_questions)])
+            eligible = [r[0] for r in w.execute("SELECT std_id FROM grades WHERE sub_code=? AND semestry=? AND grade=''", (sub, sem))]
+            w.executemany("INSERT INTO exam_results (exam_id, std_id, score, total_score, timestamp) VALUES (?,?,?,?,?)",
+                          [(exam_id, sid, rnd.randint(0, n_questions), n_questions, f"2025-03-0{rnd.randint(1, 9)} {rnd.randint(9, 15)}:{rnd.randint(0, 59):02d}")
+                           for sid in eligible if rnd.random() < results_ratio])
+            n['exams'] += 1
+            n['questions'] += n_questions
+        n['results'] = w.execute("SELECT COUNT(*) FROM exam_results").fetchone()[0]
+        rebuild_summaries(w)
+    return n
+
+
+# ==========================================
+# Fake Google Sheets
+# ==========================================
+class _FakeResponse:
+    def __init__(self, code, message):
+        self.status_code, self.text = code, message
+
+    def json(self):
+        return {'error': {'code': self.status_code, 'message': self.text, 'status': 'RESOURCE_EXHAUSTED'}}
+
+
+# subclass ของ HTTPClient (Worksheet ตรวจชนิด) แต่ไม่เรียก API จริง -> ใช้ gspread.Spreadsheet / Worksheet ตัวจริงได้โดยไม่ต่อเน็ต
+# นับ request ทุกชนิด + หน่วงเวลาต่อ request เหมือนเรียก API จริง
+class FakeSheetsClient(HTTPClient):
+    def __init__(self, sheets, latency=0.0, drive=True, write_quota=None):
+        self.sheets = {name: [list(r) for r in rows] for name, rows in sheets.items()}
+        self.latency = latency
+        self.drive = drive              # False = ไม่มีสิทธิ์ Drive (get_lastUpdateTime ใช้ไม่ได้)
+        self.write_quota = write_quota  # (จำนวน request เขียน, ต่อกี่วินาที) เกิน -> APIError 429 แบบ API จริง
+        self._writes = deque()
+        self.down = False               # True = เน็ตหลุด ทุก request ล้มเหลว
+        self.modified = 0
+        self.calls = Counter()
+
+    def _call(self, kind):
+        self.calls[kind] += 1
+        if self.latency: time.sleep(self.latency)
+        if self.down: raise ConnectionError("Sheets unavailable")
+
+    def _title(self, range_name):
+        return range_name.split('!')[0].strip("'")
+
+    def edit(self, name, row, col, value):
+        # แก้ค่าในช่องเดิมจากภายนอก (ขนาดชีตไม่เปลี่ยน)
+        self.sheets[name][row][col] = value
+        self.modified += 1
+
+    def fetch_sheet_metadata(self, id, params=None):
+        self._call('metadata')
+        return {'properties': {'title': 'SchoolData'}, 'sheets': [
+            {'properties': {'title': name, 'sheetId': i, 'index': i,
+                            'gridProperties': {'rowCount': len(rows), 'columnCount': max(map(len, rows), default=0)}}}
+            for i, (name, rows) in enumerate(self.sheets.items())]}
+
+    def get_file_drive_metadata(self, id):
+        self._call('drive')
+        if not self.drive: raise RuntimeError("insufficient permission")
+        return {'modifiedTime': f"2025-01-01T00:00:{self.modified:06d}Z"}
+
+    def values_get(self, id, range, params=None):
+        self._call('values_get')
+        return {'range': range, 'majorDimension': 'ROWS', 'values': [list(r) for r in self.sheets[self._title(range)]]}
+
+    def values_batch_get(self, id, ranges, params=None):
+        self._call('values_batch_get')
+        return {'valueRanges': [{'range': r, 'values': [list(row) for row in self.sheets[self._title(r)]]} for r in ranges]}
+
+    def _write_range(self, range_name, values):
+        # "'ชีต'!B3" / "'ชีต'!A5:G5" -> เขียนทับตั้งแต่ช่องนั้น (ขยายชีตถ้าจำเป็น)
+        m = re.match(r"'?(.*?)'?!([A-Z]+)(\d+)", range_name)
+        rows = self.sheets[m.group(1)]
+        col = sum((ord(ch) - 64) * 26 ** i for i, ch in enumerate(reversed(m.group(2)))) - 1
+        for r, vals in enumerate(values, start=int(m.group(3)) - 1):
+            while len(rows) <= r: rows.append([])
+            row = rows[r]
+            row.extend([''] * (col + len(vals) - len(row)))
+            row[col:col + len(vals)] = [str(v) for v in vals]
+        self.modified += 1
+
+    def batch_update(self, id, body):
+        self._call('batch_update')
+        replies = []
+        for req in body['requests']:
+            props = dict(req['addSheet']['properties'], sheetId=len(self.sheets))
+            self.sheets[props['title']] = []
+            replies.append({'addSheet': {'properties': props}})
+        self.modified += 1
+        return {'replies': replies}
+
+    def values_update(self, id, range, params=None, body=None):
+        self._call('values_update')
+        self._write_range(range, body['values'])
+        return {'updatedRange': range}
+
+    def values_batch_update(self, id, body=None):
+        self._call('values_batch_update')
+        for item in body['data']: self._write_range(item['range'], item['values'])
+        return {'totalUpdatedRows': len(body['data'])}
+
+    def values_append(self, id, range, params, body):
+        self._call('values_append')
+        if self.write_quota:
+            limit, window = self.write_quota
+            now = time.monotonic()
+            while self._writes and now - self._writes[0] >= window: self._writes.popleft()
+            if len(self._writes) >= limit:
+                self.calls['429'] += 1
+                raise APIError(_FakeResponse(429, "Quota exceeded for quota metric 'Write requests'"))
+            self._writes.append(now)
+        title = self._title(range)
+        start = len(self.sheets[title]) + 1
+        self.sheets[title].extend([str(v) for v in row] for row in body['values'])
+        self.modified += 1
+        end = start + len(body['values']) - 1
+        return {'updates': {'updatedRange': f"'{title}'!A{start}:Z{end}", 'updatedRows': len(body['values'])}}
+
+
+def fake_spreadsheet(sheets, latency=0.0, drive=True, write_quota=None):
+    client = FakeSheetsClient(sheets, latency, drive, write_quota)
+    sh = Spreadsheet(client, {'id': 'fake'})
+    client.calls.clear()
+    return sh, client
+
+
+def fake_sheet_rows(n_rows, seed=5):
+    rnd = random.Random(seed)
+    head = ['std_id', 'name', 'grp_code', 'score', 'total', 'note']
+    return [head] + [[f"671{i:07d}", f"ชื่อ{i}", f"G{rnd.randint(0, 99):04d}", str(rnd.randint(0, 20)), '20', rnd.choice(['', 'ส่งช้า'])]
+                     for i in range(n_rows)]
+
+
+class FakeClock:
+    # เวลาจำลองสำหรับ ttl / max_age
+    def __init__(self): self.now = 0.0
+    def __call__(self): return self.now
@@ -0,0 +1,25 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import Database
+from synthetic import seed_synthetic
+
+
+@pytest.fixture(scope="session")
+def school_db(tmp_path_factory):
+    # โรงเรียนสังเคราะห์ขนาดเล็ก (4k นศ. / 100k เกรด) ใช้ร่วมกันทุก test ที่อ่านอย่างเดียว
+    db = Database(str(tmp_path_factory.mktemp("school") / "school.db"))
+    seed_synthetic(db, n_students=4000, grades_per_student=25, n_groups=60)
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def empty_db(tmp_path):
+    db = Database(str(tmp_path / "empty.db"))
+    yield db
+    db.close()
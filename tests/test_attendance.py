@@ -0,0 +1,57 @@
+# ==========================================
+# Exam attendance statistics (tab6)
+# ==========================================
+import pandas as pd
+import pytest
+
+import attendance
+from db import Database
+from summary import apply_submissions, rebuild_summaries
+from synthetic import seed_synthetic
+
+
+def attendance_reference(conn, term):
+    # นิยามแบบตรงไปตรงมาใน pandas: ลงทะเบียน = มีวิชาในเทอม (ระดับต่ำสุด) / เข้าสอบ = มีผลสอบของข้อสอบเทอมนั้น
+    g = pd.read_sql("SELECT std_id, level_id FROM grades WHERE semestry=?", conn, params=(term,))
+    reg = g.groupby('std_id')['level_id'].min().reset_index()
+    reg = reg.merge(pd.read_sql("SELECT std_id, grp_code FROM students", conn), on='std_id')
+    took = set(pd.read_sql("SELECT r.std_id FROM exam_results r JOIN exams e ON e.exam_id = r.exam_id WHERE e.semestry=?",
+                           conn, params=(term,))['std_id'])
+    reg['att'] = reg['std_id'].isin(took)
+    return {(grp, lvl): (len(part), int(part['att'].sum())) for (grp, lvl), part in reg.groupby(['grp_code', 'level_id'], dropna=False)}
+
+
+@pytest.fixture
+def term_db(tmp_path):
+    db = Database(str(tmp_path / "attendance.db"))
+    seed_synthetic(db, n_students=600, grades_per_student=10, n_groups=12, n_exams=10)
+    # ผลสอบของเทอมก่อน -> ต้องไม่นับในเทอมปัจจุบัน
+    with db.writer(bump='results') as w:
+        old = w.execute("INSERT INTO exams (exam_name, sub_code, semestry, is_active) VALUES ('สอบเทอมก่อน', 'ทช10001', '1/2567', 0)").lastrowid
+        w.execute("INSERT INTO exam_results (exam_id, std_id, score, total_score, timestamp) "
+                  "SELECT ?, std_id, 10, 20, '2024-10-01 10:00' FROM students WHERE rowid % 3 = 0", (old,))
+        rebuild_summaries(w)
+    yield db
+    db.close()
+
+
+@pytest.mark.parametrize('term', ['2/2567', '1/2567'])
+def test_attendance_matches_reference(term_db, term):
+    conn = term_db.reader()
+    stats = attendance.load_attendance(conn, term)
+    got = {(r.grp_code, r.level_id): (r.registered, r.attended) for r in stats.cube.itertuples()}
+    assert got == attendance_reference(conn, term)
+    table = stats.by_group()
+    assert table['รวม-ทั้งหมด'].sum() == stats.registered and table['รวม-เข้าสอบ'].sum() == stats.attended
+
+
+def test_attendance_cached_per_version(term_db):
+    first = attendance.get_attendance(term_db, '2/2567')
+    assert attendance.get_attendance(term_db, '2/2567') is first
+    sid = term_db.reader().execute("SELECT std_id FROM grades WHERE semestry='2/2567' AND std_id NOT IN "
+                                   "(SELECT std_id FROM exam_results) LIMIT 1").fetchone()[0]
+    with term_db.writer(bump='results') as w:
+        apply_submissions(w, [(1, sid)])        # แบบเดียวกับคิวบันทึกผล: ปรับตารางสรุปก่อนเขียนผล
+        w.execute("INSERT INTO exam_results (exam_id, std_id, score, total_score, timestamp) VALUES (1, ?, 5, 20, '2025-03-01 11:00')", (sid,))
+    again = attendance.get_attendance(term_db, '2/2567')
+    assert again is not first and again.attended == first.attended + 1
@@ -0,0 +1,69 @@
+# ==========================================
+# Student exam dashboard (user-011)
+# ==========================================
+# หน้ารายการแบบทดสอบ: 1 query ต่อ rerun และผลต้องตรงกับหน้าเดิม (เกรด -> ข้อสอบที่เปิด -> ประวัติทีละวิชา)
+import sqlite3
+
+import pytest
+
+from db import Database
+from exams import exam_dashboard
+from synthetic import seed_synthetic
+
+DASHBOARD_MAX_QUERIES = 1
+
+
+@pytest.fixture(scope="module")
+def dashboard_db(tmp_path_factory):
+    db = Database(str(tmp_path_factory.mktemp("dashboard") / "dashboard.db"))
+    seed_synthetic(db, n_students=300, grades_per_student=25, n_groups=10)
+    # ทุกวิชามีข้อสอบเปิดอยู่ + บางแถวผลการเรียนเป็น 'nan' / 'None' แบบข้อมูลนำเข้าจริง
+    with db.writer() as w:
+        w.execute("INSERT INTO exams (exam_name, sub_code, semestry, is_active) SELECT 'สอบ ' || sub_code, sub_code, '2/2567', 1 "
+                  "FROM subjects WHERE sub_code NOT IN (SELECT sub_code FROM exams)")
+        w.execute("UPDATE grades SET grade = 'nan' WHERE rowid % 17 = 0")
+        w.execute("UPDATE grades SET grade = 'None' WHERE rowid % 19 = 0")
+    conn = sqlite3.connect(db.path)
+    yield conn
+    conn.close()
+    db.close()
+
+
+def dashboard_reference(conn, sid):
+    grades = conn.execute("SELECT sub_code, grade FROM grades WHERE std_id=?", (sid,)).fetchall()
+    registered = {str(code).strip() for code, _ in grades}
+    passed = {str(code).strip() for code, g in grades
+              if g is not None and str(g).strip() != "" and str(g).strip().lower() not in ("nan", "none")}
+    out = []
+    for exam_id, code in conn.execute("SELECT exam_id, sub_code FROM exams WHERE is_active=1 ORDER BY exam_id").fetchall():
+        code = str(code).strip()
+        if code in registered and code not in passed:
+            last = conn.execute("SELECT score FROM exam_results WHERE exam_id=? AND std_id=? ORDER BY id DESC LIMIT 1",
+                                (exam_id, sid)).fetchone()
+            out.append((exam_id, None if last is None else last[0]))
+    return out
+
+
+def _sids(conn, n=60):
+    return [r[0] for r in conn.execute("SELECT std_id FROM students ORDER BY std_id LIMIT ?", (n,))]
+
+
+def test_single_query_per_render(dashboard_db):
+    statements = []
+    dashboard_db.set_trace_callback(statements.append)
+    try:
+        for sid in _sids(dashboard_db):
+            statements.clear()
+            exam_dashboard(dashboard_db, sid)
+            assert len(statements) <= DASHBOARD_MAX_QUERIES, statements
+    finally:
+        dashboard_db.set_trace_callback(None)
+
+
+def test_matches_reference(dashboard_db):
+    n_exams = 0
+    for sid in _sids(dashboard_db):
+        got = [(r.exam_id, r.score) for r in exam_dashboard(dashboard_db, sid)]
+        assert got == dashboard_reference(dashboard_db, sid), sid
+        n_exams += len(got)
+    assert n_exams > 0
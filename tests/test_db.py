@@ -0,0 +1,112 @@
+# ==========================================
+# Database layer
+# ==========================================
+import math
+import os
+import re
+import subprocess
+import sys
+
+import pytest
+
+import db
+from db import Database, derive_columns, register_schema
+
+
+@pytest.fixture
+def hooks(monkeypatch):
+    monkeypatch.setattr(db, '_schema_hooks', [])
+    return db._schema_hooks
+
+
+def _tables(database):
+    return {r[0] for r in database.reader().execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')")}
+
+
+def test_db_imports_no_feature_module():
+    # db.py เป็นชั้นล่างสุด: import แล้วต้องไม่ดึง module อื่นของระบบเข้ามา
+    code = "import sys, db; print(sorted(m for m in sys.modules if m in {%s}))" % ', '.join(
+        repr(m) for m in ('app', 'importer', 'refdata', 'exams', 'submissions', 'summary', 'search', 'sessions', 'perf', 'replication'))
+    out = subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(os.path.abspath(db.__file__)), capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == '[]'
+
+
+def test_registered_schema_runs_at_open(tmp_path, hooks):
+    seen = []
+    register_schema(['CREATE TABLE IF NOT EXISTS hook_a (x)'], lambda conn: seen.append('a'))
+    register_schema(['CREATE TABLE IF NOT EXISTS hook_b (x)',
+                     'CREATE TRIGGER IF NOT EXISTS hook_b_ai AFTER INSERT ON hook_b BEGIN INSERT INTO hook_a VALUES (new.x); END'],
+                    lambda conn: seen.append('b'))
+    database = Database(str(tmp_path / "a.db"))
+    assert seen == ['a', 'b']
+    assert {'hook_a', 'hook_b', 'hook_b_ai'} <= _tables(database)
+    Database(str(tmp_path / "a.db"))        # เปิดซ้ำ: IF NOT EXISTS / migrate เรียกอีกครั้ง ไม่ error
+    assert seen == ['a', 'b', 'a', 'b']
+
+
+def test_late_registration_applies_to_open_databases(tmp_path, hooks):
+    database = Database(str(tmp_path / "b.db"))
+    register_schema(['CREATE TABLE IF NOT EXISTS late (x)'], lambda conn: conn.execute("INSERT INTO late VALUES (1)"))
+    assert 'late' in _tables(database)
+    assert database.reader().execute("SELECT COUNT(*) FROM late").fetchone()[0] == 1
+
+
+# ==========================================
+# Derived columns (SQL) == ฟังก์ชัน Python เดิมของ app.py
+# ==========================================
+# ต้นแบบ: format_thai_time / get_level_code / get_level_from_id / str.replace('-', '') ก่อนย้ายไปคำนวณตอนนำเข้า
+def format_thai_time(t):
+    if t is None or (isinstance(t, float) and math.isnan(t)) or t == '' or str(t).lower() == 'nan': return ""
+    try:
+        val = float(t)
+        if val >= 24: s = str(int(val)); return f"{s[:2]}.{s[2:]} น." if len(s)==4 else f"0{s[0]}.{s[1:]} น."
+        else: h = int(val); m = int(round((val - h) * 100)); return f"{h:02}.{m:02} น."
+    except: return str(t)
+
+
+def get_level_code(sub_code):
+    if not isinstance(sub_code, str): return 'Unknown'
+    match = re.search(r'\d', sub_code)
+    if match and match.group(0) in ('1', '2', '3'): return match.group(0)
+    return 'Unknown'
+
+
+def get_level_from_id(std_id):
+    sid = re.sub(r'[^0-9]', '', str(std_id).strip().replace('.0', ''))
+    return {'1': 'ประถมศึกษา', '2': 'มัธยมศึกษาตอนต้น', '3': 'มัธยมศึกษาตอนปลาย'}.get(sid[3:4], "ไม่ระบุ")
+
+
+@pytest.mark.parametrize('start, end', [
+    ('9.0', '12.0'), ('9.3', '11.45'), ('13.30', '16.3'),
+    ('0', '0.0'), ('12', '12.00'), ('0.3', '23.59'),              # เที่ยงคืน / เที่ยงวัน
+    ('930', '1330'), ('24', '2400'), ('800', '1200.0'),           # เขียนแบบ HHMM
+    ('', None), ('nan', 'NaN'), (' 9.3 ', '  '),                  # ว่าง
+    ('9:30', 'ไม่ระบุ'), ('9.3.0', '.'), ('abc', '12 น.'),         # รูปแบบผิด -> ข้อความเดิม
+])
+def test_exam_time_matches_format_thai_time(empty_db, start, end):
+    with empty_db.writer() as w:
+        w.execute("INSERT INTO schedule (sub_code, semestry, exam_start, exam_end) VALUES ('ทช11001', '2/2567', ?, ?)", (start, end))
+        derive_columns(w, 'schedule')
+    got = empty_db.reader().execute("SELECT exam_time FROM schedule").fetchone()[0]
+    # ค่าที่มีช่องว่างหัวท้าย: importer ตัดช่องว่างก่อนเก็บเสมอ -> เทียบกับค่าหลังตัด
+    clean = lambda v: v.strip() if isinstance(v, str) else v
+    assert got == f"{format_thai_time(clean(start))}-{format_thai_time(clean(end))}"
+
+
+@pytest.mark.parametrize('sub_code', ['ทช11001', 'ทร21001', 'พต-31001', 'สค-3-2001', 'ทช41001', 'ABC', '', '0-1001', None])
+def test_sub_key_and_level_match_old_helpers(empty_db, sub_code):
+    with empty_db.writer() as w:
+        w.execute("INSERT INTO grades (std_id, sub_code, semestry, grade) VALUES ('6711000001', ?, '2/2567', '')", (sub_code,))
+        derive_columns(w, 'grades')
+    sub_key, level_id = empty_db.reader().execute("SELECT sub_key, level_id FROM grades").fetchone()
+    assert sub_key == (sub_code or '').replace('-', '')
+    assert level_id == get_level_code(sub_code)
+
+
+@pytest.mark.parametrize('std_id', ['6711000001', '6722000002', '6733000003', '6740000004', '671', '', 'ABCD'])
+def test_student_level_matches_get_level_from_id(empty_db, std_id):
+    # ข้อมูลเก่าที่ level ว่าง -> เติมจากรหัสนักศึกษา
+    with empty_db.writer() as w:
+        w.execute("INSERT INTO students (std_id, name, level) VALUES (?, 'x', '')", (std_id,))
+        derive_columns(w, 'students')
+    assert empty_db.reader().execute("SELECT level FROM students").fetchone()[0] == get_level_from_id(std_id)
@@ -0,0 +1,91 @@
+# ==========================================
+# Compiled exam question sets
+# ==========================================
+import pytest
+
+from exams import CompiledExam, exam_version, get_exam
+
+COLS = "exam_id, question_text, choice_a, choice_b, choice_c, choice_d, correct_answer"
+
+
+def grade_rows(rows, answers):
+    # ต้นแบบ: ตรวจทีละแถวแบบหน้าสอบเดิม (answers: id -> ข้อความตัวเลือกที่ radio คืนมา, ไม่มี = ยังไม่ตอบ)
+    score = 0
+    for r in rows:
+        user_ans = answers.get(r[0])
+        correct_val = ""
+        if r[6] == 'A': correct_val = r[2]
+        elif r[6] == 'B': correct_val = r[3]
+        elif r[6] == 'C': correct_val = r[4]
+        elif r[6] == 'D': correct_val = r[5]
+        if str(user_ans).strip() == str(correct_val).strip(): score += 1
+    return score
+
+
+def _seed(db, questions):
+    with db.writer() as w:
+        exam_id = w.execute("INSERT INTO exams (exam_name, sub_code, semestry, is_active) VALUES ('t', 'ทช11001', '2/2567', 1)").lastrowid
+        w.executemany(f"INSERT INTO exam_questions ({COLS}) VALUES (?,?,?,?,?,?,?)", [(exam_id,) + q for q in questions])
+    rows = db.reader().execute("SELECT id, question_text, choice_a, choice_b, choice_c, choice_d, correct_answer "
+                               "FROM exam_questions WHERE exam_id=? ORDER BY id", (exam_id,)).fetchall()
+    return exam_id, rows
+
+
+def _both(exam, rows, picks):
+    # picks: index ตัวเลือกต่อข้อ (None = ไม่ตอบ) -> (คะแนนแบบเดิม, คะแนนแบบคอมไพล์)
+    text = {q_id: opts[i] for (_, q_id, _, opts), i in zip(exam.questions(), picks) if i is not None}
+    return grade_rows(rows, text), exam.grade(picks)[0]
+
+
+QUESTIONS = [
+    ('1+1', '1', '2', '3', '4', 'B'),
+    ('ช่องว่าง', ' ก ', 'ข', 'ค ', '', 'C'),            # ช่องว่างหัวท้าย / ช้อยส์ว่าง
+    ('ตัวพิมพ์เล็ก', 'x', 'y', 'z', 'w', 'a'),          # เฉลยตัวพิมพ์เล็ก: ระบบเดิมไม่นับว่าถูก
+    ('เฉลยมีช่องว่าง', 'x', 'y', 'z', 'w', ' A'),
+    ('ช้อยส์ซ้ำ', 'เหมือน', 'เหมือน ', 'ต่าง', 'อื่น', 'B'),   # ข้อความเดียวกันหลังตัดช่องว่าง -> ถูกทั้งคู่
+    ('เฉลยชี้ช้อยส์ว่าง', 'x', 'y', 'z', '', 'D'),
+    ('ไม่มีเฉลย', 'x', 'y', 'z', 'w', None),
+]
+
+
+@pytest.mark.parametrize('picks', [
+    [1, 2, 0, 0, 0, 0, 0],                  # ถูกทุกข้อที่ถูกได้
+    [0, 0, 1, 1, 1, 1, 1],
+    [None] * 7,                             # ยังไม่ตอบเลย
+    [1, None, None, 0, None, 2, None],      # ตอบบางข้อ
+    [3, 1, 3, 3, 2, 2, 3],
+])
+def test_grade_matches_row_by_row(empty_db, picks):
+    exam_id, rows = _seed(empty_db, QUESTIONS)
+    exam = get_exam(empty_db, exam_id)
+    old, new = _both(exam, rows, picks)
+    assert new == old
+    assert exam.grade(picks)[1] == sum(p is not None for p in picks)
+
+
+def test_grade_every_pick_matches_row_by_row(empty_db):
+    exam_id, rows = _seed(empty_db, QUESTIONS)
+    exam = get_exam(empty_db, exam_id)
+    for q, (_, _, _, opts) in enumerate(exam.questions()):
+        for i in [None] + list(range(len(opts))):
+            picks = [None] * len(exam)
+            picks[q] = i
+            assert _both(exam, rows, picks)[0] == _both(exam, rows, picks)[1], (QUESTIONS[q], i)
+
+
+def test_exam_without_questions(empty_db):
+    exam_id, rows = _seed(empty_db, [])
+    exam = get_exam(empty_db, exam_id)
+    assert len(exam) == 0 and list(exam.questions()) == []
+    assert exam.grade([]) == (0, 0) and grade_rows(rows, {}) == 0
+
+
+def test_exam_recompiles_after_bump(empty_db):
+    exam_id, _ = _seed(empty_db, QUESTIONS[:1])
+    first = get_exam(empty_db, exam_id)
+    assert get_exam(empty_db, exam_id) is first
+    with empty_db.writer(bump=exam_version(exam_id)) as w:
+        w.execute(f"INSERT INTO exam_questions ({COLS}) VALUES (?,?,?,?,?,?,?)", (exam_id,) + QUESTIONS[1])
+    again = get_exam(empty_db, exam_id)
+    assert again is not first and len(again) == 2
+    assert isinstance(again, CompiledExam)
@@ -0,0 +1,91 @@
+# ==========================================
+# Term score report (tab6): paged preview / streamed exports
+# ==========================================
+import openpyxl
+import pandas as pd
+import pytest
+
+import exports
+from exports import PREVIEW_PAGE_SIZE, TERM_SCORES_HEADER, TERM_SCORES_SQL, read_file, term_scores_export, term_scores_page
+
+TERM = '2/2567'
+
+
+def reference(conn, term, kw=None):
+    # หน้าเดิม: โหลดทั้งเทอมเป็น DataFrame แล้วกรองด้วย str.contains ทุกคอลัมน์
+    df = pd.read_sql(TERM_SCORES_SQL, conn, params=(term,))
+    df.columns = TERM_SCORES_HEADER
+    if kw:
+        df = df[df.astype(str).apply(lambda x: x.str.contains(kw, case=False, regex=False)).any(axis=1)]
+    return [tuple(r) for r in df.itertuples(index=False, name=None)]
+
+
+def _all_pages(conn, term, kw=None, size=PREVIEW_PAGE_SIZE):
+    first = term_scores_page(conn, term, kw, 0, size)
+    rows = list(first.rows)
+    for p in range(1, first.pages): rows += term_scores_page(conn, term, kw, p, size).rows
+    return first, rows
+
+
+def _key(rows):
+    # เวลาส่งซ้ำกันได้ -> เทียบแบบไม่สนลำดับภายในเวลาเดียวกัน
+    return sorted(rows, key=repr)
+
+
+@pytest.mark.parametrize("kw", [None, '', 'G0001', 'สอบ ทช1', '671200', '20'])
+def test_pages_match_full_report(school_db, kw):
+    conn = school_db.reader()
+    want = reference(conn, TERM, kw)
+    first, rows = _all_pages(conn, TERM, kw, size=250)
+    assert first.total == len(want)
+    assert first.pages == max(1, -(-len(want) // 250))
+    assert _key(rows) == _key(want)
+    assert [r[0] for r in rows] == sorted((r[0] for r in rows), reverse=True)
+
+
+def test_page_size_and_clamp(school_db):
+    conn = school_db.reader()
+    page = term_scores_page(conn, TERM, page=0)
+    assert page.total > PREVIEW_PAGE_SIZE and len(page.rows) == PREVIEW_PAGE_SIZE
+    last = term_scores_page(conn, TERM, page=10 ** 6)
+    assert last.page == last.pages - 1 and 0 < len(last.rows) <= PREVIEW_PAGE_SIZE
+    assert term_scores_page(conn, TERM, page=-3).page == 0
+
+
+def test_no_results(school_db):
+    page = term_scores_page(school_db.reader(), TERM, 'ไม่มีคำนี้แน่นอน')
+    assert (page.rows, page.total, page.page, page.pages) == ([], 0, 0, 1)
+
+
+@pytest.fixture
+def export_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(exports, 'EXPORT_DIR', str(tmp_path / 'exports'))
+    monkeypatch.setattr(exports, '_cache', {})
+    monkeypatch.setattr(exports, 'CHUNK_ROWS', 1000)  # หลาย chunk
+    return tmp_path / 'exports'
+
+
+def test_streamed_csv_equals_dataframe_csv(school_db, export_dir):
+    conn = school_db.reader()
+    df = pd.read_sql(TERM_SCORES_SQL, conn, params=(TERM,))
+    df.columns = TERM_SCORES_HEADER
+    art = term_scores_export(school_db, TERM, 'csv')
+    assert art.rows == len(df) > exports.CHUNK_ROWS
+    assert read_file(art.path) == df.to_csv(index=False).encode('utf-8-sig')
+
+
+def test_streamed_xlsx_rows(school_db, export_dir):
+    art = term_scores_export(school_db, TERM, 'xlsx')
+    ws = openpyxl.load_workbook(art.path, read_only=True).active
+    rows = [tuple(r) for r in ws.iter_rows(values_only=True)]
+    assert list(rows[0]) == TERM_SCORES_HEADER
+    assert _key(rows[1:]) == _key(reference(school_db.reader(), TERM))
+    assert art.rows == len(rows) - 1
+
+
+def test_export_is_cached_per_version(school_db, export_dir, monkeypatch):
+    art = term_scores_export(school_db, TERM, 'csv')
+    assert term_scores_export(school_db, TERM, 'csv') is art
+    monkeypatch.setattr(school_db, 'version', lambda *names: ('changed',))
+    fresh = term_scores_export(school_db, TERM, 'csv')
+    assert fresh is not art and fresh.version == ('changed',) and read_file(fresh.path) == read_file(art.path)
@@ -0,0 +1,297 @@
+# ==========================================
+# Streaming DBF reader / ZIP import
+# ==========================================
+import datetime
+import struct
+import zipfile
+
+import pytest
+from dbfread import DBF
+
+import importer
+from importer import DBFStream
+
+# ฟิลด์ทุกชนิดที่ไฟล์ FoxPro ของ สกร. อาจมี: (ชื่อ, ชนิด, ความยาว, ทศนิยม)
+FOXPRO_FIELDS = [('STD_CODE', 'C', 13, 0), ('HOUR', 'N', 6, 1), ('SCORE', 'F', 8, 2), ('BIRTH', 'D', 8, 0), ('ACTIVE', 'L', 1, 0),
+                 ('SEQ', 'I', 4, 0), ('AUTO', '+', 4, 0), ('FEE', 'Y', 8, 4), ('UPDATED', 'T', 8, 0), ('RATIO', 'B', 8, 0),
+                 ('WEIGHT', 'O', 8, 0), ('NOTE', 'M', 4, 0)]
+JULIAN_OFFSET = 1721425
+
+
+def _pack(ftype, value, length):
+    if ftype == 'C': return value.encode('cp874').ljust(length)
+    if ftype in ('N', 'F'): return ('' if value is None else str(value)).rjust(length).encode('ascii')
+    if ftype == 'D': return (value.strftime('%Y%m%d') if value else '').ljust(8).encode('ascii')
+    if ftype == 'L': return b'?' if value is None else (b'T' if value else b'F')
+    if ftype in ('I', '+'): return struct.pack('<i', value)
+    if ftype == 'Y': return struct.pack('<q', round(value * 10000))
+    if ftype == 'T':
+        if value is None: return b' ' * 8
+        midnight = datetime.datetime.combine(value.date(), datetime.time())
+        return struct.pack('<II', value.toordinal() + JULIAN_OFFSET, int((value - midnight).total_seconds() * 1000))
+    if ftype in ('B', 'O'): return struct.pack('<d', value)
+    if ftype == 'M': return b'\0' * length
+    raise AssertionError(ftype)
+
+
+def write_foxpro_dbf(path, fields, rows, version=0x30, deleted=()):
+    header_len = 32 + 32 * len(fields) + 1
+    record_len = 1 + sum(f[2] for f in fields)
+    with open(path, 'wb') as f:
+        f.write(struct.pack('<BBBBIHH20x', version, 125, 1, 1, len(rows), header_len, record_len))
+        for name, ftype, length, dec in fields:
+            f.write(struct.pack('<11sc4xBB14x', name.encode('ascii'), ftype.encode('ascii'), length, dec))
+        f.write(b'\r')
+        for i, row in enumerate(rows):
+            f.write(b'*' if i in deleted else b' ')
+            for (name, ftype, length, dec), v in zip(fields, row): f.write(_pack(ftype, v, length))
+        f.write(b'\x1a')
+    return path
+
+
+FOXPRO_ROWS = [
+    ('6713000001', 12.5, 3.25, datetime.date(2007, 5, 14), True, 42, 1, 1250.75, datetime.datetime(2025, 3, 1, 9, 30, 15), 0.5, -1.25, None),
+    ('6723000002', None, None, None, False, -7, 2, 0.0, None, 1e-3, 2.0, None),
+    ('6733000003', 6.0, 0.0, datetime.date(2010, 12, 31), None, 0, 3, -99.5, datetime.datetime(1999, 12, 31, 23, 59, 59), 7.0, 3.5, None),
+]
+
+
+@pytest.fixture
+def foxpro_dbf(tmp_path):
+    return write_foxpro_dbf(tmp_path / "activity.dbf", FOXPRO_FIELDS, FOXPRO_ROWS)
+
+
+def _stream(path, **kw):
+    with open(path, 'rb') as f: return [r for batch in DBFStream(f).iter_batches(**kw) for r in batch]
+
+
+def test_foxpro_types(foxpro_dbf):
+    rows = _stream(foxpro_dbf)
+    assert [r['STD_CODE'] for r in rows] == [r[0] for r in FOXPRO_ROWS]
+    first, second = rows[0], rows[1]
+    assert (first['HOUR'], first['SCORE'], first['BIRTH'], first['ACTIVE']) == (12.5, 3.25, '2007-05-14', True)
+    assert (first['SEQ'], first['AUTO'], first['FEE']) == (42, 1, 1250.75)
+    assert first['UPDATED'] == '2025-03-01 09:30:15'
+    assert (first['RATIO'], first['WEIGHT'], first['NOTE']) == (0.5, -1.25, None)
+    assert (second['HOUR'], second['BIRTH'], second['ACTIVE'], second['SEQ'], second['UPDATED']) == (None, None, False, -7, None)
+    assert rows[2]['ACTIVE'] is None and rows[2]['FEE'] == -99.5
+
+
+def test_matches_dbfread(foxpro_dbf):
+    # ค่าตรงกับ dbfread (ตัวอ่านเดิมก่อนเปลี่ยนเป็น stream) หลังแปลงชนิดให้เป็นแบบที่เก็บลง SQLite
+    def plain(v):
+        if isinstance(v, datetime.datetime): return v.isoformat(' ', 'seconds')
+        if isinstance(v, datetime.date): return v.isoformat()
+        if v.__class__.__name__ == 'Decimal': return float(v)
+        return v
+    want = [{k: plain(v) for k, v in r.items()} for r in DBF(str(foxpro_dbf), encoding='cp874', ignore_missing_memofile=True)]
+    assert _stream(foxpro_dbf) == want
+
+
+def test_b_is_memo_outside_visual_foxpro(tmp_path):
+    path = write_foxpro_dbf(tmp_path / "x.dbf", [('STD_CODE', 'C', 10, 0), ('BLOB', 'B', 8, 0)], [('1', 0.5)], version=0x03)
+    assert _stream(path) == [{'STD_CODE': '1', 'BLOB': None}]
+
+
+def test_deleted_records(tmp_path):
+    rows = [(f"67130{i:05d}", i, i) for i in range(10)]
+    path = write_foxpro_dbf(tmp_path / "x.dbf", [('STD_CODE', 'C', 10, 0), ('SEQ', 'I', 4, 0), ('AUTO', '+', 4, 0)], rows, deleted={3})
+    assert [r['SEQ'] for r in _stream(path, batch_size=4)] == [0, 1, 2, 4, 5, 6, 7, 8, 9]
+
+
+def test_unsupported_type_is_an_error(tmp_path):
+    path = tmp_path / "x.dbf"
+    write_foxpro_dbf(path, [('STD_CODE', 'C', 10, 0), ('SEQ', 'I', 4, 0)], [('1', 1)])
+    raw = bytearray(path.read_bytes())
+    raw[32 + 32 + 11] = ord('Q')    # varbinary: ไม่รองรับ
+    path.write_bytes(bytes(raw))
+    with pytest.raises(ValueError, match="'Q'.*SEQ"): _stream(path)
+
+
+def test_import_reports_unsupported_file(tmp_path, empty_db):
+    good = write_foxpro_dbf(tmp_path / "activity.dbf", FOXPRO_FIELDS, FOXPRO_ROWS)
+    bad = tmp_path / "student.dbf"
+    write_foxpro_dbf(bad, [('STD_CODE', 'C', 13, 0), ('NAME', 'C', 20, 0)], [('6713000001', 'สมชาย')] * 3)
+    raw = bytearray(bad.read_bytes())
+    raw[32 + 32 + 11] = ord('V')
+    bad.write_bytes(bytes(raw))
+    zpath = tmp_path / "school.zip"
+    with zipfile.ZipFile(zpath, 'w', zipfile.ZIP_DEFLATED) as z:
+        z.write(good, "activity.dbf"); z.write(bad, "student.dbf")
+    report, _ = importer.import_zip(empty_db, str(zpath), mode='inplace')
+    by_file = {r['file']: r for r in report}
+    assert "'V'" in by_file['student.dbf']['error']
+    assert by_file['activity.dbf']['error'] is None
+    hours = [r[0] for r in empty_db.reader().execute("SELECT hours FROM activities ORDER BY std_id")]
+    assert hours == [12.5, 0, 6.0]
+
+
+def _table_rows(db, table):
+    return sorted(db.reader().execute(f"SELECT * FROM {table}").fetchall(), key=repr)
+
+
+STUDENT_FIELDS = [('STD_CODE', 'C', 13, 0), ('PRENAME', 'C', 10, 0), ('NAME', 'C', 30, 0), ('SURNAME', 'C', 30, 0), ('GRP_CODE', 'C', 8, 0)]
+GRADE_FIELDS = [('STD_CODE', 'C', 13, 0), ('SUB_CODE', 'C', 10, 0), ('SEMESTRY', 'C', 8, 0), ('GRADE', 'C', 4, 0), ('GRP_CODE', 'C', 8, 0)]
+GROUP_FIELDS = [('GRP_CODE', 'C', 8, 0), ('GRP_ADVIS', 'C', 30, 0)]
+
+
+def _zip(path, students, grades, groups):
+    # ZIP แบบเดียวกับที่ สกร. ส่งออก: นศ. / เกรด / กลุ่ม
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as z:
+        for name, fields, rows in (('student.dbf', STUDENT_FIELDS, students), ('grade.dbf', GRADE_FIELDS, grades), ('group.dbf', GROUP_FIELDS, groups)):
+            z.write(write_foxpro_dbf(path.parent / name, fields, rows), name)
+    return str(path)
+
+
+def _school_zip(path, n_students, grades_per_student, n_groups):
+    sids = [f"671{1 + i % 3}{i:06d}" for i in range(n_students)]
+    return _zip(path, [(sid, 'นาย', f"ชื่อ{i}", f"สกุล{i}", f"G{i % n_groups:04d}") for i, sid in enumerate(sids)],
+                [(sid, f"ทช{sid[3]}{g:04d}", '2/2567', str(g % 5), f"G{i % n_groups:04d}") for i, sid in enumerate(sids) for g in range(grades_per_student)],
+                [(f"G{g:04d}", f"ครู {g}") for g in range(n_groups)])
+
+
+def test_parallel_import_matches_serial(tmp_path, monkeypatch):
+    from db import Database
+    zpath = _school_zip(tmp_path / "school.zip", n_students=600, grades_per_student=8, n_groups=12)
+    serial = Database(str(tmp_path / "serial.db"))
+    parallel = Database(str(tmp_path / "parallel.db"))
+    importer.import_zip(serial, zpath)
+
+    # แต่ละไฟล์ใน ZIP ถูกเปิด (คลาย deflate) ครั้งเดียว แม้จะแบ่งเป็นหลายช่วง
+    opened = []
+    real_open = zipfile.ZipFile.open
+    monkeypatch.setattr(zipfile.ZipFile, 'open', lambda self, name, *a, **kw: opened.append(getattr(name, 'filename', name)) or real_open(self, name, *a, **kw))
+    report, _ = importer.import_zip_parallel(parallel, zpath, workers=2, chunk_records=700)
+    assert sorted(opened) == sorted(set(opened))
+    assert all(r['error'] is None for r in report)
+    assert {r['file']: r['records'] for r in report}['grade.dbf'] == 600 * 8
+    for table in importer.IMPORT_TABLES + ['users']:
+        assert _table_rows(parallel, table) == _table_rows(serial, table), table
+    serial.close(); parallel.close()
+
+
+# ==========================================
+# Delta import
+# ==========================================
+V1 = dict(students=[('6711000001', 'นาย', 'สมชาย', 'ใจดี', 'G1'), ('6712000002', 'นาง', 'สมศรี', 'มีสุข', 'G1'),
+                    ('6713000003', 'นาย', 'สมปอง', 'ดีมาก', 'G2')],
+          grades=[('6711000001', 'ทช11001', '2/2567', '1', 'G1'), ('6712000002', 'ทช21001', '2/2567', '2', 'G1'),
+                  ('6713000003', 'ทช31001', '2/2567', '3', 'G2'), ('6713000003', 'ทช31002', '2/2567', '4', 'G2')],
+          groups=[('G1', 'ครูหนึ่ง'), ('G2', 'ครูสอง')])
+# แก้: ชื่อ นศ. 1 / เกรด นศ. 1 / ครูกลุ่ม G1 | ลบ: นศ. 3 + เกรด + กลุ่ม G2 | เพิ่ม: นศ. 4 + เกรด + กลุ่ม G3
+V2 = dict(students=[('6711000001', 'นาย', 'สมชาย', 'ใจงาม', 'G1'), ('6712000002', 'นาง', 'สมศรี', 'มีสุข', 'G1'),
+                    ('6711000004', 'นาย', 'สมหมาย', 'รักเรียน', 'G3')],
+          grades=[('6711000001', 'ทช11001', '2/2567', '4', 'G1'), ('6712000002', 'ทช21001', '2/2567', '2', 'G1'),
+                  ('6711000004', 'ทช11001', '2/2567', '3', 'G3')],
+          groups=[('G1', 'ครูหนึ่ง (ใหม่)'), ('G3', 'ครูสาม')])
+
+
+def test_delta_import_applies_changes(tmp_path, empty_db):
+    from db import Database
+    importer.import_zip(empty_db, _zip(tmp_path / "v1.zip", **V1))
+    with empty_db.writer() as w: w.execute("UPDATE users SET password='changed' WHERE username='G1'")
+    report, summary = importer.import_zip(empty_db, _zip(tmp_path / "v2.zip", **V2), mode='delta')
+    changes = summary['changes']
+    assert all(r['error'] is None for r in report)
+    assert changes['students'] == {'inserted': 1, 'updated': 1, 'deleted': 1, 'unchanged': 1}
+    assert changes['grades'] == {'inserted': 1, 'updated': 1, 'deleted': 2, 'unchanged': 1}
+    assert changes['groups'] == {'inserted': 1, 'updated': 1, 'deleted': 1, 'unchanged': 0}
+    assert changes['users'] == {'inserted': 1, 'updated': 1, 'deleted': 1, 'unchanged': 0}
+
+    # ผลเท่ากับนำเข้า v2 ใหม่ทั้งหมด (ยกเว้นรหัสผ่านที่แอดมินแก้ไว้ ไม่ถูกทับ)
+    fresh = Database(str(tmp_path / "fresh.db"))
+    importer.import_zip(fresh, _zip(tmp_path / "v2.zip", **V2))
+    for table in ('students', 'grades', 'groups'):
+        assert _table_rows(empty_db, table) == _table_rows(fresh, table), table
+    users = dict(empty_db.reader().execute("SELECT username, password FROM users"))
+    assert users == {'admin': '1234', 'G1': 'changed', 'G3': 'G3'}
+    fresh.close()
+
+
+def test_delta_import_without_changes_writes_nothing(tmp_path, empty_db):
+    path = _zip(tmp_path / "v1.zip", **V1)
+    importer.import_zip(empty_db, path)
+    _, summary = importer.import_zip(empty_db, path, mode='delta')
+    assert all(c['inserted'] == c['updated'] == c['deleted'] == 0 for c in summary['changes'].values()), summary
+
+
+# ==========================================
+# Staged import (shadow tables + swap)
+# ==========================================
+def _leftover_tables(db):
+    return [r[0] for r in db.reader().execute("SELECT name FROM sqlite_master WHERE name GLOB 'shadow_*' OR name GLOB 'retired_*'")]
+
+
+def test_staged_import_swaps_tables(tmp_path, empty_db):
+    from db import INDEXES, Database, index_table
+    importer.import_zip(empty_db, _zip(tmp_path / "v1.zip", **V1), mode='staged')
+    report, summary = importer.import_zip(empty_db, _zip(tmp_path / "v2.zip", **V2), mode='staged')
+    assert all(r['error'] is None for r in report)
+    assert summary['swap_s'] is not None
+    fresh = Database(str(tmp_path / "fresh.db"))
+    importer.import_zip(fresh, _zip(tmp_path / "v2.zip", **V2), mode='inplace')
+    for table in ('students', 'grades', 'groups', 'users'):
+        assert _table_rows(empty_db, table) == _table_rows(fresh, table), table
+    fresh.close()
+    assert _leftover_tables(empty_db) == []
+    # index ชุดเดิมอยู่บนตารางใหม่ (ชื่อหลักหรือชื่อสำรอง _b)
+    live = dict(empty_db.reader().execute("SELECT name, tbl_name FROM sqlite_master WHERE type='index' AND name GLOB 'ix_*'"))
+    for name in INDEXES:
+        assert live.get(name, live.get(name + '_b')) == index_table(name), name
+
+
+def test_search_after_staged_import(tmp_path, empty_db):
+    import search
+    importer.import_zip(empty_db, _zip(tmp_path / "v1.zip", **V1), mode='staged')
+    importer.import_zip(empty_db, _zip(tmp_path / "v2.zip", **V2), mode='staged')
+    conn = empty_db.reader()
+    assert [r[0] for r in search.search_students(conn, 'สมหมาย')] == ['6711000004']
+    assert search.search_students(conn, 'สมปอง') == []
+    assert search.search_groups(conn, 'ครูสาม') == [('G3', 'ครูสาม')]
+    # trigger ต้องอยู่บนตารางใหม่ -> แก้ไขหลังสลับแล้ว index ค้นหาตามทัน
+    with empty_db.writer() as w:
+        w.execute("UPDATE students SET name='วิชัย' WHERE std_id='6711000001'")
+        w.execute("INSERT INTO students (std_id, prefix, name, surname, grp_code) VALUES ('6713000009', 'นาย', 'ปรีชา', 'ทองคำ', 'G3')")
+        w.execute("DELETE FROM students WHERE std_id='6712000002'")
+    assert search.search_students(conn, 'สมชาย') == []
+    assert [r[0] for r in search.search_students(conn, 'วิชัย')] == ['6711000001']
+    assert [r[0] for r in search.search_students(conn, 'ปรีชา')] == ['6713000009']
+    assert search.search_students(conn, 'สมศรี') == []
+    fts = conn.execute("SELECT tbl_name, COUNT(*) FROM sqlite_master WHERE type='trigger' AND name GLOB '*_fts_*' GROUP BY tbl_name").fetchall()
+    assert fts == [('groups', 4), ('students', 4)]
+
+
+def test_failed_staged_import_keeps_live_data(tmp_path, empty_db):
+    importer.import_zip(empty_db, _zip(tmp_path / "v1.zip", **V1), mode='staged')
+    before = {t: _table_rows(empty_db, t) for t in ('students', 'grades', 'groups', 'users')}
+    bad = dict(V2, grades=V2['grades'] + [('', 'ทช11001', '2/2567', '1', 'G1')])     # รหัสนักศึกษาว่าง
+    with pytest.raises(importer.ImportValidationError, match='grades'):
+        importer.import_zip(empty_db, _zip(tmp_path / "bad.zip", **bad), mode='staged')
+    assert {t: _table_rows(empty_db, t) for t in before} == before
+    assert _leftover_tables(empty_db) == []
+
+
+# ==========================================
+# Synthetic school ZIP (suite.py)
+# ==========================================
+def test_synthetic_zip_imports_every_file(tmp_path, empty_db):
+    from summary import check_summaries
+    from synthetic import ZIP_SEMESTERS, make_zip, seed_exams
+    data = make_zip(str(tmp_path / "school.zip"), n_students=300, n_groups=8, semesters=ZIP_SEMESTERS, n_grades=3001)
+    report, _ = importer.import_zip(empty_db, str(tmp_path / "school.zip"), mode='staged')
+    assert all(r['error'] is None for r in report)
+    assert {r['file'] for r in report} == {'student.dbf', 'grade.dbf', 'group.dbf', 'subject.dbf', 'schedule.dbf', 'activity.dbf'}
+    conn = empty_db.reader()
+    count = lambda table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    assert (count('students'), count('grades'), count('groups'), count('activities')) == \
+        (data['students'], data['grades'], data['groups'], data['activities']) == (300, 3001, 8, 300)
+    assert [r[0] for r in conn.execute("SELECT DISTINCT semestry FROM grades ORDER BY semestry")] == sorted(ZIP_SEMESTERS)
+
+    seeded = seed_exams(empty_db, n_exams=5, n_questions=10)
+    assert (seeded['exams'], seeded['questions'], count('exam_questions')) == (5, 50, 50)
+    # ผลสอบเฉพาะ นศ. ที่ลงทะเบียนวิชานั้นในเทอมล่าสุดและยังไม่มีเกรด
+    assert seeded['results'] == count('exam_results') > 0
+    assert conn.execute("SELECT COUNT(*) FROM exam_results r JOIN exams e USING (exam_id) WHERE NOT EXISTS "
+                        "(SELECT 1 FROM grades g WHERE g.std_id = r.std_id AND g.sub_code = e.sub_code AND g.semestry = e.semestry AND g.grade = '')"
+                        ).fetchone()[0] == 0
+    assert check_summaries(conn) == []
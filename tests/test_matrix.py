@@ -0,0 +1,89 @@
+# ==========================================
+# Score matrix cache
+# ==========================================
+import random
+import threading
+
+import pandas as pd
+
+import matrix
+from db import Database
+from refdata import get_refdata
+from submissions import SubmissionQueue
+from synthetic import seed_synthetic
+
+
+def _groups(db, n=2):
+    return [r[0] for r in db.reader().execute(
+        "SELECT s.grp_code FROM exam_results r JOIN students s ON s.std_id = r.std_id GROUP BY s.grp_code ORDER BY s.grp_code LIMIT ?", (n,))]
+
+
+def test_slow_group_does_not_block_others(school_db, monkeypatch):
+    slow, fast = _groups(school_db)
+    for g in (slow, fast): matrix._cache.pop((school_db.path, g), None)
+    started, release = threading.Event(), threading.Event()
+    real_build = matrix.build_matrix
+
+    def build(conn, ref, grp_code, version=None):
+        if grp_code == slow:
+            started.set()
+            assert release.wait(10)
+        return real_build(conn, ref, grp_code, version)
+
+    monkeypatch.setattr(matrix, 'build_matrix', build)
+    t = threading.Thread(target=matrix.get_matrix, args=(school_db, slow))
+    t.start()
+    try:
+        assert started.wait(10)
+        done = threading.Event()
+        threading.Thread(target=lambda: (matrix.get_matrix(school_db, fast), done.set()), daemon=True).start()
+        assert done.wait(10), "matrix of another group waited for the slow pivot"
+    finally:
+        release.set()
+        t.join()
+    assert not matrix.get_matrix(school_db, slow).empty
+
+
+def test_concurrent_reads_build_once(school_db, monkeypatch):
+    grp = _groups(school_db, 1)[0]
+    matrix._cache.pop((school_db.path, grp), None)
+    calls = []
+    real_build = matrix.build_matrix
+    monkeypatch.setattr(matrix, 'build_matrix', lambda *a, **kw: calls.append(1) or real_build(*a, **kw))
+    threads = [threading.Thread(target=matrix.get_matrix, args=(school_db, grp)) for _ in range(8)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    assert len(calls) == 1
+
+
+def pivot_reference(conn, ref, grp):
+    # หน้าเดิม: query ทั้งกลุ่ม + map ชื่อวิชา + pivot ทุก rerun
+    df = pd.read_sql(matrix.MATRIX_SQL, conn, params=(grp,))
+    df['sub_name'] = ref.subject_names(df['sub_code'])
+    df['subject_label'] = df['sub_name'] + " (เต็ม " + df['total_score'].astype(str) + ")"
+    view = df.pivot_table(index=['std_id', 'full_name'], columns='subject_label', values='score', aggfunc='max').reset_index()
+    return view.rename(columns={'std_id': 'รหัสนักเรียน', 'full_name': 'ชื่อ-สกุล'})
+
+
+def assert_same_frame(a, b):
+    a, b = a.reset_index(drop=True), b.reset_index(drop=True)
+    a.columns.name = b.columns.name = None
+    assert list(a.columns) == list(b.columns)
+    assert a.astype(str).equals(b.astype(str))
+
+
+def test_patched_matrix_equals_fresh_pivot(tmp_path):
+    db = Database(str(tmp_path / "matrix.db"))
+    seed_synthetic(db, n_students=400, grades_per_student=3, n_groups=4, n_exams=10)
+    conn, ref = db.reader(), get_refdata(db)
+    grp, = conn.execute("SELECT grp_code FROM students GROUP BY grp_code ORDER BY COUNT(*) DESC LIMIT 1").fetchone()
+    sids = [r[0] for r in conn.execute("SELECT std_id FROM students WHERE grp_code=? ORDER BY std_id", (grp,))]
+    assert_same_frame(matrix.get_matrix(db, grp).frame, pivot_reference(conn, ref, grp))
+    q = SubmissionQueue(db)
+    rnd = random.Random(5)
+    # ผลใหม่ / สอบซ้ำวิชาเดิม / คะแนนเต็มใหม่ (คอลัมน์ใหม่) -> patch เฉพาะแถวต้องเท่ากับ pivot ใหม่ทั้งกลุ่ม
+    for total in (20, 20, 30):
+        tickets = [q.submit(rnd.randint(1, 10), sid, rnd.randint(0, total), total, '2025-03-02 10:00') for sid in rnd.sample(sids, 8)]
+        for t in tickets: assert t.wait(10) and t.ok
+        assert_same_frame(matrix.get_matrix(db, grp).frame, pivot_reference(conn, ref, grp))
+    db.close()
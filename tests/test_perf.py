@@ -0,0 +1,121 @@
+# ==========================================
+# Performance instrumentation (perf.py)
+# ==========================================
+import json
+
+import pandas as pd
+import pytest
+
+import perf
+from exams import DASHBOARD_SQL, exam_dashboard
+
+
+@pytest.fixture(autouse=True)
+def fresh_buffers():
+    perf.clear()
+    yield
+    perf.clear()
+    perf.set_log_path(None)
+
+
+@pytest.fixture(scope="module")
+def sids(school_db):
+    return [r[0] for r in school_db.reader().execute("SELECT std_id FROM students ORDER BY std_id LIMIT 5")]
+
+
+def per_student(conn, sids):
+    # รูปแบบ N+1: 2 query ต่อ นศ. หนึ่งคน
+    rows = 0
+    for sid in sids:
+        conn.execute("SELECT name FROM students WHERE std_id = ?", (sid,)).fetchone()
+        rows += len(pd.read_sql("SELECT * FROM grades WHERE std_id = ?", conn, params=(sid,)))
+    return rows
+
+
+def test_connections_are_traced(school_db):
+    # perf ลงทะเบียน factory กับ db.py -> connection ที่ Database เปิดถูกจับเวลาโดยไม่ต้องแก้ db.py
+    assert isinstance(school_db.reader(), perf.TracedConnection)
+
+
+@pytest.mark.parametrize('sql, want', [
+    ("SELECT * FROM grades WHERE std_id = '65001' AND score > 3.5", "SELECT * FROM grades WHERE std_id = ? AND score > ?"),
+    ("SELECT * FROM exams WHERE exam_id IN (1, 2, 3)", "SELECT * FROM exams WHERE exam_id IN (?, ...)"),
+    ("SELECT name -- ชื่อ\n  FROM  t WHERE x = 'it''s'", "SELECT name FROM t WHERE x = ?"),
+])
+def test_normalise_sql(sql, want):
+    assert perf.normalise_sql(sql) == want
+
+
+def test_rerun_records_queries_and_rows(school_db, sids):
+    conn = school_db.reader()
+    run = perf.begin_rerun('teacher')
+    perf.set_section('grades')
+    rows = per_student(conn, sids)
+    perf.end_rerun(run)
+    assert run.n_queries == 2 * len(sids) and run.ms >= run.query_ms > 0
+    want = conn.execute(f"SELECT COUNT(*) FROM grades WHERE std_id IN ({','.join('?' * len(sids))})", sids).fetchone()[0]
+    assert sum(r.rows for r in run.records if 'FROM grades' in r.sql) == rows == want
+    assert sorted(run.repeats().values()) == [len(sids), len(sids)]
+    assert {(r.page, r.section) for r in run.records} == {('teacher', 'grades')}
+    assert list(perf.reruns) == [run]
+
+
+def test_counts_match_sqlite_trace(school_db, sids):
+    conn = school_db.reader()
+    traced = []
+    conn.set_trace_callback(traced.append)
+    try:
+        run = perf.begin_rerun('student')
+        per_student(conn, sids)
+        for sid in sids: exam_dashboard(conn, sid)
+        perf.end_rerun(run)
+    finally:
+        conn.set_trace_callback(None)
+    assert run.n_queries == len(traced)
+
+
+def test_n_plus_one_flags_loops_only(school_db, sids):
+    conn = school_db.reader()
+    for page, sid_list in (('loop', sids), ('single', sids[:1])):
+        run = perf.begin_rerun(page)
+        for sid in sid_list: exam_dashboard(conn, sid)
+        perf.end_rerun(run)
+    found = perf.n_plus_one()
+    assert [(f['page'], f['max_repeats']) for f in found] == [('loop', len(sids))]
+    assert found[0]['sql'] == perf.normalise_sql(DASHBOARD_SQL)
+
+
+def test_queries_outside_rerun_are_background(school_db):
+    school_db.reader().execute("SELECT COUNT(*) FROM students").fetchone()
+    assert [q.page for q in perf.queries] == ['background'] and not perf.reruns
+
+
+def test_summaries(school_db, sids):
+    conn = school_db.reader()
+    for _ in range(3):
+        run = perf.begin_rerun('teacher')
+        per_student(conn, sids)
+        perf.end_rerun(run)
+    page, = perf.rerun_summary()
+    assert page['page'] == 'teacher' and page['reruns'] == 3 and page['queries_max'] == page['queries_avg'] == 2 * len(sids)
+    assert sorted(q['calls'] for q in perf.query_summary()) == [3 * len(sids)] * 2
+    assert len(perf.slowest_queries(4)) == 4
+
+
+def test_trace_log(school_db, sids, tmp_path):
+    path = tmp_path / 'perf.jsonl'
+    perf.set_log_path(str(path))
+    for page in ('student', 'admin'):
+        run = perf.begin_rerun(page)
+        per_student(school_db.reader(), sids[:2])
+        perf.end_rerun(run)
+    lines = [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+    assert [(l['page'], l['n_queries'], len(l['queries'])) for l in lines] == [('student', 4, 4), ('admin', 4, 4)]
+    assert all(q['page'] == l['page'] and q['sql'] for l in lines for q in l['queries'])
+
+
+def test_unwritable_log_is_ignored(tmp_path):
+    perf.set_log_path(str(tmp_path))    # เป็นโฟลเดอร์ -> เปิดเขียนไม่ได้
+    run = perf.begin_rerun('admin')
+    perf.end_rerun(run)
+    assert list(perf.reruns) == [run]
@@ -0,0 +1,132 @@
+# ==========================================
+# Query-plan regression
+# ==========================================
+# SQL ทุกตัวใน app.py (+ module ที่ app เรียก) ต้องไม่ full scan ตารางที่โตตามจำนวน นศ./เกรด
+# และ lookup หลักของแต่ละหน้าต้องใช้ index ชุด ix_* ของ db.INDEXES
+import ast
+import os
+import re
+
+import pytest
+
+import attendance
+import exams
+import exports
+import matrix
+import sessions
+from db import INDEXES
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+
+# ตารางที่โตตามจำนวน นศ./เกรด -> ห้าม full table scan
+BIG_TABLES = {'grades', 'students', 'activities', 'exam_results', 'exam_questions'}
+
+# SQL ที่ยอมให้ scan ได้ (เหตุผลกำกับ) — key คือข้อความ SQL หลัง normalise
+KNOWN_SCANS = {}
+LIMIT_ONLY_RE = re.compile(r"^SELECT .* FROM \w+ LIMIT \d+$", re.I)
+
+SQL_RE = re.compile(r"^\s*(SELECT|UPDATE|DELETE|INSERT)\b", re.I)
+# ค่าตัวแปรที่แทรกใน f-string ของ app.py
+FSTRING_VALUES = {'target_col': 'semestry'}
+
+# SQL ที่อยู่ใน module อื่น (ไม่ได้เขียนตรงใน app.py)
+MODULE_SQL = [('exams.DASHBOARD_SQL', exams.DASHBOARD_SQL), ('attendance.ATTENDANCE_SQL', attendance.ATTENDANCE_SQL),
+              ('matrix.MATRIX_SQL', matrix.MATRIX_SQL), ('matrix.CHANGED_SQL', matrix.CHANGED_SQL),
+              ('exports.TERM_SCORES_SQL', exports.TERM_SCORES_SQL),
+              ('exports.term_scores_page', f"SELECT * FROM ({exports._TERM_SCORES_SELECT}) t ORDER BY t.timestamp DESC LIMIT ? OFFSET ?"),
+              ('sessions.IDENTITY_SQL', sessions.IDENTITY_SQL)]
+
+# lookup หลัก -> index ที่ต้องถูกเลือก
+INDEX_LOOKUPS = {
+    'ix_grades_key': "SELECT sub_code, grade FROM grades WHERE std_id=?",
+    'ix_grades_sem_std_lvl': "SELECT COUNT(DISTINCT std_id) FROM grades WHERE semestry=?",
+    'ix_schedule_key': "SELECT exam_day FROM schedule WHERE sub_key=? AND semestry=?",
+    'ix_students_grp': "SELECT std_id, name FROM students WHERE grp_code=?",
+    'ix_activities_std': "SELECT act_name, hours FROM activities WHERE std_id=?",
+    'ix_exams_active': "SELECT exam_id FROM exams WHERE is_active=1",
+    'ix_exam_questions_exam': "SELECT question_text FROM exam_questions WHERE exam_id=?",
+    'ix_exam_results_exam_std': "SELECT score FROM exam_results WHERE exam_id=? AND std_id=?",
+    'ix_exam_results_std': "SELECT exam_id, score FROM exam_results WHERE std_id=?",
+}
+
+
+def normalise_sql(sql):
+    sql = re.sub(r"--[^\n]*", " ", sql)
+    return re.sub(r"\s+", " ", sql).strip()
+
+
+def _render(node):
+    if isinstance(node, ast.Constant) and isinstance(node.value, str): return node.value
+    if isinstance(node, ast.JoinedStr):
+        out = []
+        for part in node.values:
+            if isinstance(part, ast.Constant): out.append(part.value)
+            elif isinstance(part.value, ast.Name) and part.value.id in FSTRING_VALUES: out.append(FSTRING_VALUES[part.value.id])
+            else: return None
+        return ''.join(out)
+    return None
+
+
+def extract_sql(path=APP_PATH):
+    tree = ast.parse(open(path, encoding='utf-8').read())
+    # Constant ที่เป็นชิ้นส่วนของ f-string ไม่ใช่ SQL ครบประโยค
+    parts = {id(p) for n in ast.walk(tree) if isinstance(n, ast.JoinedStr) for p in n.values}
+    found = []
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Constant, ast.JoinedStr)) and id(node) not in parts:
+            text = _render(node)
+            if text and SQL_RE.match(text): found.append((f"app.py:{node.lineno}", text))
+    seen, out = set(), []
+    for where, text in sorted(found, key=lambda f: int(f[0].split(':')[1])):
+        key = normalise_sql(text)
+        if key not in seen: seen.add(key); out.append((where, key))
+    return out
+
+
+def checked_statements():
+    out = []
+    for where, sql in extract_sql() + [(name, normalise_sql(sql)) for name, sql in MODULE_SQL]:
+        upper = sql.upper()
+        if upper.startswith('INSERT'): continue
+        if upper.startswith(('UPDATE', 'DELETE')) and ' WHERE ' not in upper: continue
+        if LIMIT_ONLY_RE.match(sql): continue  # อ่านแค่ไม่กี่แถวแรก ไม่ใช่ full scan
+        out.append(pytest.param(sql, id=where))
+    return out
+
+
+def query_plan(conn, sql):
+    return [r[3] for r in conn.execute("EXPLAIN QUERY PLAN " + sql, (None,) * sql.count('?'))]
+
+
+def full_scans(plan):
+    bad = []
+    for detail in plan:
+        m = re.match(r"SCAN (\w+)(?: AS \w+)?(.*)", detail)
+        if m and m.group(1) in BIG_TABLES and 'INDEX' not in m.group(2) and 'PRIMARY KEY' not in m.group(2):
+            bad.append(detail)
+    return bad
+
+
+def test_app_sql_found():
+    assert len(extract_sql()) > 20
+
+
+@pytest.mark.parametrize("sql", checked_statements())
+def test_no_full_scan(school_db, sql):
+    if sql in KNOWN_SCANS: pytest.skip(KNOWN_SCANS[sql])
+    assert full_scans(query_plan(school_db.reader(), sql)) == []
+
+
+def test_indexes_exist(school_db):
+    live = {r[0] for r in school_db.reader().execute("SELECT name FROM sqlite_master WHERE type='index' AND name GLOB 'ix_*'")}
+    assert live == set(INDEXES)
+
+
+@pytest.mark.parametrize("index", sorted(INDEX_LOOKUPS))
+def test_lookup_uses_index(school_db, index):
+    plan = query_plan(school_db.reader(), INDEX_LOOKUPS[index])
+    assert any(re.search(rf"\bINDEX {index}\b", d) for d in plan), plan
+
+
+def test_every_index_has_a_lookup():
+    assert set(INDEX_LOOKUPS) == set(INDEXES)
@@ -0,0 +1,169 @@
+# ==========================================
+# SQLite <-> Sheets replication
+# ==========================================
+import threading
+
+import pytest
+
+import replication
+from db import Database
+from submissions import SubmissionQueue
+from synthetic import FakeClock, fake_spreadsheet, seed_synthetic
+
+
+def remote_table(client, t):
+    # แถวในชีตที่ยังไม่ถูกลบ (_deleted) -> {รหัส: ค่า}
+    n = len(t.columns)
+    out = {}
+    for raw in client.sheets.get(t.name, [])[1:]:
+        raw = list(raw) + [''] * (n + 1 - len(raw))
+        if raw[0] and raw[n] in ('', '0'): out[int(raw[0])] = tuple(raw[:n])
+    return out
+
+
+def local_table(conn, t):
+    return {r[0]: tuple(replication._sheet_values(r)) for r in conn.execute(f"SELECT {', '.join(t.columns)} FROM {t.name}")}
+
+
+def in_sync(conn, client):
+    return all(remote_table(client, t) == local_table(conn, t) for t in replication.TABLES)
+
+
+@pytest.fixture
+def synced(tmp_path):
+    db = Database(str(tmp_path / "repl.db"))
+    seed_synthetic(db, n_students=200, grades_per_student=2, n_groups=5, n_exams=5)
+    sh, client = fake_spreadsheet({})
+    rep = replication.Replicator(db, lambda: sh)
+    assert rep.sync_once(), rep.last_error
+    yield db, client, rep
+    db.close()
+
+
+def test_bootstrap_pushes_every_row(synced):
+    db, client, rep = synced
+    assert in_sync(db.reader(), client)
+    assert rep.status()['pending'] == 0
+    assert rep.sync_once()      # การเขียนของรอบก่อนทำให้เวลาแก้ไขเปลี่ยน -> อ่านทั้งไฟล์อีกรอบ (ไม่มีอะไรต้องเขียน)
+    client.calls.clear()
+    assert rep.sync_once()
+    # ไม่มีอะไรเปลี่ยน -> ตรวจเวลาแก้ไข 1 request ไม่อ่านชีต ไม่เขียน
+    assert dict(client.calls) == {'drive': 1}
+
+
+def test_local_changes_pushed(synced):
+    db, client, rep = synced
+    conn = db.reader()
+    sids = [r[0] for r in conn.execute("SELECT std_id FROM students LIMIT 30")]
+    q = SubmissionQueue(db)
+    for t in [q.submit(1, sid, 10, 20, '2025-03-02 10:00') for sid in sids] + [q.submit(1, sid, 15, 20, '2025-03-02 11:00') for sid in sids[:5]]:
+        assert t.wait(10) and t.ok
+    with db.writer() as w:
+        w.execute("INSERT INTO classroom_videos (sub_code, topic_name, video_url) VALUES ('ทช11001', 'บทที่ 1', 'https://youtu.be/x')")
+        w.execute("UPDATE exam_questions SET question_text='ข้อ 1 (แก้ไข)' WHERE id=1")
+        w.execute("DELETE FROM exam_questions WHERE id=2")
+    assert rep.status()['pending'] > 0
+    assert rep.sync_once(), rep.last_error
+    assert in_sync(conn, client) and rep.status()['pending'] == 0
+    # ลบในเครื่อง = ตั้ง _deleted ในชีต (ไม่ลบแถวจริง)
+    deleted = [r for r in client.sheets['exam_questions'][1:] if r[0] == '2']
+    assert len(deleted) == 1 and deleted[0][-1] == '1'
+
+
+def test_remote_changes_pulled(synced):
+    db, client, rep = synced
+    conn = db.reader()
+    with db.writer() as w:
+        w.execute("INSERT INTO classroom_videos (sub_code, topic_name, video_url) VALUES ('ทช11001', 'บทที่ 1', 'https://youtu.be/x')")
+    assert rep.sync_once()
+    videos = client.sheets['classroom_videos']
+    client.edit('exam_questions', 3, 2, 'ข้อ 3 (แก้จาก Sheets)')
+    videos.append(['', 'ทช21001', 'บทที่ 2', 'https://youtu.be/y', '', ''])
+    client.edit('classroom_videos', 1, 5, '1')
+    new_row = len(videos)
+    assert rep.sync_once(), rep.last_error
+    assert conn.execute("SELECT question_text FROM exam_questions WHERE id=3").fetchone()[0] == 'ข้อ 3 (แก้จาก Sheets)'
+    assert [r[0] for r in conn.execute("SELECT topic_name FROM classroom_videos")] == ['บทที่ 2']
+    assert videos[new_row - 1][0] != ''     # รหัสที่ได้ในเครื่องเขียนกลับไปที่แถวนั้น
+    assert in_sync(conn, client)
+
+
+def test_exam_results_are_push_only(synced):
+    db, client, rep = synced
+    score = client.sheets['exam_results'][1][3]
+    client.edit('exam_results', 1, 3, '99')
+    assert rep.sync_once()
+    assert db.reader().execute("SELECT score FROM exam_results WHERE id=?", (int(client.sheets['exam_results'][1][0]),)).fetchone()[0] == int(score)
+
+
+def test_conflict_keeps_local_value(synced):
+    db, client, rep = synced
+    conn = db.reader()
+    with db.writer() as w: w.execute("UPDATE exam_questions SET correct_answer='B' WHERE id=4")
+    client.edit('exam_questions', 4, 7, 'C')
+    assert rep.sync_once()
+    assert conn.execute("SELECT correct_answer FROM exam_questions WHERE id=4").fetchone()[0] == 'B'
+    assert rep.conflicts == 1 and in_sync(conn, client)
+
+
+def test_outage_keeps_changes_pending(synced):
+    db, client, rep = synced
+    conn = db.reader()
+    client.down = True
+    sids = [r[0] for r in conn.execute("SELECT std_id FROM students LIMIT 20")]
+    q = SubmissionQueue(db)
+    for t in [q.submit(2, sid, 12, 20, '2025-03-03 10:00') for sid in sids]: assert t.wait(10) and t.ok
+    assert not rep.sync_once()
+    st = rep.status()
+    assert st['failures'] == 1 and 'ConnectionError' in st['last_error'] and st['pending'] >= 20
+    client.down = False
+    assert rep.sync_once(), rep.last_error
+    assert in_sync(conn, client) and rep.status()['pending'] == 0 and rep.status()['failures'] == 0
+
+
+def test_pull_without_drive_falls_back_to_grid_size(tmp_path):
+    db = Database(str(tmp_path / "repl.db"))
+    seed_synthetic(db, n_students=50, grades_per_student=1, n_groups=2, n_exams=3)
+    sh, client = fake_spreadsheet({}, drive=False)
+    clock = FakeClock()
+    rep = replication.Replicator(db, lambda: sh, max_age=60, clock=clock)
+    assert rep.sync_once(), rep.last_error
+    assert client.calls['drive'] == 1       # ลอง Drive ครั้งเดียวแล้วใช้ขนาดชีตตลอด
+    assert rep.sync_once()
+    client.calls.clear()
+    assert rep.sync_once()
+    assert dict(client.calls) == {'metadata': 1}
+    # แถวใหม่ในชีต -> ขนาดเปลี่ยน -> อ่านทันที
+    client.sheets['classroom_videos'].append(['', 'ทช21001', 'บทที่ 1', 'https://youtu.be/y', '', ''])
+    assert rep.sync_once(), rep.last_error
+    conn = db.reader()
+    assert conn.execute("SELECT COUNT(*) FROM classroom_videos").fetchone()[0] == 1
+    # แก้ค่าในช่องเดิม -> ขนาดไม่เปลี่ยน -> เห็นเมื่อครบ max_age
+    client.edit('exam_questions', 1, 2, 'แก้จาก Sheets')
+    assert rep.sync_once()
+    assert conn.execute("SELECT question_text FROM exam_questions WHERE id=1").fetchone()[0] != 'แก้จาก Sheets'
+    clock.now += 61
+    assert rep.sync_once(), rep.last_error
+    assert conn.execute("SELECT question_text FROM exam_questions WHERE id=1").fetchone()[0] == 'แก้จาก Sheets'
+    assert in_sync(conn, client)
+    db.close()
+
+
+def test_pull_skips_rows_with_invalid_key(tmp_path):
+    db = Database(str(tmp_path / "repl.db"))
+    sh, client = fake_spreadsheet({})
+    rep = replication.Replicator(db, lambda: sh)
+    assert rep.sync_once()
+    videos = client.sheets['classroom_videos']
+    videos.append(['abc', 'ทช11001', 'บทที่ 1', 'https://youtu.be/x', '', ''])    # รหัสพิมพ์ผิด
+    videos.append(['12.5', 'ทช11001', 'บทที่ 2', 'https://youtu.be/y', '', ''])
+    videos.append(['', 'ทช21001', 'บทที่ 3', 'https://youtu.be/z', '', ''])       # แถวใหม่ปกติ
+    client.modified += 1
+    assert rep.sync_once(), rep.last_error
+    assert rep.skipped == 2
+    assert rep.last_skipped == ('classroom_videos', len(videos) - 1, '12.5')
+    assert rep.status()['skipped'] == 2
+    topics = [r[0] for r in db.reader().execute("SELECT topic_name FROM classroom_videos")]
+    assert topics == ['บทที่ 3']
+    assert videos[-1][0] != ''      # รหัสของแถวที่เพิ่มถูกเขียนกลับ แม้มีแถวเสียในชีตเดียวกัน
+    db.close()
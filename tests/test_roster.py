@@ -0,0 +1,67 @@
+# ==========================================
+# Teacher roster (รายชื่อ นศ. ในกลุ่ม แบบแบ่งหน้า)
+# ==========================================
+import pytest
+
+from roster import LEVEL_NAMES, level_counts, roster_page
+
+SEM = '2/2567'
+
+
+def registered(conn, grp, sem=SEM):
+    return [r[0] for r in conn.execute("SELECT DISTINCT s.std_id FROM students s JOIN grades g ON g.std_id = s.std_id "
+                                       "WHERE s.grp_code = ? AND g.semestry = ? ORDER BY s.std_id", (grp, sem))]
+
+
+@pytest.fixture(scope="module")
+def group(school_db):
+    grp, = school_db.reader().execute("SELECT grp_code FROM students GROUP BY grp_code ORDER BY COUNT(*) DESC LIMIT 1").fetchone()
+    return grp
+
+
+def test_pages_cover_the_group_in_order(school_db, group):
+    conn = school_db.reader()
+    want = registered(conn, group)
+    first = roster_page(conn, group, SEM, size=10)
+    assert first.total == len(want) and first.pages == -(-len(want) // 10)
+    got = [r[0] for p in range(first.pages) for r in roster_page(conn, group, SEM, page=p, size=10).rows]
+    assert got == want
+
+
+@pytest.mark.parametrize('delta', [-1, 0, 1])
+def test_page_boundary(school_db, group, delta):
+    # ขนาดหน้า = จำนวน นศ. -1 / พอดี / +1 -> หน้าสุดท้ายมีแถวที่เหลือเท่านั้น
+    conn = school_db.reader()
+    want = registered(conn, group)
+    size = len(want) + delta
+    pages = -(-len(want) // size)
+    last = roster_page(conn, group, SEM, page=pages - 1, size=size)
+    assert last.pages == pages and last.page == pages - 1
+    assert [r[0] for r in last.rows] == want[(pages - 1) * size:]
+    # หน้าเกินช่วง -> หน้าสุดท้าย / ติดลบ -> หน้าแรก
+    assert roster_page(conn, group, SEM, page=pages + 5, size=size) == last
+    assert roster_page(conn, group, SEM, page=-1, size=size).page == 0
+
+
+def test_empty_group_has_one_empty_page(school_db):
+    page = roster_page(school_db.reader(), 'ไม่มีกลุ่มนี้', SEM)
+    assert page.rows == [] and page.total == 0 and page.pages == 1 and page.page == 0
+
+
+def test_keyword_filters_inside_the_group(school_db, group):
+    conn = school_db.reader()
+    kw = registered(conn, group)[0][-4:]
+    page = roster_page(conn, group, SEM, kw=kw)
+    assert page.total == len(page.rows) > 0
+    assert all(kw in sid for sid, _, _ in page.rows)
+
+
+@pytest.mark.parametrize('sem', ['2/2567', '1/2567', '9/9999'])
+def test_level_counts_match_count_per_level(school_db, group, sem):
+    conn = school_db.reader()
+    want = dict(conn.execute("SELECT level, COUNT(*) FROM students WHERE grp_code = ? AND std_id IN "
+                             "(SELECT std_id FROM grades WHERE semestry = ?) GROUP BY level", (group, sem)).fetchall())
+    counts = level_counts(conn, group, sem)
+    assert set(LEVEL_NAMES) <= set(counts)
+    assert {lvl: n for lvl, n in counts.items() if n} == want
+    assert sum(counts.values()) == roster_page(conn, group, sem).total
@@ -0,0 +1,76 @@
+# ==========================================
+# Full-text search (FTS5 trigram)
+# ==========================================
+import pandas as pd
+import pytest
+
+import search
+from db import Database
+from synthetic import seed_synthetic, thai_names
+
+SEARCH_TERMS = ['สม', 'ชาย', 'ศรีสุข', 'ณัฐพล ทอง', '6712', '01234', 'G0042', '50%_', ' สมชาย ', 'SOMCHAI']
+
+
+def reference_ids(conn, kw, grp=None):
+    # นิยามผลที่ถูกต้อง: substring (ไม่สนตัวพิมพ์) ของรหัส หรือ คำนำหน้า+ชื่อ+' '+นามสกุล
+    df = pd.read_sql("SELECT std_id, grp_code, coalesce(prefix,'') || coalesce(name,'') || ' ' || coalesce(surname,'') AS full_name FROM students", conn)
+    if grp is not None: df = df[df['grp_code'] == grp]
+    kw = kw.strip().lower()
+    return set(df[df['std_id'].str.lower().str.contains(kw, regex=False) | df['full_name'].str.lower().str.contains(kw, regex=False)]['std_id'])
+
+
+@pytest.fixture(scope="module")
+def names_db(tmp_path_factory):
+    db = Database(str(tmp_path_factory.mktemp("search") / "search.db"))
+    seed_synthetic(db, n_students=3000, grades_per_student=1, n_groups=60, n_exams=0)
+    thai_names(db)  # UPDATE ผ่าน trigger -> index ต้องตามทัน
+    with db.writer() as w:  # ชื่อที่มีอักขระพิเศษของ LIKE
+        w.execute("UPDATE students SET name='50%_off' WHERE std_id = (SELECT min(std_id) FROM students)")
+    yield db
+    db.close()
+
+
+@pytest.mark.parametrize('kw', SEARCH_TERMS)
+def test_search_students_matches_substring_reference(names_db, kw):
+    conn = names_db.reader()
+    assert {r[0] for r in search.search_students(conn, kw)} == reference_ids(conn, kw)
+
+
+@pytest.mark.parametrize('kw', SEARCH_TERMS)
+def test_match_student_ids_in_group(names_db, kw):
+    conn = names_db.reader()
+    grp, = conn.execute("SELECT grp_code FROM students GROUP BY grp_code ORDER BY COUNT(*) DESC LIMIT 1").fetchone()
+    assert search.match_student_ids(conn, kw, grp) == reference_ids(conn, kw, grp)
+    assert search.match_student_ids(conn, kw) == reference_ids(conn, kw)
+
+
+def test_search_students_limit_keeps_order(names_db):
+    conn = names_db.reader()
+    assert [r[0] for r in search.search_students(conn, 'สมชาย', 20)] == sorted(reference_ids(conn, 'สมชาย'))[:20]
+
+
+@pytest.mark.parametrize('kw', ['G00', 'ครู G01', 'G1', 'ไม่มี'])
+def test_search_groups_matches_like(names_db, kw):
+    conn = names_db.reader()
+    want = {r[0] for r in conn.execute("SELECT grp_code FROM groups WHERE grp_code LIKE ? OR teacher_name LIKE ?", (f"%{kw}%",) * 2)}
+    assert {r[0] for r in search.search_groups(conn, kw)} == want
+
+
+def test_index_follows_writes(empty_db):
+    with empty_db.writer() as w:
+        w.execute("INSERT INTO students (std_id, prefix, name, surname, grp_code) VALUES ('6711000001', 'นาย', 'สมชาย', 'ใจดี', 'G1')")
+        w.execute("INSERT INTO groups VALUES ('G1', 'ครูหนึ่ง')")
+    conn = empty_db.reader()
+    assert [r[0] for r in search.search_students(conn, 'สมชาย')] == ['6711000001']
+    with empty_db.writer() as w:
+        w.execute("UPDATE students SET name='วิชัย' WHERE std_id='6711000001'")
+    assert search.search_students(conn, 'สมชาย') == [] and len(search.search_students(conn, 'วิชัย')) == 1
+    with empty_db.writer() as w:
+        w.execute("INSERT OR REPLACE INTO students (std_id, prefix, name, surname, grp_code) VALUES ('6711000001', 'นาย', 'ปรีชา', 'ใจดี', 'G1')")
+        w.execute("INSERT OR REPLACE INTO groups VALUES ('G1', 'ครูใหม่')")
+    assert search.search_students(conn, 'วิชัย') == [] and len(search.search_students(conn, 'ปรีชา')) == 1
+    assert search.search_groups(conn, 'ครูหนึ่ง') == [] and search.search_groups(conn, 'ครูใหม่') == [('G1', 'ครูใหม่')]
+    with empty_db.writer() as w:
+        w.execute("DELETE FROM students")
+    assert search.search_students(conn, 'ปรีชา') == []
+    assert conn.execute("SELECT COUNT(*) FROM student_fts").fetchone()[0] == 0
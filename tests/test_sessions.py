@@ -0,0 +1,198 @@
+# ==========================================
+# Signed session tokens
+# ==========================================
+import json
+
+import pytest
+
+import sessions
+from sessions import Identity, Sessions, _b64, get_sessions, token_for
+from synthetic import FakeClock
+
+
+@pytest.fixture
+def store(empty_db):
+    # DB ใหม่มีผู้ใช้ admin ให้อยู่แล้ว
+    return Sessions(empty_db, secret='test-secret')
+
+
+def _signed(store, body):
+    # body ใด ๆ ที่ลงชื่อด้วยกุญแจจริง -> ผ่านการตรวจลายเซ็น ต้องไปถูกปฏิเสธที่ขั้นอ่าน claims
+    body = _b64(body if isinstance(body, bytes) else json.dumps(body).encode('utf-8'))
+    return f"{body}.{store._sign(body)}"
+
+
+def test_roundtrip(store):
+    token = store.issue(store.identity('admin'))
+    assert store.verify(token) == 'admin'
+    assert store.restore(token).role == 'admin'
+
+
+@pytest.mark.parametrize('token', [
+    'abc.ก',                    # ลายเซ็นไม่ใช่ ASCII
+    'ก.abc',                    # body ไม่ใช่ ASCII
+    'a.b.c',                    # จุดเกิน
+    'abc',                      # ไม่มีจุด
+    '',
+    None,
+    12345,
+])
+def test_malformed_token(store, token):
+    assert store.verify(token) is None
+    assert store.restore(token) is None
+    store.revoke(token)         # ไม่ล้ม
+
+
+def test_extra_dots_on_valid_token(store):
+    token = store.issue(store.identity('admin'))
+    assert store.verify(token + '.x') is None
+    assert store.verify('x.' + token) is None
+
+
+@pytest.mark.parametrize('body', [
+    b'not json',
+    b'\xff\xfe',
+    [1, 2, 3],
+    'admin',
+    {'u': 'admin', 'g': 0, 'jti': 'j'},             # ไม่มี exp
+    {'u': 'admin', 'g': 0, 'exp': 2 ** 40},         # ไม่มี jti
+    {'g': 0, 'exp': 2 ** 40, 'jti': 'j'},           # ไม่มี u
+    {'u': 'admin', 'g': 0, 'exp': '9999999999', 'jti': 'j'},
+    {'u': ['admin'], 'g': 0, 'exp': 2 ** 40, 'jti': 'j'},
+])
+def test_signed_but_invalid_claims(store, body):
+    token = _signed(store, body)
+    assert store.verify(token) is None
+    assert store.restore(token) is None
+    store.revoke(token)
+
+
+def test_forged_signature(store):
+    token = store.issue(store.identity('admin'))
+    body, sig = token.split('.')
+    assert store.verify(f"{body}.{sig[:-1]}{'A' if sig[-1] != 'A' else 'B'}") is None
+    assert Sessions(store.db, secret='other-secret').verify(token) is None
+
+
+def test_get_sessions_rejects_different_secret(empty_db, monkeypatch):
+    monkeypatch.setattr(sessions, '_sessions', {})
+    first = get_sessions(empty_db, 'key-1')
+    assert get_sessions(empty_db) is first
+    assert get_sessions(empty_db, 'key-1') is first
+    with pytest.raises(ValueError):
+        get_sessions(empty_db, 'key-2')
+
+
+def test_token_for_unknown_user(store, monkeypatch):
+    monkeypatch.setattr(sessions, '_sessions', {store.db.path: store})
+    assert store.verify(token_for(store.db, 'admin')) == 'admin'
+    with pytest.raises(ValueError, match='nobody'):
+        token_for(store.db, 'nobody')
+
+
+# ==========================================
+# Logout / password reset / expiry / restart
+# ==========================================
+@pytest.fixture
+def people(empty_db):
+    with empty_db.writer() as w:
+        w.executemany("INSERT INTO students (std_id, prefix, name, surname, grp_code) VALUES (?, 'นาย', ?, 'ใจดี', 'G1')",
+                      [(f"671100000{i}", f"สมชาย{i}") for i in range(5)])
+    return [f"671100000{i}" for i in range(5)]
+
+
+@pytest.fixture
+def clock():
+    clock = FakeClock()
+    clock.now = 1_000_000.0
+    return clock
+
+
+def test_logout_revokes_only_that_token(empty_db, people, clock):
+    store = Sessions(empty_db, clock=clock)
+    first, second = (store.issue(store.identity(people[0])) for _ in range(2))
+    store.revoke(first)
+    assert store.verify(first) is None
+    assert store.verify(second) == people[0]
+
+
+def test_password_reset_revokes_every_token(empty_db, people, clock):
+    store = Sessions(empty_db, clock=clock)
+    old = [store.issue(store.identity(people[0])) for _ in range(2)]
+    other = store.issue(store.identity(people[1]))
+    store.revoke_user(people[0])
+    assert [store.verify(t) for t in old] == [None, None]
+    assert store.verify(other) == people[1]
+    assert store.verify(store.issue(store.identity(people[0]))) == people[0]
+
+
+def test_expired_token(empty_db, people, clock):
+    store = Sessions(empty_db, ttl=60, clock=clock)
+    token = store.issue(store.identity(people[0]))
+    clock.now += 59
+    assert store.verify(token) == people[0]
+    clock.now += 1
+    assert store.verify(token) is None
+
+
+def test_revocations_survive_restart(empty_db, people, clock):
+    store = Sessions(empty_db, clock=clock)
+    logged_out = store.issue(store.identity(people[0]))
+    before_reset = store.issue(store.identity(people[1]))
+    store.revoke(logged_out)
+    store.revoke_user(people[1])
+    after_reset = store.issue(store.identity(people[1]))
+    restarted = Sessions(empty_db, clock=clock)     # กุญแจเดิมจาก DB
+    assert restarted.verify(logged_out) is None and restarted.verify(before_reset) is None
+    assert restarted.verify(after_reset) == people[1]
+
+
+def test_expired_revocations_are_pruned(empty_db, people, clock):
+    store = Sessions(empty_db, ttl=60, clock=clock)
+    early = store.issue(store.identity(people[0]))
+    clock.now += 30
+    late = store.issue(store.identity(people[1]))
+    store.revoke(early)
+    store.revoke(late)
+    stored = lambda: {r[0] for r in empty_db.reader().execute("SELECT jti FROM session_revoked")}
+    assert len(store._revoked) == len(stored()) == 2
+    # ตอนตรวจ: early หมดอายุแล้ว -> ลบออกจากหน่วยความจำ
+    clock.now += 31
+    assert store.verify(late) is None
+    assert list(store._revoked) == [store._claims(late)['jti']]
+    # ตอนเพิ่ม: ลบทั้งหน่วยความจำและ DB / token ที่หมดอายุแล้วไม่ต้องจำ
+    clock.now += 30
+    store.revoke(late)
+    assert store._revoked == {}
+    newest = store.issue(store.identity(people[2]))
+    store.revoke(newest)
+    assert stored() == {store._claims(newest)['jti']}
+    clock.now += 61
+    assert Sessions(empty_db, clock=clock)._revoked == {}
+
+
+# ==========================================
+# Identity cache
+# ==========================================
+def test_restore_after_restart_costs_one_lookup(empty_db, people, clock):
+    store = Sessions(empty_db, clock=clock)
+    tokens = [store.issue(Identity(sid, 'student', '', 'G1')) for sid in people]
+    restarted = Sessions(empty_db, clock=clock)
+    assert [restarted.restore(t).user for t in tokens] == people
+    assert restarted.stats['miss'] == len(people) and restarted.stats['hit'] == 0
+    assert [restarted.restore(t).user for t in tokens] == people
+    assert restarted.stats['miss'] == len(people) and restarted.stats['hit'] == len(people)
+
+
+def test_identity_cache_is_bounded(empty_db, people, clock):
+    store = Sessions(empty_db, cache_size=3, clock=clock)
+    for sid in people: store.identity(sid)
+    assert list(store._identities) == people[-3:]
+
+
+def test_identity_refreshed_after_data_change(empty_db, people, clock):
+    store = Sessions(empty_db, clock=clock)
+    token = store.issue(store.identity(people[0]))
+    assert store.restore(token).name == 'นายสมชาย0 ใจดี'
+    with empty_db.writer(bump='data') as w: w.execute("UPDATE students SET name = 'วิชัย' WHERE std_id = ?", (people[0],))
+    assert store.restore(token).name == 'นายวิชัย ใจดี'
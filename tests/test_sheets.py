@@ -0,0 +1,196 @@
+# ==========================================
+# Google Sheets read cache (SheetCache) / write-behind buffer (SheetWriter)
+# ==========================================
+import threading
+
+import pandas as pd
+import pytest
+
+import sheets
+from synthetic import FakeClock, fake_sheet_rows, fake_spreadsheet
+
+NAMES = ['Sheet0', 'Sheet1']
+ROWS = 50
+
+
+@pytest.fixture(params=[True, False], ids=['modifiedTime', 'grid size'])
+def cached(request):
+    # drive=False: ไม่มีสิทธิ์ Drive -> ตรวจด้วยขนาดชีตแทน
+    sh, client = fake_spreadsheet({n: fake_sheet_rows(ROWS, seed=i) for i, n in enumerate(NAMES)}, drive=request.param)
+    clock = FakeClock()
+    cache = sheets.SheetCache(sh, ttl=10, max_age=100, clock=clock)
+    cache.get_many(NAMES)
+    client.calls.clear()
+    return sh, client, clock, cache, request.param
+
+
+def test_frames_equal_get_all_records():
+    sh, client = fake_spreadsheet({n: fake_sheet_rows(ROWS, seed=i) for i, n in enumerate(NAMES)})
+    frames = sheets.SheetCache(sh, clock=FakeClock()).get_many(NAMES)
+    for n in NAMES:
+        assert frames[n].equals(pd.DataFrame(sh.worksheet(n).get_all_records()))
+    assert sheets.records_frame([]).empty
+
+
+def test_misses_are_fetched_in_one_batch():
+    sh, client = fake_spreadsheet({n: fake_sheet_rows(ROWS, seed=i) for i, n in enumerate(NAMES)})
+    cache = sheets.SheetCache(sh, clock=FakeClock())
+    cache.get_many(NAMES)
+    assert client.calls['values_batch_get'] == 1 and client.calls['values_get'] == 0
+    client.calls.clear()
+    cache.get_many(NAMES)
+    assert sum(client.calls.values()) == 0
+
+
+def test_within_ttl_no_requests(cached):
+    sh, client, clock, cache, _ = cached
+    clock.now += 9
+    client.edit(NAMES[0], 1, 3, '19')
+    assert cache.get(NAMES[0]).iloc[0]['score'] != 19
+    assert sum(client.calls.values()) == 0
+
+
+def test_unchanged_after_ttl_probe_only(cached):
+    sh, client, clock, cache, drive = cached
+    clock.now += 11
+    cache.get(NAMES[0])
+    assert client.calls['values_batch_get'] == 0
+    client.calls.clear()
+    clock.now += 11
+    cache.get(NAMES[0])
+    # หลังรู้ว่าไม่มีสิทธิ์ Drive แล้วไม่ลองซ้ำ -> 1 request ต่อการตรวจ
+    assert sum(client.calls.values()) == 1
+    assert client.calls['drive' if drive else 'metadata'] == 1
+
+
+def test_own_append_visible_immediately(cached):
+    sh, client, clock, cache, _ = cached
+    sh.worksheet(NAMES[0]).append_row(['6719999999', 'ใหม่', 'G0001', '7', '20', ''])
+    cache.invalidate(NAMES[0])
+    assert len(cache.get(NAMES[0])) == ROWS + 1
+
+
+def test_append_elsewhere_refetches_after_ttl(cached):
+    sh, client, clock, cache, _ = cached
+    sh.worksheet(NAMES[0]).append_row(['6719999999', 'ใหม่', 'G0001', '7', '20', ''])
+    client.calls.clear()
+    clock.now += 11
+    cache.get(NAMES[1])
+    assert client.calls['values_batch_get'] == 1
+    assert len(cache.get(NAMES[0])) == ROWS + 1
+
+
+def test_in_place_edit_after_ttl(cached):
+    sh, client, clock, cache, drive = cached
+    client.edit(NAMES[1], 1, 3, '19')
+    clock.now += 11
+    # ขนาดชีตไม่เปลี่ยน -> ตรวจด้วยขนาดมองไม่เห็นจนครบ max_age
+    assert (cache.get(NAMES[1]).iloc[0]['score'] == 19) == drive
+    clock.now += 100
+    assert cache.get(NAMES[1]).iloc[0]['score'] == 19
+
+
+def test_returns_copies(cached):
+    sh, client, clock, cache, _ = cached
+    frame = cache.get(NAMES[0])
+    frame['score'] = -1
+    assert (cache.get(NAMES[0])['score'] != -1).all()
+
+
+# ==========================================
+# SheetWriter
+# ==========================================
+def _rows(n, start=0):
+    return [[f"671{i:07d}", f"ชื่อ{i}", 'G0001', str(i % 21), '20', ''] for i in range(start, start + n)]
+
+
+@pytest.fixture
+def results_sheet():
+    return fake_spreadsheet({'Results': fake_sheet_rows(0)})
+
+
+def test_rows_written_in_order_in_batches(results_sheet):
+    sh, client = results_sheet
+    writer = sheets.SheetWriter(sh, flush_rows=10, flush_interval=60)
+    rows = _rows(25)
+    tickets = [writer.append('Results', r) for r in rows]
+    assert writer.flush(timeout=10)
+    assert client.sheets['Results'][1:] == rows
+    assert client.calls['values_append'] == 3 and writer.stats['written'] == 25
+    assert all(t.ok and t.written is not None for t in tickets) and writer.pending() == 0
+
+
+def test_concurrent_sessions_each_row_once(results_sheet):
+    sh, client = results_sheet
+    writer = sheets.SheetWriter(sh, flush_rows=50, flush_interval=0.05)
+    rows = _rows(400)
+    threads = [threading.Thread(target=lambda part: [writer.append('Results', r) for r in part], args=(rows[k::8],)) for k in range(8)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    assert writer.flush(timeout=10)
+    assert sorted(map(tuple, client.sheets['Results'][1:])) == sorted(map(tuple, rows))
+    # แถวของ session เดียวกันยังเรียงตามลำดับที่ส่ง
+    for k in range(8):
+        mine = [r for r in client.sheets['Results'][1:] if r in rows[k::8]]
+        assert mine == rows[k::8]
+
+
+def test_flush_interval_without_flush(results_sheet):
+    sh, client = results_sheet
+    writer = sheets.SheetWriter(sh, flush_rows=100, flush_interval=0.05)
+    ticket = writer.append('Results', _rows(1)[0])
+    assert not ticket.done
+    assert ticket.wait(5) and ticket.ok
+
+
+def test_quota_error_is_retried(results_sheet):
+    sh, client = results_sheet
+    client.write_quota = (1, 3600)
+    slept = []
+
+    def sleep(s):
+        # รอ backoff = หน้าต่าง quota ผ่านไป
+        slept.append(s)
+        client._writes.clear()
+
+    writer = sheets.SheetWriter(sh, flush_rows=5, flush_interval=60, backoff=0.5, sleep=sleep)
+    tickets = [writer.append('Results', r) for r in _rows(10)]
+    assert writer.flush(timeout=10)
+    assert all(t.ok for t in tickets) and len(client.sheets['Results']) == 11
+    assert client.calls['429'] == 1 and writer.stats['retries'] == 1 and 0.5 <= slept[0] < 0.6
+
+
+def test_retries_exhausted_marks_tickets(results_sheet):
+    sh, client = results_sheet
+    client.write_quota = (0, 3600)
+    slept = []
+    writer = sheets.SheetWriter(sh, flush_rows=5, flush_interval=60, retries=3, backoff=1, sleep=slept.append)
+    tickets = [writer.append('Results', r) for r in _rows(3)]
+    assert writer.flush(timeout=10) is False
+    assert all(t.done and not t.ok and 'APIError' in t.error and t.written is None for t in tickets)
+    assert [round(s) for s in slept] == [1, 2, 4] and writer.stats['failed'] == 3
+    assert len(client.sheets['Results']) == 1
+
+
+def test_other_errors_are_not_retried(results_sheet, monkeypatch):
+    sh, client = results_sheet
+
+    def broken(*a, **kw):
+        client.calls['values_append'] += 1
+        raise ValueError("bad range")
+
+    monkeypatch.setattr(client, 'values_append', broken)
+    writer = sheets.SheetWriter(sh, flush_rows=5, flush_interval=60, sleep=lambda s: pytest.fail("retried"))
+    ticket = writer.append('Results', _rows(1)[0])
+    assert writer.flush(timeout=10) is False
+    assert ticket.error == "ValueError: bad range" and client.calls['values_append'] == 1
+
+
+def test_written_rows_invalidate_read_cache(results_sheet):
+    sh, client = results_sheet
+    cache = sheets.SheetCache(sh, ttl=3600, clock=FakeClock())
+    assert cache.get('Results').empty
+    writer = sheets.SheetWriter(sh, flush_rows=5, flush_interval=60, on_written=cache.invalidate)
+    writer.append('Results', _rows(1)[0])
+    assert writer.flush(timeout=10)
+    assert len(cache.get('Results')) == 1
@@ -0,0 +1,65 @@
+# ==========================================
+# Exam submission queue
+# ==========================================
+import sqlite3
+
+import pytest
+
+import submissions
+from submissions import SubmissionQueue
+
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(submissions.time, 'sleep', lambda s: None)
+
+
+def _results(db):
+    return sorted(db.reader().execute("SELECT exam_id, std_id, score, total_score FROM exam_results").fetchall())
+
+
+def test_queue_batches_and_keeps_latest_result(empty_db):
+    q = SubmissionQueue(empty_db, batch_max=50, batch_wait=0.2)
+    tickets = [q.submit(1, f"67110000{i:02d}", i % 10, 10, '2025-03-01 10:00') for i in range(40)]
+    tickets.append(q.submit(1, "6711000000", 9, 10, '2025-03-01 10:05'))      # ส่งซ้ำ -> เก็บผลล่าสุด
+    assert all(t.wait(5) for t in tickets)
+    assert all(t.ok and t.committed is not None for t in tickets)
+    stats = q.stats()
+    assert stats['committed'] == 41 and stats['failed'] == 0
+    assert stats['batches'] < 5 and stats['depth'] == 0
+    rows = _results(empty_db)
+    assert len(rows) == 40
+    assert (1, "6711000000", 9, 10) in rows
+
+
+def test_queue_retries_locked_database(empty_db, monkeypatch, no_backoff):
+    q = SubmissionQueue(empty_db)
+    real, calls = q._write, []
+
+    def flaky(batch):
+        calls.append(len(batch))
+        if len(calls) == 1: raise sqlite3.OperationalError("database is locked")
+        real(batch)
+    monkeypatch.setattr(q, '_write', flaky)
+    ticket = q.submit(2, "6711000001", 7, 10, '2025-03-01 10:00')
+    assert ticket.wait(5) and ticket.ok and ticket.error is None
+    assert len(calls) == 2
+    assert _results(empty_db) == [(2, "6711000001", 7, 10)]
+    assert q.stats()['failed'] == 0
+
+
+def test_ticket_reports_error_after_retries(empty_db, monkeypatch, no_backoff):
+    q = SubmissionQueue(empty_db)
+    calls = []
+
+    def locked(batch):
+        calls.append(len(batch))
+        raise sqlite3.OperationalError("database is locked")
+    monkeypatch.setattr(q, '_write', locked)
+    ticket = q.submit(3, "6711000002", 5, 10, '2025-03-01 10:00')
+    assert ticket.wait(5) and ticket.done
+    assert not ticket.ok and ticket.committed is None
+    assert "database is locked" in ticket.error
+    assert len(calls) == submissions.RETRIES
+    assert q.stats()['failed'] == 1 and q.stats()['committed'] == 0
+    assert _results(empty_db) == []
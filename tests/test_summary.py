@@ -0,0 +1,66 @@
+# ==========================================
+# Materialised summary tables
+# ==========================================
+import random
+
+import pytest
+
+import importer
+from db import Database
+from submissions import SubmissionQueue
+from summary import check_summaries, rebuild_summaries
+from synthetic import make_zip, seed_synthetic
+
+
+@pytest.fixture
+def live_db(tmp_path):
+    db = Database(str(tmp_path / "summary.db"))
+    seed_synthetic(db, n_students=800, grades_per_student=10, n_groups=16, n_exams=12)
+    yield db
+    db.close()
+
+
+def _submit_all(db, sids, seed=5):
+    # ทั้งรุ่นส่งผ่านคิว: บางคนส่งซ้ำ / บางคนสอบข้อสอบเทอมก่อน / บางคนไม่ได้ลงทะเบียนเทอมนั้น
+    conn = db.reader()
+    exam_ids = [r[0] for r in conn.execute("SELECT exam_id FROM exams")]
+    rnd = random.Random(seed)
+    q = SubmissionQueue(db, batch_wait=0.01)
+    tickets = [q.submit(rnd.choice(exam_ids), sid, rnd.randint(0, 20), 20, '2025-03-01 10:00') for sid in sids + sids[:len(sids) // 5]]
+    assert all(t.wait(10) and t.ok for t in tickets)
+    return q
+
+
+def test_submissions_keep_summaries_consistent(live_db):
+    with live_db.writer() as w:
+        w.execute("INSERT INTO exams (exam_name, sub_code, semestry, is_active) VALUES ('เทอมก่อน', 'ทช10001', '1/2567', 0)")
+        w.execute("INSERT INTO students (std_id, name, grp_code, level) VALUES ('6719999999', 'ไม่ลงทะเบียน', 'G0000', '')")
+    conn = live_db.reader()
+    sids = [r[0] for r in conn.execute("SELECT std_id FROM students ORDER BY random() LIMIT 300")] + ['6719999999']
+    q = _submit_all(live_db, sids)
+    assert q.stats()['batches'] > 1
+    assert check_summaries(conn) == []
+
+
+@pytest.mark.parametrize('mode', ['inplace', 'staged', 'delta'])
+def test_import_rebuilds_summaries(tmp_path, live_db, mode):
+    conn = live_db.reader()
+    _submit_all(live_db, [r[0] for r in conn.execute("SELECT std_id FROM students LIMIT 200")])
+    make_zip(str(tmp_path / "v1.zip"), n_students=600, grades_per_student=8, n_groups=10, seed=1)
+    importer.import_zip(live_db, str(tmp_path / "v1.zip"), mode=mode)
+    assert check_summaries(conn) == []
+    # นำเข้ารอบสอง (ข้อมูลเปลี่ยน) แล้วส่งผลสอบต่อ -> ยังตรงกับการคำนวณใหม่
+    make_zip(str(tmp_path / "v2.zip"), n_students=700, grades_per_student=8, n_groups=10, seed=2)
+    importer.import_zip(live_db, str(tmp_path / "v2.zip"), mode=mode)
+    _submit_all(live_db, [r[0] for r in conn.execute("SELECT std_id FROM students ORDER BY std_id DESC LIMIT 100")], seed=6)
+    assert check_summaries(conn) == []
+
+
+def test_check_summaries_reports_drift(live_db):
+    with live_db.writer() as w:
+        w.execute("UPDATE att_summary SET attended = attended + 1 WHERE rowid = (SELECT MIN(rowid) FROM att_summary)")
+        w.execute("DELETE FROM exam_summary WHERE exam_id = 1")
+    diffs = check_summaries(live_db.reader())
+    assert {d[0] for d in diffs} == {'att_summary', 'exam_summary'} and len(diffs) == 2
+    with live_db.writer() as w: rebuild_summaries(w)
+    assert check_summaries(live_db.reader()) == []